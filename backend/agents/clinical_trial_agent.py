@@ -9,17 +9,33 @@ import pprint
 import logging
 import re # <-- Import re
 import asyncio # <-- Import asyncio
-from typing import Any, Dict, Optional, List, Tuple # <-- Add Tuple
+import contextlib
+import time
+from typing import Any, AsyncIterator, Dict, Iterable, Optional, List, Tuple # <-- Add Tuple
 from pathlib import Path # Import Path
 
 import chromadb
 from sentence_transformers import SentenceTransformer
-import google.generativeai as genai
 from google.generativeai.types import GenerationConfig # Added for JSON output
 from dotenv import load_dotenv
 
 # Import the base class
 from backend.core.agent_interface import AgentInterface
+from backend.core.embedding_cache import EmbeddingCache
+from backend.core.assessment_store import AssessmentStore, content_hash, prompt_version
+from backend.core.criteria_index import (
+    CRITERIA_RULES_VERSION, DEFAULT_INDEX_DB_PATH, KIND_EXCLUSION, KIND_INCLUSION, STATUS_NOT_MET, CriteriaIndex,
+    atoms_to_text, split_atoms,
+)
+from backend.core.llm_gateway import llm_gateway
+from backend.core.patient_profile import PatientProfileCache, compression_report, estimate_tokens
+from backend.core.reranker import TrialReranker, iter_budgeted_assessments, policy_report, resolve_policy
+from backend.core.retrieval import (
+    CRITERIA_COLLECTION_NAME, DEFAULT_POOLING, CriterionRetriever, LexicalIndex, allowed_trial_ids,
+    filters_from_entities, reciprocal_rank_fusion, trial_matches_filters,
+)
+from backend.core.sqlite_pool import get_pool, json_list
+from backend.core.vector_index import DEFAULT_VECTOR_BACKEND, VECTOR_BACKEND_CHROMA, VECTOR_BACKEND_LOCAL, open_vector_collection
 
 # --- NEW Import --- 
 from backend.agents.action_suggester import get_action_suggestions_for_trial
@@ -32,10 +48,21 @@ load_dotenv(dotenv_path=dotenv_path)
 print(f"Attempting to load .env from: {dotenv_path}") # Add print statement
 
 SQLITE_DB_PATH = "backend/db/trials.db"
+TRIAL_INDEX_DB_PATH = DEFAULT_INDEX_DB_PATH
+TRIALS_BY_IDS_SQL = "SELECT * FROM clinical_trials WHERE nct_id IN (SELECT value FROM json_each(?))"
 CHROMA_DB_PATH = "./chroma_db"
 CHROMA_COLLECTION_NAME = "clinical_trials_eligibility"
 EMBEDDING_MODEL = 'all-MiniLM-L6-v2'
-N_CHROMA_RESULTS = 10 # Number of results to fetch from ChromaDB
+# Hybrid (criterion-level vector + FTS5) retrieval ranks trials better, so fewer of them go on to LLM assessment
+N_RANKED_TRIALS = int(os.getenv("TRIAL_SEARCH_TOP_K", "6"))
+HYBRID_CANDIDATE_MULTIPLIER = 3  # Candidates fetched per side = N_RANKED_TRIALS * this, before fusion
+TRIAL_RETRIEVAL_POOLING = os.getenv("TRIAL_RETRIEVAL_POOLING", DEFAULT_POOLING)
+# Query embedding cache (set EMBEDDING_CACHE_PATH to keep it across restarts)
+EMBEDDING_CACHE_MAX_ENTRIES = int(os.getenv("EMBEDDING_CACHE_MAX_ENTRIES", "1024"))
+EMBEDDING_CACHE_TTL_SECONDS = float(os.getenv("EMBEDDING_CACHE_TTL_SECONDS", str(24 * 60 * 60)))
+EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH")
+# Persistent cache of parsed eligibility assessments
+ASSESSMENT_CACHE_PATH = os.getenv("ASSESSMENT_CACHE_PATH", "backend/db/assessments.db")
 # LLM Configuration
 GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
 LLM_MODEL_NAME = "gemini-1.5-pro"
@@ -58,7 +85,7 @@ ELIGIBILITY_AND_NARRATIVE_SUMMARY_PROMPT_TEMPLATE = """
 Analyze the patient's eligibility for the following clinical trial based ONLY on the provided information. Provide a concise patient-specific summary, an overall eligibility status, and a breakdown of met, unmet, and unclear criteria.
 
 **Patient Profile:**
-{patient_profile_json}
+{patient_profile}
 
 **Clinical Trial Criteria:**
 Trial Title: {trial_title}
@@ -104,6 +131,9 @@ Exclusion Criteria:
 *   Focus solely on the provided text. Do not infer information not present.
 *   Be concise and specific in your reasoning.
 """
+# Bump the label when the parser changes; template edits change the hash automatically
+ELIGIBILITY_PROMPT_VERSION = prompt_version(f"eligibility-text-v2+{CRITERIA_RULES_VERSION}", ELIGIBILITY_AND_NARRATIVE_SUMMARY_PROMPT_TEMPLATE)
+LOCALLY_EVALUATED_PLACEHOLDER = "(All criteria in this section were evaluated from structured patient data.)"
 # --- End Structured Text Prompt --- 
 
 # --- MockTrialDatabase Class (Commented out as it's being replaced) ---
@@ -125,7 +155,24 @@ class ClinicalTrialAgent(AgentInterface):
         self.model = None
         self.chroma_client = None
         self.chroma_collection = None
+        self.criteria_collection = None
+        self.criterion_retriever = None
         self.llm_client = None
+        self.reranker = None
+        self.embedding_cache = EmbeddingCache(
+            model_name=EMBEDDING_MODEL,
+            max_entries=EMBEDDING_CACHE_MAX_ENTRIES,
+            ttl_seconds=EMBEDDING_CACHE_TTL_SECONDS,
+            persist_path=EMBEDDING_CACHE_PATH,
+        )
+        self.assessment_store = AssessmentStore(ASSESSMENT_CACHE_PATH)
+        self.assessment_store.purge_other_versions(ELIGIBILITY_PROMPT_VERSION)
+        # One compact eligibility profile per patient record, shared by all trial prompts
+        self.profile_cache = PatientProfileCache()
+        # Derived tables live in their own database; trials.db is only read
+        self.criteria_index = CriteriaIndex(TRIAL_INDEX_DB_PATH, SQLITE_DB_PATH)
+        self.lexical_index = LexicalIndex(TRIAL_INDEX_DB_PATH, SQLITE_DB_PATH) # FTS5 index is built on first search, off the event loop
+        self.trials_db = get_pool(SQLITE_DB_PATH)
 
         # --- Initialize Embedding Model ---
         try:
@@ -134,8 +181,45 @@ class ClinicalTrialAgent(AgentInterface):
             logging.info("Embedding model loaded.")
         except Exception as e:
             logging.error(f"Failed to load SentenceTransformer model \'{EMBEDDING_MODEL}\': {e}", exc_info=True)
+        # Patient-vs-criteria reranking before LLM assessment (cross-encoder, else MiniLM similarity)
+        self.reranker = TrialReranker(bi_encoder=self.model)
+
+        # --- Initialize vector search (in-process index or ChromaDB) ---
+        self.vector_backend = DEFAULT_VECTOR_BACKEND
+        if self.vector_backend == VECTOR_BACKEND_LOCAL:
+            self._init_local_vector_index()
+        else:
+            self._init_chroma()
 
-        # --- Initialize ChromaDB ---
+        # --- LLM access goes through the shared gateway ---
+        if not llm_gateway.available:
+            logging.error(f"{llm_gateway.unavailable_reason}. LLM features will be disabled.")
+            self.llm_client = None
+        else:
+            self.llm_client = llm_gateway
+
+        logging.info("ClinicalTrialAgent Initialized.")
+
+    def _init_local_vector_index(self) -> None:
+        """ Opens the memory-mapped exports of both collections (see backend/scripts/build_vector_index.py). """
+        try:
+            # Warns (and reports "stale" in stats) when trials.db was re-ingested after the export
+            self.chroma_collection = open_vector_collection(CHROMA_COLLECTION_NAME, VECTOR_BACKEND_LOCAL, trials_db_path=SQLITE_DB_PATH)
+            self.criteria_collection = open_vector_collection(CRITERIA_COLLECTION_NAME, VECTOR_BACKEND_LOCAL, trials_db_path=SQLITE_DB_PATH)
+        except Exception as e:
+            logging.error(f"Failed to open local vector index: {e}", exc_info=True)
+            self.chroma_collection = self.criteria_collection = None
+        if self.criteria_collection is not None:
+            self.criterion_retriever = CriterionRetriever(self.criteria_collection, method=TRIAL_RETRIEVAL_POOLING)
+        if self.chroma_collection is None and self.criteria_collection is None:
+            logging.warning("Local vector index not found; run backend/scripts/build_vector_index.py. Falling back to ChromaDB.")
+            self.vector_backend = VECTOR_BACKEND_CHROMA
+            self._init_chroma()
+            return
+        logging.info(f"Local vector index ready: trials={self.chroma_collection.stats() if self.chroma_collection else None}, "
+                     f"criteria={self.criteria_collection.stats() if self.criteria_collection else None}")
+
+    def _init_chroma(self) -> None:
         try:
             logging.info(f"Initializing ChromaDB client at: {CHROMA_DB_PATH}")
             self.chroma_client = chromadb.PersistentClient(path=CHROMA_DB_PATH)
@@ -148,31 +232,18 @@ class ClinicalTrialAgent(AgentInterface):
             else:
                  logging.warning(f"ChromaDB collection \'{CHROMA_COLLECTION_NAME}\' not found at path \'{CHROMA_DB_PATH}\'. Loading script might need to be run.")
                  self.chroma_collection = None
+            if CRITERIA_COLLECTION_NAME in col_names:
+                 self.criteria_collection = self.chroma_client.get_collection(name=CRITERIA_COLLECTION_NAME)
+                 self.criterion_retriever = CriterionRetriever(self.criteria_collection, method=TRIAL_RETRIEVAL_POOLING)
+                 logging.info(f"Criterion-level collection \'{CRITERIA_COLLECTION_NAME}\' ready. Count: {self.criteria_collection.count()}")
+            else:
+                 logging.warning(f"Criterion-level collection \'{CRITERIA_COLLECTION_NAME}\' not found; falling back to trial-level search.")
         except Exception as e:
             logging.error(f"Failed to initialize ChromaDB client or get collection: {e}", exc_info=True)
             self.chroma_client = None
             self.chroma_collection = None
-
-        # --- Initialize Google Generative AI Client ---
-        if not GOOGLE_API_KEY:
-            logging.error("GOOGLE_API_KEY not found in environment variables. LLM features will be disabled.")
-            self.llm_client = None # Ensure llm_client is None if key missing
-        else:
-            try:
-                logging.info("Configuring Google Generative AI...")
-                genai.configure(api_key=GOOGLE_API_KEY)
-                logging.info(f"Initializing Google Generative Model: {LLM_MODEL_NAME}")
-                # Apply JSON config during initialization if possible, or during generate_content call
-                self.llm_client = genai.GenerativeModel(
-                    LLM_MODEL_NAME,
-                    generation_config=DEFAULT_LLM_GENERATION_CONFIG # Apply config here
-                )
-                logging.info("Google Generative AI client initialized successfully.")
-            except Exception as e:
-                logging.error(f"Failed to initialize Google Generative AI client: {e}", exc_info=True)
-                self.llm_client = None
-
-        logging.info("ClinicalTrialAgent Initialized.")
+            self.criteria_collection = None
+            self.criterion_retriever = None
 
     @property
     def name(self) -> str:
@@ -182,16 +253,44 @@ class ClinicalTrialAgent(AgentInterface):
     def description(self) -> str:
         return "Searches for relevant clinical trials based on patient diagnosis, eligibility context, stage, biomarkers, etc. using local vector and relational databases."
 
-    def _get_db_connection(self):
-        """ Establishes a connection to the SQLite database. """
-        try:
-            conn = sqlite3.connect(SQLITE_DB_PATH)
-            conn.row_factory = sqlite3.Row # Return rows as dictionary-like objects
-            logging.info(f"Connected to SQLite DB: {SQLITE_DB_PATH}")
-            return conn
-        except sqlite3.Error as e:
-            logging.error(f"Failed to connect to SQLite DB at {SQLITE_DB_PATH}: {e}")
-            return None
+    def warmup(self) -> None:
+        """ Runs one throwaway encode and collection count so the first real search is not cold. """
+        if self.model:
+            self.model.encode(["clinical trial eligibility warmup"])
+        if self.chroma_collection:
+            self.chroma_collection.count()
+        self.reranker.warmup()
+
+    def health(self) -> Dict[str, Any]:
+        """ Reports which of the agent's heavy components are available. """
+        return {
+            "embedding_model": EMBEDDING_MODEL if self.model else None,
+            "vector_backend": self.vector_backend,
+            "chroma_collection": CHROMA_COLLECTION_NAME if self.chroma_collection else None,
+            "criteria_collection": CRITERIA_COLLECTION_NAME if self.criteria_collection else None,
+            "retrieval_pooling": TRIAL_RETRIEVAL_POOLING if self.criterion_retriever else None,
+            "llm_client": LLM_MODEL_NAME if self.llm_client else None,
+            "embedding_cache": self.embedding_cache.stats(),
+            "assessment_cache": self.assessment_store.stats(),
+            "patient_profile_cache": self.profile_cache.stats(),
+            "criteria_index": self.criteria_index.stats(),
+            "lexical_index": self.lexical_index.available,
+            "reranker": self.reranker.method,
+            "assessment_policy": resolve_policy(),
+            "trials_db": self.trials_db.stats(),
+        }
+
+    def close(self) -> None:
+        self.embedding_cache.close()
+        self.assessment_store.close()
+        self.criteria_index.close()
+        self.lexical_index.close()
+
+    def _embed_query(self, query: str) -> List[float]:
+        """ Returns the query embedding, encoding it only on a cache miss. """
+        return self.embedding_cache.get_or_compute(
+            query, lambda text: self.model.encode([text])[0].tolist()
+        )
 
     def _build_query_text(self, context: Dict[str, Any], entities: Dict[str, Any], prompt: str) -> str:
         """ Constructs the text to be embedded for searching based on available info. """
@@ -234,6 +333,19 @@ class ClinicalTrialAgent(AgentInterface):
              return ""
 
     # --- Refined LLM Helper - Calls NEW Text Parser --- 
+    def _assessment_cache_key(self, patient_context: Dict[str, Any], trial_detail: Dict[str, Any]) -> Tuple[str, str, str]:
+        """ Returns (patient_ref, patient_hash, criteria_hash) for the assessment store. """
+        patient_hash = content_hash(patient_context)
+        patient_ref = str(patient_context.get("patientId") or patient_hash)
+        criteria_hash = content_hash({
+            "title": trial_detail.get('brief_title'),
+            "status": trial_detail.get('overall_status'),
+            "phase": trial_detail.get('phase'),
+            "inclusion": trial_detail.get('inclusion_criteria_text'),
+            "exclusion": trial_detail.get('exclusion_criteria_text'),
+        })
+        return patient_ref, patient_hash, criteria_hash
+
     async def _get_llm_assessment_for_trial(self, patient_context: Dict[str, Any], trial_detail: Dict[str, Any]) -> Optional[Dict[str, Any]]:
         """Generates prompt, calls LLM for STRUCTURED TEXT, parses text response for a single trial."""
         nct_id = trial_detail.get("nct_id", "UNKNOWN_ID")
@@ -250,6 +362,30 @@ class ClinicalTrialAgent(AgentInterface):
                 "overall_assessment": "Not Assessed (No Criteria Text)", 
                 "narrative_summary": "Eligibility criteria text was missing or could not be retrieved for this trial."
             }
+
+        # --- Check persistent assessment cache ---
+        patient_ref, patient_hash, criteria_hash = self._assessment_cache_key(patient_context, trial_detail)
+        cached_assessment = await asyncio.to_thread(
+            self.assessment_store.get, nct_id, patient_ref, patient_hash, criteria_hash, ELIGIBILITY_PROMPT_VERSION
+        )
+        if cached_assessment is not None:
+            logging.info(f"Using cached eligibility assessment for trial {nct_id}.")
+            return {"llm_eligibility_analysis": cached_assessment}
+
+        # --- Decide deterministic criteria (age, ECOG, lab thresholds) locally ---
+        atoms = await asyncio.to_thread(self.criteria_index.atoms_for_trial, trial_detail)
+        local_results, remaining_atoms = split_atoms(atoms, patient_context)
+        if local_results:
+            logging.info(f"Evaluated {len(local_results)}/{len(atoms)} criteria locally for trial {nct_id}.")
+            inclusion_criteria = atoms_to_text(remaining_atoms, KIND_INCLUSION) or LOCALLY_EVALUATED_PLACEHOLDER
+            exclusion_criteria = atoms_to_text(remaining_atoms, KIND_EXCLUSION) or LOCALLY_EVALUATED_PLACEHOLDER
+            if not remaining_atoms:
+                parsed_assessment_dict = self._merge_local_results(None, local_results)
+                await asyncio.to_thread(
+                    self.assessment_store.put, nct_id, patient_ref, patient_hash, criteria_hash,
+                    ELIGIBILITY_PROMPT_VERSION, parsed_assessment_dict
+                )
+                return {"llm_eligibility_analysis": parsed_assessment_dict}
             
         if not self.llm_client:
             logging.error("LLM client not initialized. Cannot perform assessment.")
@@ -268,50 +404,39 @@ class ClinicalTrialAgent(AgentInterface):
                 inclusion_criteria, 
                 exclusion_criteria
             ) 
+            prompt_tokens = estimate_tokens(prompt)
             
             # Use the default config (expects plain text now)
-            response = await asyncio.to_thread(
-                self.llm_client.generate_content,
+            raw_response_text = await self.llm_client.generate(
                 prompt,
+                model_name=LLM_MODEL_NAME,
+                caller=self.name,
                 generation_config=DEFAULT_LLM_GENERATION_CONFIG, 
                 safety_settings=SAFETY_SETTINGS
             )
             
-            # --- Get raw response text --- 
-            raw_response_text = ""
-            try: 
-                if response.parts:
-                    raw_response_text = response.parts[0].text
-                else:
-                    raw_response_text = response.text
-            except Exception as e:
-                 # ... (keep robust text retrieval error handling) ...
-                 logging.warning(f"Could not access response parts/text directly for {nct_id}: {e}")
-                 try:
-                      raw_response_text = response.text 
-                 except AttributeError:
-                       logging.error(f"Response object for {nct_id} has no 'text' or 'parts' attribute.", exc_info=True)
-                       raw_response_text = "Error: Response object structure invalid."
-                 except Exception as e2:
-                      logging.error(f"Failed even getting response.text for {nct_id}: {e2}")
-                      raw_response_text = "Error retrieving response text."
-            # --- End response text extraction ---
-            
             logging.debug(f"Raw LLM TEXT response for {nct_id}:\n{raw_response_text}")
 
             # --- Call NEW Structured Text Parser --- 
             parsed_assessment_dict = self._parse_structured_text_response(raw_response_text)
 
             if parsed_assessment_dict:
+                parsed_assessment_dict = self._merge_local_results(parsed_assessment_dict, local_results)
                 logging.info(f"Successfully parsed structured text assessment for trial {nct_id}.")
+                # Only successful parses are cached; failures should be retried next time
+                await asyncio.to_thread(
+                    self.assessment_store.put, nct_id, patient_ref, patient_hash, criteria_hash,
+                    ELIGIBILITY_PROMPT_VERSION, parsed_assessment_dict
+                )
                 # The parser should return the dict in the expected nested format
-                return {"llm_eligibility_analysis": parsed_assessment_dict} 
+                return {"llm_eligibility_analysis": parsed_assessment_dict, "prompt_tokens": prompt_tokens}
             else:
                 logging.warning(f"Failed to parse structured text assessment for trial {nct_id}. Raw text logged.")
                 return { # Return specific structure for parsing failure
                     "llm_eligibility_analysis": None,
                     "overall_assessment": "Assessment Failed (Text Parsing Error)",
-                    "narrative_summary": f"The AI assessment could not be processed from text. Raw response logged."
+                    "narrative_summary": f"The AI assessment could not be processed from text. Raw response logged.",
+                    "prompt_tokens": prompt_tokens,
                 }
 
         except Exception as e:
@@ -323,24 +448,45 @@ class ClinicalTrialAgent(AgentInterface):
             }
     # --- End Refined LLM Helper --- 
 
-    def _fetch_trial_details(self, conn: sqlite3.Connection, nct_ids: List[str]) -> List[Dict[str, Any]]:
-        """Fetches full trial details from SQLite for given NCT IDs."""
+    def _merge_local_results(self, parsed_assessment: Optional[Dict[str, Any]], local_results: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """ Folds locally decided criteria into a parsed LLM assessment (or builds one when no LLM call was needed). """
+        if parsed_assessment is None:
+            failed = sum(1 for r in local_results if r["status"] == STATUS_NOT_MET)
+            parsed_assessment = {
+                "patient_specific_summary": (
+                    f"All {len(local_results)} criteria were evaluated from structured patient data; "
+                    f"{failed} not met."
+                ),
+                "eligibility_assessment": {
+                    "eligibility_summary": "Likely Eligible",
+                    "met_criteria": [], "unmet_criteria": [], "unclear_criteria": [],
+                },
+            }
+        if not local_results:
+            return parsed_assessment
+
+        assessment = parsed_assessment.setdefault("eligibility_assessment", {})
+        met = [{"criterion": r["criterion"], "reasoning": r["reasoning"], "analysis_source": r["analysis_source"]}
+               for r in local_results if r["status"] != STATUS_NOT_MET]
+        unmet = [{"criterion": r["criterion"], "reasoning": r["reasoning"], "analysis_source": r["analysis_source"]}
+                 for r in local_results if r["status"] == STATUS_NOT_MET]
+        assessment["met_criteria"] = met + (assessment.get("met_criteria") or [])
+        assessment["unmet_criteria"] = unmet + (assessment.get("unmet_criteria") or [])
+        if unmet:
+            # A hard threshold failure outranks whatever the model concluded from the remaining criteria
+            assessment["eligibility_summary"] = "Likely Ineligible"
+        parsed_assessment["locally_evaluated_criteria"] = len(local_results)
+        return parsed_assessment
+
+    async def _fetch_trial_details(self, nct_ids: List[str]) -> List[Dict[str, Any]]:
+        """Fetches full trial details from SQLite for given NCT IDs, in the order given."""
         if not nct_ids:
             return []
         try:
-            conn.row_factory = sqlite3.Row # Return rows as dict-like objects
-            cursor = conn.cursor()
-            placeholders = ','.join('?' * len(nct_ids))
-            # Select all columns needed by the frontend/LLM
-            query = f"SELECT * FROM clinical_trials WHERE nct_id IN ({placeholders})"
-            cursor.execute(query, nct_ids)
-            rows = cursor.fetchall()
-            # Convert rows to dictionaries
-            results = [dict(row) for row in rows]
-            
-            # Reorder results to match the input nct_ids order if needed (or handle later)
-            # For simplicity now, return as fetched
-            return results
+            # One statement for any number of IDs, so the pooled connections reuse the prepared statement
+            rows = await self.trials_db.fetchall(TRIALS_BY_IDS_SQL, (json_list(nct_ids),))
+            by_id = {row["nct_id"]: row for row in rows}
+            return [by_id[nct_id] for nct_id in dict.fromkeys(nct_ids) if nct_id in by_id]
         except sqlite3.Error as e:
             logging.error(f"SQLite error fetching trial details: {e}", exc_info=True)
             return []
@@ -351,18 +497,12 @@ class ClinicalTrialAgent(AgentInterface):
     # --- NEW: Prompt Generation Method --- 
     def _create_eligibility_prompt(self, patient_context: Dict[str, Any], trial_title: str, trial_status: str, trial_phase: str, inclusion_criteria: Optional[str], exclusion_criteria: Optional[str]) -> str:
         """Creates the prompt for the LLM to assess eligibility and summarize using structured text, handling potentially missing criteria text."""
-        # Basic formatting for patient context
-        # --- FIX: Use json.dumps for reliable formatting --- 
-        try:
-            patient_profile_json = json.dumps(patient_context, indent=2)
-        except TypeError as e:
-            logging.error(f"Patient context is not JSON serializable: {e}. Using basic string representation.")
-            patient_profile_json = str(patient_context)
-        # --- END FIX --- 
+        # Compact eligibility profile (cached per record) instead of the full record JSON
+        patient_profile = self.profile_cache.get(patient_context)["text"]
             
         # --- FIX: Format with all arguments for the structured text prompt --- 
         prompt = ELIGIBILITY_AND_NARRATIVE_SUMMARY_PROMPT_TEMPLATE.format(
-             patient_profile_json=patient_profile_json,
+             patient_profile=patient_profile,
              trial_title=trial_title,             # Use argument
              trial_status=trial_status,           # Use argument
              trial_phase=trial_phase,             # Use argument
@@ -544,163 +684,309 @@ class ClinicalTrialAgent(AgentInterface):
             }
     # --- END NEW: Single Trial Analysis Method --- 
 
-    async def run(self, context: Dict[str, Any] = None, **kwargs) -> Dict[str, Any]:
-        """ Executes the agent's logic: search trials, assess eligibility using TEXT LLM output. """
-        query = kwargs.get("prompt", "")
-        patient_context = context.get("patient_data", {})
+    async def _vector_ranking(self, query: str, allowed_ids: List[str], limit: int) -> List[Dict[str, Any]]:
+        """ Vector side of the hybrid search, restricted to `allowed_ids` with a Chroma `where` filter. """
+        if not self.model or not (self.criterion_retriever or self.chroma_collection):
+            return []
+        logging.info(f"Generating embedding for query: {query[:50]}...")
+        query_embedding = await asyncio.to_thread(self._embed_query, query)
+        where = {"nct_id": {"$in": allowed_ids}}
+
+        # Criterion-level collection: chunk hits pooled per trial
+        if self.criterion_retriever:
+            return await self.criterion_retriever.search(query_embedding, limit, where=where)
+
+        # Trial-level collection: one embedding per trial
+        logging.info(f"Querying ChromaDB collection '{CHROMA_COLLECTION_NAME}'...")
+        results = await asyncio.to_thread(
+            self.chroma_collection.query,
+            query_embeddings=[query_embedding], n_results=min(limit, len(allowed_ids)),
+            include=['metadatas'], where=where,
+        )
+        ranked, seen = [], set()
+        for meta in ((results or {}).get('metadatas') or [[]])[0] or []:
+            nct_id = (meta or {}).get('nct_id')
+            if nct_id and nct_id not in seen:
+                seen.add(nct_id)
+                ranked.append({"nct_id": nct_id, "best_match": None})
+        return ranked
+
+    async def _search_candidates(self, query: str, entities: Optional[Dict[str, Any]] = None,
+                                 filters: Optional[Dict[str, Any]] = None,
+                                 limit: int = N_RANKED_TRIALS) -> Tuple[List[Dict[str, Any]], Optional[Dict[str, Any]]]:
+        """
+        Hybrid search: status/phase pre-filter on the indexed SQLite columns, then vector and FTS5
+        rankings over the allowed trials merged with reciprocal-rank fusion. Trials that fail the
+        filters never reach the LLM.
+        `filters` (see trial_filters.search_filters) replaces the entity-derived open-status filter,
+        and `limit` the default top-k, for callers such as batch pre-screening.
+        Returns (trials, early_response); early_response is set when the caller should return it as-is.
+        """
+        if not self.model and not self.lexical_index.available:
+            return [], {"status": "failure", "output": None, "summary": "Embedding model not loaded."}
+        if not self.chroma_collection and not self.criterion_retriever and not self.lexical_index.available:
+            return [], {"status": "failure", "output": None, "summary": "ChromaDB collection not available."}
+
+        # --- 1. Metadata pre-filter ---
+        filters = filters if filters is not None else filters_from_entities(entities)
+        allowed_ids = await allowed_trial_ids(SQLITE_DB_PATH, filters)
+        statuses = sorted(filters['statuses']) if filters['statuses'] is not None else "any"
+        logging.info(f"{len(allowed_ids)} trials pass filters statuses={statuses} phases={filters['phases']}")
+        if not allowed_ids:
+            return [], {"status": "success", "output": { "found_trials": [] }, "summary": "No open trials match the requested status/phase filters."}
+
+        # --- 2. Vector and lexical rankings, concurrently ---
+        n_candidates = limit * HYBRID_CANDIDATE_MULTIPLIER
+        vector_ranked, lexical_ranked = await asyncio.gather(
+            self._vector_ranking(query, allowed_ids, n_candidates),
+            self.lexical_index.search(query, allowed_ids, n_candidates),
+        )
+        vector_ids = [r["nct_id"] for r in vector_ranked]
+        lexical_ids = [nct_id for nct_id, _ in lexical_ranked]
+
+        # --- 3. Reciprocal-rank fusion ---
+        fused = reciprocal_rank_fusion([vector_ids, lexical_ids])[:limit]
+        if not fused:
+            logging.info("No relevant trials found in hybrid search.")
+            return [], {"status": "success", "output": { "found_trials": [] }, "summary": "No relevant trials found in vector search."}
+        logging.info(f"Hybrid search ranked trials: {[(nct_id, round(score, 5)) for nct_id, score in fused]}")
+
+        # --- 4. Fetch Details from SQLite ---
+        found_trials_details = [
+            t for t in await self._fetch_trial_details([nct_id for nct_id, _ in fused])
+            if trial_matches_filters(t, filters)
+        ]
+        if not found_trials_details:
+            logging.warning(f"NCT IDs {[n for n, _ in fused]} found by search but no details found in SQLite.")
+            return [], {"status": "success", "output": { "found_trials": [] }, "summary": "Trial details not found in database for vector search results."}
+
+        fused_scores = dict(fused)
+        best_matches = {r["nct_id"]: r.get("best_match") for r in vector_ranked}
+        for trial in found_trials_details:
+            nct_id = trial.get("nct_id")
+            trial["retrieval"] = {
+                "score": round(fused_scores.get(nct_id, 0.0), 6),
+                "method": "hybrid_rrf",
+                "vector_rank": vector_ids.index(nct_id) + 1 if nct_id in vector_ids else None,
+                "lexical_rank": lexical_ids.index(nct_id) + 1 if nct_id in lexical_ids else None,
+                "best_match": best_matches.get(nct_id),
+            }
+        return found_trials_details, None
+
+    def _build_interpreted_result(self, trial_detail: Dict[str, Any], llm_result_dict: Optional[Dict[str, Any]], patient_context: Dict[str, Any]) -> Dict[str, Any]:
+        """ Attaches the UI-facing interpreted_result (summary, unclear criteria, suggestions) to a trial dict. """
+        trial_detail = dict(trial_detail)
+        if 'interpreted_result' not in trial_detail:
+            trial_detail['interpreted_result'] = {}
+
+        # --- Process based on the structure from the TEXT parser ---
+        # The text parser returns the nested dict under 'llm_eligibility_analysis' key
+        if llm_result_dict and llm_result_dict.get("llm_eligibility_analysis"):
+            # Case 1: Successful parsing
+            parsed_analysis = llm_result_dict["llm_eligibility_analysis"] # This is the dict built by the text parser
+            eligibility_assessment_nested = parsed_analysis.get("eligibility_assessment", {}) # Get nested assessment
+
+            trial_detail['interpreted_result']['llm_eligibility_analysis'] = parsed_analysis # Store the manually parsed dict
+            # Extract summary from the correct nested location
+            trial_detail['interpreted_result']['eligibility_assessment'] = eligibility_assessment_nested.get("eligibility_summary", "Assessment Incomplete") 
+            # Extract patient summary from the correct top-level location
+            trial_detail['interpreted_result']['narrative_summary'] = parsed_analysis.get("patient_specific_summary", "Summary not generated.") 
+
+            # Extract unclear criteria from the correct nested location (built by parser)
+            unclear_criteria_list = []
+            unclear_items = eligibility_assessment_nested.get("unclear_criteria", [])
+            if isinstance(unclear_items, list):
+                for criterion in unclear_items:
+                     # The text parser puts dicts like {"criterion": "...", "reasoning": "..."} here
+                     if isinstance(criterion, dict) and "criterion" in criterion:
+                         unclear_criteria_list.append(criterion["criterion"])
+                     elif isinstance(criterion, str): # Fallback if structure is unexpected
+                         unclear_criteria_list.append(criterion)
+            trial_detail['interpreted_result']['unclear_criteria'] = unclear_criteria_list # This is for UI display
+            
+            # --- Call suggester with the parsed nested assessment --- 
+            try:
+                 logging.debug(f"Passing TEXT-PARSED eligibility assessment to suggester for {trial_detail.get('nct_id')}: {json.dumps(eligibility_assessment_nested, indent=2)}")
+                 suggestions = get_action_suggestions_for_trial(
+                     eligibility_assessment=eligibility_assessment_nested, # Pass the nested dict built by text parser
+                     patient_context=patient_context
+                 )
+                 logging.debug(f"Received suggestions from suggester for {trial_detail.get('nct_id')}: {suggestions}")
+                 trial_detail['interpreted_result']['action_suggestions'] = suggestions
+            except Exception as suggester_err:
+                 logging.error(f"Error generating action suggestions for trial {trial_detail.get('nct_id', 'UNKNOWN')}: {suggester_err}", exc_info=True)
+                 trial_detail['interpreted_result']['action_suggestions'] = [] 
+            
+        else: 
+             # Case 2: Assessment skipped, failed, or text parsing error
+             # Use the overall_assessment/narrative_summary from the error structure returned by _get_llm_assessment_for_trial
+             trial_detail['interpreted_result']['llm_eligibility_analysis'] = None
+             trial_detail['interpreted_result']['eligibility_assessment'] = llm_result_dict.get("overall_assessment", "Assessment Status Unknown") if llm_result_dict else "Not Assessed (No LLM Task)"
+             trial_detail['interpreted_result']['narrative_summary'] = llm_result_dict.get("narrative_summary", "Assessment not performed or failed.") if llm_result_dict else "Assessment not performed."
+             # Provide generic unclear criteria/suggestions on failure
+             if "failed" in trial_detail['interpreted_result']['eligibility_assessment'].lower():
+                  trial_detail['interpreted_result']['unclear_criteria'] = ["Assessment failed, review criteria manually."]
+             else: 
+                  trial_detail['interpreted_result']['unclear_criteria'] = ["Review criteria manually."]
+             trial_detail['interpreted_result']['action_suggestions'] = []
+
+        return trial_detail
+
+    def _extract_patient_context(self, context: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+        patient_context = (context or {}).get("patient_data", {})
         if not isinstance(patient_context, dict): 
              logging.warning(f"Received non-dict patient_context: {type(patient_context)}. Using empty dict.")
              patient_context = {}
-        logging.info(f"ClinicalTrialAgent running. Query: '{query}'. Patient context provided: {bool(patient_context)}")
+        return patient_context
 
-        if not self.model:
-            return {"status": "failure", "output": None, "summary": "Embedding model not loaded."}
-        if not self.chroma_collection:
-             return {"status": "failure", "output": None, "summary": "ChromaDB collection not available."}
+    async def _plan_assessments(self, patient_context: Dict[str, Any], trials: List[Dict[str, Any]],
+                                overrides: Optional[Dict[str, Any]]) -> Tuple[List[Dict[str, Any]], Dict[str, Any], Dict[str, Any]]:
+        """ Reranks trials against the patient and resolves the LLM budget. Returns (trials, policy, report). """
+        policy = resolve_policy(overrides)
+        rerank_report = None
+        if patient_context and trials:
+            trials, rerank_report = await self.reranker.rerank(patient_context, trials)
+        return trials, policy, policy_report(policy, rerank_report, len(trials))
 
-        conn = None
-        try:
-            # --- 1. Embed Query --- 
-            logging.info(f"Generating embedding for query: {query[:50]}...")
-            query_embedding = self.model.encode([query])[0].tolist()
-            
-            # --- 2. Search Vector DB --- 
-            logging.info(f"Querying ChromaDB collection '{CHROMA_COLLECTION_NAME}'...")
-            results = self.chroma_collection.query(
-                query_embeddings=[query_embedding],
-                n_results=N_CHROMA_RESULTS, # Use constant
-                include=['metadatas']
-            )
-            
-            if not results or not results.get('ids') or not results['ids'][0]:
-                logging.info("No relevant trials found in vector search.")
-                return {"status": "success", "output": { "found_trials": [] }, "summary": "No relevant trials found in vector search."}
-            
-            # Extract NCT IDs correctly from metadata
-            found_nct_ids = []
-            if results.get('metadatas') and results['metadatas'][0]:
-                 found_nct_ids = [meta.get('nct_id') for meta in results['metadatas'][0] if meta.get('nct_id')]
-            
-            if not found_nct_ids:
-                 logging.warning("Vector search returned results but no valid NCT IDs found in metadata.")
-                 return {"status": "success", "output": { "found_trials": [] }, "summary": "Vector search returned results but no valid NCT IDs found in metadata."}
-            
-            logging.info(f"Found potential trial IDs from vector search: {found_nct_ids}")
+    def _budgeted_assessments(self, patient_context: Dict[str, Any], trials: List[Dict[str, Any]],
+                              policy: Dict[str, Any], report: Dict[str, Any]):
+        """ Async iterator of (index, llm_result) for the trials the policy lets through to the LLM. """
+        if not (self.llm_client and patient_context):
+            logging.warning("LLM client not initialized or no patient context provided. Skipping LLM assessment.")
+            trials = []
+        return iter_budgeted_assessments(
+            trials, lambda trial: self._get_llm_assessment_for_trial(patient_context, trial), policy, report,
+        )
 
-            # --- 3. Fetch Details from SQLite --- 
-            conn = self._get_db_connection()
-            if not conn:
-                 return {"status": "failure", "output": None, "summary": "Database connection failed."}
-            
-            found_trials_details = self._fetch_trial_details(conn, found_nct_ids)
-            logging.info(f"Fetched details for {len(found_trials_details)} trials from SQLite.")
-            
-            if not found_trials_details: # Handle case where IDs were found in Chroma but not SQLite
-                logging.warning(f"NCT IDs {found_nct_ids} found in ChromaDB but no details found in SQLite.")
-                return {"status": "success", "output": { "found_trials": [] }, "summary": "Trial details not found in database for vector search results."}
-
-            # --- 4. Perform LLM Eligibility Assessment (Concurrent) --- 
-            llm_assessment_tasks = []
-            if self.llm_client and patient_context: 
-                logging.info(f"Starting concurrent LLM assessments for {len(found_trials_details)} trials...")
-                for trial_detail_row in found_trials_details: # Iterate through rows
-                    plain_trial_detail = dict(trial_detail_row) # Convert row to dict
-                    task = asyncio.create_task(
-                        self._get_llm_assessment_for_trial(patient_context, plain_trial_detail) # Pass dict
-                    )
-                    llm_assessment_tasks.append(task)
-            else:
-                logging.warning("LLM client not initialized or no patient context provided. Skipping LLM assessment.")
+    def _not_assessed_result(self, report: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """ Placeholder assessment for trials the budget policy skipped (None when no LLM pass ran at all). """
+        if not report["assessed"]:
+            return None
+        return {
+            "overall_assessment": "Not Assessed (Reranker Budget)",
+            "narrative_summary": f"Skipped by the '{report['mode']}' assessment policy; ranked below the assessed trials.",
+        }
 
-            # --- 5. Gather LLM Results and Update Trial Details --- 
-            llm_results = []
-            if llm_assessment_tasks:
-                llm_results = await asyncio.gather(*llm_assessment_tasks)
-                logging.info(f"Completed LLM assessments processing for {len(llm_results)} tasks.")
-            
-            # Process results and add to trial details
-            final_trials_output = [] # Build a new list of plain dicts
-            for i, trial_detail_row in enumerate(found_trials_details):
-                trial_detail = dict(trial_detail_row) # Convert row to dict for processing
+    def _prompt_compression(self, patient_context: Dict[str, Any], llm_results: Iterable[Optional[Dict[str, Any]]]) -> Optional[Dict[str, Any]]:
+        """ Token savings of the compact profile over the full record, for the prompts this request sent. """
+        if not patient_context:
+            return None
+        prompts_sent = sum(1 for result in llm_results if result and result.get("prompt_tokens"))
+        return compression_report(self.profile_cache.get(patient_context), prompts_sent)
 
-                if 'interpreted_result' not in trial_detail:
-                    trial_detail['interpreted_result'] = {}
-                
-                llm_result_dict = llm_results[i] if i < len(llm_results) and llm_results[i] else None
-                
-                # --- Process based on the structure from the TEXT parser ---
-                # The text parser returns the nested dict under 'llm_eligibility_analysis' key
-                if llm_result_dict and llm_result_dict.get("llm_eligibility_analysis"):
-                    # Case 1: Successful parsing
-                    parsed_analysis = llm_result_dict["llm_eligibility_analysis"] # This is the dict built by the text parser
-                    eligibility_assessment_nested = parsed_analysis.get("eligibility_assessment", {}) # Get nested assessment
-
-                    trial_detail['interpreted_result']['llm_eligibility_analysis'] = parsed_analysis # Store the manually parsed dict
-                    # Extract summary from the correct nested location
-                    trial_detail['interpreted_result']['eligibility_assessment'] = eligibility_assessment_nested.get("eligibility_summary", "Assessment Incomplete") 
-                    # Extract patient summary from the correct top-level location
-                    trial_detail['interpreted_result']['narrative_summary'] = parsed_analysis.get("patient_specific_summary", "Summary not generated.") 
-
-                    # Extract unclear criteria from the correct nested location (built by parser)
-                    unclear_criteria_list = []
-                    unclear_items = eligibility_assessment_nested.get("unclear_criteria", [])
-                    if isinstance(unclear_items, list):
-                        for criterion in unclear_items:
-                             # The text parser puts dicts like {"criterion": "...", "reasoning": "..."} here
-                             if isinstance(criterion, dict) and "criterion" in criterion:
-                                 unclear_criteria_list.append(criterion["criterion"])
-                             elif isinstance(criterion, str): # Fallback if structure is unexpected
-                                 unclear_criteria_list.append(criterion)
-                    trial_detail['interpreted_result']['unclear_criteria'] = unclear_criteria_list # This is for UI display
-                    
-                    # --- Call suggester with the parsed nested assessment --- 
-                    try:
-                         logging.debug(f"Passing TEXT-PARSED eligibility assessment to suggester for {trial_detail.get('nct_id')}: {json.dumps(eligibility_assessment_nested, indent=2)}")
-                         suggestions = get_action_suggestions_for_trial(
-                             eligibility_assessment=eligibility_assessment_nested, # Pass the nested dict built by text parser
-                             patient_context=patient_context
-                         )
-                         logging.debug(f"Received suggestions from suggester for {trial_detail.get('nct_id')}: {suggestions}")
-                         trial_detail['interpreted_result']['action_suggestions'] = suggestions
-                    except Exception as suggester_err:
-                         logging.error(f"Error generating action suggestions for trial {trial_detail.get('nct_id', 'UNKNOWN')}: {suggester_err}", exc_info=True)
-                         trial_detail['interpreted_result']['action_suggestions'] = [] 
-                    
-                else: 
-                     # Case 2: Assessment skipped, failed, or text parsing error
-                     # Use the overall_assessment/narrative_summary from the error structure returned by _get_llm_assessment_for_trial
-                     trial_detail['interpreted_result']['llm_eligibility_analysis'] = None
-                     trial_detail['interpreted_result']['eligibility_assessment'] = llm_result_dict.get("overall_assessment", "Assessment Status Unknown") if llm_result_dict else "Not Assessed (No LLM Task)"
-                     trial_detail['interpreted_result']['narrative_summary'] = llm_result_dict.get("narrative_summary", "Assessment not performed or failed.") if llm_result_dict else "Assessment not performed."
-                     # Provide generic unclear criteria/suggestions on failure
-                     if "failed" in trial_detail['interpreted_result']['eligibility_assessment'].lower():
-                          trial_detail['interpreted_result']['unclear_criteria'] = ["Assessment failed, review criteria manually."]
-                     else: 
-                          trial_detail['interpreted_result']['unclear_criteria'] = ["Review criteria manually."]
-                     trial_detail['interpreted_result']['action_suggestions'] = []
-
-                final_trials_output.append(trial_detail) # Add the processed dict
+    async def run(self, context: Dict[str, Any] = None, **kwargs) -> Dict[str, Any]:
+        """ Executes the agent's logic: search trials, assess eligibility using TEXT LLM output. """
+        query = kwargs.get("prompt", "")
+        patient_context = self._extract_patient_context(context)
+        logging.info(f"ClinicalTrialAgent running. Query: '{query}'. Patient context provided: {bool(patient_context)}")
+
+        try:
+            found_trials_details, early_response = await self._search_candidates(query, kwargs.get("entities"))
+            if early_response is not None:
+                return early_response
+
+            # --- 4. Rerank against the patient and assess within the policy's budget ---
+            found_trials_details, policy, assessment_policy = await self._plan_assessments(
+                patient_context, found_trials_details, kwargs.get("assessment_policy"))
+            llm_results: Dict[int, Optional[Dict[str, Any]]] = {}
+            async with contextlib.aclosing(self._budgeted_assessments(patient_context, found_trials_details, policy, assessment_policy)) as assessments:
+                async for index, llm_result_dict in assessments:
+                    llm_results[index] = llm_result_dict
+            logging.info(f"LLM assessment policy: {assessment_policy}")
+            prompt_compression = self._prompt_compression(patient_context, llm_results.values())
+
+            # --- 5. Update Trial Details (assessed trials keep rerank order, skipped ones follow) ---
+            final_trials_output = []
+            not_assessed = self._not_assessed_result(assessment_policy)
+            for i, trial_detail in enumerate(found_trials_details):
+                llm_result_dict = llm_results[i] if i in llm_results else not_assessed
+                final_trials_output.append(self._build_interpreted_result(trial_detail, llm_result_dict, patient_context))
 
             # --- 6. Return Results --- 
             logging.info(f"Agent run completed successfully. Returning {len(final_trials_output)} trials.")
             return {
                 "status": "success", 
-                "output": { "found_trials": final_trials_output } 
+                "output": { "found_trials": final_trials_output, "assessment_policy": assessment_policy, "prompt_compression": prompt_compression }
             }
             
         except Exception as e:
             logging.error(f"Error in ClinicalTrialAgent run: {e}", exc_info=True)
             # Ensure a consistent error structure is returned
             return {"status": "error", "summary": f"An internal error occurred in the agent: {str(e)}", "output": {}}
-        finally:
-            if conn:
-                try:
-                    conn.close()
-                    logging.info("SQLite connection closed in agent run.")
-                except Exception as db_close_err:
-                     logging.error(f"Error closing SQLite connection: {db_close_err}")
     # --- End Run Method --- 
 
+    # --- Streaming Run --- 
+    async def run_streaming(self, context: Dict[str, Any] = None, **kwargs) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Streaming variant of run(). Yields events as soon as they are available:
+          {"event": "search_results", ...}  vector hits, before any LLM call
+          {"event": "trial_result", ...}    one per trial, in completion order
+          {"event": "complete", ...} or {"event": "error", ...}
+        """
+        query = kwargs.get("prompt", "")
+        patient_context = self._extract_patient_context(context)
+        logging.info(f"ClinicalTrialAgent streaming run. Query: '{query}'. Patient context provided: {bool(patient_context)}")
+        start_time = time.perf_counter()
+
+        try:
+            found_trials_details, early_response = await self._search_candidates(query, kwargs.get("entities"))
+        except Exception as e:
+            logging.error(f"Error in ClinicalTrialAgent streaming search: {e}", exc_info=True)
+            yield {"event": "error", "summary": f"An internal error occurred in the agent: {str(e)}"}
+            return
+
+        if early_response is not None:
+            if early_response.get("status") == "success":
+                yield {"event": "search_results", "found_trials": [], "summary": early_response.get("summary")}
+                yield {"event": "complete", "total": 0, "elapsed_seconds": round(time.perf_counter() - start_time, 3)}
+            else:
+                yield {"event": "error", "summary": early_response.get("summary")}
+            return
+
+        try:
+            found_trials_details, policy, assessment_policy = await self._plan_assessments(
+                patient_context, found_trials_details, kwargs.get("assessment_policy"))
+        except Exception as e:
+            logging.error(f"Error in ClinicalTrialAgent streaming rerank: {e}", exc_info=True)
+            yield {"event": "error", "summary": f"An internal error occurred in the agent: {str(e)}"}
+            return
+
+        yield {
+            "event": "search_results",
+            "found_trials": found_trials_details,
+            "assessment_policy": dict(assessment_policy),
+            "elapsed_seconds": round(time.perf_counter() - start_time, 3),
+        }
+
+        # Closing the iterator (client went away mid-stream) cancels in-flight LLM calls
+        assessed: Dict[int, Optional[Dict[str, Any]]] = {}
+        async with contextlib.aclosing(self._budgeted_assessments(patient_context, found_trials_details, policy, assessment_policy)) as assessments:
+            async for index, llm_result_dict in assessments:
+                assessed[index] = llm_result_dict
+                trial = self._build_interpreted_result(found_trials_details[index], llm_result_dict, patient_context)
+                yield {
+                    "event": "trial_result",
+                    "index": index,
+                    "nct_id": trial.get("nct_id"),
+                    "trial": trial,
+                    "elapsed_seconds": round(time.perf_counter() - start_time, 3),
+                }
+        not_assessed = self._not_assessed_result(assessment_policy)
+        for index, trial_detail in enumerate(found_trials_details):
+            if index not in assessed:
+                trial = self._build_interpreted_result(trial_detail, not_assessed, patient_context)
+                yield {"event": "trial_result", "index": index, "nct_id": trial.get("nct_id"), "trial": trial}
+
+        logging.info(f"Streaming run completed for {len(found_trials_details)} trials. Policy: {assessment_policy}")
+        yield {
+            "event": "complete",
+            "total": len(found_trials_details),
+            "assessment_policy": assessment_policy,
+            "prompt_compression": self._prompt_compression(patient_context, assessed.values()),
+            "elapsed_seconds": round(time.perf_counter() - start_time, 3),
+        }
+    # --- End Streaming Run --- 
+
 # Example Usage (for testing) - Keep commented out unless needed for direct testing
 # if __name__ == '__main__':
 #     import asyncio
@@ -2,7 +2,6 @@
 Agent responsible for analyzing patient data, generating summaries, and extracting insights.
 """
 
-import google.generativeai as genai
 import os
 import json
 from datetime import datetime
@@ -11,6 +10,7 @@ from typing import Any, Dict
 # Import the base agent interface and the LLM client
 from backend.core.agent_interface import AgentInterface
 from backend.core.llm_clients import GeminiClient
+from backend.core.llm_gateway import llm_gateway
 
 # Placeholder for Gemini/LangChain integration
 # from langchain_google_genai import ChatGoogleGenerativeAI
@@ -28,19 +28,14 @@ class DataAnalysisAgent(AgentInterface):
         self.api_key = os.getenv("GOOGLE_API_KEY")
         
         # Robust check for API Key after dotenv load
-        if not self.api_key:
-            raise ValueError("GOOGLE_API_KEY environment variable not set. "
+        if not llm_gateway.available:
+            raise ValueError(f"{llm_gateway.unavailable_reason}. "
                              "Ensure it is defined in the .env file in the 'backend' directory.")
 
-        # Configure the Gemini client
-        try:
-            genai.configure(api_key=self.api_key)
-            self.model = genai.GenerativeModel('gemini-1.5-flash')
-            print(f"DataAnalysisAgent Initialized with Gemini Client (Model: {self.model.model_name}).")
-        except Exception as e:
-             print(f"Error configuring Gemini client: {e}")
-             # Optionally re-raise or handle more gracefully depending on requirements
-             raise RuntimeError(f"Failed to initialize Gemini client: {e}")
+        # All Gemini calls go through the shared gateway
+        self.model_name = 'gemini-1.5-flash'
+        self.llm = llm_gateway
+        print(f"DataAnalysisAgent Initialized with shared LLM gateway (Model: {self.model_name}).")
         
         # Placeholder for the LLM setup (Implementation in step 2b)
         # self.llm = ChatGoogleGenerativeAI(model="gemini-pro", google_api_key=self.api_key)
@@ -84,7 +79,7 @@ class DataAnalysisAgent(AgentInterface):
         task = kwargs.get("task", "summarize")
 
         if task == "summarize":
-            if not self.model:
+            if not self.llm.available:
                 # Fallback to placeholder if API key/model is missing
                 print("Gemini model not available, using placeholder summary.")
                 placeholder_summary = self._generate_placeholder_summary(patient_data)
@@ -117,7 +112,7 @@ class DataAnalysisAgent(AgentInterface):
                     "summary": "Failed: No question prompt provided for answer_question task.", "error_message": "Missing prompt for question."
                 }
             
-            if not self.model:
+            if not self.llm.available:
                 # Fallback to placeholder if API key/model is missing
                 print("Gemini model not available, using placeholder answer.")
                 return {
@@ -181,16 +176,15 @@ Clinical Summary:
 
     async def _call_llm_for_summary(self, patient_data: dict) -> str:
         """ Calls the Gemini API to generate the summary. """
-        if not self.model:
-            raise RuntimeError("Gemini model not initialized. Check API key.")
+        if not self.llm.available:
+            raise RuntimeError("LLM gateway not available. Check API key.")
             
         prompt = self._generate_summary_prompt(patient_data)
         
         print("Sending summarization prompt to Gemini...")
         try:
             # Use generate_content_async for async FastAPI
-            response = await self.model.generate_content_async(prompt)
-            summary = response.text
+            summary = await self.llm.generate(prompt, model_name=self.model_name, caller=self.name)
             print("Received summary from Gemini.")
             return summary
         except Exception as e:
@@ -222,15 +216,14 @@ Answer:
 
     async def _call_llm_for_question(self, patient_data: dict, question: str) -> str:
         """ Calls the Gemini API to answer a specific question based on patient data. """
-        if not self.model:
-            raise RuntimeError("Gemini model not initialized. Check API key.")
+        if not self.llm.available:
+            raise RuntimeError("LLM gateway not available. Check API key.")
             
         prompt = self._generate_question_prompt(patient_data, question)
         
         print("Sending question prompt to Gemini...")
         try:
-            response = await self.model.generate_content_async(prompt)
-            answer = response.text
+            answer = await self.llm.generate(prompt, model_name=self.model_name, caller=self.name)
             print(f"Received answer from Gemini for question '{question}'.")
             return answer
         except Exception as e:
@@ -2,10 +2,13 @@ import logging
 from typing import List, Dict, Any, Optional, Tuple
 import re
 import json
-import google.generativeai as genai
 import os
 import asyncio
 
+from backend.core.llm_gateway import llm_gateway
+from backend.core.criteria_index import CriteriaIndex, evaluate_atom, normalize_criterion_text
+from backend.core.patient_repository import patient_repository, project_record
+
 # Attempt to import the interface, handle if not found for now
 try:
     from ..core.agent_interface import AgentInterface
@@ -133,6 +136,12 @@ DEFAULT_LLM_GENERATION_CONFIG = {
 }
 # --- End Constants ---
 
+# Patient sections (and list lengths) sent to the LLM with each criterion
+DEEP_DIVE_SECTIONS = (
+    "demographics", "diagnosis", "medicalHistory", "currentMedications", "allergies", "recentLabs", "notes", "mutations",
+)
+DEEP_DIVE_LIMITS = {"medicalHistory": 5, "currentMedications": 5, "recentLabs": 3, "notes": 2}
+
 # Attempt to import the specific agent, handle if not found
 try:
     from .genomic_analyst_agent import GenomicAnalystAgent, GenomicAnalysisResult
@@ -159,25 +168,18 @@ class EligibilityDeepDiveAgent(AgentInterface):
         # Call super().__init__() - No need to set name/desc here now
         super().__init__() 
         
-        # Initialize only the LLM client here
+        # LLM calls go through the shared gateway (rate limits, retries, coalescing)
         self.llm_client = None
-        if GOOGLE_API_KEY:
-            try:
-                genai.configure(api_key=GOOGLE_API_KEY)
-                self.llm_client = genai.GenerativeModel(
-                    LLM_MODEL_NAME,
-                    # system_instruction="You are an expert clinical research assistant..." # Add if needed
-                )
-                # Use self.name (the property) in logging
-                logging.info(f"[{self.name}] Google GenAI client initialized successfully with model {LLM_MODEL_NAME}.") 
-            except Exception as e:
-                 # Use self.name (the property) in logging
-                logging.error(f"[{self.name}] Failed to initialize Google GenAI client: {e}", exc_info=True)
+        if llm_gateway.available:
+            self.llm_client = llm_gateway
+            logging.info(f"[{self.name}] Using shared LLM gateway with model {LLM_MODEL_NAME}.")
         else:
              # Use self.name (the property) in logging
-            logging.error(f"[{self.name}] GOOGLE_API_KEY environment variable not set. LLM features will be disabled.")
+            logging.error(f"[{self.name}] {llm_gateway.unavailable_reason}. LLM features will be disabled.")
+        # Atomized criteria let deterministic thresholds (age, ECOG, labs) skip the LLM entirely
+        self.criteria_index = CriteriaIndex()
 
-    async def _analyze_single_criterion_async(self, criterion: str, original_reasoning: str, patient_data: Dict[str, Any], trial_id: str) -> Dict[str, Any]:
+    async def _analyze_single_criterion_async(self, criterion: str, original_reasoning: str, patient_data: Dict[str, Any], trial_id: str, atom: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
         """Analyzes a single criterion asynchronously, using original reasoning context."""
         result = {
             "criterion": criterion,
@@ -186,6 +188,17 @@ class EligibilityDeepDiveAgent(AgentInterface):
             "analysis_source": "Standard LLM" # Default source
         }
 
+        # --- Deterministic criteria are decided locally when the data is there ---
+        local_result = evaluate_atom(atom, patient_data) if atom else None
+        if local_result:
+            logging.debug(f"[{self.name}:{trial_id}] Decided locally: {local_result['status']} for {criterion[:80]}...")
+            result.update({
+                "status": local_result["status"],
+                "evidence": local_result["reasoning"],
+                "analysis_source": local_result["analysis_source"],
+            })
+            return result
+
         # --- Refined Genomic Criterion Detection ---
         is_genomic_criterion = False
         # Keywords indicating a request for genomic status/test results
@@ -319,35 +332,16 @@ class EligibilityDeepDiveAgent(AgentInterface):
             REASONING: Initial reasoning stated 'Allergy info missing'. The snippet shows an allergy to Penicillin, which is listed as an exclusion.
             """
 
-            # --- FIX: Use generate_content_async ---
             if not self.llm_client:
                  raise ValueError("LLM Client not initialized")
                  
-            response = await self.llm_client.generate_content_async(
+            response_text = await self.llm_client.generate(
                 prompt,
+                model_name=LLM_MODEL_NAME,
+                caller=self.name,
                 generation_config=DEFAULT_LLM_GENERATION_CONFIG,
                 safety_settings=SAFETY_SETTINGS
             )
-            # --- End FIX ---
-            
-            # --- Extract Text Safely (reuse logic from previous versions if needed) --- 
-            response_text = ""
-            try:
-                # Standard way to get text from Gemini response
-                if response.parts:
-                    response_text = response.parts[0].text
-                elif hasattr(response, 'text'):
-                     response_text = response.text # Fallback for simpler text responses
-                else:
-                    logging.warning(f"[EligibilityDeepDiveAgent:{trial_id}] LLM Response structure unexpected or no text content found for criterion: {criterion[:80]}. Blocked? Resp: {response}")
-                    response_text = "Error: LLM response structure invalid or missing text."
-            except AttributeError:
-                 logging.warning(f"[EligibilityDeepDiveAgent:{trial_id}] LLM Response object missing .text/.parts attribute for criterion: {criterion[:80]}. Blocked? Resp: {response}")
-                 response_text = "Error: LLM response blocked or attribute missing."
-            except Exception as text_ex:
-                 logging.error(f"[EligibilityDeepDiveAgent:{trial_id}] Error extracting text from LLM response: {text_ex}", exc_info=True)
-                 response_text = f"Error extracting text: {text_ex}"
-            # --- End Text Extraction ---
 
             logging.debug(f"[{self.name}:{trial_id}] Raw LLM response for standard criterion: {response_text[:150]}...")
 
@@ -399,20 +393,22 @@ class EligibilityDeepDiveAgent(AgentInterface):
                 "error": "LLM client not initialized"
             }
 
-        # --- Prepare Patient Data Snippet (Same as before) ---
-        # This snippet is passed to the LLM for each criterion.
-        # For now, it includes key sections. Could be made more dynamic.
-        patient_data_snippet = {
-            "patientId": patient_data.get("patientId"),
-            "diagnosis": patient_data.get("diagnosis"),
-            "medicalHistory": patient_data.get("medicalHistory", [])[:5], # Limit for brevity
-            "currentMedications": patient_data.get("currentMedications", [])[:5],
-            "allergies": patient_data.get("allergies", []), # ADDED allergies
-            "recentLabs": patient_data.get("recentLabs", [])[:3], # Limit recent labs
-            "notes": [note.get("text") for note in patient_data.get("notes", [])[:2]], # Only text of first 2 notes
-            # NEW: Include mutations if available
-            "mutations": patient_data.get("mutations", []) # Include all mutations for this patient
+        # --- Prepare Patient Data Snippet ---
+        # This snippet is passed to the LLM for each criterion, so it carries only the sections it needs.
+        if not patient_data.get("mutations") and patient_data.get("patientId"):
+            # Clients rarely send mutations; fall back to the stored ones
+            try:
+                stored = await patient_repository.get(patient_data["patientId"], sections=("mutations",))
+            except Exception as e:
+                logging.warning(f"[{self.name}:{trial_id}] Could not load stored mutations: {e}")
+                stored = None
+            if stored and stored.get("mutations"):
+                patient_data = {**patient_data, "mutations": stored["mutations"]}
+        patient_data_snippet = project_record(patient_data, DEEP_DIVE_SECTIONS, DEEP_DIVE_LIMITS)
+        patient_data_snippet["demographics"] = {
+            k: v for k, v in (patient_data_snippet.get("demographics") or {}).items() if k in ("dob", "age", "sex")
         }
+        patient_data_snippet["notes"] = [note.get("text") for note in patient_data_snippet.get("notes") or []]
         # Remove empty sections from the snippet to keep the prompt clean
         patient_data_snippet = {k: v for k, v in patient_data_snippet.items() if v}
         # --- End Snippet Prep ---
@@ -430,6 +426,10 @@ class EligibilityDeepDiveAgent(AgentInterface):
                 "strategic_next_steps": []
             }
 
+        # --- Match submitted criteria to indexed atoms (by normalized text) ---
+        atoms = await asyncio.to_thread(self.criteria_index.atoms_for_trial, trial_data)
+        atoms_by_text = {normalize_criterion_text(a["text"]): a for a in atoms}
+
         # --- Create tasks for concurrent execution (Same as before) ---
         tasks = []
         for item in all_criteria_to_analyze:
@@ -442,7 +442,8 @@ class EligibilityDeepDiveAgent(AgentInterface):
                     criterion=criterion_text,
                     original_reasoning=original_reasoning_text, # Pass the extracted reasoning
                     patient_data=patient_data_snippet, 
-                    trial_id=trial_id
+                    trial_id=trial_id,
+                    atom=atoms_by_text.get(normalize_criterion_text(criterion_text))
                 ))
             else:
                 logging.warning(f"[{self.name}:{trial_id}] Found item without 'criterion' text: {item}")
@@ -651,32 +652,16 @@ class EligibilityDeepDiveAgent(AgentInterface):
                 ```
                 """
 
-                # --- Make LLM call (using existing safe extraction logic) ---
+                # --- Make LLM call (via shared gateway) ---
                 logging.debug(f"[{self.name}:{trial_id}] Sending refined prompt to LLM for strategic next steps...")
-                # Assume generate_content_async is preferred/available
-                next_steps_response = await self.llm_client.generate_content_async(
+                raw_next_steps_text = await self.llm_client.generate(
                     next_steps_prompt,
+                    model_name=LLM_MODEL_NAME,
+                    caller=self.name,
                     generation_config=DEFAULT_LLM_GENERATION_CONFIG,
                     safety_settings=SAFETY_SETTINGS
                 )
 
-                raw_next_steps_text = ""
-                try:
-                    # Standard way to get text from Gemini response
-                    if next_steps_response.parts:
-                        raw_next_steps_text = next_steps_response.parts[0].text
-                    elif hasattr(next_steps_response, 'text'):
-                         raw_next_steps_text = next_steps_response.text # Fallback for simpler text responses
-                    else:
-                        logging.warning(f"[{self.name}:{trial_id}] Next steps LLM Response structure unexpected or no text content found. Blocked? Resp: {next_steps_response}")
-                        raw_next_steps_text = "Error: LLM response structure invalid or missing text."
-                except AttributeError:
-                     logging.warning(f"[{self.name}:{trial_id}] Next steps LLM Response object missing .text/.parts attribute. Blocked? Resp: {next_steps_response}")
-                     raw_next_steps_text = "Error: LLM response blocked or attribute missing."
-                except Exception as text_ex:
-                     logging.error(f"[{self.name}:{trial_id}] Error extracting text from next steps LLM response: {text_ex}", exc_info=True)
-                     raw_next_steps_text = f"Error extracting text: {text_ex}"
-
                 logging.debug(f"[{self.name}:{trial_id}] Raw next steps response: {raw_next_steps_text[:500]}...")
 
                 # --- Parse JSON response (using existing safe parsing logic) ---
@@ -5,10 +5,10 @@ Agent responsible for drafting and sending notifications.
 import json
 import os
 from typing import Any, Dict, Optional
-import google.generativeai as genai
 
 # Import the base class
 from backend.core.agent_interface import AgentInterface
+from backend.core.llm_gateway import llm_gateway
 from backend.core.llm_clients import GeminiClient
 
 # Placeholder for potential future integrations (e.g., secure messaging API client)
@@ -19,17 +19,14 @@ class NotificationAgent(AgentInterface):
     def __init__(self):
         """ Initialize the notification agent and Gemini model. """
         self.api_key = os.getenv("GOOGLE_API_KEY")
-        if not self.api_key:
+        if not llm_gateway.available:
             # This assumes the key is mandatory for this agent to function
-            raise ValueError("NotificationAgent requires GOOGLE_API_KEY environment variable.")
+            raise ValueError(f"NotificationAgent requires an LLM: {llm_gateway.unavailable_reason}.")
         
-        # Configure Gemini client (assuming genai.configure was called globally or handle errors)
-        try:
-            # Using flash for potentially faster drafting tasks
-            self.model = genai.GenerativeModel('gemini-1.5-flash') 
-            print("NotificationAgent Initialized with Gemini Client.")
-        except Exception as e:
-            raise RuntimeError(f"Failed to initialize Gemini client for NotificationAgent: {e}")
+        # Gemini calls go through the shared gateway; flash for faster drafting tasks
+        self.model_name = 'gemini-1.5-flash'
+        self.llm = llm_gateway
+        print("NotificationAgent Initialized with shared LLM gateway.")
         
         print("NotificationAgent Initialization complete.")
 
@@ -156,15 +153,15 @@ JSON Response:
 
     async def _call_llm_for_drafting(self, recipient: str, patient_name: str, context_info: str, condition: str, urgency: str) -> str:
         """ Calls the Gemini API to draft the notification. """
-        if not self.model:
-            raise RuntimeError("NotificationAgent: Gemini model not initialized.")
+        if not self.llm.available:
+            raise RuntimeError("NotificationAgent: LLM gateway not available.")
 
         prompt = self._generate_drafting_prompt(recipient, patient_name, context_info, condition, urgency)
 
         print("Sending notification drafting prompt to Gemini...")
         try:
-            response = await self.model.generate_content_async(prompt)
-            drafted_text = response.text.strip().replace("`json", "").replace("```", "")
+            response_text = await self.llm.generate(prompt, model_name=self.model_name, caller=self.name)
+            drafted_text = response_text.strip().replace("`json", "").replace("```", "")
             print(f"Received raw drafted content from Gemini: {drafted_text}")
             return drafted_text
         except Exception as e:
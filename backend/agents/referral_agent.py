@@ -7,10 +7,10 @@ import os
 from datetime import datetime
 from typing import Any, Dict
 
-import google.generativeai as genai
 
 # Import the base class
 from backend.core.agent_interface import AgentInterface
+from backend.core.llm_gateway import llm_gateway
 
 class ReferralAgent(AgentInterface):
     """ Drafts referral letters using Gemini based on context and user request. """
@@ -18,16 +18,13 @@ class ReferralAgent(AgentInterface):
     def __init__(self):
         """ Initialize the referral agent and Gemini model. """
         self.api_key = os.getenv("GOOGLE_API_KEY")
-        if not self.api_key:
-            raise ValueError("ReferralAgent requires GOOGLE_API_KEY environment variable.")
+        if not llm_gateway.available:
+            raise ValueError(f"ReferralAgent requires an LLM: {llm_gateway.unavailable_reason}.")
         
-        # Configure Gemini client (assuming genai.configure was called globally)
-        try:
-            # Using flash for potentially faster drafting tasks
-            self.model = genai.GenerativeModel('gemini-1.5-flash') 
-            print("ReferralAgent Initialized with Gemini Client.")
-        except Exception as e:
-            raise RuntimeError(f"Failed to initialize Gemini client for ReferralAgent: {e}")
+        # Gemini calls go through the shared gateway; flash for faster drafting tasks
+        self.model_name = 'gemini-1.5-flash'
+        self.llm = llm_gateway
+        print("ReferralAgent Initialized with shared LLM gateway.")
         
         print("ReferralAgent Initialization complete.")
 
@@ -54,7 +51,7 @@ class ReferralAgent(AgentInterface):
 
         # Extract referral details
         recipient_specialty = entities.get("recipient_specialty", entities.get("recipient", "Specialist"))
-        reason = entities.get("reason_for_referral", entities.get("specific_condition", "evaluation"))
+        reason = entities.get("reason_for_referral", entities.get("reason", entities.get("specific_condition", "evaluation")))
         urgency = entities.get("urgency", "Routine")
 
         try:
@@ -175,15 +172,15 @@ You are a helpful clinical assistant AI specializing in oncology. Your task is t
 
     async def _call_llm_for_referral_draft(self, patient_data: dict, recipient_specialty: str, reason_for_referral: str, urgency: str, original_request: str) -> str:
         """ Calls the Gemini API to draft the referral letter. """
-        if not self.model:
-            raise RuntimeError("ReferralAgent: Gemini model not initialized.")
+        if not self.llm.available:
+            raise RuntimeError("ReferralAgent: LLM gateway not available.")
 
         prompt = self._generate_referral_drafting_prompt(patient_data, recipient_specialty, reason_for_referral, urgency, original_request)
 
         print("Sending referral drafting prompt to Gemini...")
         try:
-            response = await self.model.generate_content_async(prompt)
-            drafted_text = response.text.strip() # Basic strip is enough here
+            response_text = await self.llm.generate(prompt, model_name=self.model_name, caller=self.name)
+            drafted_text = response_text.strip() # Basic strip is enough here
             print(f"Received raw drafted referral content from Gemini: {drafted_text}")
             return drafted_text
         except Exception as e:
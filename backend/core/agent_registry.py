@@ -0,0 +1,139 @@
+"""
+Process-wide registry of long-lived agent instances.
+
+Agents that own expensive resources (embedding models, vector DB handles,
+LLM clients) are created once per worker and shared by every request
+instead of being rebuilt per call.
+"""
+
+import asyncio
+import inspect
+import logging
+import threading
+import time
+from typing import Any, Callable, Dict, Optional
+
+
+class AgentRegistry:
+    """ Creates, warms up and hands out shared agent instances. """
+
+    def __init__(self):
+        self._factories: Dict[str, Callable[[], Any]] = {}
+        self._instances: Dict[str, Any] = {}
+        self._errors: Dict[str, str] = {}
+        self._warmup_seconds: Dict[str, float] = {}
+        # Guards lazy creation; get() can be called from the event loop or worker threads
+        self._lock = threading.Lock()
+        self._started = False
+
+    def register(self, name: str, factory: Callable[[], Any]) -> None:
+        """ Registers a zero-argument factory (usually the agent class) under a name. """
+        with self._lock:
+            if name in self._factories:
+                logging.debug(f"[AgentRegistry] Agent '{name}' already registered, keeping existing factory.")
+                return
+            self._factories[name] = factory
+            logging.info(f"[AgentRegistry] Registered agent factory: {name}")
+
+    def is_registered(self, name: str) -> bool:
+        return name in self._factories
+
+    def get(self, name: str) -> Optional[Any]:
+        """
+        Returns the shared instance for `name`, creating it on first use.
+        Returns None if the agent is unknown or its construction failed.
+        """
+        instance = self._instances.get(name)
+        if instance is not None:
+            return instance
+
+        with self._lock:
+            # Double-checked: another caller may have created it while we waited
+            instance = self._instances.get(name)
+            if instance is not None:
+                return instance
+            factory = self._factories.get(name)
+            if factory is None:
+                logging.warning(f"[AgentRegistry] Requested unknown agent '{name}'.")
+                return None
+            try:
+                start = time.perf_counter()
+                instance = factory()
+                self._instances[name] = instance
+                self._errors.pop(name, None)
+                logging.info(f"[AgentRegistry] Created agent '{name}' in {time.perf_counter() - start:.2f}s")
+                return instance
+            except Exception as e:
+                logging.error(f"[AgentRegistry] Failed to create agent '{name}': {e}", exc_info=True)
+                self._errors[name] = str(e)
+                return None
+
+    async def startup(self) -> None:
+        """ Instantiates and warms up every registered agent off the event loop. """
+        for name in list(self._factories):
+            instance = await asyncio.to_thread(self.get, name)
+            if instance is None:
+                continue
+            warmup = getattr(instance, "warmup", None)
+            if not callable(warmup):
+                continue
+            try:
+                start = time.perf_counter()
+                if inspect.iscoroutinefunction(warmup):
+                    await warmup()
+                else:
+                    await asyncio.to_thread(warmup)
+                self._warmup_seconds[name] = time.perf_counter() - start
+                logging.info(f"[AgentRegistry] Warmed up '{name}' in {self._warmup_seconds[name]:.2f}s")
+            except Exception as e:
+                # A failed warmup is not fatal, the agent will just be cold on first use
+                logging.warning(f"[AgentRegistry] Warmup failed for '{name}': {e}", exc_info=True)
+                self._errors[name] = f"warmup failed: {e}"
+        self._started = True
+
+    async def shutdown(self) -> None:
+        """ Calls close() on agents that define it and drops all instances. """
+        for name, instance in list(self._instances.items()):
+            close = getattr(instance, "close", None)
+            if not callable(close):
+                continue
+            try:
+                result = close()
+                if inspect.isawaitable(result):
+                    await result
+            except Exception as e:
+                logging.warning(f"[AgentRegistry] Error closing agent '{name}': {e}")
+        with self._lock:
+            self._instances.clear()
+            self._warmup_seconds.clear()
+        self._started = False
+
+    def health(self) -> Dict[str, Any]:
+        """ Reports load/warmup state for each registered agent. """
+        agents = {}
+        for name in self._factories:
+            instance = self._instances.get(name)
+            details = None
+            agent_health = getattr(instance, "health", None)
+            if callable(agent_health):
+                try:
+                    details = agent_health()
+                except Exception as e:
+                    details = {"error": str(e)}
+            agents[name] = {
+                "loaded": instance is not None,
+                "warmed": name in self._warmup_seconds,
+                "warmup_seconds": round(self._warmup_seconds[name], 3) if name in self._warmup_seconds else None,
+                "error": self._errors.get(name),
+                "details": details,
+            }
+        healthy = all(a["loaded"] and not a["error"] for a in agents.values())
+        return {
+            "status": "ok" if healthy else "degraded",
+            "started": self._started,
+            "agents": agents,
+        }
+
+
+# Singleton instance
+agent_registry = AgentRegistry()
@@ -0,0 +1,147 @@
+"""
+SQLite-backed store of parsed per-(patient, trial) eligibility assessments.
+
+Each row remembers the hashes of the inputs that produced it: the patient
+profile, the trial criteria and the prompt template version. A lookup whose
+current hashes do not match the stored ones deletes the row and reports a
+miss, so edits to any of the three invalidate the cached result.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Optional
+
+DEFAULT_ASSESSMENT_DB_PATH = "backend/db/assessments.db"
+
+
+def content_hash(value: Any) -> str:
+    """ Stable sha256 of a JSON-serializable value (dict keys sorted). """
+    payload = json.dumps(value, sort_keys=True, default=str, ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def prompt_version(label: str, template: str) -> str:
+    """ Combines a human-readable label with a hash of the template text, so any edit bumps the version. """
+    return f"{label}:{hashlib.sha256(template.encode('utf-8')).hexdigest()[:12]}"
+
+
+class AssessmentStore:
+    """ Persistent cache of parsed LLM eligibility assessments. """
+
+    def __init__(self, db_path: str = DEFAULT_ASSESSMENT_DB_PATH):
+        self.db_path = db_path
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        try:
+            directory = os.path.dirname(db_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._conn = sqlite3.connect(db_path, check_same_thread=False)
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS trial_assessments (
+                    trial_id TEXT NOT NULL,
+                    patient_ref TEXT NOT NULL,
+                    patient_hash TEXT NOT NULL,
+                    criteria_hash TEXT NOT NULL,
+                    prompt_version TEXT NOT NULL,
+                    assessment_json TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    PRIMARY KEY (trial_id, patient_ref)
+                )
+            """)
+            self._conn.commit()
+            logging.info(f"[AssessmentStore] Using assessment cache at {db_path}")
+        except sqlite3.Error as e:
+            logging.error(f"[AssessmentStore] Could not open assessment cache at {db_path}: {e}. Caching disabled.")
+            self._conn = None
+
+    @property
+    def available(self) -> bool:
+        return self._conn is not None
+
+    def get(self, trial_id: str, patient_ref: str, patient_hash: str,
+            criteria_hash: str, version: str) -> Optional[Dict[str, Any]]:
+        """ Returns the stored assessment if all input hashes still match, otherwise None. """
+        if not self._conn:
+            return None
+        with self._lock:
+            try:
+                row = self._conn.execute(
+                    "SELECT patient_hash, criteria_hash, prompt_version, assessment_json "
+                    "FROM trial_assessments WHERE trial_id = ? AND patient_ref = ?",
+                    (trial_id, patient_ref),
+                ).fetchone()
+                if row is None:
+                    self.misses += 1
+                    return None
+                if row[0] != patient_hash or row[1] != criteria_hash or row[2] != version:
+                    self._conn.execute(
+                        "DELETE FROM trial_assessments WHERE trial_id = ? AND patient_ref = ?",
+                        (trial_id, patient_ref),
+                    )
+                    self._conn.commit()
+                    self.invalidations += 1
+                    self.misses += 1
+                    logging.info(f"[AssessmentStore] Invalidated stale assessment for {trial_id}/{patient_ref}")
+                    return None
+                self.hits += 1
+                return json.loads(row[3])
+            except (sqlite3.Error, ValueError) as e:
+                logging.warning(f"[AssessmentStore] Lookup failed for {trial_id}/{patient_ref}: {e}")
+                self.misses += 1
+                return None
+
+    def put(self, trial_id: str, patient_ref: str, patient_hash: str,
+            criteria_hash: str, version: str, assessment: Dict[str, Any]) -> None:
+        """ Stores (or replaces) the assessment for a patient/trial pair. """
+        if not self._conn:
+            return
+        with self._lock:
+            try:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO trial_assessments "
+                    "(trial_id, patient_ref, patient_hash, criteria_hash, prompt_version, assessment_json, created_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (trial_id, patient_ref, patient_hash, criteria_hash, version,
+                     json.dumps(assessment, default=str), time.time()),
+                )
+                self._conn.commit()
+            except sqlite3.Error as e:
+                logging.warning(f"[AssessmentStore] Failed to store assessment for {trial_id}/{patient_ref}: {e}")
+
+    def purge_other_versions(self, version: str) -> int:
+        """ Deletes every row produced by a different prompt version. Returns the number removed. """
+        if not self._conn:
+            return 0
+        with self._lock:
+            try:
+                cursor = self._conn.execute("DELETE FROM trial_assessments WHERE prompt_version != ?", (version,))
+                self._conn.commit()
+                if cursor.rowcount:
+                    self.invalidations += cursor.rowcount
+                    logging.info(f"[AssessmentStore] Purged {cursor.rowcount} assessments from older prompt versions.")
+                return cursor.rowcount
+            except sqlite3.Error as e:
+                logging.warning(f"[AssessmentStore] Failed to purge old prompt versions: {e}")
+                return 0
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "db_path": self.db_path if self._conn else None,
+            "hits": self.hits,
+            "misses": self.misses,
+            "invalidations": self.invalidations,
+        }
+
+    def close(self) -> None:
+        if self._conn:
+            self._conn.close()
+            self._conn = None
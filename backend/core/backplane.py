@@ -0,0 +1,420 @@
+"""
+Pub/sub backplane for fanning WebSocket traffic out across workers.
+
+Each uvicorn worker has its own `ConnectionManager`, so a room broadcast or a
+user-targeted message only reaches sockets held by the worker that sent it.
+A backplane connects the workers: a manager subscribes to `room:<id>` /
+`user:<id>` channels while it has local members, publishes what it sends,
+and delivers what other workers publish to its own sockets.
+
+Implementations:
+- `InMemoryBackplane`: managers sharing an `InMemoryHub` in one process
+  (tests, single-worker dev). Does not cross process boundaries.
+- `RedisBackplane`: speaks the Redis pub/sub protocol (RESP) over plain
+  asyncio streams, so it needs no client library. Works against Redis,
+  or against `LocalPubSubServer` (a small stand-in for tests and dev:
+  `python -m backend.core.backplane --port 6390`).
+
+`create_backplane()` picks one from `WS_BACKPLANE_URL`
+("memory://" or "redis://[:password@]host:port"); unset means no backplane.
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import socket
+import uuid
+from abc import ABC, abstractmethod
+from typing import Any, Awaitable, Callable, Dict, Optional, Set
+from urllib.parse import urlparse
+
+BACKPLANE_URL = os.getenv("WS_BACKPLANE_URL", "")
+RECONNECT_DELAY_SECONDS = 0.5
+MAX_RECONNECT_DELAY_SECONDS = 10.0
+
+MessageHandler = Callable[[str, str], Awaitable[None]]
+
+
+def new_worker_id() -> str:
+    """ Unique per manager: host, pid and a random suffix. """
+    return f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+
+class Backplane(ABC):
+    """ Channel pub/sub between workers. Payloads are strings (JSON envelopes). """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.channels: Set[str] = set()  # Channels this worker is subscribed to
+
+    @abstractmethod
+    async def start(self, handler: MessageHandler) -> None:
+        """ Connects and starts delivering messages for subscribed channels to `handler(channel, data)`. """
+        pass
+
+    @abstractmethod
+    async def publish(self, channel: str, data: str) -> int:
+        """ Publishes `data`; returns how many subscribers (including this one) received it. """
+        pass
+
+    @abstractmethod
+    def subscribe(self, channel: str) -> None:
+        """ Starts receiving `channel`. Non-blocking so it can be called from sync bookkeeping. """
+        pass
+
+    @abstractmethod
+    def unsubscribe(self, channel: str) -> None:
+        pass
+
+    @abstractmethod
+    async def close(self) -> None:
+        pass
+
+    def is_subscribed(self, channel: str) -> bool:
+        return channel in self.channels
+
+    def stats(self) -> Dict[str, Any]:
+        return {"backend": self.name, "channels": len(self.channels)}
+
+
+# --- In-memory ---
+
+class InMemoryHub:
+    """ Channel registry shared by the in-memory backplanes of one process. """
+
+    def __init__(self):
+        self.channels: Dict[str, Set["InMemoryBackplane"]] = {}
+
+    def publish(self, channel: str, data: str) -> int:
+        subscribers = self.channels.get(channel, ())
+        for backplane in subscribers:
+            backplane.inbox.put_nowait((channel, data))
+        return len(subscribers)
+
+
+default_hub = InMemoryHub()
+
+
+class InMemoryBackplane(Backplane):
+    def __init__(self, hub: Optional[InMemoryHub] = None):
+        super().__init__("memory")
+        self.hub = hub or default_hub
+        self.inbox: asyncio.Queue = asyncio.Queue()
+        self._reader: Optional[asyncio.Task] = None
+
+    async def start(self, handler: MessageHandler) -> None:
+        self._reader = asyncio.create_task(self._read(handler))
+
+    async def _read(self, handler: MessageHandler) -> None:
+        # One reader per backplane keeps delivery in publish order
+        while True:
+            channel, data = await self.inbox.get()
+            try:
+                await handler(channel, data)
+            except Exception as e:
+                logging.error(f"[Backplane] Handler failed for '{channel}': {e}")
+
+    async def publish(self, channel: str, data: str) -> int:
+        return self.hub.publish(channel, data)
+
+    def subscribe(self, channel: str) -> None:
+        self.channels.add(channel)
+        self.hub.channels.setdefault(channel, set()).add(self)
+
+    def unsubscribe(self, channel: str) -> None:
+        self.channels.discard(channel)
+        subscribers = self.hub.channels.get(channel)
+        if subscribers is not None:
+            subscribers.discard(self)
+            if not subscribers:
+                del self.hub.channels[channel]
+
+    async def close(self) -> None:
+        for channel in list(self.channels):
+            self.unsubscribe(channel)
+        if self._reader is not None:
+            self._reader.cancel()
+            try:
+                await self._reader
+            except asyncio.CancelledError:
+                pass
+            self._reader = None
+
+
+# --- Redis protocol (RESP) ---
+
+class RespError(Exception):
+    """ Error reply from the pub/sub server. """
+
+
+def _bulk(value: Any) -> bytes:
+    data = value if isinstance(value, bytes) else str(value).encode("utf-8")
+    return b"$%d\r\n%s\r\n" % (len(data), data)
+
+
+def encode_command(*args: Any) -> bytes:
+    return b"*%d\r\n" % len(args) + b"".join(_bulk(arg) for arg in args)
+
+
+async def read_reply(reader: asyncio.StreamReader) -> Any:
+    """ Reads one RESP value. Bulk strings come back as bytes, errors as `RespError` instances. """
+    line = await reader.readline()
+    if not line:
+        raise ConnectionError("Connection closed by server")
+    kind, body = line[:1], line[1:-2]
+    if kind == b"+":
+        return body.decode("utf-8")
+    if kind == b"-":
+        return RespError(body.decode("utf-8"))
+    if kind == b":":
+        return int(body)
+    if kind == b"$":
+        length = int(body)
+        if length < 0:
+            return None
+        return (await reader.readexactly(length + 2))[:-2]
+    if kind == b"*":
+        count = int(body)
+        if count < 0:
+            return None
+        return [await read_reply(reader) for _ in range(count)]
+    raise ConnectionError(f"Unexpected RESP line: {line[:40]!r}")
+
+
+class RedisBackplane(Backplane):
+    """ Redis pub/sub over two connections: one for PUBLISH, one in subscriber mode. """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 6379, password: Optional[str] = None):
+        super().__init__("redis")
+        self.host = host
+        self.port = port
+        self.password = password
+        self._handler: Optional[MessageHandler] = None
+        self._pub: Optional[tuple] = None
+        self._pub_lock = asyncio.Lock()
+        self._sub_writer: Optional[asyncio.StreamWriter] = None
+        self._sub_ready = asyncio.Event()
+        self._reader_task: Optional[asyncio.Task] = None
+        self._closed = False
+        self.reconnects = 0
+
+    @classmethod
+    def from_url(cls, url: str) -> "RedisBackplane":
+        parsed = urlparse(url)
+        return cls(host=parsed.hostname or "127.0.0.1", port=parsed.port or 6379, password=parsed.password)
+
+    async def _open(self):
+        reader, writer = await asyncio.open_connection(self.host, self.port)
+        if self.password:
+            writer.write(encode_command("AUTH", self.password))
+            reply = await read_reply(reader)
+            if isinstance(reply, RespError):
+                writer.close()
+                raise reply
+        return reader, writer
+
+    async def start(self, handler: MessageHandler) -> None:
+        self._handler = handler
+        reader, writer = await self._open()
+        self._attach_subscriber(writer)
+        self._reader_task = asyncio.create_task(self._read_loop(reader))
+        logging.info(f"[Backplane] Connected to redis://{self.host}:{self.port}")
+
+    def _attach_subscriber(self, writer: asyncio.StreamWriter) -> None:
+        self._sub_writer = writer
+        if self.channels:
+            writer.write(encode_command("SUBSCRIBE", *sorted(self.channels)))
+        self._sub_ready.set()
+
+    async def _read_loop(self, reader: asyncio.StreamReader) -> None:
+        delay = RECONNECT_DELAY_SECONDS
+        while not self._closed:
+            try:
+                while True:
+                    reply = await read_reply(reader)
+                    if isinstance(reply, list) and len(reply) == 3 and reply[0] == b"message":
+                        channel, data = reply[1].decode("utf-8"), reply[2].decode("utf-8")
+                        try:
+                            await self._handler(channel, data)
+                        except Exception as e:
+                            logging.error(f"[Backplane] Handler failed for '{channel}': {e}")
+                    elif isinstance(reply, RespError):
+                        logging.error(f"[Backplane] Subscriber error: {reply}")
+                    delay = RECONNECT_DELAY_SECONDS
+            except asyncio.CancelledError:
+                raise
+            except (ConnectionError, OSError, asyncio.IncompleteReadError) as e:
+                if self._closed:
+                    return
+                self._sub_ready.clear()
+                logging.warning(f"[Backplane] Subscriber connection lost ({e}); reconnecting in {delay:.1f}s")
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, MAX_RECONNECT_DELAY_SECONDS)
+                try:
+                    reader, writer = await self._open()
+                except (ConnectionError, OSError, RespError) as reconnect_error:
+                    logging.warning(f"[Backplane] Reconnect failed: {reconnect_error}")
+                    continue
+                self.reconnects += 1
+                self._attach_subscriber(writer)  # Re-subscribes every tracked channel
+
+    async def publish(self, channel: str, data: str) -> int:
+        async with self._pub_lock:
+            for attempt in range(2):
+                try:
+                    if self._pub is None:
+                        self._pub = await self._open()
+                    reader, writer = self._pub
+                    writer.write(encode_command("PUBLISH", channel, data))
+                    await writer.drain()
+                    reply = await read_reply(reader)
+                    if isinstance(reply, RespError):
+                        raise reply
+                    return int(reply)
+                except (ConnectionError, OSError, asyncio.IncompleteReadError) as e:
+                    self._drop_publisher()
+                    if attempt:
+                        logging.error(f"[Backplane] Publish to '{channel}' failed: {e}")
+            return 0
+
+    def _drop_publisher(self) -> None:
+        if self._pub is not None:
+            self._pub[1].close()
+            self._pub = None
+
+    def _send_subscriber(self, *args: Any) -> None:
+        # While reconnecting the command is skipped; _attach_subscriber replays self.channels
+        if self._sub_ready.is_set() and self._sub_writer is not None and not self._sub_writer.is_closing():
+            self._sub_writer.write(encode_command(*args))
+
+    def subscribe(self, channel: str) -> None:
+        if channel not in self.channels:
+            self.channels.add(channel)
+            self._send_subscriber("SUBSCRIBE", channel)
+
+    def unsubscribe(self, channel: str) -> None:
+        if channel in self.channels:
+            self.channels.discard(channel)
+            self._send_subscriber("UNSUBSCRIBE", channel)
+
+    async def close(self) -> None:
+        self._closed = True
+        if self._reader_task is not None:
+            self._reader_task.cancel()
+            try:
+                await self._reader_task
+            except asyncio.CancelledError:
+                pass
+            self._reader_task = None
+        if self._sub_writer is not None:
+            self._sub_writer.close()
+            self._sub_writer = None
+        self._drop_publisher()
+
+    def stats(self) -> Dict[str, Any]:
+        return {**super().stats(), "server": f"{self.host}:{self.port}", "reconnects": self.reconnects}
+
+
+# --- Local stand-in server ---
+
+class LocalPubSubServer:
+    """ Minimal RESP server with SUBSCRIBE / UNSUBSCRIBE / PUBLISH / PING / AUTH, for tests and dev. """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0):
+        self.host = host
+        self.port = port
+        self.channels: Dict[str, Set[asyncio.StreamWriter]] = {}
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._clients: Set[asyncio.StreamWriter] = set()
+
+    @property
+    def url(self) -> str:
+        return f"redis://{self.host}:{self.port}"
+
+    async def start(self) -> "LocalPubSubServer":
+        self._server = await asyncio.start_server(self._serve, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        return self
+
+    async def _serve(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        self._clients.add(writer)
+        subscribed: Set[str] = set()
+        try:
+            while True:
+                command = await read_reply(reader)
+                if not isinstance(command, list) or not command:
+                    writer.write(b"-ERR protocol error\r\n")
+                    continue
+                name, args = command[0].decode("utf-8").upper(), [a.decode("utf-8") for a in command[1:]]
+                if name == "PUBLISH" and len(args) == 2:
+                    receivers = self.channels.get(args[0], set())
+                    message = encode_command("message", args[0], args[1])
+                    for subscriber in receivers:
+                        subscriber.write(message)
+                    writer.write(b":%d\r\n" % len(receivers))
+                elif name in ("SUBSCRIBE", "UNSUBSCRIBE"):
+                    for channel in args:
+                        if name == "SUBSCRIBE":
+                            subscribed.add(channel)
+                            self.channels.setdefault(channel, set()).add(writer)
+                        else:
+                            subscribed.discard(channel)
+                            self._drop(channel, writer)
+                        writer.write(b"*3\r\n" + _bulk(name.lower()) + _bulk(channel) + b":%d\r\n" % len(subscribed))
+                elif name == "PING":
+                    writer.write(b"+PONG\r\n")
+                elif name == "AUTH":
+                    writer.write(b"+OK\r\n")
+                else:
+                    writer.write(f"-ERR unknown command '{name}'\r\n".encode("utf-8"))
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError, OSError):
+            pass
+        finally:
+            for channel in subscribed:
+                self._drop(channel, writer)
+            self._clients.discard(writer)
+            writer.close()
+
+    def _drop(self, channel: str, writer: asyncio.StreamWriter) -> None:
+        members = self.channels.get(channel)
+        if members is not None:
+            members.discard(writer)
+            if not members:
+                del self.channels[channel]
+
+    async def close(self) -> None:
+        if self._server is not None:
+            self._server.close()
+            for writer in list(self._clients):
+                writer.close()
+            await self._server.wait_closed()
+            self._server = None
+
+
+def create_backplane(url: Optional[str] = None) -> Optional[Backplane]:
+    """ Builds the backplane named by `url` (default: WS_BACKPLANE_URL); None when unset. """
+    url = BACKPLANE_URL if url is None else url
+    if not url:
+        return None
+    scheme = urlparse(url).scheme
+    if scheme == "memory":
+        return InMemoryBackplane()
+    if scheme == "redis":
+        return RedisBackplane.from_url(url)
+    raise ValueError(f"Unsupported WS_BACKPLANE_URL scheme '{scheme}' (expected memory:// or redis://)")
+
+
+async def _serve_forever(host: str, port: int) -> None:
+    server = await LocalPubSubServer(host, port).start()
+    print(f"Pub/sub stand-in listening on {server.url}")
+    await asyncio.Event().wait()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the local RESP pub/sub stand-in server.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=6390)
+    cli_args = parser.parse_args()
+    asyncio.run(_serve_forever(cli_args.host, cli_args.port))
@@ -1,208 +1,376 @@
-from fastapi import WebSocket
-from typing import List, Dict, Set, Optional, Any
+"""
+WebSocket connection, room and user bookkeeping with queued fan-out.
+
+Membership is set-backed (room -> sockets, socket -> rooms, user -> sockets,
+socket -> user), so joins, leaves and disconnect cleanup are O(1) per
+membership instead of list scans.
+
+Every socket gets a bounded outbound queue drained by its own writer task.
+`send_personal_message` and `broadcast_to_room` serialize the payload once
+per wire encoding (see `ws_codec.py`; negotiated per socket at auth, JSON by
+default) and only enqueue the resulting frame, so a broadcast costs one `put_nowait` per member and a
+slow client never holds up the rest of the room. A client whose queue fills
+up (it stopped reading) is closed with 1013 and dropped rather than buffered
+without bound. Messages to one socket keep their order because they all go
+through the same queue.
+
+With a backplane (see `backplane.py`, enabled by WS_BACKPLANE_URL) the
+manager also reaches sockets held by other workers: it subscribes to
+`room:<id>` / `user:<id>` while it has local members, publishes broadcasts
+and user messages, and delivers what other workers publish. User messages
+are acknowledged on this worker's `worker:<id>` channel, so `send_to_user`
+can report how many sockets received them cluster-wide.
+
+Room broadcasts are stamped with a `seq` cursor and kept in a bounded
+per-room history (`room_history.py`); joining with `catch_up=True` queues a
+`room_history` message with everything after the client's `since` cursor,
+atomically with the join so nothing falls between catch-up and live traffic.
+"""
+
 import asyncio
 import json
+import logging
+import os
+import uuid
+from collections import Counter
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from fastapi import WebSocket
 from starlette.websockets import WebSocketState
 
+from backend.core.backplane import Backplane, create_backplane, new_worker_id
+from backend.core.room_history import RoomHistory
+from backend.core.ws_codec import DEFAULT_ENCODING, EncodedMessage
+
+OUTBOUND_QUEUE_SIZE = int(os.getenv("WS_OUTBOUND_QUEUE_SIZE", "256"))
+SLOW_CONSUMER_CLOSE_CODE = 1013  # "Try again later"
+FLUSH_TIMEOUT_SECONDS = 5.0
+USER_ACK_TIMEOUT_SECONDS = float(os.getenv("WS_BACKPLANE_ACK_TIMEOUT", "1.0"))
+
+
+def _label(websocket: Any) -> str:
+    client = getattr(websocket, "client", None)
+    return f"{client.host}:{client.port}" if client else f"socket-{id(websocket):x}"
+
+
 class ConnectionManager:
     """Manages active WebSocket connections, rooms, and user mapping."""
-    def __init__(self):
+    def __init__(self, queue_size: int = OUTBOUND_QUEUE_SIZE, history: Optional[RoomHistory] = None):
+        self.queue_size = queue_size
         # Stores connections per room
-        self.room_connections: Dict[str, List[WebSocket]] = {}
+        self.room_connections: Dict[str, Set[WebSocket]] = {}
         # Allows quick lookup of rooms a socket is in
         self.socket_to_rooms: Dict[WebSocket, Set[str]] = {}
         # Maps user ID to their active WebSocket connection(s)
         # Note: A user might have multiple connections (e.g., multiple tabs)
-        self.user_connections: Dict[str, List[WebSocket]] = {}
+        self.user_connections: Dict[str, Set[WebSocket]] = {}
         # Maps WebSocket to user ID for quick reverse lookup
         self.socket_to_user: Dict[WebSocket, str] = {}
+        # Per-socket outbound queue and the writer task draining it
+        self.outbound: Dict[WebSocket, asyncio.Queue] = {}
+        self.writers: Dict[WebSocket, asyncio.Task] = {}
+        # Negotiated wire encoding per socket (absent = JSON)
+        self.socket_encoding: Dict[WebSocket, str] = {}
+        self.slow_consumers_closed = 0
+        # Cross-worker routing (None = single worker)
+        self.backplane: Optional[Backplane] = None
+        self.worker_id = new_worker_id()
+        self._pending_acks: Dict[str, Dict[str, Any]] = {}
+        # Recent room broadcasts for catch-up on join
+        self.history = history if history is not None else RoomHistory()
 
     async def connect(self, websocket: WebSocket):
         """Accepts a new WebSocket connection. Room joining happens separately."""
         await websocket.accept()
-        self.socket_to_rooms[websocket] = set() # Initialize room set for this socket
-        print(f"WebSocket connection accepted: {websocket.client.host}:{websocket.client.port}")
+        self.register(websocket)
+        logging.info(f"WebSocket connection accepted: {_label(websocket)}")
         # User association will happen upon successful authentication
 
+    def register(self, websocket: WebSocket) -> None:
+        """Starts bookkeeping and the writer task for an already-accepted socket."""
+        self.socket_to_rooms.setdefault(websocket, set())
+        if websocket not in self.outbound:
+            queue: asyncio.Queue = asyncio.Queue(maxsize=self.queue_size)
+            self.outbound[websocket] = queue
+            self.writers[websocket] = asyncio.create_task(self._writer(websocket, queue))
+
+    async def _writer(self, websocket: WebSocket, queue: asyncio.Queue) -> None:
+        """Sends queued messages in order; a failed send drops the socket."""
+        try:
+            while True:
+                message = await queue.get()
+                try:
+                    if isinstance(message, bytes):
+                        await websocket.send_bytes(message)
+                    else:
+                        await websocket.send_text(message)
+                finally:
+                    queue.task_done()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logging.warning(f"[ConnectionManager] Send to {_label(websocket)} failed: {e}")
+            self.writers.pop(websocket, None)  # This task is ending; don't cancel it from disconnect()
+            self.disconnect(websocket)
+
     async def associate_user(self, user_id: str, websocket: WebSocket):
         """Associates an authenticated user ID with a WebSocket connection."""
         self.socket_to_user[websocket] = user_id
         if user_id not in self.user_connections:
-            self.user_connections[user_id] = []
-        if websocket not in self.user_connections[user_id]:
-            self.user_connections[user_id].append(websocket)
-            print(f"Associated user '{user_id}' with socket {websocket.client.host}:{websocket.client.port}")
+            self._subscribe(f"user:{user_id}")
+        self.user_connections.setdefault(user_id, set()).add(websocket)
+        logging.info(f"Associated user '{user_id}' with socket {_label(websocket)}")
+
+    def set_encoding(self, websocket: WebSocket, encoding: str) -> None:
+        """Switches the wire encoding for messages queued to `websocket` from now on."""
+        if encoding == DEFAULT_ENCODING:
+            self.socket_encoding.pop(websocket, None)
         else:
-             print(f"User '{user_id}' already associated with socket {websocket.client.host}:{websocket.client.port}")
+            self.socket_encoding[websocket] = encoding
 
     async def get_user_sockets(self, user_id: str) -> List[WebSocket]:
         """Returns a list of active WebSocket connections for a given user ID."""
-        return self.user_connections.get(user_id, [])
+        return list(self.user_connections.get(user_id, ()))
 
-    async def join_room(self, room_id: str, websocket: WebSocket):
-        """Adds a WebSocket connection to a specific room."""
+    async def join_room(self, room_id: str, websocket: WebSocket, since: Optional[int] = None, catch_up: bool = False) -> int:
+        """Adds a WebSocket connection to a specific room. With `catch_up`, also queues the room's history after
+        `since` (all of it when None). Returns the number of history messages queued."""
         if room_id not in self.room_connections:
-            self.room_connections[room_id] = []
-        if websocket not in self.room_connections[room_id]:
-            self.room_connections[room_id].append(websocket)
-            self.socket_to_rooms[websocket].add(room_id)
-            print(f"Socket {websocket.client.host}:{websocket.client.port} joined room '{room_id}'")
-            # Optionally broadcast a join message to the room
-            # await self.broadcast_to_room(room_id, json.dumps({"type": "join", "user": "anonymous"}), websocket)
-        else:
-             print(f"Socket {websocket.client.host}:{websocket.client.port} already in room '{room_id}'")
+            self._subscribe(f"room:{room_id}")
+        self.room_connections.setdefault(room_id, set()).add(websocket)
+        self.socket_to_rooms.setdefault(websocket, set()).add(room_id)
+        logging.debug(f"Socket {_label(websocket)} joined room '{room_id}'")
+        if catch_up and self.history.enabled:
+            await self.history.load(room_id)
+            return self._send_history(room_id, websocket, since)
+        return 0
+
+    def _send_history(self, room_id: str, websocket: WebSocket, since: Optional[int]) -> int:
+        entries, truncated = self.history.since(room_id, since)
+        # Stored messages are already JSON; splice them in rather than parse and re-serialize
+        text = (f'{{"type": "room_history", "roomId": {json.dumps(room_id)}, "since": {json.dumps(since)}, '
+                f'"latestSeq": {json.dumps(self.history.latest_seq(room_id))}, "truncated": {json.dumps(truncated)}, '
+                f'"messages": [{", ".join(message for _, message in entries)}]}}')
+        frame = EncodedMessage(json_text=text).frame(self.socket_encoding.get(websocket, DEFAULT_ENCODING))
+        return len(entries) if self._enqueue(websocket, frame) else 0
 
     async def leave_room(self, room_id: str, websocket: WebSocket):
         """Removes a WebSocket connection from a specific room."""
-        if room_id in self.room_connections and websocket in self.room_connections[room_id]:
-            self.room_connections[room_id].remove(websocket)
-            if not self.room_connections[room_id]: # Delete room if empty
-                 del self.room_connections[room_id]
-            if websocket in self.socket_to_rooms:
-                 self.socket_to_rooms[websocket].discard(room_id)
-            print(f"Socket {websocket.client.host}:{websocket.client.port} left room '{room_id}'")
-            # Optionally broadcast a leave message
-            # await self.broadcast_to_room(room_id, json.dumps({"type": "leave", "user": "anonymous"}), websocket)
-        else:
-            print(f"Socket {websocket.client.host}:{websocket.client.port} not found in room '{room_id}' for removal")
+        self._remove_from_room(room_id, websocket)
+        rooms = self.socket_to_rooms.get(websocket)
+        if rooms is not None:
+            rooms.discard(room_id)
+        logging.debug(f"Socket {_label(websocket)} left room '{room_id}'")
 
-    def disconnect(self, websocket: WebSocket):
-        """Handles disconnection, removing socket from rooms and user mappings."""
-        user_id = self.socket_to_user.get(websocket)
-        client_info = f"{getattr(websocket, 'client', 'UnknownClient')}" # Get client info safely
-        print(f"[Disconnect START] for socket {client_info} (User: {user_id or 'N/A'})")
-        
-        # Remove from rooms - MODIFIED LOGIC
-        if websocket in self.socket_to_rooms:
-            rooms_to_leave = list(self.socket_to_rooms[websocket]) # Get rooms socket was in
-            print(f"[Disconnect] Socket {client_info} leaving rooms: {rooms_to_leave}")
-            
-            # --- Directly remove socket from room lists --- 
-            for room_id in rooms_to_leave:
-                print(f"[Disconnect] Attempting removal from room '{room_id}'")
-                if room_id in self.room_connections:
-                    print(f"[Disconnect] Room '{room_id}' connections BEFORE removal: {self.room_connections[room_id]}")
-                    if websocket in self.room_connections[room_id]:
-                        try:
-                            self.room_connections[room_id].remove(websocket)
-                            print(f"[Disconnect] Removed socket from room '{room_id}' list.")
-                            if not self.room_connections[room_id]: # Clean up empty room
-                                del self.room_connections[room_id]
-                                print(f"[Disconnect] Deleted empty room: '{room_id}'")
-                            print(f"[Disconnect] Room '{room_id}' connections AFTER removal: {self.room_connections.get(room_id)}")
-                        except ValueError:
-                            print(f"[Disconnect WARNING] Socket not found in room '{room_id}' during direct removal (ValueError).")
-                    else:
-                        print(f"[Disconnect WARNING] Socket not found in room '{room_id}' connection list (pre-check). Connections: {self.room_connections[room_id]}")
-                else:
-                    print(f"[Disconnect WARNING] Room '{room_id}' not found in room_connections during disconnect cleanup.")
-            # --- End direct removal --- 
+    def _remove_from_room(self, room_id: str, websocket: WebSocket) -> None:
+        members = self.room_connections.get(room_id)
+        if members is not None:
+            members.discard(websocket)
+            if not members: # Delete room if empty
+                del self.room_connections[room_id]
+                self._unsubscribe(f"room:{room_id}")
 
-            # Now clear the socket's room tracking
-            del self.socket_to_rooms[websocket]
-        else:
-             print(f"[Disconnect] Socket {client_info} not found in socket_to_rooms mapping.")
-            
-        # Remove from user mapping
-        if user_id and user_id in self.user_connections:
-            if websocket in self.user_connections[user_id]:
-                self.user_connections[user_id].remove(websocket)
-                if not self.user_connections[user_id]: # Remove user if no connections left
+    def disconnect(self, websocket: WebSocket):
+        """Handles disconnection, removing socket from rooms and user mappings and stopping its writer."""
+        for room_id in self.socket_to_rooms.pop(websocket, ()):
+            self._remove_from_room(room_id, websocket)
+        user_id = self.socket_to_user.pop(websocket, None)
+        if user_id is not None:
+            sockets = self.user_connections.get(user_id)
+            if sockets is not None:
+                sockets.discard(websocket)
+                if not sockets: # Remove user if no connections left
                     del self.user_connections[user_id]
-                print(f"Removed socket association for user '{user_id}'")
-            else:
-                print(f"Warning: Socket not found in user '{user_id}' connection list during disconnect.")
-
-        # Remove reverse lookup
-        if websocket in self.socket_to_user:
-            del self.socket_to_user[websocket]
-            
-        print(f"[Disconnect END] for socket {client_info} (User: {user_id or 'N/A'})")
-
-    async def send_personal_message(self, message_data: Any, websocket: WebSocket):
-        """Sends a message (Python object) directly to a specific WebSocket connection, converting to JSON."""
+                    self._unsubscribe(f"user:{user_id}")
+        self.outbound.pop(websocket, None)
+        self.socket_encoding.pop(websocket, None)
+        writer = self.writers.pop(websocket, None)
+        if writer is not None and not writer.done():
+            writer.cancel()
+        logging.debug(f"Disconnected socket {_label(websocket)} (User: {user_id or 'N/A'})")
+
+    # --- Sending ---
+    def _enqueue(self, websocket: WebSocket, message: Any) -> bool:
+        queue = self.outbound.get(websocket)
+        if queue is None:
+            return False
         try:
-            # Convert the Python object (dict, list, etc.) to a JSON string
-            message_str = json.dumps(message_data)
-            await websocket.send_text(message_str)
-        except TypeError as e:
-            # Handle cases where the data isn't JSON serializable
-            print(f"Serialization Error sending personal message to {websocket.client.host}:{websocket.client.port}: {e}. Data: {message_data}")
-            # Optionally, disconnect or send an error message back if appropriate
-            # For now, just log and potentially disconnect
-            self.disconnect(websocket)
-        except Exception as e:
-             # Catch other errors like connection closed abruptly
-             print(f"Error sending personal message to {websocket.client.host}:{websocket.client.port}: {e}")
-             self.disconnect(websocket)
+            queue.put_nowait(message)
+            return True
+        except asyncio.QueueFull:
+            self._close_slow_consumer(websocket)
+            return False
+
+    def _close_slow_consumer(self, websocket: WebSocket) -> None:
+        logging.warning(f"[ConnectionManager] Outbound queue full for {_label(websocket)}; closing slow client.")
+        self.slow_consumers_closed += 1
+        self.disconnect(websocket)
+        if getattr(websocket, "client_state", WebSocketState.CONNECTED) == WebSocketState.CONNECTED:
+            asyncio.ensure_future(self._close_quietly(websocket, SLOW_CONSUMER_CLOSE_CODE))
+
+    @staticmethod
+    async def _close_quietly(websocket: WebSocket, code: int) -> None:
+        try:
+            await websocket.close(code=code)
+        except Exception:
+            pass
+
+    async def send_personal_message(self, message_data: Any, websocket: WebSocket) -> bool:
+        """Queues a message (Python object, serialized in the socket's encoding) for one socket. Returns False if it was not queued."""
+        try:
+            frame = EncodedMessage(message_data).frame(self.socket_encoding.get(websocket, DEFAULT_ENCODING))
+        except (TypeError, ValueError) as e:
+            # Handle cases where the data isn't serializable
+            logging.error(f"Serialization error sending personal message to {_label(websocket)}: {e}")
+            return False
+        return self._enqueue(websocket, frame)
+
+    async def broadcast_to_room(self, room_id: str, message_data: Any, exclude_sender: Optional[WebSocket] = None,
+                                record: bool = True) -> Tuple[int, Optional[int]]:
+        """Queues a message (serialized once per encoding in use) for every socket in a room except `exclude_sender`,
+        and publishes it to other workers. Dict payloads are stamped with a `seq` cursor and kept in the room
+        history unless `record` is False. Returns (number queued on this worker, seq or None if not recorded)."""
+        seq = None
+        if record and self.history.enabled and isinstance(message_data, dict):
+            await self.history.load(room_id)
+            seq = self.history.next_seq(room_id)
+            message_data = {**message_data, "seq": seq}
+        message = EncodedMessage(message_data)
+        try:
+            queued = self._fan_out(self.room_connections.get(room_id), message, exclude_sender)
+            if seq is not None:
+                self.history.append(room_id, seq, message.json_text)
+            if self.backplane is not None:
+                await self._publish(f"room:{room_id}", {"kind": "room", "message": message.json_text, "seq": seq})
+        except (TypeError, ValueError) as e:
+            logging.error(f"[Broadcast] Serialization error for room '{room_id}': {e}")
+            return 0, None
+        if not queued and self.backplane is None:
+            logging.debug(f"[Broadcast] No room '{room_id}' to broadcast to")
+        return queued, seq
+
+    def _fan_out(self, sockets: Optional[Set[WebSocket]], message: EncodedMessage, exclude: Optional[WebSocket] = None) -> int:
+        queued = 0
+        # Copy: closing a slow consumer mutates the member set
+        for websocket in list(sockets or ()):
+            if websocket is not exclude:
+                frame = message.frame(self.socket_encoding.get(websocket, DEFAULT_ENCODING))
+                if self._enqueue(websocket, frame):
+                    queued += 1
+        return queued
 
-    async def broadcast_to_room(self, room_id: str, message_data: Any, sender: Optional[WebSocket] = None):
-        """Sends a message (Python object) to all connections in a room (optionally excluding sender), converting to JSON."""
-        if room_id in self.room_connections:
+    async def send_to_user(self, user_id: str, message_data: Any, timeout: float = USER_ACK_TIMEOUT_SECONDS) -> int:
+        """Queues a message for every socket of `user_id` on any worker. Returns the number of sockets it reached
+        (remote sockets count once their worker acknowledges, waiting at most `timeout`)."""
+        message = EncodedMessage(message_data)
+        try:
+            delivered = self._fan_out(self.user_connections.get(user_id), message)
+            message_str = message.json_text if self.backplane is not None else None
+        except (TypeError, ValueError) as e:
+            logging.error(f"Serialization error sending to user '{user_id}': {e}")
+            return 0
+        if self.backplane is None:
+            return delivered
+
+        request_id = uuid.uuid4().hex
+        pending = {"delivered": 0, "acks": 0, "expected": 0, "done": asyncio.Event()}
+        self._pending_acks[request_id] = pending
+        try:
+            receivers = await self._publish(f"user:{user_id}", {
+                "kind": "user", "message": message_str, "request_id": request_id, "reply_to": f"worker:{self.worker_id}",
+            })
+            # Our own subscription (if we hold sockets for this user) is counted but never acks
+            pending["expected"] = receivers - (1 if self.backplane.is_subscribed(f"user:{user_id}") else 0)
+            if pending["expected"] > pending["acks"]:
+                try:
+                    await asyncio.wait_for(pending["done"].wait(), timeout)
+                except asyncio.TimeoutError:
+                    logging.warning(f"[ConnectionManager] {pending['expected'] - pending['acks']} worker(s) did not ack "
+                                    f"message for user '{user_id}' within {timeout}s")
+            return delivered + pending["delivered"]
+        finally:
+            self._pending_acks.pop(request_id, None)
+
+    # --- Backplane ---
+    async def start_backplane(self, backplane: Optional[Backplane] = None) -> Optional[Backplane]:
+        """Connects to the backplane (default: from WS_BACKPLANE_URL) and subscribes to current rooms/users."""
+        backplane = backplane or create_backplane()
+        if backplane is None:
+            return None
+        await backplane.start(self._on_backplane_message)
+        self.backplane = backplane
+        self._subscribe(f"worker:{self.worker_id}")
+        for room_id in self.room_connections:
+            self._subscribe(f"room:{room_id}")
+        for user_id in self.user_connections:
+            self._subscribe(f"user:{user_id}")
+        logging.info(f"[ConnectionManager] Backplane '{backplane.name}' started for worker {self.worker_id}")
+        return backplane
+
+    async def stop_backplane(self) -> None:
+        backplane, self.backplane = self.backplane, None
+        if backplane is not None:
+            await backplane.close()
+
+    def _subscribe(self, channel: str) -> None:
+        if self.backplane is not None:
+            self.backplane.subscribe(channel)
+
+    def _unsubscribe(self, channel: str) -> None:
+        if self.backplane is not None:
+            self.backplane.unsubscribe(channel)
+
+    async def _publish(self, channel: str, envelope: Dict[str, Any]) -> int:
+        envelope["origin"] = self.worker_id
+        return await self.backplane.publish(channel, json.dumps(envelope))
+
+    async def _on_backplane_message(self, channel: str, data: str) -> None:
+        """Delivers a message published by another worker to this worker's sockets."""
+        envelope = json.loads(data)
+        if envelope.get("origin") == self.worker_id:
+            return  # Already delivered locally when it was sent
+        kind = envelope.get("kind")
+        scope, _, target = channel.partition(":")
+        if kind == "room" and scope == "room":
+            if envelope.get("seq") is not None and self.history.enabled:
+                await self.history.load(target)
+                self.history.append(target, envelope["seq"], envelope["message"], persist=False) # The origin persists it
+            self._fan_out(self.room_connections.get(target), EncodedMessage(json_text=envelope["message"]))
+        elif kind == "user" and scope == "user":
+            delivered = self._fan_out(self.user_connections.get(target), EncodedMessage(json_text=envelope["message"]))
+            if envelope.get("reply_to") and self.backplane is not None:
+                await self._publish(envelope["reply_to"], {
+                    "kind": "ack", "request_id": envelope.get("request_id"), "delivered": delivered,
+                })
+        elif kind == "ack":
+            pending = self._pending_acks.get(envelope.get("request_id"))
+            if pending is not None:
+                pending["acks"] += 1
+                pending["delivered"] += envelope.get("delivered", 0)
+                if pending["expected"] and pending["acks"] >= pending["expected"]:
+                    pending["done"].set()
+
+    async def flush(self, websocket: WebSocket, timeout: float = FLUSH_TIMEOUT_SECONDS) -> None:
+        """Waits until everything queued for `websocket` has been sent (e.g. before closing it)."""
+        queue = self.outbound.get(websocket)
+        if queue is not None:
             try:
-                # Convert the Python object to a JSON string once for efficiency
-                message_str = json.dumps(message_data)
-                sender_info = f"{getattr(sender, 'client', 'N/A')}" if sender else "N/A"
-                print(f"[Broadcast START] Room '{room_id}' (from {sender_info}): {message_str[:100]}...")
-                
-                # Log the connection list BEFORE iterating
-                current_connections = self.room_connections.get(room_id, []) # Get safely
-                print(f"[Broadcast] Connections in room '{room_id}' before loop: {current_connections}")
-
-                # Prepare tasks, excluding the sender if provided
-                tasks = []
-                # Iterate over a COPY of the list to avoid issues if disconnect modifies it during iteration
-                connections_in_room = list(current_connections) 
-                for websocket in connections_in_room:
-                    
-                    # Log the specific websocket object being processed
-                    print(f"[Broadcast Loop] Processing websocket: {websocket}, State: {getattr(websocket, 'client_state', 'UNKNOWN')}")
-
-                    # --- Check --- 
-                    if not websocket or websocket.client_state != WebSocketState.CONNECTED:
-                        print(f"[Broadcast Loop] Skipping broadcast to non-existent or disconnected socket: {websocket}")
-                        # Optionally try to clean up here if a None or disconnected socket is found
-                        if room_id in self.room_connections and websocket in self.room_connections.get(room_id, []):
-                             try:
-                                 self.room_connections[room_id].remove(websocket)
-                                 print(f"[Broadcast Loop] Removed non-connected socket {websocket} from room '{room_id}' list.")
-                             except ValueError:
-                                 print(f"[Broadcast Loop WARNING] Socket {websocket} not found for removal despite check.")
-                        continue # Skip to the next socket
-                    # --- END CHECK --- 
-                    
-                    if sender is None or websocket != sender:
-                         # Use a wrapper coroutine to handle potential send errors individually
-                         async def send_wrapper(ws, msg_str):
-                            ws_info = f"{getattr(ws, 'client', '?')}"
-                            try:
-                                # Ensure the socket is still connected before sending
-                                if ws and ws.client_state == WebSocketState.CONNECTED:
-                                    print(f"[Broadcast Send] Sending to {ws_info} in room '{room_id}'")
-                                    await ws.send_text(msg_str)
-                                else:
-                                     print(f"[Broadcast Send SKIPPED] Socket {ws_info} disconnected before send.")
-                                     self.disconnect(ws) # Ensure cleanup if state check missed something
-                            except Exception as send_ex:
-                                print(f"[Broadcast Send ERROR] Error sending to {ws_info} in room '{room_id}': {send_ex}")
-                                # Disconnect the problematic socket
-                                self.disconnect(ws)
-                         
-                         tasks.append(send_wrapper(websocket, message_str))
-                
-                if tasks:
-                    print(f"[Broadcast] Gathering {len(tasks)} send tasks for room '{room_id}'")
-                    await asyncio.gather(*tasks) # Exceptions are handled within send_wrapper
-                    print(f"[Broadcast END] Send tasks completed for room '{room_id}'")
-                else:
-                    print(f"[Broadcast END] No clients (excluding sender, if specified) in room '{room_id}' to broadcast to.")
-                    
-            except TypeError as e:
-                print(f"[Broadcast ERROR] Serialization Error preparing broadcast for room '{room_id}': {e}. Data: {message_data}")
-            except Exception as e:
-                 print(f"[Broadcast ERROR] Unexpected error during broadcast preparation for room '{room_id}': {e}")
-        else:
-             print(f"[Broadcast WARNING] Attempted to broadcast to non-existent room '{room_id}'")
+                await asyncio.wait_for(queue.join(), timeout)
+            except asyncio.TimeoutError:
+                logging.warning(f"[ConnectionManager] Flush timed out for {_label(websocket)}")
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "sockets": len(self.outbound),
+            "rooms": len(self.room_connections),
+            "users": len(self.user_connections),
+            "queued_messages": sum(q.qsize() for q in self.outbound.values()),
+            "slow_consumers_closed": self.slow_consumers_closed,
+            "encodings": dict(Counter(self.socket_encoding.values())),
+            "worker_id": self.worker_id,
+            "history": self.history.stats(),
+            "backplane": self.backplane.stats() if self.backplane is not None else None,
+        }
 
 # Singleton instance
-manager = ConnectionManager() 
\ No newline at end of file
+manager = ConnectionManager()
@@ -0,0 +1,503 @@
+"""
+Atomized eligibility criteria, built once at ingestion time.
+
+`load_trials_local.py` splits each trial's inclusion/exclusion text into one
+row per bullet in the `trial_criteria` table. Derived tables (this one and the
+FTS index in retrieval.py) live in their own git-ignored database
+(`DEFAULT_INDEX_DB_PATH`), so building them never writes to the tracked
+trials.db, which is only ever opened read-only here. Each row carries a stable ID, a
+category tag (age, ecog, lab_threshold, genomic, prior_therapy, ...) and, where
+one could be parsed, a numeric threshold (operator, value, unit or ULN
+multiple).
+
+Atoms flagged `deterministic` can be decided from structured patient data
+without an LLM (`evaluate_atom`). The assessment and deep-dive agents
+evaluate those locally and only send the remaining criteria to the model.
+
+Status semantics follow the LLM output: MET means the patient satisfies the
+criterion *for eligibility*, so a true exclusion condition is NOT_MET.
+"""
+
+import hashlib
+import logging
+import os
+import re
+import sqlite3
+import threading
+from datetime import date, datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from backend.core.lab_rules import LAB_ANALYTES, LabRuleEngine, describe_threshold, is_lab_rule
+
+DEFAULT_TRIALS_DB_PATH = "backend/db/trials.db"
+DEFAULT_INDEX_DB_PATH = os.getenv("TRIAL_INDEX_DB_PATH", "backend/db/trial_indexes.db")
+DEFAULT_CRITERIA_DB_PATH = DEFAULT_INDEX_DB_PATH
+
+KIND_INCLUSION = "inclusion"
+KIND_EXCLUSION = "exclusion"
+
+STATUS_MET = "MET"
+STATUS_NOT_MET = "NOT_MET"
+STATUS_UNCLEAR = "UNCLEAR"
+LOCAL_ANALYSIS_SOURCE = "Local Rule"
+# Bump when parsing/evaluation rules change so cached assessments built on them are invalidated
+CRITERIA_RULES_VERSION = "criteria-rules-v1"
+
+_FLAGS = re.IGNORECASE
+
+# --- Bullet splitting ---
+# Top level: "- text" / "\- text"; nested: "\\* text", "\\*\\* text" (escaped markdown from the scraper)
+BULLET_RE = re.compile(r"^\s*(?:\\?-|•|(?P<stars>(?:\\*\*)+)|\d+[.)])\s*(?P<text>.*)$")
+
+# --- Category tags (first match wins; order matters) ---
+CATEGORY_PATTERNS: List[Tuple[str, "re.Pattern"]] = [
+    ("ecog", re.compile(r"\b(ecog|performance\s+status|karnofsky|\bkps\b)", _FLAGS)),
+    ("lab_threshold", re.compile(r"\b(neutrophil|\banc\b|platelet|h(?:a)?emoglobin|\bhgb\b|bilirubin|creatinine|\balt\b|\bast\b|aminotransferase|\bsgot\b|\bsgpt\b|glucose|hba1c|white\s+blood\s+cell|\bwbc\b|leukocyte|albumin|\binr\b)", _FLAGS)),
+    ("pregnancy", re.compile(r"\b(pregnan\w*|breast[-\s]?feeding|lactating|child[-\s]?bearing|contracepti\w*)", _FLAGS)),
+    ("cns_metastases", re.compile(r"\b(brain\s+metastas\w*|cns\s+metastas\w*|leptomeningeal|spinal\s+cord\s+compression)", _FLAGS)),
+    ("genomic", re.compile(r"\b(mutation\w*|variant\w*|amplif\w*|fusion\w*|rearrangement\w*|her-?2|egfr|brca[12]?|kras|braf|alk|ros1|pik3ca|akt[123]?|pd-?l1|msi|tmb|ngs|sequencing)\b", _FLAGS)),
+    ("prior_therapy", re.compile(r"\b(prior|previous(?:ly)?|received|progressed\s+on|refractory|treatment\s+with|chemotherapy|immunotherapy|radiotherapy|radiation|surgery|inhibitor\w*)\b", _FLAGS)),
+    ("cardiac", re.compile(r"\b(qtc|lvef|ejection\s+fraction|myocardial|heart\s+failure|nyha|arrhythmi\w*)", _FLAGS)),
+    ("infection", re.compile(r"\b(hepatitis|hiv|human\s+immunodeficiency|infection)", _FLAGS)),
+    ("age", re.compile(r"\b(age[ds]?\b|years?\s+old|years?\s+of\s+age|or\s+older)", _FLAGS)),
+    ("life_expectancy", re.compile(r"\blife\s+expectancy\b", _FLAGS)),
+    ("measurable_disease", re.compile(r"\b(measurable\s+disease|recist)", _FLAGS)),
+    ("consent", re.compile(r"\b(informed\s+consent|willing|able\s+to\s+comply)", _FLAGS)),
+]
+
+_NUMBER = r"\d{1,3}(?:,\d{3})+|\d+(?:\.\d+)?"
+_OPERATOR = (r"[<>]\s*or\s*=|[<>]/=|>=|=>|≥|<=|=<|≤|>|<|at\s+least|no\s+less\s+than|no\s+more\s+than|not\s+more\s+than|"
+             r"greater\s+than\s+or\s+equal\s+to|less\s+than\s+or\s+equal\s+to|greater\s+than|more\s+than|"
+             r"less\s+than|below|above|exceeding|over|under")
+THRESHOLD_RE = re.compile(
+    r"(?P<op>" + _OPERATOR + r")\s*(?P<num>" + _NUMBER + r")\s*"
+    r"(?P<uln>(?:x|×|times)\s*(?:the\s+)?(?:institutional\s+)?(?:upper\s+limit\s+of\s+(?:the\s+)?normal|i?uln))?"
+    r"(?P<unit>\s*(?:x\s*|×\s*)?10\^?\d\s*/\s*(?:mcl|[uµm]?l)|\s*(?:cells\s*)?/\s*(?:mcl|[uµ]l|mm\^?3)|\s*k\s*/\s*[uµ]l|"
+    r"\s*i?u\s*/\s*l|\s*m?g\s*/\s*d?l|\s*[uµm]mol\s*/\s*(?:l|mol)|\s*ml\s*/\s*min(?:\s*/\s*1\.73\s*m\^?2)?|\s*%)?",
+    _FLAGS,
+)
+# "0-2", "0 or 1", "0, 1, or 2"
+RANGE_RE = re.compile(r"\b[0-4](?:\s*(?:-|–|to|,\s*or|,|or|and)\s*[0-4]\b)+", _FLAGS)
+AGE_OR_OLDER_RE = re.compile(r"\b(\d{1,3})\s*years?\s*(?:of\s+age\s+)?(?:or|and)\s+(?:older|over|above)\b", _FLAGS)
+ECOG_NOTE_RE = re.compile(r"\b(?:ecog|performance\s+status)(?:\s+(?:ps|performance\s+status))?\s*(?:of|:|=|is)?\s*([0-4])\b", _FLAGS)
+# Clauses that make a criterion conditional; those go to the LLM even when a threshold parses
+CONDITIONAL_RE = re.compile(r"\b(unless|except|if|provided|whichever|in\s+(?:patients|subjects|participants)\s+with|for\s+(?:patients|subjects|participants)\s+with)\b", _FLAGS)
+
+# Look-alike characters seen in scraped criteria ("˃75,000/mm³")
+_CHAR_FIXES = str.maketrans({"˃": ">", "˂": "<", "＞": ">", "＜": "<", "³": "3", "²": "2", "μ": "µ"})
+
+OPERATOR_ALIASES = {
+    ">=": ">=", "=>": ">=", "≥": ">=", "at least": ">=", "no less than": ">=", "greater than or equal to": ">=",
+    "<=": "<=", "=<": "<=", "≤": "<=", "no more than": "<=", "not more than": "<=", "less than or equal to": "<=",
+    ">": ">", "greater than": ">", "more than": ">", "above": ">", "exceeding": ">", "over": ">",
+    "<": "<", "less than": "<", "below": "<", "under": "<",
+}
+
+
+# --- Parsing helpers ---
+def normalize_criterion_text(text: str) -> str:
+    """ Lower-case, collapse whitespace and markdown escapes; used for stable IDs and lookups. """
+    text = re.sub(r"\\+([*\-\[\]()])", r"\1", text or "")
+    return re.sub(r"\s+", " ", text.strip().lower()).strip(" .;:*-")
+
+
+def criterion_id(nct_id: str, kind: str, text: str) -> str:
+    """ Stable ID: does not change when bullets are re-ordered or the trial is re-ingested. """
+    digest = hashlib.sha1(normalize_criterion_text(text).encode("utf-8")).hexdigest()[:12]
+    return f"{nct_id}:{kind[:3]}:{digest}"
+
+
+def _normalize_operator(op: str) -> str:
+    op = re.sub(r"\s+", " ", op.strip().lower())
+    if re.fullmatch(r"[<>](?: or )?/?=", op):
+        return op[0] + "="
+    return OPERATOR_ALIASES.get(op, op)
+
+
+def _parse_number(num: str) -> float:
+    return float(num.replace(",", ""))
+
+
+def classify_criterion(text: str) -> str:
+    for category, pattern in CATEGORY_PATTERNS:
+        if pattern.search(text):
+            return category
+    return "other"
+
+
+def parse_threshold(text: str, category: str) -> Dict[str, Any]:
+    """ Extracts {analyte, operator, value, value_max, unit, uln_multiple} where possible. """
+    parsed: Dict[str, Any] = {"analyte": None, "operator": None, "value": None, "value_max": None, "unit": None, "uln_multiple": None}
+    clean = re.sub(r"\\+", "", text).translate(_CHAR_FIXES)
+
+    if category == "lab_threshold":
+        found = [(name, m) for name, pattern, _ in LAB_ANALYTES for m in pattern.finditer(clean)]
+        # "creatinine clearance" also matches "creatinine"; drop hits nested inside another analyte's hit
+        distinct = [(name, m) for name, m in found
+                    if not any(o is not m and o.start() <= m.start() and m.end() <= o.end() and (o.end() - o.start()) > (m.end() - m.start())
+                               for _, o in found)]
+        if not distinct:
+            return parsed
+        name, match = min(distinct, key=lambda item: item[1].start())
+        parsed["analyte"] = name
+        parsed["analyte_count"] = len({n for n, _ in distinct})
+        threshold = THRESHOLD_RE.search(clean, match.end())
+        if threshold:
+            parsed["operator"] = _normalize_operator(threshold.group("op"))
+            parsed["value"] = _parse_number(threshold.group("num"))
+            if threshold.group("uln"):
+                parsed["uln_multiple"] = parsed["value"]
+                parsed["value"] = None
+            elif threshold.group("unit"):
+                parsed["unit"] = threshold.group("unit").strip()
+        return parsed
+
+    if category == "ecog":
+        if re.search(r"\b(karnofsky|kps|lansky)\b", clean, _FLAGS):
+            return parsed  # different scale (0-100); leave it to the LLM
+        keyword = CATEGORY_PATTERNS[0][1].search(clean)
+        tail = clean[keyword.end():] if keyword else clean
+        parsed["analyte"] = "ecog"
+        threshold = THRESHOLD_RE.search(tail)
+        if threshold and float(threshold.group("num")) <= 4:
+            parsed["operator"] = _normalize_operator(threshold.group("op"))
+            parsed["value"] = _parse_number(threshold.group("num"))
+            return parsed
+        span = RANGE_RE.search(tail)
+        if span:
+            levels = [int(d) for d in re.findall(r"[0-4]", span.group(0))]
+            parsed.update(operator="between", value=float(min(levels)), value_max=float(max(levels)))
+        return parsed
+
+    if category == "age":
+        parsed["analyte"] = "age"
+        older = AGE_OR_OLDER_RE.search(clean)
+        if older:
+            parsed.update(operator=">=", value=float(older.group(1)), unit="years")
+            return parsed
+        threshold = THRESHOLD_RE.search(clean)
+        if threshold and re.match(r"\s*years?", clean[threshold.end():], _FLAGS):
+            parsed.update(operator=_normalize_operator(threshold.group("op")), value=_parse_number(threshold.group("num")), unit="years")
+        return parsed
+
+    return parsed
+
+
+def atomize_criteria(nct_id: str, text: Optional[str], kind: str) -> List[Dict[str, Any]]:
+    """ Splits one criteria blob into atom dicts (one per bullet), with parent links for nested bullets. """
+    atoms: List[Dict[str, Any]] = []
+    if not text:
+        return atoms
+    parents: Dict[int, Dict[str, Any]] = {}
+    seen_ids = set()
+    for line in text.splitlines():
+        if not line.strip():
+            continue
+        match = BULLET_RE.match(line)
+        if match:
+            depth = match.group("stars").count("*") if match.group("stars") else 0
+            body = match.group("text").strip()
+        elif atoms:
+            # Continuation line of the previous bullet
+            atoms[-1]["text"] = f"{atoms[-1]['text']} {line.strip()}"
+            continue
+        else:
+            depth, body = 0, line.strip()
+        if not body:
+            continue
+
+        atom_id = criterion_id(nct_id, kind, body)
+        if atom_id in seen_ids:
+            continue  # duplicated bullet; the stable ID would collide
+        seen_ids.add(atom_id)
+        parent = parents.get(depth - 1) if depth > 0 else None
+        atom = {
+            "criterion_id": atom_id,
+            "nct_id": nct_id,
+            "kind": kind,
+            "position": len(atoms),
+            "depth": depth,
+            "parent_id": parent["criterion_id"] if parent else None,
+            "text": body,
+        }
+        atoms.append(atom)
+        parents[depth] = atom
+        for deeper in [d for d in parents if d > depth]:
+            del parents[deeper]
+
+    has_children = {a["parent_id"] for a in atoms if a["parent_id"]}
+    for atom in atoms:
+        atom["category"] = classify_criterion(atom["text"])
+        atom.update(parse_threshold(atom["text"], atom["category"]))
+        atom["deterministic"] = _is_deterministic(atom, atom["criterion_id"] in has_children)
+        atom.pop("analyte_count", None)
+    return atoms
+
+
+def _is_deterministic(atom: Dict[str, Any], has_children: bool) -> bool:
+    if atom["category"] not in ("age", "ecog", "lab_threshold") or atom["operator"] is None:
+        return False
+    if atom["value"] is None and atom["uln_multiple"] is None:
+        return False
+    if has_children or CONDITIONAL_RE.search(atom["text"]):
+        return False
+    if atom.get("analyte_count", 1) > 1:
+        return False  # "AST and ALT < 2.5 x ULN", "creatinine ... or creatinine clearance ..."
+    if atom["category"] == "lab_threshold" and not is_lab_rule(atom):
+        return False
+    # Nested inclusion bullets are often alternatives ("one of the following"); nested exclusions each exclude
+    if atom["parent_id"] and atom["kind"] == KIND_INCLUSION:
+        return False
+    return True
+
+
+# --- Patient lookups ---
+def patient_age(patient: Dict[str, Any], today: Optional[date] = None) -> Optional[float]:
+    demographics = patient.get("demographics") or {}
+    if isinstance(demographics.get("age"), (int, float)):
+        return float(demographics["age"])
+    if isinstance(patient.get("age"), (int, float)):
+        return float(patient["age"])
+    dob = demographics.get("dob") or patient.get("dob")
+    if not dob:
+        return None
+    try:
+        born = datetime.strptime(str(dob)[:10], "%Y-%m-%d").date()
+    except ValueError:
+        return None
+    today = today or date.today()
+    return float(today.year - born.year - ((today.month, today.day) < (born.month, born.day)))
+
+
+def patient_ecog(patient: Dict[str, Any]) -> Optional[float]:
+    for key in ("ecog", "ecogStatus", "performanceStatus"):
+        value = patient.get(key)
+        if isinstance(value, (int, float)):
+            return float(value)
+    for note in patient.get("notes") or []:
+        note_text = note.get("text") if isinstance(note, dict) else note
+        match = ECOG_NOTE_RE.search(note_text or "")
+        if match:
+            return float(match.group(1))
+    return None
+
+
+def _compare(value: float, operator: str, threshold: float, threshold_max: Optional[float] = None) -> bool:
+    if operator == ">=":
+        return value >= threshold
+    if operator == "<=":
+        return value <= threshold
+    if operator == ">":
+        return value > threshold
+    if operator == "<":
+        return value < threshold
+    if operator == "between":
+        return threshold <= value <= (threshold_max if threshold_max is not None else threshold)
+    raise ValueError(f"Unknown operator {operator}")
+
+
+def _local_result(atom: Dict[str, Any], status: str, reasoning: str) -> Dict[str, Any]:
+    return {
+        "criterion_id": atom["criterion_id"],
+        "criterion": atom["text"],
+        "status": status,
+        "reasoning": reasoning,
+        "analysis_source": LOCAL_ANALYSIS_SOURCE,
+    }
+
+
+def _evaluate_lab_results(engine: LabRuleEngine, patient: Dict[str, Any]) -> Dict[str, Dict[str, Any]]:
+    """ Decided (non-UNCLEAR) lab results keyed by criterion ID. """
+    decided = {}
+    for atom, result in zip(engine.atoms, engine.evaluate_patient(patient)):
+        if result["status"] != STATUS_UNCLEAR:
+            decided[atom["criterion_id"]] = _local_result(atom, result["status"], result["reasoning"])
+    return decided
+
+
+def evaluate_atom(atom: Dict[str, Any], patient: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """
+    Decides a deterministic atom from structured patient data.
+    Returns {"criterion", "status", "reasoning", "analysis_source", "criterion_id"} or None when it cannot.
+    """
+    if not atom.get("deterministic"):
+        return None
+    analyte = atom["analyte"]
+    if analyte == "age":
+        observed = patient_age(patient)
+        evidence = f"Patient age {observed:g} years" if observed is not None else ""
+    elif analyte == "ecog":
+        observed = patient_ecog(patient)
+        evidence = f"ECOG {observed:g} documented" if observed is not None else ""
+    else:
+        return _evaluate_lab_results(LabRuleEngine([atom]), patient).get(atom["criterion_id"])
+
+    if observed is None or atom["value"] is None:
+        return None
+    condition_true = _compare(observed, atom["operator"], atom["value"], atom.get("value_max"))
+    # Inclusion: the condition must hold. Exclusion: the condition must not hold.
+    satisfied = condition_true if atom["kind"] == KIND_INCLUSION else not condition_true
+    verdict = "meets" if condition_true else "does not meet"
+    return _local_result(
+        atom, STATUS_MET if satisfied else STATUS_NOT_MET,
+        f"{evidence}; {verdict} {describe_threshold(atom)} ({atom['kind']} criterion).",
+    )
+
+
+def split_atoms(atoms: List[Dict[str, Any]], patient: Dict[str, Any]) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+    """ Returns (locally decided results, atoms still needing the LLM). Lab thresholds are evaluated in one pass. """
+    lab_results = _evaluate_lab_results(LabRuleEngine(atoms), patient)
+    decided, remaining = [], []
+    for atom in atoms:
+        if atom["criterion_id"] in lab_results:
+            result = lab_results[atom["criterion_id"]]
+        elif atom.get("analyte") in ("age", "ecog"):
+            result = evaluate_atom(atom, patient)
+        else:
+            result = None
+        if result is None:
+            remaining.append(atom)
+        else:
+            decided.append(result)
+    return decided, remaining
+
+
+def atoms_to_text(atoms: List[Dict[str, Any]], kind: str) -> str:
+    """ Re-renders the atoms of one kind as a bullet list for the LLM prompt. """
+    lines = [f"{'  ' * a['depth']}- {a['text']}" for a in atoms if a["kind"] == kind]
+    return "\n".join(lines)
+
+
+def read_trial_rows(db_path: str, sql: str) -> List[sqlite3.Row]:
+    """ Runs a query against the trials database through a short-lived read-only connection. """
+    conn = sqlite3.connect(f"file:{os.path.abspath(db_path)}?mode=ro", uri=True)
+    try:
+        conn.row_factory = sqlite3.Row
+        return conn.execute(sql).fetchall()
+    finally:
+        conn.close()
+
+
+class CriteriaIndex:
+    """ SQLite table of atomized criteria (`trial_criteria`), keyed by stable criterion ID. """
+
+    COLUMNS = ("criterion_id", "nct_id", "kind", "position", "depth", "parent_id", "text", "category",
+               "analyte", "operator", "value", "value_max", "unit", "uln_multiple", "deterministic")
+
+    def __init__(self, db_path: str = DEFAULT_CRITERIA_DB_PATH, trials_db_path: Optional[str] = None):
+        """ `trials_db_path` holds `clinical_trials` for rebuilds; defaults to `db_path` itself. """
+        self.db_path = db_path
+        self.trials_db_path = trials_db_path or db_path
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        try:
+            directory = os.path.dirname(db_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._conn = sqlite3.connect(db_path, check_same_thread=False)
+            self._conn.row_factory = sqlite3.Row
+            self.ensure_schema()
+        except sqlite3.Error as e:
+            logging.error(f"[CriteriaIndex] Could not open {db_path}: {e}. Criteria will be atomized on the fly.")
+            self._conn = None
+
+    def ensure_schema(self) -> None:
+        with self._lock:
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS trial_criteria (
+                    criterion_id TEXT PRIMARY KEY,
+                    nct_id TEXT NOT NULL,
+                    kind TEXT NOT NULL,
+                    position INTEGER NOT NULL,
+                    depth INTEGER NOT NULL DEFAULT 0,
+                    parent_id TEXT,
+                    text TEXT NOT NULL,
+                    category TEXT NOT NULL,
+                    analyte TEXT,
+                    operator TEXT,
+                    value REAL,
+                    value_max REAL,
+                    unit TEXT,
+                    uln_multiple REAL,
+                    deterministic INTEGER NOT NULL DEFAULT 0
+                )
+            """)
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_trial_criteria_nct ON trial_criteria (nct_id, kind, position)")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_trial_criteria_category ON trial_criteria (category)")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_trial_criteria_analyte ON trial_criteria (analyte, deterministic)")
+            self._conn.commit()
+
+    def index_trial(self, nct_id: str, inclusion_text: Optional[str], exclusion_text: Optional[str], commit: bool = True) -> List[Dict[str, Any]]:
+        """ Replaces all atoms for `nct_id`. Returns the atoms written. """
+        atoms = atomize_criteria(nct_id, inclusion_text, KIND_INCLUSION) + atomize_criteria(nct_id, exclusion_text, KIND_EXCLUSION)
+        if self._conn is None:
+            return atoms
+        placeholders = ",".join("?" * len(self.COLUMNS))
+        rows = [tuple(int(a[c]) if c == "deterministic" else a[c] for c in self.COLUMNS) for a in atoms]
+        with self._lock:
+            self._conn.execute("DELETE FROM trial_criteria WHERE nct_id = ?", (nct_id,))
+            self._conn.executemany(f"INSERT OR REPLACE INTO trial_criteria ({', '.join(self.COLUMNS)}) VALUES ({placeholders})", rows)
+            if commit:
+                self._conn.commit()
+        return atoms
+
+    def commit(self) -> None:
+        if self._conn is not None:
+            with self._lock:
+                self._conn.commit()
+
+    def _row_to_atom(self, row: sqlite3.Row) -> Dict[str, Any]:
+        atom = dict(row)
+        atom["deterministic"] = bool(atom["deterministic"])
+        return atom
+
+    def get_atoms(self, nct_id: str) -> List[Dict[str, Any]]:
+        """ Atoms for one trial in document order (empty if the trial was never indexed). """
+        if self._conn is None or not nct_id:
+            return []
+        try:
+            with self._lock:
+                rows = self._conn.execute(
+                    "SELECT * FROM trial_criteria WHERE nct_id = ? ORDER BY kind DESC, position", (nct_id,)
+                ).fetchall()
+        except sqlite3.Error as e:
+            logging.error(f"[CriteriaIndex] Lookup failed for {nct_id}: {e}")
+            return []
+        return [self._row_to_atom(r) for r in rows]
+
+    def atoms_for_trial(self, trial: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """ Indexed atoms, or atoms built on the fly for trials loaded before the index existed. """
+        nct_id = trial.get("nct_id") or "UNKNOWN"
+        atoms = self.get_atoms(nct_id)
+        if atoms:
+            return atoms
+        return (atomize_criteria(nct_id, trial.get("inclusion_criteria_text"), KIND_INCLUSION)
+                + atomize_criteria(nct_id, trial.get("exclusion_criteria_text"), KIND_EXCLUSION))
+
+    def rebuild_from_trials(self) -> int:
+        """ Re-atomizes every row of `clinical_trials` in the trials database. Returns the number of trials indexed. """
+        if self._conn is None:
+            return 0
+        rows = read_trial_rows(
+            self.trials_db_path,
+            "SELECT nct_id, inclusion_criteria_text, exclusion_criteria_text FROM clinical_trials WHERE nct_id IS NOT NULL",
+        )
+        for row in rows:
+            self.index_trial(row["nct_id"], row["inclusion_criteria_text"], row["exclusion_criteria_text"], commit=False)
+        self.commit()
+        return len(rows)
+
+    def stats(self) -> Dict[str, Any]:
+        if self._conn is None:
+            return {"available": False}
+        with self._lock:
+            total, deterministic, trials = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(deterministic), 0), COUNT(DISTINCT nct_id) FROM trial_criteria"
+            ).fetchone()
+        return {"available": True, "trials": trials, "criteria": total, "deterministic": deterministic}
+
+    def close(self) -> None:
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
@@ -0,0 +1,205 @@
+"""
+Bounded LRU/TTL cache for query embeddings.
+
+Clinicians send the same handful of search queries all day, so encoding them
+with the SentenceTransformer on every request is wasted CPU. Entries are keyed
+on the normalized query text plus the embedding model name, so switching
+models never serves stale vectors. An optional SQLite tier keeps the cache
+warm across restarts.
+"""
+
+import hashlib
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from array import array
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional, Tuple
+
+DEFAULT_MAX_ENTRIES = 1024
+DEFAULT_TTL_SECONDS = 24 * 60 * 60
+
+_WHITESPACE_RE = re.compile(r"\s+")
+
+
+class EmbeddingCache:
+    """ In-memory LRU of query embeddings with an optional on-disk (SQLite) second tier. """
+
+    def __init__(self, model_name: str, max_entries: int = DEFAULT_MAX_ENTRIES,
+                 ttl_seconds: Optional[float] = DEFAULT_TTL_SECONDS, persist_path: Optional[str] = None):
+        """
+        Args:
+            model_name: Name of the embedding model; part of every cache key.
+            max_entries: Maximum number of embeddings held in memory.
+            ttl_seconds: Entry lifetime in seconds (None disables expiry).
+            persist_path: Optional SQLite file for the on-disk tier.
+        """
+        self.model_name = model_name
+        self.max_entries = max(1, int(max_entries))
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[str, Tuple[float, List[float]]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.disk_hits = 0
+        self._disk_conn: Optional[sqlite3.Connection] = None
+        if persist_path:
+            self._open_disk_tier(persist_path)
+
+    # --- Keys ---
+    @staticmethod
+    def normalize_query(text: str) -> str:
+        """ Lower-cases and collapses whitespace so trivially different queries share an entry. """
+        return _WHITESPACE_RE.sub(" ", (text or "").strip()).lower()
+
+    def _key(self, normalized: str) -> str:
+        return hashlib.sha256(f"{self.model_name}\x1f{normalized}".encode("utf-8")).hexdigest()
+
+    def _expired(self, created_at: float) -> bool:
+        return self.ttl_seconds is not None and (time.time() - created_at) > self.ttl_seconds
+
+    # --- Disk Tier ---
+    def _open_disk_tier(self, path: str) -> None:
+        try:
+            directory = os.path.dirname(path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(path, check_same_thread=False)
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS query_embeddings (
+                    cache_key TEXT PRIMARY KEY,
+                    model_name TEXT NOT NULL,
+                    embedding BLOB NOT NULL,
+                    created_at REAL NOT NULL
+                )
+            """)
+            conn.commit()
+            self._disk_conn = conn
+            logging.info(f"[EmbeddingCache] On-disk tier enabled at {path}")
+        except sqlite3.Error as e:
+            logging.warning(f"[EmbeddingCache] Could not open on-disk tier at {path}: {e}. Using memory only.")
+            self._disk_conn = None
+
+    def _disk_get(self, key: str) -> Optional[Tuple[float, List[float]]]:
+        if not self._disk_conn:
+            return None
+        try:
+            row = self._disk_conn.execute(
+                "SELECT embedding, created_at FROM query_embeddings WHERE cache_key = ?", (key,)
+            ).fetchone()
+        except sqlite3.Error as e:
+            logging.warning(f"[EmbeddingCache] Disk lookup failed: {e}")
+            return None
+        if not row:
+            return None
+        blob, created_at = row
+        if self._expired(created_at):
+            self._disk_delete(key)
+            return None
+        vector = array("f")
+        vector.frombytes(blob)
+        return created_at, vector.tolist()
+
+    def _disk_put(self, key: str, created_at: float, embedding: List[float]) -> None:
+        if not self._disk_conn:
+            return
+        try:
+            self._disk_conn.execute(
+                "INSERT OR REPLACE INTO query_embeddings (cache_key, model_name, embedding, created_at) VALUES (?, ?, ?, ?)",
+                (key, self.model_name, array("f", embedding).tobytes(), created_at),
+            )
+            self._disk_conn.commit()
+        except sqlite3.Error as e:
+            logging.warning(f"[EmbeddingCache] Disk write failed: {e}")
+
+    def _disk_delete(self, key: str) -> None:
+        try:
+            self._disk_conn.execute("DELETE FROM query_embeddings WHERE cache_key = ?", (key,))
+            self._disk_conn.commit()
+        except sqlite3.Error:
+            pass
+
+    # --- Public API ---
+    def get(self, text: str) -> Optional[List[float]]:
+        """ Returns the cached embedding for `text`, or None on a miss. Counts hits/misses. """
+        key = self._key(self.normalize_query(text))
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and self._expired(entry[0]):
+                del self._entries[key]
+                entry = None
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+
+            disk_entry = self._disk_get(key)
+            if disk_entry is not None:
+                self._store(key, disk_entry[0], disk_entry[1])
+                self.hits += 1
+                self.disk_hits += 1
+                return disk_entry[1]
+
+            self.misses += 1
+            return None
+
+    def put(self, text: str, embedding: List[float]) -> None:
+        """ Stores an embedding for `text` in memory (and on disk when enabled). """
+        key = self._key(self.normalize_query(text))
+        created_at = time.time()
+        embedding = list(embedding)
+        with self._lock:
+            self._store(key, created_at, embedding)
+            self._disk_put(key, created_at, embedding)
+
+    def get_or_compute(self, text: str, compute_fn: Callable[[str], List[float]]) -> List[float]:
+        """
+        Returns the cached embedding or computes it with `compute_fn(normalized_text)`.
+        The normalized text is what gets encoded so every variant maps to the same vector.
+        """
+        cached = self.get(text)
+        if cached is not None:
+            return cached
+        embedding = list(compute_fn(self.normalize_query(text)))
+        self.put(text, embedding)
+        return embedding
+
+    def _store(self, key: str, created_at: float, embedding: List[float]) -> None:
+        self._entries[key] = (created_at, embedding)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        """ Drops every entry from both tiers and resets counters. """
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.misses = self.disk_hits = 0
+            if self._disk_conn:
+                try:
+                    self._disk_conn.execute("DELETE FROM query_embeddings")
+                    self._disk_conn.commit()
+                except sqlite3.Error as e:
+                    logging.warning(f"[EmbeddingCache] Failed to clear disk tier: {e}")
+
+    def stats(self) -> Dict[str, object]:
+        """ Returns hit/miss counters and current size. """
+        lookups = self.hits + self.misses
+        return {
+            "model_name": self.model_name,
+            "size": len(self._entries),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "disk_hits": self.disk_hits,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "persistent": self._disk_conn is not None,
+        }
+
+    def close(self) -> None:
+        if self._disk_conn:
+            self._disk_conn.close()
+            self._disk_conn = None
@@ -0,0 +1,230 @@
+"""
+Tiered intent classification for the orchestrator.
+
+Tier 1 is a set of compiled keyword/regex rules plus a small entity
+extractor. The " for <condition>" phrase is only taken as a condition when
+it names a known cancer/condition term, so "eligible for any clinical
+trials" yields no condition. When exactly one intent matches with high
+confidence and every entity its agent needs (`REQUIRED_ENTITIES`) was
+extracted, the LLM is skipped entirely. Anything ambiguous or incomplete
+falls through to the LLM parser. Successful results are cached by
+normalized prompt.
+
+Every result carries `intent_tier` ("cache", "rules" or "llm") and
+`intent_confidence` so callers can see which tier answered.
+"""
+
+import logging
+import re
+import threading
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from backend.core.intents import (
+    SUMMARIZE, SCHEDULE, NOTIFY, REFERRAL, ANSWER_QUESTION, FIND_TRIALS, MANAGE_SIDE_EFFECTS, UNKNOWN_INTENT,
+)
+
+DEFAULT_CONFIDENCE_THRESHOLD = 0.8
+DEFAULT_CACHE_SIZE = 512
+
+TIER_CACHE = "cache"
+TIER_RULES = "rules"
+TIER_LLM = "llm"
+
+_FLAGS = re.IGNORECASE
+
+# (intent, pattern, confidence when it is the only intent matched)
+INTENT_RULES: List[Tuple[str, "re.Pattern", float]] = [
+    (FIND_TRIALS, re.compile(r"\b(find|search|look(?:ing)?\s+for|match|eligible|enrol+|screen)\b.*\b(clinical\s+)?(trials?|stud(?:y|ies))\b", _FLAGS), 0.95),
+    (FIND_TRIALS, re.compile(r"\bclinical\s+trials?\b", _FLAGS), 0.9),
+    # A bare "study" may be an imaging study etc.; not confident enough on its own
+    (FIND_TRIALS, re.compile(r"\b(trials?|stud(?:y|ies))\b", _FLAGS), 0.6),
+    (SUMMARIZE, re.compile(r"\b(summari[sz]e|summary|overview|recap)\b", _FLAGS), 0.9),
+    (NOTIFY, re.compile(r"\b(notify|alert|inform|let\s+\S+(?:\s+\S+)?\s+know|send\s+(?:a\s+)?(?:message|note)\s+to)\b", _FLAGS), 0.9),
+    (SCHEDULE, re.compile(r"\b(schedule|reschedule|book|set\s+up\s+(?:an?\s+)?(?:appointment|visit|follow-?up))\b", _FLAGS), 0.9),
+    (REFERRAL, re.compile(r"\b(refer|referral|referring)\b", _FLAGS), 0.9),
+    (MANAGE_SIDE_EFFECTS, re.compile(r"\b(side[-\s]effects?|toxicit(?:y|ies))\b", _FLAGS), 0.9),
+    (MANAGE_SIDE_EFFECTS, re.compile(r"\b(manag\w*|treat|reliev\w*|cope\s+with|help\s+with)\b.*\b(nausea|vomiting|fatigue|rash|neuropathy|diarrh?o?ea|mucositis|pain|hot\s+flashes)\b", _FLAGS), 0.9),
+]
+# Entities an intent's agent needs; each entry is satisfied by any one of its keys
+REQUIRED_ENTITIES: Dict[str, List[Tuple[str, ...]]] = {
+    NOTIFY: [("recipient",), ("specific_condition",)],
+    SCHEDULE: [("date_details",)],
+    REFERRAL: [("recipient_specialty",), ("reason",)],
+    MANAGE_SIDE_EFFECTS: [("medication_name", "symptom", "treatment_type")],
+}
+QUESTION_RE = re.compile(r"^\s*(what|when|which|who|how\s+(?:many|much|high|low)|is|are|was|were|did|does|has|have)\b.*\?\s*$", _FLAGS)
+QUESTION_CONFIDENCE = 0.85
+
+# --- Entity patterns ---
+ENTITY_PATTERNS: Dict[str, "re.Pattern"] = {
+    "trial_phase": re.compile(r"\bphase\s*(iv|iii|ii|i|[1-4])\b", _FLAGS),
+    "recruitment_status": re.compile(r"\b(recruiting|not\s+yet\s+recruiting|active|open|enrolling)\b", _FLAGS),
+    "disease_stage": re.compile(r"\b(stage\s+(?:iv|iii|ii|i|0|[1-4])[abc]?|advanced|metastatic|early[-\s]stage)\b", _FLAGS),
+    "biomarkers": re.compile(r"\b((?:HER2|EGFR|BRCA[12]?|KRAS|ALK|ROS1|BRAF|PD-?L1|TP53|PIK3CA)\s*(?:positive|negative|mutat\w*|amplified|\+|-)?)", _FLAGS),
+    "timeframe": re.compile(r"\b(latest|most\s+recent|last\s+(?:week|month|year|visit)|yesterday|today|this\s+week)\b", _FLAGS),
+    "data_type": re.compile(r"\b(labs?|lab\s+results|ct\s+scan|mri|pet\s+scan|imaging|notes|vitals|blood\s+pressure|medications?)\b", _FLAGS),
+    "symptom": re.compile(r"\b(nausea|vomiting|fatigue|rash|neuropathy|diarrh?o?ea|mucositis|pain|hot\s+flashes)\b", _FLAGS),
+    "treatment_type": re.compile(r"\b(chemo(?:therapy)?|immunotherapy|radiation(?:\s+therapy)?|radiotherapy|hormone\s+therapy|targeted\s+therapy)\b", _FLAGS),
+    "date_details": re.compile(r"\b((?:next|this|on)\s+(?:week|month|(?:mon|tues|wednes|thurs|fri|satur|sun)day)|tomorrow|today|"
+                               r"in\s+\d+\s+(?:days?|weeks?|months?)|(?:mon|tues|wednes|thurs|fri|satur|sun)day)\b", _FLAGS),
+    "time_preference": re.compile(r"\b(morning|afternoon|evening)\b", _FLAGS),
+}
+RECIPIENT_RE = re.compile(r"\b(?:notify|alert|inform|tell|message)\s+((?:dr\.?\s+\w+)|(?:the\s+)?(?:pcp|patient|oncologist|nurse|care\s+team))", _FLAGS)
+# Up to three words between "refer" and "to": "refer the patient to a cardiologist", "refer Mrs. Lee to oncology"
+SPECIALTY_RE = re.compile(r"\brefer(?:ral)?\s+(?:\S+\s+){0,3}?to\s+(?:a\s+|an\s+|the\s+)?(\w+)", _FLAGS)
+# "... for <condition>" is split at these, then kept only if it names a known condition
+CONDITION_TERMINATORS = (" involving ", " related to ", " with ", " who ", " that ")
+CONDITION_TERM_RE = re.compile(
+    r"\b(cancers?|carcinomas?|adenocarcinomas?|lymphomas?|leuka?emias?|melanomas?|sarcomas?|myelomas?|"
+    r"tumou?rs?|neoplasms?|malignanc(?:y|ies)|metastas[ie]s|gliomas?|glioblastomas?|mesotheliomas?|"
+    r"blastomas?|nsclc|sclc|tnbc|hcc|aml|cml|cll|mds)\b", _FLAGS)
+CONDITION_LEADING_WORDS = re.compile(r"^(?:(?:her|his|their|the|a|an|patients?\s+with|people\s+with)\s+)+", _FLAGS)
+# "side effects of Letrozole"; possessives and "the" mean the patient's own medications
+MEDICATION_RE = re.compile(r"\bside[-\s]effects?\s+(?:of|from)\s+(?!(?:her|his|their|the|this|these|my|its|current)\b)([A-Za-z][\w-]*)", _FLAGS)
+# "Notify Dr. Baker about the patient's high glucose from yesterday's labs" -> "high glucose"
+ABOUT_RE = re.compile(r"\babout\s+(?:(?:the\s+)?patient'?s\s+|her\s+|his\s+|their\s+|the\s+)?(.+?)(?:\s+(?:from|in|on|since)\s+.*)?[.?!]?$", _FLAGS)
+# "Refer ... to cardiology for chest pain evaluation" -> "chest pain evaluation"
+REASON_RE = re.compile(r"\brefer(?:ral)?\b.*?\bfor\s+(?:an?\s+|the\s+)?(.+?)[.?!]?$", _FLAGS)
+
+
+def normalize_prompt(prompt: str) -> str:
+    """ Lower-case, collapse whitespace, drop trailing punctuation. """
+    return re.sub(r"\s+", " ", (prompt or "").strip().lower()).rstrip(" .?!")
+
+
+def extract_entities(prompt: str) -> Dict[str, Any]:
+    """ Cheap regex entity extraction; keys match what the LLM parser returns. """
+    entities: Dict[str, Any] = {}
+    for name, pattern in ENTITY_PATTERNS.items():
+        match = pattern.search(prompt)
+        if match:
+            entities[name] = match.group(1).strip()
+    if "trial_phase" in entities:
+        roman = {"i": "1", "ii": "2", "iii": "3", "iv": "4"}
+        entities["trial_phase"] = roman.get(entities["trial_phase"].lower(), entities["trial_phase"])
+    recipient = RECIPIENT_RE.search(prompt)
+    if recipient:
+        entities["recipient"] = recipient.group(1).strip()
+    specialty = SPECIALTY_RE.search(prompt)
+    if specialty:
+        entities["recipient_specialty"] = specialty.group(1).strip().capitalize()
+    condition = extract_condition(prompt)
+    if condition:
+        entities["specific_condition"] = condition
+    for name, pattern in (("medication_name", MEDICATION_RE), ("specific_condition", ABOUT_RE), ("reason", REASON_RE)):
+        match = pattern.search(prompt) if name not in entities else None
+        if match:
+            entities[name] = match.group(1).strip()
+    return entities
+
+
+def missing_entities(intent: str, entities: Dict[str, Any]) -> List[str]:
+    """ Required entities for `intent` that were not extracted (alternatives joined with "|"). """
+    return ["|".join(keys) for keys in REQUIRED_ENTITIES.get(intent, ())
+            if not any(entities.get(key) for key in keys)]
+
+
+def extract_condition(prompt: str) -> Optional[str]:
+    """ The condition in "... for <condition>", or None unless it names a known condition term. """
+    for segment in prompt.split(" for ")[1:]:
+        for terminator in CONDITION_TERMINATORS:
+            segment = segment.split(terminator)[0]
+        condition = CONDITION_LEADING_WORDS.sub("", segment.strip(" .?!"))
+        if CONDITION_TERM_RE.search(condition):
+            return condition
+    return None
+
+
+class IntentClassifier:
+    """ Rules first, LLM only when the rules are not confident; results cached by normalized prompt. """
+
+    def __init__(self, llm_fallback: Optional[Callable[[str], Awaitable[Dict[str, Any]]]] = None,
+                 confidence_threshold: float = DEFAULT_CONFIDENCE_THRESHOLD, cache_size: int = DEFAULT_CACHE_SIZE):
+        """
+        Args:
+            llm_fallback: Async callable returning the LLM parser's dict ({"status", "intent", "entities", ...}).
+            confidence_threshold: Minimum rule confidence needed to skip the LLM.
+            cache_size: Max number of normalized prompts kept in the LRU cache.
+        """
+        self.llm_fallback = llm_fallback
+        self.confidence_threshold = confidence_threshold
+        self.cache_size = max(1, cache_size)
+        self._cache: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.tier_counts = {TIER_CACHE: 0, TIER_RULES: 0, TIER_LLM: 0}
+
+    def classify_rules(self, prompt: str) -> Tuple[Optional[str], Dict[str, Any], float]:
+        """ Returns (intent or None, entities, confidence) from the rule tier alone. """
+        scores: Dict[str, float] = {}
+        for intent, pattern, confidence in INTENT_RULES:
+            if pattern.search(prompt):
+                scores[intent] = max(scores.get(intent, 0.0), confidence)
+
+        if not scores and QUESTION_RE.match(prompt):
+            scores[ANSWER_QUESTION] = QUESTION_CONFIDENCE
+
+        if not scores:
+            return None, {}, 0.0
+        entities = extract_entities(prompt)
+        if len(scores) > 1:
+            # Several intents matched ("summarize the trial side effects"): let the LLM decide
+            best = max(scores, key=scores.get)
+            return best, entities, 0.5
+        intent, confidence = next(iter(scores.items()))
+        missing = missing_entities(intent, entities)
+        if missing:
+            # Right intent, but its agent would run without what it needs: let the LLM extract it
+            logging.debug(f"[IntentClassifier] Rules matched '{intent}' without {missing}.")
+            return intent, entities, min(confidence, 0.5)
+        return intent, entities, confidence
+
+    def _cache_get(self, key: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            result = self._cache.get(key)
+            if result is not None:
+                self._cache.move_to_end(key)
+                return dict(result, entities=dict(result.get("entities", {})))
+            return None
+
+    def _cache_put(self, key: str, result: Dict[str, Any]) -> None:
+        with self._lock:
+            self._cache[key] = dict(result, entities=dict(result.get("entities", {})))
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    async def classify(self, prompt: str) -> Dict[str, Any]:
+        """ Returns {"status", "intent", "entities", "intent_tier", "intent_confidence", ...}. """
+        key = normalize_prompt(prompt)
+        cached = self._cache_get(key)
+        if cached is not None:
+            self.tier_counts[TIER_CACHE] += 1
+            cached["intent_tier"] = TIER_CACHE
+            return cached
+
+        intent, entities, confidence = self.classify_rules(prompt)
+        if intent and confidence >= self.confidence_threshold:
+            result = {"status": "success", "intent": intent, "entities": entities,
+                      "intent_tier": TIER_RULES, "intent_confidence": confidence}
+            self.tier_counts[TIER_RULES] += 1
+            self._cache_put(key, result)
+            return result
+
+        if self.llm_fallback is None:
+            # No LLM configured: best effort from the rules (or unknown)
+            self.tier_counts[TIER_RULES] += 1
+            return {"status": "success", "intent": intent or UNKNOWN_INTENT, "entities": entities,
+                    "intent_tier": TIER_RULES, "intent_confidence": confidence}
+
+        logging.debug(f"[IntentClassifier] Rule confidence {confidence:.2f} below threshold, asking LLM.")
+        result = await self.llm_fallback(prompt)
+        self.tier_counts[TIER_LLM] += 1
+        result["intent_tier"] = TIER_LLM
+        result.setdefault("intent_confidence", None)
+        if result.get("status") == "success":
+            self._cache_put(key, result)
+        return result
+
+    def stats(self) -> Dict[str, Any]:
+        return {"cache_size": len(self._cache), "tiers": dict(self.tier_counts)}
@@ -0,0 +1,15 @@
+"""
+Intent names shared by the orchestrator and the rule-based intent classifier.
+
+Kept free of imports so the classifier can use them without pulling in the
+orchestrator (which imports every agent).
+"""
+
+SUMMARIZE = "summarize"
+SCHEDULE = "schedule"
+NOTIFY = "notify"
+REFERRAL = "referral"
+ANSWER_QUESTION = "answer_question"
+FIND_TRIALS = "find_trials"
+MANAGE_SIDE_EFFECTS = "manage_side_effects"
+UNKNOWN_INTENT = "unknown_intent"
@@ -0,0 +1,88 @@
+"""
+Incremental parsing of large top-level JSON arrays (cBioPortal dumps).
+
+`iter_json_array(path)` yields one array element at a time, so memory stays
+bounded by the largest single record rather than the whole file. It uses
+`ijson` (C backend when available) if installed, and otherwise falls back to
+a chunked `json.JSONDecoder.raw_decode` loop over the same file.
+"""
+
+import json
+import logging
+from typing import Any, Iterator
+
+try:
+    import ijson
+except ImportError:
+    ijson = None
+
+DEFAULT_CHUNK_SIZE = 1024 * 1024
+_WHITESPACE = " \t\n\r"
+
+
+def _iter_with_ijson(path: str) -> Iterator[Any]:
+    with open(path, "rb") as f:
+        # use_float: plain floats instead of Decimal, matching json.load
+        yield from ijson.items(f, "item", use_float=True)
+
+
+def _iter_with_raw_decode(path: str, chunk_size: int) -> Iterator[Any]:
+    decoder = json.JSONDecoder()
+    with open(path, "r", encoding="utf-8") as f:
+        buf, pos, eof = "", 0, False
+
+        def fill() -> bool:
+            nonlocal buf, pos, eof
+            chunk = f.read(chunk_size)
+            if not chunk:
+                eof = True
+                return False
+            buf, pos = buf[pos:] + chunk, 0
+            return True
+
+        def skip_whitespace() -> None:
+            nonlocal pos
+            while True:
+                while pos < len(buf) and buf[pos] in _WHITESPACE:
+                    pos += 1
+                if pos < len(buf) or not fill():
+                    return
+
+        skip_whitespace()
+        if pos >= len(buf) or buf[pos] != "[":
+            raise ValueError(f"{path} does not contain a top-level JSON array")
+        pos += 1
+        skip_whitespace()
+        if pos < len(buf) and buf[pos] == "]":
+            return
+
+        while True:
+            try:
+                item, end = decoder.raw_decode(buf, pos)
+            except json.JSONDecodeError:
+                if fill():
+                    continue
+                raise
+            if end == len(buf) and not eof:
+                # A value ending exactly at the buffer end may be a truncated number/literal
+                fill()
+                continue
+            yield item
+            pos = end
+            skip_whitespace()
+            if pos >= len(buf):
+                raise ValueError(f"Unexpected end of file in {path}")
+            if buf[pos] == "]":
+                return
+            if buf[pos] != ",":
+                raise ValueError(f"Expected ',' or ']' at offset {pos} in {path}, found {buf[pos]!r}")
+            pos += 1
+            skip_whitespace()
+
+
+def iter_json_array(path: str, chunk_size: int = DEFAULT_CHUNK_SIZE) -> Iterator[Any]:
+    """ Yields the elements of the JSON array stored in `path` without loading the whole file. """
+    if ijson is not None:
+        return _iter_with_ijson(path)
+    logging.debug("[json_stream] ijson not installed; using the raw_decode fallback")
+    return _iter_with_raw_decode(path, chunk_size)
@@ -0,0 +1,257 @@
+"""
+Deterministic lab-threshold evaluation for eligibility criteria.
+
+Criteria atoms from `criteria_index` that carry a lab analyte and a numeric
+threshold ("Platelets > 75,000/µl", "Total bilirubin <= 1.5 x ULN") are
+compiled into NumPy arrays once. Patient `recentLabs` are normalized into a
+(patients x analytes) matrix of canonical-unit values plus a matching matrix
+of value / upper-limit-of-normal ratios taken from each component's
+`refRange` (unit-free, so ULN rules work even for unknown units). A single
+broadcast comparison then yields MET / NOT_MET / UNCLEAR for every
+(patient, criterion) pair; missing labs or unconvertible units are UNCLEAR.
+
+Used for single-trial assessments (one patient, one trial's atoms) and for
+batch pre-screening (many patients, many trials' atoms) without LLM calls.
+"""
+
+import re
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+# --- Analytes: criterion text pattern, patient test names (lower-case) ---
+# Order matters: more specific names first (creatinine clearance before creatinine, HbA1c before hemoglobin)
+_FLAGS = re.IGNORECASE
+LAB_ANALYTES: List[Tuple[str, "re.Pattern", Tuple[str, ...]]] = [
+    ("creatinine_clearance", re.compile(r"\b(creatinine\s+clearance|crcl)\b", _FLAGS), ("creatinine clearance", "crcl", "egfr (creatinine)")),
+    ("creatinine", re.compile(r"\bcreatinine\b", _FLAGS), ("creatinine", "cr", "serum creatinine")),
+    ("hba1c", re.compile(r"\b(hba1c|glycosylated\s+h(?:a)?emoglobin|h(?:a)?emoglobin\s+a1c)\b", _FLAGS), ("hba1c", "hemoglobin a1c", "a1c")),
+    ("hemoglobin", re.compile(r"\b(h(?:a)?emoglobin|hgb)\b", _FLAGS), ("hemoglobin", "hgb", "hb")),
+    ("anc", re.compile(r"\b(absolute\s+neutrophil\s+count|anc)\b", _FLAGS), ("anc", "absolute neutrophil count", "neutrophils", "neutrophils, absolute", "neutrophils abs")),
+    ("platelets", re.compile(r"\bplatelets?(?:\s+count)?\b", _FLAGS), ("plt", "platelets", "platelet", "platelet count")),
+    ("wbc", re.compile(r"\b(white\s+blood\s+cells?(?:\s+count)?|wbc|leukocytes?)\b", _FLAGS), ("wbc", "white blood cells", "leukocytes")),
+    ("bilirubin", re.compile(r"\b(?:total\s+)?bilirubin\b", _FLAGS), ("bilirubin", "total bilirubin", "tbili", "bilirubin, total")),
+    ("alt", re.compile(r"\b(alt|sgpt|alanine\s+aminotransferase)\b", _FLAGS), ("alt", "sgpt", "alanine aminotransferase")),
+    ("ast", re.compile(r"\b(ast|sgot|aspartate\s+aminotransferase)\b", _FLAGS), ("ast", "sgot", "aspartate aminotransferase")),
+    ("glucose", re.compile(r"\bglucose\b", _FLAGS), ("glucose", "fasting glucose", "plasma glucose")),
+    ("albumin", re.compile(r"\balbumin\b", _FLAGS), ("albumin",)),
+]
+ANALYTE_NAMES: List[str] = [name for name, _, _ in LAB_ANALYTES]
+ANALYTE_INDEX: Dict[str, int] = {name: i for i, name in enumerate(ANALYTE_NAMES)}
+_TEST_TO_ANALYTE: Dict[str, str] = {test: name for name, _, tests in LAB_ANALYTES for test in tests}
+
+# Unit aliases -> (canonical unit, multiplier into canonical). Keys are lower-case with spaces removed.
+UNIT_ALIASES: Dict[str, Tuple[str, float]] = {
+    "10^9/l": ("10^9/L", 1.0), "x10^9/l": ("10^9/L", 1.0), "k/ul": ("10^9/L", 1.0), "k/µl": ("10^9/L", 1.0),
+    "10^3/ul": ("10^9/L", 1.0), "10^3/µl": ("10^9/L", 1.0), "x10^3/ul": ("10^9/L", 1.0), "x10^3/µl": ("10^9/L", 1.0),
+    "10^3/mm3": ("10^9/L", 1.0), "/ul": ("10^9/L", 0.001), "/µl": ("10^9/L", 0.001), "/mm3": ("10^9/L", 0.001),
+    "/mm^3": ("10^9/L", 0.001), "cells/mm3": ("10^9/L", 0.001), "cells/ul": ("10^9/L", 0.001), "cells/µl": ("10^9/L", 0.001),
+    "g/dl": ("g/dL", 1.0), "g/l": ("g/dL", 0.1),
+    "mg/dl": ("mg/dL", 1.0),
+    "u/l": ("U/L", 1.0), "iu/l": ("U/L", 1.0),
+    "ml/min": ("mL/min", 1.0), "ml/min/1.73m2": ("mL/min", 1.0),
+    "%": ("%", 1.0),
+}
+# SI units whose conversion depends on the analyte
+ANALYTE_UNIT_CONVERSIONS: Dict[str, Dict[str, Tuple[str, float]]] = {
+    "creatinine": {"µmol/l": ("mg/dL", 1 / 88.4), "umol/l": ("mg/dL", 1 / 88.4)},
+    "bilirubin": {"µmol/l": ("mg/dL", 1 / 17.1), "umol/l": ("mg/dL", 1 / 17.1)},
+    "glucose": {"mmol/l": ("mg/dL", 18.016)},
+    "hemoglobin": {"mmol/l": ("g/dL", 1.611)},
+    "hba1c": {"mmol/mol": ("%", None)},  # IFCC -> NGSP is affine; handled in normalize_value
+}
+
+STATUS_UNCLEAR, STATUS_MET, STATUS_NOT_MET = 0, 1, 2
+STATUS_LABELS = {STATUS_UNCLEAR: "UNCLEAR", STATUS_MET: "MET", STATUS_NOT_MET: "NOT_MET"}
+OPERATOR_CODES = {">=": 0, "<=": 1, ">": 2, "<": 3}
+
+
+def _unit_key(unit: str) -> str:
+    key = unit.lower().replace(" ", "").replace("×", "x").replace("μ", "µ")
+    return key.replace("mcl", "µl")
+
+
+def normalize_unit(unit: Optional[str], analyte: Optional[str] = None) -> Tuple[Optional[str], float]:
+    """ Returns (canonical unit, multiplier) or (None, 1.0) when the unit is unknown. """
+    if not unit:
+        return None, 1.0
+    key = _unit_key(unit)
+    if analyte and key in ANALYTE_UNIT_CONVERSIONS.get(analyte, {}):
+        canonical, factor = ANALYTE_UNIT_CONVERSIONS[analyte][key]
+        return (canonical, factor) if factor is not None else (None, 1.0)
+    return UNIT_ALIASES.get(key, (None, 1.0))
+
+
+def normalize_value(value: Any, unit: Optional[str], analyte: str) -> Tuple[Optional[float], Optional[str]]:
+    """ Converts a raw lab value into the analyte's canonical unit. Returns (value, canonical unit) or (None, None). """
+    if not isinstance(value, (int, float)) or isinstance(value, bool):
+        return None, None
+    if analyte == "hba1c" and unit and _unit_key(unit) == "mmol/mol":
+        return round(value * 0.0915 + 2.15, 2), "%"
+    canonical, factor = normalize_unit(unit, analyte)
+    if canonical is None:
+        return None, None
+    return float(value) * factor, canonical
+
+
+def upper_limit(ref_range: Any) -> Optional[float]:
+    """ Upper bound of a reference range like "10-40" or "< 38". """
+    if not ref_range:
+        return None
+    text = str(ref_range)
+    numbers = re.findall(r"\d+(?:\.\d+)?", text)
+    if not numbers:
+        return None
+    if re.search(r"-|–|to", text) and len(numbers) >= 2:
+        return float(numbers[1])
+    if "<" in text:
+        return float(numbers[0])
+    return None
+
+
+def analyte_for_test(test_name: Any) -> Optional[str]:
+    return _TEST_TO_ANALYTE.get(str(test_name or "").strip().lower())
+
+
+def find_patient_lab(patient: Dict[str, Any], analyte: str) -> Optional[Dict[str, Any]]:
+    """ First matching lab component across recentLabs panels (most recent panel first, as stored). """
+    for panel in patient.get("recentLabs") or []:
+        if not isinstance(panel, dict):
+            continue
+        for component in panel.get("components") or []:
+            if isinstance(component, dict) and analyte_for_test(component.get("test")) == analyte:
+                return component
+    return None
+
+
+def describe_threshold(atom: Dict[str, Any]) -> str:
+    if atom.get("operator") == "between":
+        return f"{atom['value']:g}-{atom['value_max']:g}"
+    if atom.get("uln_multiple") is not None:
+        return f"{atom['operator']} {atom['uln_multiple']:g} x ULN"
+    unit = f" {atom['unit']}" if atom.get("unit") else ""
+    return f"{atom['operator']} {atom['value']:g}{unit}"
+
+
+def is_lab_rule(atom: Dict[str, Any]) -> bool:
+    """ True if the atom is a lab threshold the engine can compile. """
+    if atom.get("analyte") not in ANALYTE_INDEX or atom.get("operator") not in OPERATOR_CODES:
+        return False
+    if atom.get("uln_multiple") is not None:
+        return True
+    return atom.get("value") is not None and normalize_unit(atom.get("unit"), atom["analyte"])[0] is not None
+
+
+class LabRuleEngine:
+    """ Compiles lab-threshold atoms into arrays and evaluates them against many patients at once. """
+
+    def __init__(self, atoms: Iterable[Dict[str, Any]], require_deterministic: bool = True):
+        """
+        Args:
+            atoms: Criteria atoms (see criteria_index.atomize_criteria). Non-lab atoms are ignored.
+            require_deterministic: Skip atoms not flagged deterministic (conditional clauses, alternatives, ...).
+        """
+        self.atoms: List[Dict[str, Any]] = [
+            a for a in atoms if is_lab_rule(a) and (a.get("deterministic") or not require_deterministic)
+        ]
+        n = len(self.atoms)
+        self.analyte_idx = np.array([ANALYTE_INDEX[a["analyte"]] for a in self.atoms], dtype=np.intp)
+        self.operator = np.array([OPERATOR_CODES[a["operator"]] for a in self.atoms], dtype=np.int8)
+        self.exclusion = np.array([a.get("kind") == "exclusion" for a in self.atoms], dtype=bool)
+        self.uln_multiple = np.full(n, np.nan)
+        self.threshold = np.full(n, np.nan)
+        for i, atom in enumerate(self.atoms):
+            if atom.get("uln_multiple") is not None:
+                self.uln_multiple[i] = atom["uln_multiple"]
+            else:
+                _, factor = normalize_unit(atom.get("unit"), atom["analyte"])
+                self.threshold[i] = atom["value"] * factor
+
+    def __len__(self) -> int:
+        return len(self.atoms)
+
+    @staticmethod
+    def build_lab_matrix(patients: Sequence[Dict[str, Any]]) -> Tuple[np.ndarray, np.ndarray]:
+        """ Returns (values, uln_ratio), each (patients x analytes); values in canonical units, NaN where unknown. """
+        values = np.full((len(patients), len(ANALYTE_NAMES)), np.nan)
+        uln_ratio = np.full((len(patients), len(ANALYTE_NAMES)), np.nan)
+        for p, patient in enumerate(patients):
+            seen = [False] * len(ANALYTE_NAMES)
+            for panel in (patient or {}).get("recentLabs") or []:
+                if not isinstance(panel, dict):
+                    continue
+                for component in panel.get("components") or []:
+                    if not isinstance(component, dict):
+                        continue
+                    analyte = analyte_for_test(component.get("test"))
+                    if analyte is None:
+                        continue
+                    a = ANALYTE_INDEX[analyte]
+                    if seen[a]:
+                        continue  # first (most recent) result wins, as in find_patient_lab
+                    seen[a] = True
+                    raw = component.get("value")
+                    value, _ = normalize_value(raw, component.get("unit"), analyte)
+                    if value is not None:
+                        values[p, a] = value
+                    limit = upper_limit(component.get("refRange"))
+                    # Raw value and reference range share a unit, so the ratio needs no conversion
+                    if limit and isinstance(raw, (int, float)) and not isinstance(raw, bool):
+                        uln_ratio[p, a] = raw / limit
+        return values, uln_ratio
+
+    def evaluate_matrix(self, values: np.ndarray, uln_ratio: np.ndarray) -> np.ndarray:
+        """ Returns an int8 (patients x criteria) matrix of STATUS_* codes. """
+        if not self.atoms:
+            return np.zeros((values.shape[0], 0), dtype=np.int8)
+        uses_uln = np.isnan(self.threshold)
+        observed = np.where(uses_uln, uln_ratio[:, self.analyte_idx], values[:, self.analyte_idx])
+        limits = np.where(uses_uln, self.uln_multiple, self.threshold)
+        condition = np.select(
+            [self.operator == 0, self.operator == 1, self.operator == 2, self.operator == 3],
+            [observed >= limits, observed <= limits, observed > limits, observed < limits],
+            default=False,
+        )
+        # Inclusion: the condition must hold. Exclusion: the condition must not hold.
+        satisfied = np.where(self.exclusion, ~condition, condition)
+        known = ~np.isnan(observed)
+        return np.where(known, np.where(satisfied, STATUS_MET, STATUS_NOT_MET), STATUS_UNCLEAR).astype(np.int8)
+
+    def evaluate(self, patients: Sequence[Dict[str, Any]]) -> np.ndarray:
+        """ Convenience wrapper: build the lab matrix and evaluate every criterion for every patient. """
+        return self.evaluate_matrix(*self.build_lab_matrix(patients))
+
+    def evaluate_patient(self, patient: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """ Per-criterion results with evidence for one patient: {"criterion_id", "criterion", "status", "reasoning"}. """
+        statuses = self.evaluate_matrix(*self.build_lab_matrix([patient]))[0]
+        results = []
+        for atom, status in zip(self.atoms, statuses):
+            component = find_patient_lab(patient, atom["analyte"])
+            if component is None:
+                evidence = f"No {atom['analyte']} result in recent labs"
+            else:
+                evidence = f"{component.get('test')} {component.get('value')} {component.get('unit', '')}".strip()
+                if atom.get("uln_multiple") is not None:
+                    evidence += f" (ULN {upper_limit(component.get('refRange'))})"
+            if status == STATUS_UNCLEAR:
+                reasoning = f"{evidence}; cannot compare against {describe_threshold(atom)}."
+            else:
+                condition_true = (status == STATUS_MET) != (atom.get("kind") == "exclusion")
+                verdict = "meets" if condition_true else "does not meet"
+                reasoning = f"{evidence}; {verdict} {describe_threshold(atom)} ({atom.get('kind')} criterion)."
+            results.append({
+                "criterion_id": atom.get("criterion_id"),
+                "criterion": atom.get("text"),
+                "status": STATUS_LABELS[int(status)],
+                "reasoning": reasoning,
+            })
+        return results
+
+    @staticmethod
+    def patient_verdicts(statuses: np.ndarray) -> np.ndarray:
+        """ Collapses a (patients x criteria) status matrix: any NOT_MET -> NOT_MET, all MET -> MET, else UNCLEAR. """
+        if statuses.shape[1] == 0:
+            return np.full(statuses.shape[0], STATUS_UNCLEAR, dtype=np.int8)
+        any_failed = (statuses == STATUS_NOT_MET).any(axis=1)
+        all_met = (statuses == STATUS_MET).all(axis=1)
+        return np.where(any_failed, STATUS_NOT_MET, np.where(all_met, STATUS_MET, STATUS_UNCLEAR)).astype(np.int8)
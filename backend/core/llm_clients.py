@@ -1,12 +1,286 @@
+"""
+LLM provider backends and the legacy GeminiClient wrapper.
+
+`LLMProvider` is the seam between the LLM gateway and an actual model
+backend. `GeminiProvider` talks to Google Generative AI; `LocalLLMProvider`
+is an offline, deterministic stand-in for load testing that returns
+well-formed responses for the prompts the agents send (structured
+eligibility text, intent JSON, STATUS/REASONING, next-steps JSON, drafts)
+with configurable latency and error rates. Select one with LLM_PROVIDER
+("gemini", the default, or "local").
+"""
+
+import asyncio
+import hashlib
+import json
+import logging
 import os
-import google.generativeai as genai
+import random
+import re
+from abc import ABC, abstractmethod
+from typing import Any, Dict, List, Optional
+
 from dotenv import load_dotenv
 
+from backend.core.intent_classifier import extract_condition
+
 # Load environment variables
 # Assumes .env file is at the project root (two levels up from core)
 dotenv_path = os.path.join(os.path.dirname(__file__), '..', '..', '.env')
 load_dotenv(dotenv_path=dotenv_path)
 
+
+class LLMProviderError(Exception):
+    """ Base class for provider-level failures. """
+
+
+class LLMBlockedError(LLMProviderError):
+    """ The model returned no candidates (safety block or empty response). """
+
+    def __init__(self, block_reason: str):
+        super().__init__(f"LLM response blocked or empty (reason: {block_reason})")
+        self.block_reason = block_reason
+
+
+class SimulatedLLMError(LLMProviderError):
+    """ Transient failure injected by LocalLLMProvider (treated as retryable by the gateway). """
+
+
+# --- Provider Interface ---
+class LLMProvider(ABC):
+    """ Minimal interface every LLM backend implements. """
+
+    name = "base"
+
+    @property
+    def available(self) -> bool:
+        return True
+
+    @property
+    def missing_setting(self) -> Optional[str]:
+        """ Environment variable the provider needs but doesn't have (None when configured). """
+        return None
+
+    @abstractmethod
+    async def generate(self, prompt: str, model_name: str, generation_config: Optional[Any] = None,
+                       safety_settings: Optional[Any] = None) -> str:
+        """ Returns the response text; raises LLMBlockedError when the model returns nothing usable. """
+        pass
+
+
+class GeminiProvider(LLMProvider):
+    """ Google Generative AI backend. Models are created once per name and reused. """
+
+    name = "gemini"
+
+    def __init__(self, api_key: Optional[str] = None):
+        self._api_key = api_key
+        self._models: Dict[str, Any] = {}
+        self._configured = False
+
+    @property
+    def api_key(self) -> Optional[str]:
+        # Resolved lazily so .env files loaded after import are still picked up
+        return self._api_key if self._api_key is not None else os.getenv("GOOGLE_API_KEY")
+
+    @property
+    def available(self) -> bool:
+        return bool(self.api_key)
+
+    @property
+    def missing_setting(self) -> Optional[str]:
+        return None if self.available else "GOOGLE_API_KEY"
+
+    def _get_model(self, model_name: str):
+        import google.generativeai as genai  # Imported lazily so the local provider works without it
+        if not self._configured:
+            genai.configure(api_key=self.api_key)
+            self._configured = True
+        if model_name not in self._models:
+            logging.info(f"[GeminiProvider] Initializing Gemini model: {model_name}")
+            self._models[model_name] = genai.GenerativeModel(model_name)
+        return self._models[model_name]
+
+    async def generate(self, prompt: str, model_name: str, generation_config: Optional[Any] = None,
+                       safety_settings: Optional[Any] = None) -> str:
+        model = self._get_model(model_name)
+        kwargs = {}
+        if generation_config is not None:
+            kwargs["generation_config"] = generation_config
+        if safety_settings is not None:
+            kwargs["safety_settings"] = safety_settings
+        response = await model.generate_content_async(prompt, **kwargs)
+        if not response.candidates or not response.parts:
+            feedback = getattr(response, "prompt_feedback", None)
+            block_reason = getattr(feedback, "block_reason", None) if feedback else None
+            raise LLMBlockedError(str(block_reason or "unknown"))
+        return response.text
+
+
+class LocalLLMProvider(LLMProvider):
+    """
+    Deterministic offline backend for load tests and demos.
+
+    Response *content* depends only on the prompt (same prompt -> same text).
+    Latency and injected errors come from a seeded RNG so runs are reproducible.
+    """
+
+    name = "local"
+
+    INTENT_KEYWORDS = [
+        ("find_trials", ("trial", "study", "studies")),
+        ("manage_side_effects", ("side effect", "nausea", "fatigue", "rash", "manage")),
+        ("notify", ("notify", "tell", "inform", "message")),
+        ("schedule", ("schedule", "book", "appointment")),
+        ("referral", ("refer", "referral")),
+        ("summarize", ("summarize", "summary", "overview")),
+    ]
+
+    def __init__(self, latency_ms: Optional[float] = None, latency_jitter_ms: Optional[float] = None,
+                 error_rate: Optional[float] = None, block_rate: Optional[float] = None,
+                 seed: Optional[int] = None):
+        """
+        Args:
+            latency_ms: Mean simulated latency (LOCAL_LLM_LATENCY_MS, default 50).
+            latency_jitter_ms: Std-dev of the latency (LOCAL_LLM_LATENCY_JITTER_MS, default 0).
+            error_rate: Probability of a transient SimulatedLLMError (LOCAL_LLM_ERROR_RATE, default 0).
+            block_rate: Probability of an LLMBlockedError (LOCAL_LLM_BLOCK_RATE, default 0).
+            seed: RNG seed for latency/error draws (LOCAL_LLM_SEED, default 0).
+        """
+        self.latency_ms = float(latency_ms if latency_ms is not None else os.getenv("LOCAL_LLM_LATENCY_MS", "50"))
+        self.latency_jitter_ms = float(latency_jitter_ms if latency_jitter_ms is not None else os.getenv("LOCAL_LLM_LATENCY_JITTER_MS", "0"))
+        self.error_rate = float(error_rate if error_rate is not None else os.getenv("LOCAL_LLM_ERROR_RATE", "0"))
+        self.block_rate = float(block_rate if block_rate is not None else os.getenv("LOCAL_LLM_BLOCK_RATE", "0"))
+        self._rng = random.Random(int(seed if seed is not None else os.getenv("LOCAL_LLM_SEED", "0")))
+        self.calls = 0
+
+    async def generate(self, prompt: str, model_name: str, generation_config: Optional[Any] = None,
+                       safety_settings: Optional[Any] = None) -> str:
+        self.calls += 1
+        delay_ms = self.latency_ms
+        if self.latency_jitter_ms:
+            delay_ms = max(0.0, self._rng.gauss(self.latency_ms, self.latency_jitter_ms))
+        roll = self._rng.random()
+        if delay_ms:
+            await asyncio.sleep(delay_ms / 1000.0)
+        if roll < self.error_rate:
+            raise SimulatedLLMError(f"Simulated transient failure from local provider ({model_name})")
+        if roll < self.error_rate + self.block_rate:
+            raise LLMBlockedError("SIMULATED_SAFETY")
+        return self.respond(prompt)
+
+    # --- Deterministic response builders ---
+    @staticmethod
+    def _digest(text: str) -> int:
+        return int(hashlib.sha256(text.encode("utf-8")).hexdigest()[:8], 16)
+
+    def respond(self, prompt: str) -> str:
+        """ Picks a response shape based on the prompt's expected output format. """
+        if "== SUMMARY ==" in prompt and "== UNCLEAR CRITERIA ==" in prompt:
+            return self._eligibility_text(prompt)
+        if "STATUS: [MET | NOT_MET | UNCLEAR]" in prompt:
+            return self._criterion_status(prompt)
+        if '"action_type"' in prompt and "JSON list" in prompt:
+            return self._next_steps(prompt)
+        if "The possible intents are:" in prompt:
+            return self._intent(prompt)
+        if '"subject"' in prompt and '"body"' in prompt:
+            return json.dumps({
+                "subject": "Clinical update (local draft)",
+                "body": f"This is a locally generated draft (ref {self._digest(prompt) % 10000:04d}). Please review before sending.",
+            })
+        return f"Local LLM response (ref {self._digest(prompt) % 10000:04d}): {prompt.strip()[:120]}"
+
+    @staticmethod
+    def _criteria_lines(prompt: str, start_label: str, end_label: str) -> List[str]:
+        match = re.search(re.escape(start_label) + r"\s*(.*?)\s*" + re.escape(end_label), prompt, re.DOTALL)
+        if not match:
+            return []
+        lines = []
+        for raw in match.group(1).split("\n"):
+            line = raw.strip().lstrip("*-•0123456789.) ").strip()
+            if len(line) > 3 and not line.startswith("("):
+                lines.append(line[:200])
+        return lines[:12]
+
+    def _eligibility_text(self, prompt: str) -> str:
+        criteria = (self._criteria_lines(prompt, "Inclusion Criteria:", "Exclusion Criteria:")
+                    + self._criteria_lines(prompt, "Exclusion Criteria:", "**Instructions"))
+        met, unmet, unclear = [], [], []
+        for criterion in criteria:
+            bucket = self._digest(criterion) % 3
+            if bucket == 0:
+                met.append(f"* {criterion}")
+            elif bucket == 1:
+                unmet.append(f"* {criterion} - Reasoning: Patient record does not satisfy this requirement (simulated).")
+            else:
+                unclear.append(f"* {criterion} - Reasoning: Required information is not present in the profile (simulated).")
+        if unmet:
+            status = "Likely Ineligible"
+        elif unclear:
+            status = "Eligibility Unclear due to missing info"
+        else:
+            status = "Likely Eligible"
+        return "\n".join([
+            "== SUMMARY ==",
+            f"Simulated assessment: {len(met)} criteria met, {len(unmet)} unmet and {len(unclear)} unclear.",
+            "",
+            "== ELIGIBILITY ==",
+            status,
+            "",
+            "== MET CRITERIA ==",
+            "\n".join(met) or "None",
+            "",
+            "== UNMET CRITERIA ==",
+            "\n".join(unmet) or "None",
+            "",
+            "== UNCLEAR CRITERIA ==",
+            "\n".join(unclear) or "None",
+        ])
+
+    def _criterion_status(self, prompt: str) -> str:
+        status = ("MET", "NOT_MET", "UNCLEAR")[self._digest(prompt) % 3]
+        return f"STATUS: {status}\nREASONING: Simulated re-evaluation against the Initial Assessment Reasoning and the Patient Data Snippet."
+
+    def _next_steps(self, prompt: str) -> str:
+        steps = [
+            {"action_type": "ORDER_LABS", "description": "Order CBC w/ Diff & CMP",
+             "rationale": "Simulated: fills lab-value gaps.", "details": "CBC with differential, Comprehensive Metabolic Panel"},
+            {"action_type": "SCHEDULE_ASSESSMENT", "description": "Document ECOG performance status",
+             "rationale": "Simulated: performance status frequently missing.", "details": None},
+            {"action_type": "CLARIFY_WITH_PATIENT", "description": "Confirm prior therapies and concomitant medications",
+             "rationale": "Simulated: medication history incomplete.", "details": None},
+        ]
+        count = 1 + self._digest(prompt) % len(steps)
+        return "```json\n" + json.dumps(steps[:count], indent=2) + "\n```"
+
+    def _intent(self, prompt: str) -> str:
+        match = re.search(r"Analyze the following user request:\s*(.*?)\s*Respond ONLY", prompt, re.DOTALL)
+        request = (match.group(1) if match else prompt).strip()
+        lowered = request.lower()
+        intent = "answer_question"
+        for candidate, keywords in self.INTENT_KEYWORDS:
+            if any(k in lowered for k in keywords):
+                intent = candidate
+                break
+        entities: Dict[str, Any] = {}
+        condition = extract_condition(request)
+        if condition:
+            entities["specific_condition"] = condition
+        return json.dumps({"intent": intent, "entities": entities})
+
+
+def get_llm_provider(name: Optional[str] = None) -> LLMProvider:
+    """ Builds the provider named by `name` or the LLM_PROVIDER env var (default: gemini). """
+    provider_name = (name or os.getenv("LLM_PROVIDER", "gemini")).strip().lower()
+    if provider_name == "local":
+        logging.info("[llm_clients] Using LocalLLMProvider (offline, deterministic).")
+        return LocalLLMProvider()
+    if provider_name != "gemini":
+        logging.warning(f"[llm_clients] Unknown LLM_PROVIDER '{provider_name}', falling back to gemini.")
+    return GeminiProvider()
+
+
 class GeminiClient:
     """Client for interacting with the Google Gemini API."""
 
@@ -17,23 +291,23 @@ class GeminiClient:
             model_name (str): The name of the Gemini model to use.
                               Defaults to "gemini-1.5-flash".
         """
-        self.api_key = os.getenv("GOOGLE_API_KEY")
-        if not self.api_key:
-            raise ValueError("GOOGLE_API_KEY environment variable not set.")
+        # Imported here: the gateway itself depends on the providers above
+        from backend.core.llm_gateway import llm_gateway
+
+        if not llm_gateway.available:
+            raise ValueError(llm_gateway.unavailable_reason)
         
-        try:
-            genai.configure(api_key=self.api_key)
-            self.model = genai.GenerativeModel(model_name)
-            print(f"GeminiClient initialized with model: {model_name}")
-        except Exception as e:
-            print(f"Error initializing Gemini model: {e}")
-            raise RuntimeError(f"Failed to initialize Gemini model ({model_name}): {e}") from e
+        # Requests are sent through the shared gateway (rate limits, retries, coalescing)
+        self.model_name = model_name
+        self.gateway = llm_gateway
+        print(f"GeminiClient initialized with model: {model_name}")
 
-    async def generate(self, prompt: str) -> str:
+    async def generate(self, prompt: str, caller: str = "gemini_client") -> str:
         """Generates text using the configured Gemini model.
 
         Args:
             prompt: The input prompt string.
+            caller: Name reported in the gateway's per-caller metrics.
 
         Returns:
             The generated text response.
@@ -42,19 +316,11 @@ class GeminiClient:
             Exception: If the API call fails.
         """
         try:
-            # print(f"GeminiClient sending prompt:\n---\n{prompt}\n---") # Optional debug logging
-            response = await self.model.generate_content_async(prompt)
-            # print(f"GeminiClient received response parts: {response.parts}") # Optional debug logging
-            # Handle potential lack of text in response parts gracefully
-            if response.parts:
-                # Assuming the first part contains the primary text response
-                # This might need adjustment based on specific model behavior or safety settings
-                return response.text # Use response.text for convenience
-            else:
-                # Handle cases where response might be blocked or empty
-                block_reason = response.prompt_feedback.block_reason if response.prompt_feedback else 'unknown'
-                print(f"Warning: Gemini response was empty or blocked. Reason: {block_reason}")
-                return f"[AI response blocked or empty - Reason: {block_reason}]"
+            return await self.gateway.generate(prompt, model_name=self.model_name, caller=caller)
+        except LLMBlockedError as e:
+            # Handle cases where response might be blocked or empty
+            print(f"Warning: Gemini response was empty or blocked. Reason: {e.block_reason}")
+            return f"[AI response blocked or empty - Reason: {e.block_reason}]"
         except Exception as e:
             print(f"Error during Gemini API call: {e}")
             # Re-raise or handle more specifically as needed
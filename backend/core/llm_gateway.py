@@ -0,0 +1,289 @@
+"""
+Shared async gateway for every LLM call made by the backend.
+
+Agents used to build their own `genai.GenerativeModel` and fire requests
+without any limit, so a busy room could burst past the Gemini quota. All
+calls now go through `llm_gateway.generate()`, which applies:
+
+- a per-model concurrency semaphore
+- a per-model token-bucket rate limiter
+- jittered exponential backoff on transient (quota/availability) errors
+- coalescing of identical in-flight prompts
+- per-caller metrics (exposed via /api/health)
+
+The backend itself is an `LLMProvider` from llm_clients (Gemini by default,
+or the offline LocalLLMProvider with LLM_PROVIDER=local).
+"""
+
+import asyncio
+import hashlib
+import logging
+import os
+import random
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from dotenv import load_dotenv
+
+from backend.core.llm_clients import LLMBlockedError, LLMProvider, get_llm_provider
+
+load_dotenv(dotenv_path=os.path.join(os.path.dirname(__file__), '..', '.env'))
+
+DEFAULT_MODEL_NAME = "gemini-1.5-flash"
+DEFAULT_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "4"))
+DEFAULT_RATE_LIMIT_RPM = float(os.getenv("LLM_RATE_LIMIT_RPM", "60"))
+DEFAULT_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "3"))
+DEFAULT_BACKOFF_BASE_SECONDS = float(os.getenv("LLM_BACKOFF_BASE_SECONDS", "1.0"))
+DEFAULT_BACKOFF_MAX_SECONDS = float(os.getenv("LLM_BACKOFF_MAX_SECONDS", "20.0"))
+DEFAULT_REQUEST_TIMEOUT_SECONDS = float(os.getenv("LLM_REQUEST_TIMEOUT_SECONDS", "120"))
+
+# Matched by class name (anywhere in the MRO) so we don't hard-depend on google.api_core
+RETRYABLE_ERROR_NAMES = {
+    "ResourceExhausted",      # 429 quota
+    "TooManyRequests",
+    "ServiceUnavailable",     # 503
+    "InternalServerError",    # 500
+    "DeadlineExceeded",
+    "GatewayTimeout",
+    "TimeoutError",
+    "ConnectionError",
+    "SimulatedLLMError",      # injected by LocalLLMProvider
+}
+
+GenerateFn = Callable[[str, str, Optional[Any], Optional[Any]], Awaitable[str]]
+
+
+class LLMGatewayError(Exception):
+    """ Raised when the gateway cannot produce a response. """
+
+
+class TokenBucket:
+    """ Async token bucket: `rate` tokens per second, holding at most `capacity`. """
+
+    def __init__(self, rate_per_second: float, capacity: float):
+        self.rate = rate_per_second
+        self.capacity = max(1.0, capacity)
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self) -> float:
+        """ Waits for one token. Returns the number of seconds spent waiting. """
+        if self.rate <= 0:
+            return 0.0
+        waited = 0.0
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+                self.updated_at = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return waited
+                delay = (1 - self.tokens) / self.rate
+                waited += delay
+                await asyncio.sleep(delay)
+
+
+class LLMGateway:
+    """ Rate-limited, retrying, coalescing front door for LLM requests. """
+
+    def __init__(self, provider: Optional[LLMProvider] = None, generate_fn: Optional[GenerateFn] = None,
+                 max_concurrency: int = DEFAULT_MAX_CONCURRENCY, rate_limit_rpm: float = DEFAULT_RATE_LIMIT_RPM,
+                 max_retries: int = DEFAULT_MAX_RETRIES, backoff_base: float = DEFAULT_BACKOFF_BASE_SECONDS,
+                 backoff_max: float = DEFAULT_BACKOFF_MAX_SECONDS,
+                 request_timeout: Optional[float] = DEFAULT_REQUEST_TIMEOUT_SECONDS,
+                 model_limits: Optional[Dict[str, Dict[str, float]]] = None):
+        """
+        Args:
+            provider: LLM backend. Defaults to get_llm_provider() (LLM_PROVIDER env var), resolved on first use.
+            generate_fn: Optional async callable (prompt, model_name, generation_config, safety_settings) -> text;
+                         takes precedence over the provider (handy for tests).
+            model_limits: Optional per-model overrides, e.g. {"gemini-1.5-pro": {"max_concurrency": 2, "rate_limit_rpm": 30}}.
+        """
+        self._provider = provider
+        self._generate_fn = generate_fn
+        self.max_concurrency = max(1, int(max_concurrency))
+        self.rate_limit_rpm = rate_limit_rpm
+        self.max_retries = max(0, int(max_retries))
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.request_timeout = request_timeout
+        self.model_limits = model_limits or {}
+
+        self._semaphores: Dict[str, asyncio.Semaphore] = {}
+        self._buckets: Dict[str, TokenBucket] = {}
+        self._in_flight: Dict[str, asyncio.Future] = {}
+        self._in_flight_counts: Dict[str, int] = {}
+        self._metrics: Dict[str, Dict[str, float]] = {}
+
+    @property
+    def provider(self) -> LLMProvider:
+        if self._provider is None:
+            self._provider = get_llm_provider()
+        return self._provider
+
+    def set_provider(self, provider: LLMProvider) -> None:
+        """ Swaps the backend (e.g. to LocalLLMProvider for load tests). In-flight calls are unaffected. """
+        self._provider = provider
+
+    @property
+    def available(self) -> bool:
+        """ True if the gateway can actually reach a model. """
+        return self._generate_fn is not None or self.provider.available
+
+    @property
+    def unavailable_reason(self) -> Optional[str]:
+        """ Why the gateway can't reach a model, naming the provider and its missing setting (None if available). """
+        if self.available:
+            return None
+        missing = self.provider.missing_setting
+        detail = f"{missing} is not set" if missing else "provider unavailable"
+        return f"LLM provider '{self.provider.name}' (LLM_PROVIDER) is not configured: {detail}"
+
+    # --- Per-model limiters ---
+    def _limit(self, model_name: str, key: str, default: float) -> float:
+        return self.model_limits.get(model_name, {}).get(key, default)
+
+    def _semaphore(self, model_name: str) -> asyncio.Semaphore:
+        if model_name not in self._semaphores:
+            self._semaphores[model_name] = asyncio.Semaphore(int(self._limit(model_name, "max_concurrency", self.max_concurrency)))
+        return self._semaphores[model_name]
+
+    def _bucket(self, model_name: str) -> TokenBucket:
+        if model_name not in self._buckets:
+            rpm = self._limit(model_name, "rate_limit_rpm", self.rate_limit_rpm)
+            # Allow a burst of up to the concurrency limit
+            capacity = self._limit(model_name, "max_concurrency", self.max_concurrency)
+            self._buckets[model_name] = TokenBucket(rpm / 60.0, capacity)
+        return self._buckets[model_name]
+
+    # --- Metrics ---
+    def _caller_metrics(self, caller: str) -> Dict[str, float]:
+        if caller not in self._metrics:
+            self._metrics[caller] = {
+                "requests": 0, "successes": 0, "failures": 0, "retries": 0, "coalesced": 0,
+                "total_latency_seconds": 0.0, "max_latency_seconds": 0.0, "total_queue_seconds": 0.0,
+            }
+        return self._metrics[caller]
+
+    def metrics(self) -> Dict[str, Any]:
+        """ Returns per-caller counters plus current in-flight counts per model. """
+        callers = {}
+        for caller, m in self._metrics.items():
+            completed = m["successes"] + m["failures"]
+            callers[caller] = dict(m)
+            callers[caller]["avg_latency_seconds"] = round(m["total_latency_seconds"] / completed, 4) if completed else 0.0
+        return {
+            "provider": "custom" if self._generate_fn else self.provider.name,
+            "available": self.available,
+            "max_concurrency": self.max_concurrency,
+            "rate_limit_rpm": self.rate_limit_rpm,
+            "in_flight": dict(self._in_flight_counts),
+            "callers": callers,
+        }
+
+    # --- Retry policy ---
+    @staticmethod
+    def is_retryable(error: BaseException) -> bool:
+        if isinstance(error, LLMBlockedError):
+            return False
+        if isinstance(error, (asyncio.TimeoutError, ConnectionError)):
+            return True
+        return any(cls.__name__ in RETRYABLE_ERROR_NAMES for cls in type(error).__mro__)
+
+    def _backoff_delay(self, attempt: int) -> float:
+        # Full jitter: uniform in [0, min(cap, base * 2^attempt)]
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+    async def _execute(self, prompt: str, model_name: str, caller: str,
+                       generation_config: Optional[Any], safety_settings: Optional[Any]) -> str:
+        metrics = self._caller_metrics(caller)
+        generate = self._generate_fn or self.provider.generate
+        attempt = 0
+        while True:
+            queued_at = time.perf_counter()
+            async with self._semaphore(model_name):
+                await self._bucket(model_name).acquire()
+                metrics["total_queue_seconds"] += time.perf_counter() - queued_at
+                self._in_flight_counts[model_name] = self._in_flight_counts.get(model_name, 0) + 1
+                try:
+                    call = generate(prompt, model_name, generation_config, safety_settings)
+                    if self.request_timeout:
+                        return await asyncio.wait_for(call, timeout=self.request_timeout)
+                    return await call
+                except Exception as e:
+                    error = e
+                finally:
+                    self._in_flight_counts[model_name] -= 1
+
+            # Sleep outside the semaphore so other requests can use the slot
+            if attempt >= self.max_retries or not self.is_retryable(error):
+                raise error
+            delay = self._backoff_delay(attempt)
+            attempt += 1
+            metrics["retries"] += 1
+            logging.warning(f"[LLMGateway] {caller} -> {model_name} failed with {type(error).__name__}: {error}. "
+                            f"Retry {attempt}/{self.max_retries} in {delay:.2f}s")
+            await asyncio.sleep(delay)
+
+    # --- Public API ---
+    async def generate(self, prompt: str, model_name: str = DEFAULT_MODEL_NAME, caller: str = "unknown",
+                       generation_config: Optional[Any] = None, safety_settings: Optional[Any] = None,
+                       coalesce: bool = True) -> str:
+        """
+        Sends `prompt` to `model_name` and returns the response text.
+
+        Identical concurrent requests (same model, prompt and config) share one upstream call.
+        Raises LLMGatewayError if the gateway is not configured, LLMBlockedError on blocked
+        responses, and re-raises the last upstream error once retries are exhausted.
+        """
+        if not self.available:
+            raise LLMGatewayError(f"LLM gateway is not configured. {self.unavailable_reason}.")
+
+        metrics = self._caller_metrics(caller)
+        metrics["requests"] += 1
+        start = time.perf_counter()
+
+        key = None
+        future = None
+        if coalesce:
+            key = hashlib.sha256(
+                f"{model_name}\x1f{generation_config!r}\x1f{safety_settings!r}\x1f{prompt}".encode("utf-8")
+            ).hexdigest()
+            future = self._in_flight.get(key)
+            if future is not None:
+                metrics["coalesced"] += 1
+                logging.debug(f"[LLMGateway] Coalesced identical in-flight request from {caller}")
+
+        if future is None:
+            future = asyncio.ensure_future(self._execute(prompt, model_name, caller, generation_config, safety_settings))
+            future.add_done_callback(lambda f, k=key: self._forget(k, f))
+            if key is not None:
+                self._in_flight[key] = future
+
+        try:
+            # shield() so one waiter being cancelled doesn't cancel a call others are sharing
+            result = await asyncio.shield(future)
+            metrics["successes"] += 1
+            return result
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            metrics["failures"] += 1
+            raise
+        finally:
+            elapsed = time.perf_counter() - start
+            metrics["total_latency_seconds"] += elapsed
+            metrics["max_latency_seconds"] = max(metrics["max_latency_seconds"], elapsed)
+
+    def _forget(self, key: Optional[str], future: asyncio.Future) -> None:
+        if key is not None and self._in_flight.get(key) is future:
+            del self._in_flight[key]
+        # Mark the exception as retrieved in case every waiter was cancelled
+        if not future.cancelled():
+            future.exception()
+
+
+# Singleton instance
+llm_gateway = LLMGateway()
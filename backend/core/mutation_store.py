@@ -0,0 +1,343 @@
+"""
+Columnar, dictionary-encoded store for the TCGA (cBioPortal) mutation data.
+
+The SQLite `mutations` table keeps one wide TEXT row per mutation. Here every
+string column is dictionary-encoded (gene, patient, sample, chromosome,
+protein change, variant type, mutation status) into small integer codes, and
+each column is saved as its own `.npy` file so the API can open the store
+memory-mapped (`np.load(..., mmap_mode="r")`): startup costs a few page faults
+and the OS page cache is shared between workers.
+
+Rows are sorted by (gene, patient, protein change), which gives:
+- a CSR gene index: rows of gene g are `gene_offsets[g]:gene_offsets[g + 1]`
+- a patient index: `patient_order` (row ids sorted by patient) with `patient_offsets`
+- a position index: `position_order` (row ids sorted by chromosome, start), with
+  `chrom_offsets` and the matching sorted `position_start` for binary search
+
+Typical queries ("all patients with PIK3CA H1047R", gene x patient presence
+matrices, chromosome/start range lookups) then touch only the slices they need.
+"""
+
+import json
+import logging
+import os
+import shutil
+import sqlite3
+import threading
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+DEFAULT_MUTATION_STORE_PATH = os.getenv(
+    "MUTATION_STORE_PATH",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "mutation_store"),
+)
+STORE_FORMAT_VERSION = 1
+
+# Dictionary-encoded columns -> (SQL column name, cBioPortal JSON key)
+ENCODED_COLUMNS = {
+    "gene": ("hugo_gene_symbol", "hugoGeneSymbol"),
+    "patient": ("patient_id", "patientId"),
+    "sample": ("sample_id", "sampleId"),
+    "chrom": ("chromosome", "chromosome"),
+    "protein": ("protein_change", "proteinChange"),
+    "variant_type": ("variant_type", "variantType"),
+    "mutation_status": ("mutation_status", "mutationStatus"),
+}
+# Integer columns -> (SQL column name, cBioPortal JSON key)
+NUMERIC_COLUMNS = {
+    "start": ("start_position", "startPosition"),
+    "end": ("end_position", "endPosition"),
+}
+_MISSING_POSITION = -1
+
+
+def normalize_protein_change(value: Optional[str]) -> str:
+    """ "p.H1047R" / "h1047r" -> "H1047R" so queries match however the change was written. """
+    text = (value or "").strip()
+    if text[:2].lower() == "p.":
+        text = text[2:]
+    return text.upper()
+
+
+def normalize_chromosome(value: Any) -> str:
+    text = str(value or "").strip()
+    return text[3:] if text.lower().startswith("chr") else text
+
+
+def _row_value(record: Dict[str, Any], sql_key: str, json_key: str) -> Any:
+    """ Reads a field from either a SQL row (snake_case) or a raw cBioPortal record (camelCase, gene nested). """
+    if sql_key in record:
+        return record[sql_key]
+    if json_key == "hugoGeneSymbol":
+        return (record.get("gene") or {}).get("hugoGeneSymbol")
+    return record.get(json_key)
+
+
+def _encode(values: List[str]) -> Tuple[np.ndarray, List[str]]:
+    dictionary, codes = np.unique(np.asarray(values, dtype=object).astype(str), return_inverse=True)
+    dtype = np.int16 if len(dictionary) < 2 ** 15 else np.int32
+    return codes.astype(dtype), [str(v) for v in dictionary]
+
+
+def _offsets(sorted_codes: np.ndarray, size: int) -> np.ndarray:
+    """ CSR offsets for codes 0..size-1 in an already sorted code array. """
+    return np.searchsorted(sorted_codes, np.arange(size + 1)).astype(np.int64)
+
+
+class MutationStore:
+    """ Read side of the columnar store; use `build` / `build_from_sqlite` to create one. """
+
+    def __init__(self, columns: Dict[str, np.ndarray], dictionaries: Dict[str, List[str]], meta: Dict[str, Any]):
+        self.columns = columns
+        self.dictionaries = dictionaries
+        self.meta = meta
+        self._code_lookup = {name: {value: i for i, value in enumerate(values)} for name, values in dictionaries.items()}
+
+    # --- Build ---
+    @classmethod
+    def build(cls, records: Iterable[Dict[str, Any]], out_dir: Optional[str] = None) -> "MutationStore":
+        """ Encodes mutation rows (SQL rows or raw cBioPortal records) and optionally saves them to `out_dir`. """
+        raw: Dict[str, List[Any]] = {name: [] for name in list(ENCODED_COLUMNS) + list(NUMERIC_COLUMNS)}
+        for record in records:
+            gene = _row_value(record, *ENCODED_COLUMNS["gene"])
+            patient = _row_value(record, *ENCODED_COLUMNS["patient"])
+            if not gene or not patient:
+                continue
+            for name, keys in ENCODED_COLUMNS.items():
+                value = _row_value(record, *keys)
+                if name == "protein":
+                    value = normalize_protein_change(value)
+                elif name == "chrom":
+                    value = normalize_chromosome(value)
+                raw[name].append("" if value is None else str(value))
+            for name, keys in NUMERIC_COLUMNS.items():
+                value = _row_value(record, *keys)
+                raw[name].append(int(value) if isinstance(value, (int, float)) or str(value or "").isdigit() else _MISSING_POSITION)
+
+        columns: Dict[str, np.ndarray] = {}
+        dictionaries: Dict[str, List[str]] = {}
+        for name in ENCODED_COLUMNS:
+            columns[name], dictionaries[name] = _encode(raw[name])
+        for name in NUMERIC_COLUMNS:
+            columns[name] = np.asarray(raw[name], dtype=np.int64)
+
+        # --- Sort rows by (gene, patient, protein) and build the indexes ---
+        order = np.lexsort((columns["protein"], columns["patient"], columns["gene"]))
+        columns = {name: col[order] for name, col in columns.items()}
+        n_genes, n_patients, n_chroms = (len(dictionaries[k]) for k in ("gene", "patient", "chrom"))
+        columns["gene_offsets"] = _offsets(columns["gene"], n_genes)
+        columns["patient_order"] = np.argsort(columns["patient"], kind="stable").astype(np.int64)
+        columns["patient_offsets"] = _offsets(columns["patient"][columns["patient_order"]], n_patients)
+        columns["position_order"] = np.lexsort((columns["start"], columns["chrom"])).astype(np.int64)
+        columns["position_start"] = columns["start"][columns["position_order"]]
+        columns["chrom_offsets"] = _offsets(columns["chrom"][columns["position_order"]], n_chroms)
+
+        lengths = columns["end"] - columns["start"]
+        meta = {
+            "format_version": STORE_FORMAT_VERSION,
+            "rows": int(len(order)),
+            "genes": n_genes,
+            "patients": n_patients,
+            "max_span": int(lengths.max()) if len(lengths) else 0,
+        }
+        store = cls(columns, dictionaries, meta)
+        if out_dir:
+            store.save(out_dir)
+        return store
+
+    @classmethod
+    def build_from_sqlite(cls, db_path: str, out_dir: Optional[str] = None, table: str = "mutations") -> "MutationStore":
+        conn = sqlite3.connect(db_path)
+        conn.row_factory = sqlite3.Row
+        try:
+            return cls.build((dict(row) for row in conn.execute(f'SELECT * FROM "{table}"')), out_dir)
+        finally:
+            conn.close()
+
+    def save(self, out_dir: str) -> None:
+        """ Writes one .npy per column plus JSON dictionaries; swaps the directory in atomically. """
+        tmp_dir = f"{out_dir}.tmp"
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        os.makedirs(tmp_dir)
+        for name, column in self.columns.items():
+            np.save(os.path.join(tmp_dir, f"{name}.npy"), np.ascontiguousarray(column))
+        with open(os.path.join(tmp_dir, "dictionaries.json"), "w") as f:
+            json.dump(self.dictionaries, f)
+        with open(os.path.join(tmp_dir, "meta.json"), "w") as f:
+            json.dump(self.meta, f)
+        old_dir = f"{out_dir}.old"
+        shutil.rmtree(old_dir, ignore_errors=True)
+        if os.path.exists(out_dir):
+            os.rename(out_dir, old_dir)
+        os.rename(tmp_dir, out_dir)
+        shutil.rmtree(old_dir, ignore_errors=True)
+
+    @classmethod
+    def open(cls, path: str = DEFAULT_MUTATION_STORE_PATH, mmap: bool = True) -> "MutationStore":
+        """ Opens a saved store; columns are memory-mapped unless mmap=False. """
+        with open(os.path.join(path, "meta.json")) as f:
+            meta = json.load(f)
+        if meta.get("format_version") != STORE_FORMAT_VERSION:
+            raise ValueError(f"Unsupported mutation store format {meta.get('format_version')} at {path}")
+        with open(os.path.join(path, "dictionaries.json")) as f:
+            dictionaries = json.load(f)
+        columns = {
+            file[:-4]: np.load(os.path.join(path, file), mmap_mode="r" if mmap else None)
+            for file in os.listdir(path) if file.endswith(".npy")
+        }
+        return cls(columns, dictionaries, meta)
+
+    # --- Lookups ---
+    def code(self, column: str, value: str) -> Optional[int]:
+        return self._code_lookup[column].get(value)
+
+    def gene_code(self, gene: str) -> Optional[int]:
+        """ Exact symbol first (e.g. "C1orf112"), then upper-cased. """
+        code = self.code("gene", gene)
+        return code if code is not None else self.code("gene", gene.upper())
+
+    def _gene_rows(self, gene: str) -> slice:
+        g = self.gene_code(gene)
+        if g is None:
+            return slice(0, 0)
+        offsets = self.columns["gene_offsets"]
+        return slice(int(offsets[g]), int(offsets[g + 1]))
+
+    def rows_to_dicts(self, rows: Iterable[int]) -> List[Dict[str, Any]]:
+        """ Decodes rows back into dicts using the SQL column names (what GenomicAnalystAgent expects). """
+        results = []
+        for row in rows:
+            record = {}
+            for name, (sql_key, _) in ENCODED_COLUMNS.items():
+                value = self.dictionaries[name][int(self.columns[name][row])]
+                record[sql_key] = value or None
+            for name, (sql_key, _) in NUMERIC_COLUMNS.items():
+                value = int(self.columns[name][row])
+                record[sql_key] = None if value == _MISSING_POSITION else value
+            results.append(record)
+        return results
+
+    def patients_with(self, gene: str, protein_change: Optional[str] = None,
+                      variant_type: Optional[str] = None) -> List[str]:
+        """ Sorted patient IDs with a mutation in `gene`, optionally a specific protein change / variant type. """
+        rows = self._gene_rows(gene)
+        mask = np.ones(rows.stop - rows.start, dtype=bool)
+        if protein_change:
+            p = self.code("protein", normalize_protein_change(protein_change))
+            if p is None:
+                return []
+            mask &= self.columns["protein"][rows] == p
+        if variant_type:
+            v = self.code("variant_type", variant_type)
+            if v is None:
+                return []
+            mask &= self.columns["variant_type"][rows] == v
+        patient_codes = np.unique(self.columns["patient"][rows][mask])
+        return [self.dictionaries["patient"][int(c)] for c in patient_codes]
+
+    def mutations_for_patient(self, patient_id: str) -> List[Dict[str, Any]]:
+        p = self.code("patient", patient_id)
+        if p is None:
+            return []
+        offsets = self.columns["patient_offsets"]
+        rows = self.columns["patient_order"][int(offsets[p]):int(offsets[p + 1])]
+        return self.rows_to_dicts(rows)
+
+    def presence_matrix(self, genes: Optional[Sequence[str]] = None,
+                        patients: Optional[Sequence[str]] = None) -> Tuple[np.ndarray, List[str], List[str]]:
+        """
+        Returns (matrix, genes, patients): a bool (genes x patients) matrix that is True where the
+        patient has at least one mutation in the gene. Unknown genes/patients get all-False rows/columns.
+        """
+        gene_names = list(genes) if genes is not None else list(self.dictionaries["gene"])
+        patient_names = list(patients) if patients is not None else list(self.dictionaries["patient"])
+        # Map store codes -> output positions (-1 = not requested)
+        gene_pos = np.full(len(self.dictionaries["gene"]), -1, dtype=np.int64)
+        for i, name in enumerate(gene_names):
+            code = self.gene_code(name)
+            if code is not None:
+                gene_pos[code] = i
+        patient_pos = np.full(len(self.dictionaries["patient"]), -1, dtype=np.int64)
+        for j, name in enumerate(patient_names):
+            code = self.code("patient", name)
+            if code is not None:
+                patient_pos[code] = j
+
+        matrix = np.zeros((len(gene_names), len(patient_names)), dtype=bool)
+        rows_g = gene_pos[self.columns["gene"]]
+        rows_p = patient_pos[self.columns["patient"]]
+        keep = (rows_g >= 0) & (rows_p >= 0)
+        matrix[rows_g[keep], rows_p[keep]] = True
+        return matrix, gene_names, patient_names
+
+    def range_lookup(self, chromosome: Any, start: int, end: Optional[int] = None) -> List[Dict[str, Any]]:
+        """ Mutations on `chromosome` overlapping [start, end] (a single position when end is None). """
+        end = start if end is None else end
+        c = self.code("chrom", normalize_chromosome(chromosome))
+        if c is None:
+            return []
+        offsets = self.columns["chrom_offsets"]
+        lo, hi = int(offsets[c]), int(offsets[c + 1])
+        starts = self.columns["position_start"][lo:hi]
+        # Any overlapping mutation starts at most max_span before `start`
+        first = lo + int(np.searchsorted(starts, start - self.meta["max_span"], side="left"))
+        last = lo + int(np.searchsorted(starts, end, side="right"))
+        candidates = np.asarray(self.columns["position_order"][first:last])
+        overlapping = candidates[self.columns["end"][candidates] >= start]
+        return self.rows_to_dicts(overlapping)
+
+    def gene_counts(self) -> Dict[str, int]:
+        """ Number of mutated patients per gene. """
+        counts = {}
+        offsets = self.columns["gene_offsets"]
+        for g, gene in enumerate(self.dictionaries["gene"]):
+            rows = self.columns["patient"][int(offsets[g]):int(offsets[g + 1])]
+            counts[gene] = int(len(np.unique(rows)))
+        return counts
+
+    def stats(self) -> Dict[str, Any]:
+        nbytes = sum(int(col.nbytes) for col in self.columns.values())
+        return {**self.meta, "column_bytes": nbytes}
+
+
+# --- Shared read-only instance for the API ---
+_shared_store: Optional[MutationStore] = None
+_shared_version: Optional[Tuple[str, int, int]] = None  # (path, meta.json inode, mtime) of the open store
+_shared_lock = threading.Lock()
+
+
+def _store_version(path: str) -> Optional[Tuple[str, int, int]]:
+    """ `save` swaps in a new directory, so a rebuild always changes meta.json's inode/mtime. """
+    try:
+        info = os.stat(os.path.join(path, "meta.json"))
+    except OSError:
+        return None
+    return path, info.st_ino, info.st_mtime_ns
+
+
+def get_mutation_store(path: str = DEFAULT_MUTATION_STORE_PATH) -> Optional[MutationStore]:
+    """
+    Memory-mapped store shared by request handlers, or None if it has not been built yet.
+    A store rebuilt on disk (e.g. by load_mutations_to_db.py in another process) is picked up
+    on the next call; requests still holding the old instance keep their (unlinked) mappings.
+    """
+    global _shared_store, _shared_version
+    version = _store_version(path)
+    with _shared_lock:
+        if version is not None and version != _shared_version:
+            try:
+                _shared_store = MutationStore.open(path)
+                _shared_version = version
+                logging.info(f"[MutationStore] Opened {path}: {_shared_store.meta}")
+            except (OSError, ValueError) as e:
+                logging.error(f"[MutationStore] Could not open {path}: {e}")
+        return _shared_store
+
+
+def reset_mutation_store() -> None:
+    """ Drops the shared instance so the next call re-opens the store from disk. """
+    global _shared_store, _shared_version
+    with _shared_lock:
+        _shared_store = None
+        _shared_version = None
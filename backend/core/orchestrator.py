@@ -4,8 +4,14 @@ Core Orchestrator for managing AI agents and handling user prompts.
 
 import json
 import os
-from typing import Any, Dict
-import google.generativeai as genai
+from typing import Any, Dict, Optional
+from backend.core.llm_gateway import llm_gateway
+
+from backend.core.agent_registry import AgentRegistry
+from backend.core.intent_classifier import IntentClassifier
+from backend.core.intents import (
+    SUMMARIZE, SCHEDULE, NOTIFY, REFERRAL, ANSWER_QUESTION, FIND_TRIALS, MANAGE_SIDE_EFFECTS, UNKNOWN_INTENT,
+)
 
 # Import Agents
 from backend.agents.data_analysis_agent import DataAnalysisAgent
@@ -46,16 +52,9 @@ CLINICAL_TRIAL_FINDER = "clinical_trial_finder"
 SIDE_EFFECT_MANAGER = "side_effect_manager"
 COMPARATIVE_THERAPIST = "comparative_therapist"
 PATIENT_EDUCATOR = "patient_educator"
+ELIGIBILITY_DEEP_DIVE = "eligibility_deep_dive" # Not intent-routed, shared via the agent registry
 
-# Define constants for intent names
-SUMMARIZE = "summarize"
-SCHEDULE = "schedule"
-NOTIFY = "notify"
-REFERRAL = "referral"
-ANSWER_QUESTION = "answer_question"
-FIND_TRIALS = "find_trials"
-MANAGE_SIDE_EFFECTS = "manage_side_effects"
-UNKNOWN_INTENT = "unknown_intent"
+# Intent name constants live in backend.core.intents (shared with the intent classifier)
 
 class AgentOrchestrator:
     """ Coordinates AI agents to handle user prompts and workflows using LLM for intent parsing. """
@@ -66,21 +65,27 @@ class AgentOrchestrator:
         ANSWER_QUESTION, FIND_TRIALS, MANAGE_SIDE_EFFECTS
     ]
 
-    def __init__(self):
-        """ Initializes the orchestrator, loads configuration, and registers agents. """
+    def __init__(self, registry: Optional[AgentRegistry] = None):
+        """
+        Initializes the orchestrator, loads configuration, and registers agents.
+
+        Agents registered in `registry` are shared with the rest of the app instead
+        of being instantiated again here; they are looked up when a prompt is routed
+        to them (see `get_agent`), so building the orchestrator never builds them.
+        """
+        self.registry = registry
         # LLM for Intent Parsing/Planning
         self.api_key = os.getenv("GOOGLE_API_KEY")
-        if not self.api_key:
+        if not llm_gateway.available:
             # If the agent initialization didn't already raise an error, this will.
-            raise ValueError("Orchestrator requires GOOGLE_API_KEY environment variable.")
+            raise ValueError(f"Orchestrator requires an LLM: {llm_gateway.unavailable_reason} (or use LLM_PROVIDER=local).")
         
-        try:
-            # Assuming genai was configured in main.py or agent init
-            # If not, uncomment: genai.configure(api_key=self.api_key)
-            self.intent_parser_model = genai.GenerativeModel('gemini-1.5-flash')
-            print("Orchestrator Initialized with Intent Parser Model.")
-        except Exception as e:
-            raise RuntimeError(f"Failed to initialize intent parser model: {e}")
+        # Intent parsing goes through the shared, rate-limited LLM gateway
+        self.intent_parser_model_name = 'gemini-1.5-flash'
+        self.llm = llm_gateway
+        print("Orchestrator Initialized with Intent Parser Model (via LLM gateway).")
+        # Rules answer obvious prompts; the LLM parser is only used when they are not confident
+        self.intent_classifier = IntentClassifier(llm_fallback=self._parse_intent_with_llm)
         
         # Instantiate and Register Agents using constants
         self.agents = {}
@@ -96,6 +101,9 @@ class AgentOrchestrator:
         }
         
         for agent_name, agent_class in agent_classes.items():
+            if self.registry and self.registry.is_registered(agent_name):
+                print(f"Using shared agent from registry: {agent_name}")
+                continue
             try:
                 agent_instance = agent_class()
                 self.agents[agent_name] = agent_instance
@@ -105,14 +113,21 @@ class AgentOrchestrator:
         
         print("Agent Orchestrator Initialized.")
 
+    def get_agent(self, agent_name: str) -> Optional[Any]:
+        """ The agent for `agent_name`: the registry's shared instance (created on first use) or our own. """
+        if self.registry and self.registry.is_registered(agent_name):
+            return self.registry.get(agent_name)
+        return self.agents.get(agent_name)
+
     async def handle_prompt(self, prompt: str, patient_id: str, patient_data: dict) -> dict:
         """ Receives a prompt, parses intent, routes to the appropriate agent, and returns the result. """
         print(f"Orchestrator received prompt for patient {patient_id}: '{prompt}'")
         context = {"patient_data": patient_data}
 
-        # --- Step 1: Intent Parsing (Using LLM) --- 
-        parsed_details = await self._parse_intent_with_llm(prompt)
-        print(f"Parsed intent result: {parsed_details}")
+        # --- Step 1: Intent Parsing (rules -> cache -> LLM) --- 
+        parsed_details = await self.intent_classifier.classify(prompt)
+        intent_tier = parsed_details.get("intent_tier")
+        print(f"Parsed intent result ({intent_tier} tier): {parsed_details}")
 
         if parsed_details["status"] != "success":
             return parsed_details # Return the parsing error
@@ -122,7 +137,7 @@ class AgentOrchestrator:
         agent_kwargs = {"prompt": prompt, "entities": entities, "patient_id": patient_id} # Pass original prompt + entities
 
         if intent not in self.SUPPORTED_INTENTS:
-            return {"status": "unknown_intent", "message": f"Could not process the recognized intent: {intent}"}
+            return {"status": "unknown_intent", "intent_tier": intent_tier, "message": f"Could not process the recognized intent: {intent}"}
 
         # Determine agent to use based on intent
         agent_name_to_use = None
@@ -139,14 +154,14 @@ class AgentOrchestrator:
         elif intent == MANAGE_SIDE_EFFECTS:
              agent_name_to_use = SIDE_EFFECT_MANAGER
 
-        if not agent_name_to_use or agent_name_to_use not in self.agents:
-            return {"status": "agent_not_implemented", "intent": intent, "message": f"Agent for '{intent}' is not available in this version."}
+        agent_to_run = self.get_agent(agent_name_to_use) if agent_name_to_use else None
+        if agent_to_run is None:
+            return {"status": "agent_not_implemented", "intent": intent, "intent_tier": intent_tier, "message": f"Agent for '{intent}' is not available in this version."}
 
         # Execute the chosen agent
         agent_result = None
         try:
             print(f"Routing to agent: {agent_name_to_use} for intent: {intent}")
-            agent_to_run = self.agents[agent_name_to_use]
             
             # --- Adapt call signature --- 
             if agent_name_to_use in [CLINICAL_TRIAL_FINDER, DATA_ANALYZER]:
@@ -162,17 +177,19 @@ class AgentOrchestrator:
             if agent_result:
                 agent_result["parsed_intent"] = intent
                 agent_result["parsed_entities"] = entities
+                agent_result["intent_tier"] = intent_tier
             return agent_result if agent_result else { # Handle cases where agent might return None
                  "status": "failure", 
                  "parsed_intent": intent,
                  "parsed_entities": entities,
+                 "intent_tier": intent_tier,
                  "error_message": f"Agent '{agent_name_to_use}' did not return a result.",
                  "output": None
              }
 
         except Exception as e:
             print(f"Error during agent execution ({agent_name_to_use}): {e}")
-            return {"status": "failure", "output": None, "summary": f"Agent {agent_name_to_use} failed.", "error_message": str(e)}
+            return {"status": "failure", "output": None, "intent_tier": intent_tier, "summary": f"Agent {agent_name_to_use} failed.", "error_message": str(e)}
 
     async def _parse_intent_with_llm(self, prompt: str) -> Dict[str, Any]:
         """ Uses the configured LLM to parse intent and extract entities. """
@@ -275,8 +292,7 @@ JSON Response:
         print("Sending prompt to Intent Parser Model...")
         response_text = "" # Initialize for error handling
         try:
-            response = await self.intent_parser_model.generate_content_async(instruction)
-            response_text = response.text
+            response_text = await self.llm.generate(instruction, model_name=self.intent_parser_model_name, caller="orchestrator.intent_parser")
             print(f"Raw Intent Parser Response Text: {response_text}") # Log raw response
             
             # Attempt to extract JSON block more robustly
@@ -0,0 +1,259 @@
+"""
+Compact, eligibility-relevant patient profiles for trial-assessment prompts.
+
+The full patient record (imaging access UIDs, wearable sync data, complete
+note text, contact details) used to be pasted into every trial prompt as
+indented JSON. `build_eligibility_profile` keeps only what eligibility
+criteria are judged on:
+
+- age, sex
+- diagnosis, stage, status
+- ECOG / performance status (structured value, else note mentions)
+- key labs with flags: every abnormal result plus the analytes lab
+  criteria refer to, one line per test, most recent first
+- current medications, medical history, allergies, prior treatments
+- mutations and biomarkers
+- imaging impressions (no accession numbers or UIDs)
+
+`PatientProfileCache` builds one profile per record (keyed by the record's
+content hash) and reuses it for every trial prompt of a search. Token counts
+are estimated at ~4 characters per token, which is close enough to report the
+savings per request.
+"""
+
+import json
+import os
+import re
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from backend.core.assessment_store import content_hash
+from backend.core.criteria_index import patient_age, patient_ecog
+from backend.core.lab_rules import analyte_for_test
+
+PROFILE_CACHE_MAX_ENTRIES = int(os.getenv("PATIENT_PROFILE_CACHE_MAX_ENTRIES", "256"))
+CHARS_PER_TOKEN = 4
+MAX_LIST_ITEMS = 15
+MAX_MUTATIONS = 40
+MAX_ECOG_MENTIONS = 3
+MAX_IMAGING_STUDIES = 3
+MAX_IMPRESSION_CHARS = 240
+NORMAL_FLAGS = {"", "normal", "n", "wnl", "none"}
+
+_STAGE_RE = re.compile(r"\bstage\s+([0IV]{1,4}[ABC]?\d?)\b", re.IGNORECASE)
+_SENTENCE_RE = re.compile(r"[^.;\n]*(?:ecog|performance\s+status|karnofsky|\bkps\b)[^.;\n]*", re.IGNORECASE)
+_IMPRESSION_RE = re.compile(r"impression:\s*(.+?)(?:recommendation:|$)", re.IGNORECASE | re.DOTALL)
+
+
+def estimate_tokens(text: str) -> int:
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+def full_record_text(patient: Dict[str, Any]) -> str:
+    """ What the prompt used to contain: the whole record as indented JSON. """
+    try:
+        return json.dumps(patient, indent=2)
+    except TypeError:
+        return str(patient)
+
+
+# --- Sections ---
+def _names(items: Any, key: str = "name", limit: int = MAX_LIST_ITEMS) -> List[str]:
+    names = []
+    for item in (items or [])[:limit]:
+        if isinstance(item, dict):
+            parts = [str(item.get(key) or "")] + [str(item[k]) for k in ("dosage", "frequency", "date", "endDate") if item.get(k)]
+            names.append(" ".join(p for p in parts if p).strip())
+        elif item:
+            names.append(str(item))
+    overflow = len(items or []) - limit
+    if overflow > 0:
+        names.append(f"(+{overflow} more)")
+    return [n for n in names if n]
+
+
+def _stage(diagnosis: Dict[str, Any]) -> Optional[str]:
+    if diagnosis.get("stage"):
+        return str(diagnosis["stage"])
+    match = _STAGE_RE.search(str(diagnosis.get("primary") or ""))
+    return f"Stage {match.group(1).upper()}" if match else None
+
+
+def _panel_date(panel: Dict[str, Any]) -> Optional[str]:
+    return panel.get("resultDate") or panel.get("orderDate") or panel.get("date")
+
+
+def _date_sort_key(value: Optional[str]) -> float:
+    """ Newest first; undated (or unparseable) panels go last, in record order. """
+    try:
+        parsed = datetime.fromisoformat(str(value).replace("Z", "+00:00")).replace(tzinfo=None)
+        return -(parsed - datetime.min).total_seconds()
+    except (TypeError, ValueError):
+        return float("inf")
+
+
+def _lab_lines(patient: Dict[str, Any]) -> List[str]:
+    lines, seen = [], set()
+    panels = [panel for panel in patient.get("recentLabs") or [] if isinstance(panel, dict)]
+    # Sorted before de-duplicating, so each test keeps its most recent result
+    for panel in sorted(panels, key=lambda p: _date_sort_key(_panel_date(p))):
+        date = _panel_date(panel)
+        for component in panel.get("components") or []:
+            if not isinstance(component, dict) or not component.get("test"):
+                continue
+            test = str(component["test"])
+            flag = str(component.get("flag") or "").strip()
+            abnormal = flag.lower() not in NORMAL_FLAGS
+            if test.lower() in seen or not (abnormal or analyte_for_test(test)):
+                continue
+            seen.add(test.lower())
+            value = " ".join(str(component[k]) for k in ("value", "unit") if component.get(k) is not None)
+            details = [f"ref {component['refRange']}"] if component.get("refRange") else []
+            if date:
+                details.append(str(date))
+            line = f"{test} {value}" + (f" ({', '.join(details)})" if details else "")
+            lines.append(f"{line} [{flag.upper()}]" if abnormal else line)
+    return lines
+
+
+def _ecog_text(patient: Dict[str, Any]) -> Optional[str]:
+    value = patient_ecog(patient)
+    mentions = []
+    for note in patient.get("notes") or []:
+        text = note.get("text") if isinstance(note, dict) else note
+        date = note.get("date") if isinstance(note, dict) else None
+        for sentence in _SENTENCE_RE.findall(text or ""):
+            mentions.append(f"{date + ': ' if date else ''}{sentence.strip()}")
+        if len(mentions) >= MAX_ECOG_MENTIONS:
+            mentions = mentions[:MAX_ECOG_MENTIONS]
+            break
+    if value is None and not mentions:
+        return None
+    head = f"{value:g}" if value is not None else "not documented as a number"
+    return head + (f" (notes: {' | '.join(mentions)})" if mentions else "")
+
+
+def _imaging_lines(patient: Dict[str, Any]) -> List[str]:
+    lines = []
+    for study in (patient.get("imagingStudies") or [])[:MAX_IMAGING_STUDIES]:
+        if not isinstance(study, dict):
+            continue
+        report = str(study.get("reportText") or "")
+        match = _IMPRESSION_RE.search(report)
+        impression = " ".join((match.group(1) if match else report).split())[:MAX_IMPRESSION_CHARS]
+        label = " ".join(str(study[k]) for k in ("date", "type") if study.get(k))
+        if impression or label:
+            lines.append(f"{label}: {impression}".strip(": "))
+    return lines
+
+
+def _mutation_text(patient: Dict[str, Any]) -> Optional[str]:
+    mutations = []
+    for m in patient.get("mutations") or []:
+        if not isinstance(m, dict):
+            continue
+        text = " ".join(str(m[k]) for k in ("hugo_gene_symbol", "protein_change") if m.get(k))
+        if text and text not in mutations:
+            mutations.append(text)
+    if not mutations:
+        return None
+    overflow = len(mutations) - MAX_MUTATIONS
+    return ", ".join(mutations[:MAX_MUTATIONS]) + (f" (+{overflow} more)" if overflow > 0 else "")
+
+
+def build_eligibility_profile(patient: Dict[str, Any]) -> str:
+    """ One line per eligibility-relevant fact group; empty groups are left out. """
+    demographics = patient.get("demographics") or {}
+    diagnosis = patient.get("diagnosis") or {}
+    age = patient_age(patient)
+    lines = []
+
+    basics = [f"age {age:g}" if age is not None else None, demographics.get("sex")]
+    if any(basics):
+        lines.append(f"Patient: {', '.join(str(b) for b in basics if b)}")
+    if diagnosis:
+        stage = _stage(diagnosis)
+        parts = [diagnosis.get("primary")]
+        if stage and stage.lower() not in str(diagnosis.get("primary") or "").lower():
+            parts.append(stage)
+        parts += [f"{k}: {diagnosis[k]}" for k in ("histology", "grade", "receptorStatus", "diagnosedDate", "status") if diagnosis.get(k)]
+        lines.append(f"Diagnosis: {'; '.join(str(p) for p in parts if p)}")
+    ecog = _ecog_text(patient)
+    if ecog:
+        lines.append(f"ECOG: {ecog}")
+
+    labs = _lab_lines(patient)
+    if labs:
+        lines.append("Key labs (abnormal flagged):")
+        lines.extend(f"- {lab}" for lab in labs)
+
+    for label, key in (("Current medications", "currentMedications"), ("Prior treatments", "prior_treatments"),
+                       ("Medical history", "medicalHistory"), ("Allergies", "allergies")):
+        names = _names(patient.get(key))
+        if names:
+            lines.append(f"{label}: {'; '.join(names)}")
+
+    mutations = _mutation_text(patient)
+    if mutations:
+        lines.append(f"Mutations: {mutations}")
+    biomarkers = _names(patient.get("biomarkers"))
+    if biomarkers:
+        lines.append(f"Biomarkers: {'; '.join(biomarkers)}")
+    imaging = _imaging_lines(patient)
+    if imaging:
+        lines.append("Imaging impressions:")
+        lines.extend(f"- {line}" for line in imaging)
+    return "\n".join(lines) if lines else "(No patient information provided)"
+
+
+# --- Cache ---
+class PatientProfileCache:
+    """ LRU of compact profiles keyed by the patient record's content hash. """
+
+    def __init__(self, max_entries: int = PROFILE_CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, patient: Dict[str, Any]) -> Dict[str, Any]:
+        """ Returns {"text", "record_hash", "full_tokens", "profile_tokens"}, building it on a miss. """
+        record_hash = content_hash(patient)
+        with self._lock:
+            entry = self._entries.get(record_hash)
+            if entry is not None:
+                self._entries.move_to_end(record_hash)
+                self.hits += 1
+                return entry
+            self.misses += 1
+        text = build_eligibility_profile(patient)
+        entry = {
+            "text": text,
+            "record_hash": record_hash,
+            "full_tokens": estimate_tokens(full_record_text(patient)),
+            "profile_tokens": estimate_tokens(text),
+        }
+        with self._lock:
+            self._entries[record_hash] = entry
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return entry
+
+    def stats(self) -> Dict[str, Any]:
+        return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+
+def compression_report(profile: Dict[str, Any], prompts_sent: int) -> Dict[str, Any]:
+    """ Estimated patient-section tokens saved by this request's prompts. """
+    saved = max(0, profile["full_tokens"] - profile["profile_tokens"])
+    return {
+        "full_record_tokens": profile["full_tokens"],
+        "profile_tokens": profile["profile_tokens"],
+        "saved_tokens_per_prompt": saved,
+        "prompts_sent": prompts_sent,
+        "saved_tokens": saved * prompts_sent,
+        "ratio": round(profile["profile_tokens"] / profile["full_tokens"], 3) if profile["full_tokens"] else None,
+    }
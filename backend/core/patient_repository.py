@@ -0,0 +1,315 @@
+"""
+Patient record repository.
+
+Records are stored in `patient_data.db` next to the TCGA `mutations` table:
+`patients` holds one row per patient, and `patient_sections` holds each
+top-level section (demographics, diagnosis, recentLabs, notes,
+currentMedications, ...) with list sections split into one row per item,
+indexed by (patient_id, section, position). Mutations are read from the
+existing `mutations` table and exposed as the `mutations` section.
+
+Callers ask for a projection - only the sections (and list lengths) they
+need - and only the missing sections are read from SQLite, on the shared
+read-only pool. Hydrated sections are kept in an in-memory LRU per patient;
+every write goes to SQLite first and then evicts the patient's cache entry.
+Returned dicts share section objects with the cache, so treat them as
+read-only.
+"""
+
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, List, Optional, Sequence
+
+from .assessment_store import content_hash
+from .sqlite_pool import get_pool, json_list
+
+DEFAULT_PATIENT_DB_PATH = os.getenv(
+    "PATIENT_DB_PATH",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "patient_data.db"),
+)
+DEFAULT_CACHE_SIZE = int(os.getenv("PATIENT_CACHE_SIZE", "256"))
+
+MUTATIONS_SECTION = "mutations"
+# Everything the clinical UI and prompts use; mutations are fetched only when asked for
+CLINICAL_SECTIONS = (
+    "demographics", "diagnosis", "medicalHistory", "currentMedications", "allergies",
+    "recentLabs", "imagingStudies", "patientGeneratedHealthData", "notes",
+)
+ALL_SECTIONS = CLINICAL_SECTIONS + (MUTATIONS_SECTION,)
+
+EMPTY_LIST_POSITION = -1  # patient_sections row recording an empty list section
+SECTIONS_SQL = (
+    "SELECT section, position, is_list, item_json FROM patient_sections "
+    "WHERE patient_id = ? AND section IN (SELECT value FROM json_each(?)) ORDER BY section, position"
+)
+PATIENT_EXISTS_SQL = "SELECT 1 FROM patients WHERE patient_id = ?"
+MUTATIONS_SQL = "SELECT * FROM mutations WHERE patient_id = ?"
+MUTATIONS_TABLE_SQL = "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'mutations'"
+
+
+def project_record(record: Dict[str, Any], sections: Optional[Iterable[str]] = None,
+                   limits: Optional[Dict[str, int]] = None) -> Dict[str, Any]:
+    """ Returns patientId plus the requested sections, with list sections truncated to `limits`. """
+    wanted = list(sections) if sections is not None else [k for k in record if k != "patientId"]
+    projected = {"patientId": record.get("patientId")}
+    for section in wanted:
+        if section not in record:
+            continue
+        value = record[section]
+        limit = (limits or {}).get(section)
+        projected[section] = value[:limit] if limit is not None and isinstance(value, list) else value
+    return projected
+
+
+class PatientRepository:
+    """ SQLite-backed patient records with section projections and a write-through LRU. """
+
+    def __init__(self, db_path: str = DEFAULT_PATIENT_DB_PATH, cache_size: int = DEFAULT_CACHE_SIZE):
+        self.db_path = os.path.abspath(db_path)
+        self.cache_size = max(1, cache_size)
+        self.hits = 0
+        self.misses = 0
+        self._cache: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._cache_lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._has_mutations_table: Optional[bool] = None
+        self._generation = 0  # Bumped on every invalidation; loads that raced a write are not cached
+
+    # --- Schema / writer connection ---
+    def _writer(self) -> sqlite3.Connection:
+        if self._conn is None:
+            directory = os.path.dirname(self.db_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.db_path, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")  # Pool readers never block on a seed
+            conn.executescript("""
+                CREATE TABLE IF NOT EXISTS patients (
+                    patient_id TEXT PRIMARY KEY,
+                    record_hash TEXT NOT NULL,
+                    updated_at REAL NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS patient_sections (
+                    patient_id TEXT NOT NULL,
+                    section TEXT NOT NULL,
+                    position INTEGER NOT NULL,
+                    is_list INTEGER NOT NULL,
+                    item_json TEXT NOT NULL,
+                    PRIMARY KEY (patient_id, section, position)
+                );
+            """)
+            conn.commit()
+            self._conn = conn
+        return self._conn
+
+    def ensure_schema(self) -> None:
+        with self._write_lock:
+            self._writer()
+
+    # --- Writes (write-through: SQLite first, then evict) ---
+    @staticmethod
+    def _section_rows(patient_id: str, section: str, value: Any) -> List[tuple]:
+        if isinstance(value, list):
+            if not value:
+                # Marker row so an empty list reads back as [] rather than a missing section
+                return [(patient_id, section, EMPTY_LIST_POSITION, 1, "null")]
+            return [(patient_id, section, i, 1, json.dumps(item)) for i, item in enumerate(value)]
+        return [(patient_id, section, 0, 0, json.dumps(value))]
+
+    def upsert(self, record: Dict[str, Any]) -> bool:
+        """ Stores a full patient record (mutations excluded). Returns False if it was unchanged. """
+        patient_id = record.get("patientId")
+        if not patient_id:
+            raise ValueError("Patient record is missing 'patientId'")
+        sections = {k: v for k, v in record.items() if k not in ("patientId", MUTATIONS_SECTION)}
+        record_hash = content_hash(sections)
+        with self._write_lock:
+            conn = self._writer()
+            row = conn.execute("SELECT record_hash FROM patients WHERE patient_id = ?", (patient_id,)).fetchone()
+            if row and row[0] == record_hash:
+                return False
+            with conn:
+                conn.execute("DELETE FROM patient_sections WHERE patient_id = ?", (patient_id,))
+                conn.executemany(
+                    "INSERT INTO patient_sections (patient_id, section, position, is_list, item_json) VALUES (?, ?, ?, ?, ?)",
+                    [r for section, value in sections.items() for r in self._section_rows(patient_id, section, value)],
+                )
+                conn.execute(
+                    "INSERT OR REPLACE INTO patients (patient_id, record_hash, updated_at) VALUES (?, ?, ?)",
+                    (patient_id, record_hash, time.time()),
+                )
+        self.invalidate(patient_id)
+        return True
+
+    def update_section(self, patient_id: str, section: str, value: Any) -> None:
+        """ Replaces one section of an existing record. """
+        if section in ("patientId", MUTATIONS_SECTION):
+            raise ValueError(f"Section '{section}' cannot be updated through the repository")
+        with self._write_lock:
+            conn = self._writer()
+            if not conn.execute(PATIENT_EXISTS_SQL, (patient_id,)).fetchone():
+                raise KeyError(patient_id)
+            with conn:
+                conn.execute("DELETE FROM patient_sections WHERE patient_id = ? AND section = ?", (patient_id, section))
+                conn.executemany(
+                    "INSERT INTO patient_sections (patient_id, section, position, is_list, item_json) VALUES (?, ?, ?, ?, ?)",
+                    self._section_rows(patient_id, section, value),
+                )
+                # Hash no longer matches any seed file, so the next seed rewrites the record
+                conn.execute("UPDATE patients SET record_hash = '', updated_at = ? WHERE patient_id = ?", (time.time(), patient_id))
+        self.invalidate(patient_id)
+
+    def seed(self, records: Iterable[Dict[str, Any]]) -> int:
+        """ Upserts records whose content changed; returns how many were written. """
+        return sum(1 for record in records if self.upsert(record))
+
+    def seed_from_file(self, path: str) -> int:
+        """ Seeds from a JSON file holding either {patient_id: record} or a list of records. """
+        with open(path, "r") as f:
+            data = json.load(f)
+        records = list(data.values()) if isinstance(data, dict) else data
+        written = self.seed(records)
+        logging.info(f"[PatientRepository] Seeded {written}/{len(records)} changed records from {path}")
+        return written
+
+    # --- Cache ---
+    def invalidate(self, patient_id: Optional[str] = None) -> None:
+        """ Evicts one patient (or everyone, e.g. after the mutations table is reloaded externally). """
+        with self._cache_lock:
+            self._generation += 1
+            if patient_id is None:
+                self._cache.clear()
+                self._has_mutations_table = None
+            else:
+                self._cache.pop(patient_id, None)
+
+    def _cached(self, patient_id: str) -> Optional[Dict[str, Any]]:
+        with self._cache_lock:
+            entry = self._cache.get(patient_id)
+            if entry is not None:
+                self._cache.move_to_end(patient_id)
+            return entry
+
+    def _remember(self, patient_id: str, loaded: Dict[str, Any], generation: int) -> Dict[str, Any]:
+        """ Merges freshly loaded sections into the patient's cache entry. """
+        with self._cache_lock:
+            entry = self._cache.get(patient_id)
+            if generation != self._generation:
+                # A write landed while we were reading; answer from what was loaded without caching it
+                merged = dict(entry or {"patientId": patient_id})
+                merged.update(loaded["sections"])
+                return merged
+            if entry is None:
+                entry = {"patientId": patient_id, "_loaded": set()}
+                self._cache[patient_id] = entry
+            entry.update(loaded["sections"])
+            entry["_loaded"] |= loaded["names"]
+            self._cache.move_to_end(patient_id)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+            return entry
+
+    # --- Reads ---
+    @staticmethod
+    def _missing_sections(entry: Optional[Dict[str, Any]], sections: Sequence[str]) -> List[str]:
+        loaded = entry["_loaded"] if entry else set()
+        return [s for s in sections if s not in loaded]
+
+    @staticmethod
+    def _hydrate(rows: List[Dict[str, Any]], requested: Sequence[str]) -> Dict[str, Any]:
+        sections: Dict[str, Any] = {}
+        for row in rows:
+            if row["is_list"] and row["position"] == EMPTY_LIST_POSITION:
+                sections.setdefault(row["section"], [])
+                continue
+            item = json.loads(row["item_json"])
+            if row["is_list"]:
+                sections.setdefault(row["section"], []).append(item)
+            else:
+                sections[row["section"]] = item
+        return {"sections": sections, "names": set(requested)}
+
+    def _plan(self, patient_id: str, sections: Optional[Iterable[str]]):
+        """ Returns (cache entry, requested section names, names still to load, cache generation). """
+        requested = list(sections) if sections is not None else list(ALL_SECTIONS)
+        with self._cache_lock:
+            generation = self._generation
+        entry = self._cached(patient_id)
+        missing = self._missing_sections(entry, requested)
+        if missing:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return entry, requested, missing, generation
+
+    def _load_sections(self, patient_id: str, entry: Optional[Dict[str, Any]],
+                       missing: Sequence[str]) -> Optional[Dict[str, Any]]:
+        """ Reads `missing` sections from SQLite (blocking). None if the patient is unknown. """
+        self.ensure_schema()
+        pool = get_pool(self.db_path)
+        if entry is None and not pool.fetchone_sync(PATIENT_EXISTS_SQL, (patient_id,)):
+            return None
+        table_sections = [s for s in missing if s != MUTATIONS_SECTION]
+        rows = pool.fetchall_sync(SECTIONS_SQL, (patient_id, json_list(table_sections))) if table_sections else []
+        loaded = self._hydrate(rows, missing)
+        if MUTATIONS_SECTION in missing:
+            if not self._has_mutations_table:
+                # Only a positive answer is cached: load_mutations_to_db may create the table later
+                self._has_mutations_table = bool(pool.fetchall_sync(MUTATIONS_TABLE_SQL))
+            loaded["sections"][MUTATIONS_SECTION] = (
+                pool.fetchall_sync(MUTATIONS_SQL, (patient_id,)) if self._has_mutations_table else []
+            )
+        return loaded
+
+    def get_sync(self, patient_id: str, sections: Optional[Iterable[str]] = None,
+                 limits: Optional[Dict[str, int]] = None) -> Optional[Dict[str, Any]]:
+        """ Blocking variant of `get` for scripts and worker threads. """
+        entry, requested, missing, generation = self._plan(patient_id, sections)
+        if missing:
+            loaded = self._load_sections(patient_id, entry, missing)
+            if loaded is None:
+                return None
+            entry = self._remember(patient_id, loaded, generation)
+        return project_record(entry, requested, limits)
+
+    async def get(self, patient_id: str, sections: Optional[Iterable[str]] = None,
+                  limits: Optional[Dict[str, int]] = None) -> Optional[Dict[str, Any]]:
+        """
+        Returns patientId plus the requested sections (ALL_SECTIONS when None), or None if the
+        patient is unknown. Only sections not already cached are read from SQLite.
+        """
+        entry, requested, missing, generation = self._plan(patient_id, sections)
+        if missing:
+            # One executor job for all of the patient's queries (and the first-use schema check)
+            loaded = await get_pool(self.db_path).run(self._load_sections, patient_id, entry, missing)
+            if loaded is None:
+                return None
+            entry = self._remember(patient_id, loaded, generation)
+        return project_record(entry, requested, limits)
+
+    def patient_ids(self) -> List[str]:
+        self.ensure_schema()
+        return [row["patient_id"] for row in get_pool(self.db_path).fetchall_sync("SELECT patient_id FROM patients ORDER BY patient_id")]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cache_lock:
+            cached = len(self._cache)
+        return {"db_path": self.db_path, "cached_patients": cached, "cache_size": self.cache_size,
+                "hits": self.hits, "misses": self.misses}
+
+    def close(self) -> None:
+        with self._write_lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+        self.invalidate()
+
+
+# Shared instance used by the API and agents
+patient_repository = PatientRepository()
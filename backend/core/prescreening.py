@@ -0,0 +1,539 @@
+"""
+Batch patient x trial pre-screening.
+
+Screens a whole cohort against the trial catalogue in stages, so the LLM is
+only asked about pairs that survive the cheap checks:
+
+1. retrieval  - candidate trials per patient (vector search when available, else every trial)
+2. status     - trial recruitment status must be in the allowed set
+3. phase      - optional phase filter
+4. rules      - deterministic criteria atoms (age, ECOG, lab thresholds; labs vectorized per patient batch)
+5. genomic    - top-level genomic criteria checked by GenomicAnalystAgent against the patient's mutations
+6. llm        - survivors are assessed by a bounded pool of async workers
+
+Every pair ends up as one row in `prescreen_matrix` (keyed by run, patient and
+trial) recording the stage it stopped at and why. A patient is checkpointed
+once all of its pairs are written, and LLM rows stay `pending`/`error` until
+assessed, so an interrupted run resumes where it stopped.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+from .criteria_index import (
+    KIND_EXCLUSION, KIND_INCLUSION, STATUS_MET, STATUS_NOT_MET,
+    atomize_criteria, evaluate_atom,
+)
+from .lab_rules import STATUS_NOT_MET as LAB_NOT_MET, LabRuleEngine
+from .trial_filters import DEFAULT_OPEN_STATUSES, parse_phases, search_filters
+
+DEFAULT_PRESCREEN_DB_PATH = "backend/db/prescreening.db"
+DEFAULT_TRIALS_DB_PATH = "backend/db/trials.db"
+DEFAULT_PATIENT_DB_PATH = "backend/data/patient_data.db"
+DEFAULT_CLINICAL_JSON_PATH = "backend/data/brca_tcga_clinical_data.json"
+DEFAULT_RETRIEVAL_TOP_K = 20  # Candidate trials retrieved per patient (the chat path shows 6)
+
+STAGE_RETRIEVAL = "retrieval"
+STAGE_STATUS = "status"
+STAGE_PHASE = "phase"
+STAGE_RULES = "rules"
+STAGE_GENOMIC = "genomic"
+STAGE_LLM = "llm"
+STAGES = (STAGE_RETRIEVAL, STAGE_STATUS, STAGE_PHASE, STAGE_RULES, STAGE_GENOMIC, STAGE_LLM)
+FILTER_STAGES = (STAGE_STATUS, STAGE_PHASE, STAGE_RULES, STAGE_GENOMIC)
+
+OUTCOME_EXCLUDED = "excluded"    # Failed a deterministic stage
+OUTCOME_PASSED = "passed"        # Survived every deterministic stage; LLM stage disabled
+OUTCOME_PENDING = "pending"      # Queued for LLM assessment
+OUTCOME_ASSESSED = "assessed"    # LLM assessment stored
+OUTCOME_ERROR = "error"          # LLM assessment failed; retried on resume
+
+PatientRetriever = Callable[[Dict[str, Any]], Awaitable[List[Tuple[str, Optional[float]]]]]
+TrialAssessor = Callable[[Dict[str, Any], Dict[str, Any]], Awaitable[Optional[Dict[str, Any]]]]
+
+# --- Data loading ---
+def load_trials(db_path: str = DEFAULT_TRIALS_DB_PATH) -> List[Dict[str, Any]]:
+    """ Every row of `clinical_trials` as a dict. """
+    conn = sqlite3.connect(db_path)
+    conn.row_factory = sqlite3.Row
+    try:
+        return [dict(row) for row in conn.execute("SELECT * FROM clinical_trials ORDER BY nct_id")]
+    finally:
+        conn.close()
+
+
+def _load_mutations(db_path: str) -> Optional[Dict[str, List[Dict[str, Any]]]]:
+    """ Mutations grouped by patient_id, or None when the mutations table is unavailable. """
+    if not os.path.exists(db_path) or os.path.getsize(db_path) == 0:
+        return None
+    conn = sqlite3.connect(db_path)
+    conn.row_factory = sqlite3.Row
+    try:
+        by_patient: Dict[str, List[Dict[str, Any]]] = {}
+        for row in conn.execute("SELECT * FROM mutations"):
+            by_patient.setdefault(row["patient_id"], []).append(dict(row))
+        return by_patient
+    except sqlite3.Error as e:
+        logging.warning(f"Could not read mutations from {db_path}: {e}")
+        return None
+    finally:
+        conn.close()
+
+
+def load_cohort(patient_db_path: str = DEFAULT_PATIENT_DB_PATH,
+                clinical_json_path: str = DEFAULT_CLINICAL_JSON_PATH,
+                limit: Optional[int] = None) -> List[Dict[str, Any]]:
+    """
+    Builds patient dicts for the TCGA cohort from the clinical JSON plus the mutations table.
+    Age is TCGA's age at diagnosis (no date of birth is available). `mutations` is None for
+    every patient when the mutations table is missing, which disables the genomic stage.
+    """
+    with open(clinical_json_path, "r") as f:
+        clinical_rows = json.load(f)
+    mutations = _load_mutations(patient_db_path)
+    patients = []
+    for row in clinical_rows:
+        patient_id = row.get("Patient ID")
+        if not patient_id:
+            continue
+        age = row.get("Diagnosis Age")
+        patients.append({
+            "patientId": patient_id,
+            "demographics": {
+                "age": float(age) if isinstance(age, (int, float)) else None,
+                "sex": row.get("Sex"),
+            },
+            "diagnosis": {
+                "primary": row.get("Cancer Type Detailed") or row.get("Cancer Type") or "Breast Invasive Carcinoma",
+                "stage": row.get("Neoplasm Disease Stage American Joint Committee on Cancer Code"),
+            },
+            "mutations": None if mutations is None else mutations.get(patient_id, []),
+        })
+        if limit and len(patients) >= limit:
+            break
+    return patients
+
+
+# --- Matrix storage and checkpoints ---
+class PrescreenStore:
+    """ SQLite-backed result matrix with per-patient checkpoints. Safe to share across threads. """
+
+    def __init__(self, db_path: str = DEFAULT_PRESCREEN_DB_PATH):
+        self.db_path = db_path
+        if db_path != ":memory:" and os.path.dirname(db_path):
+            os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self.ensure_schema()
+
+    def ensure_schema(self) -> None:
+        with self._lock:
+            self._conn.executescript("""
+                CREATE TABLE IF NOT EXISTS prescreen_runs (
+                    run_id TEXT PRIMARY KEY,
+                    config_json TEXT,
+                    state TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    updated_at REAL NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS prescreen_matrix (
+                    run_id TEXT NOT NULL,
+                    patient_id TEXT NOT NULL,
+                    nct_id TEXT NOT NULL,
+                    stage TEXT NOT NULL,
+                    outcome TEXT NOT NULL,
+                    retrieval_score REAL,
+                    reason TEXT,
+                    eligibility TEXT,
+                    assessment_json TEXT,
+                    updated_at REAL NOT NULL,
+                    PRIMARY KEY (run_id, patient_id, nct_id)
+                );
+                CREATE INDEX IF NOT EXISTS idx_prescreen_matrix_outcome ON prescreen_matrix (run_id, outcome);
+                CREATE TABLE IF NOT EXISTS prescreen_checkpoints (
+                    run_id TEXT NOT NULL,
+                    patient_id TEXT NOT NULL,
+                    completed_at REAL NOT NULL,
+                    PRIMARY KEY (run_id, patient_id)
+                );
+            """)
+            self._conn.commit()
+
+    def start_run(self, run_id: str, config: Dict[str, Any]) -> bool:
+        """ Registers the run. Returns True if it already existed (i.e. this is a resume). """
+        now = time.time()
+        with self._lock:
+            existing = self._conn.execute("SELECT 1 FROM prescreen_runs WHERE run_id = ?", (run_id,)).fetchone()
+            if existing:
+                self._conn.execute("UPDATE prescreen_runs SET state = 'running', updated_at = ? WHERE run_id = ?", (now, run_id))
+            else:
+                self._conn.execute(
+                    "INSERT INTO prescreen_runs (run_id, config_json, state, created_at, updated_at) VALUES (?, ?, 'running', ?, ?)",
+                    (run_id, json.dumps(config, sort_keys=True), now, now),
+                )
+            self._conn.commit()
+        return existing is not None
+
+    def finish_run(self, run_id: str, state: str = "complete") -> None:
+        with self._lock:
+            self._conn.execute("UPDATE prescreen_runs SET state = ?, updated_at = ? WHERE run_id = ?", (state, time.time(), run_id))
+            self._conn.commit()
+
+    def completed_patients(self, run_id: str) -> Set[str]:
+        with self._lock:
+            rows = self._conn.execute("SELECT patient_id FROM prescreen_checkpoints WHERE run_id = ?", (run_id,)).fetchall()
+        return {row["patient_id"] for row in rows}
+
+    def write_patient(self, run_id: str, patient_id: str, rows: Sequence[Dict[str, Any]]) -> None:
+        """ Writes all of a patient's pairs and its checkpoint in one transaction. """
+        now = time.time()
+        with self._lock:
+            with self._conn:
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO prescreen_matrix "
+                    "(run_id, patient_id, nct_id, stage, outcome, retrieval_score, reason, eligibility, assessment_json, updated_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?, NULL, ?)",
+                    [(run_id, patient_id, r["nct_id"], r["stage"], r["outcome"], r.get("retrieval_score"),
+                      r.get("reason"), r.get("eligibility"), now) for r in rows],
+                )
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO prescreen_checkpoints (run_id, patient_id, completed_at) VALUES (?, ?, ?)",
+                    (run_id, patient_id, now),
+                )
+
+    def record_assessment(self, run_id: str, patient_id: str, nct_id: str, outcome: str,
+                          eligibility: Optional[str], reason: Optional[str], assessment: Optional[Dict[str, Any]]) -> None:
+        with self._lock:
+            self._conn.execute(
+                "UPDATE prescreen_matrix SET outcome = ?, eligibility = ?, reason = ?, assessment_json = ?, updated_at = ? "
+                "WHERE run_id = ? AND patient_id = ? AND nct_id = ?",
+                (outcome, eligibility, reason, json.dumps(assessment) if assessment is not None else None,
+                 time.time(), run_id, patient_id, nct_id),
+            )
+            self._conn.commit()
+
+    def unfinished_pairs(self, run_id: str) -> List[Tuple[str, str]]:
+        """ (patient_id, nct_id) pairs still waiting for (or failed) LLM assessment. """
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT patient_id, nct_id FROM prescreen_matrix WHERE run_id = ? AND outcome IN (?, ?) ORDER BY patient_id, nct_id",
+                (run_id, OUTCOME_PENDING, OUTCOME_ERROR),
+            ).fetchall()
+        return [(row["patient_id"], row["nct_id"]) for row in rows]
+
+    def summary(self, run_id: str) -> Dict[str, Any]:
+        """ Pair counts by (stage, outcome) plus eligibility counts for assessed pairs. """
+        with self._lock:
+            by_stage = self._conn.execute(
+                "SELECT stage, outcome, COUNT(*) AS n FROM prescreen_matrix WHERE run_id = ? GROUP BY stage, outcome", (run_id,)
+            ).fetchall()
+            by_eligibility = self._conn.execute(
+                "SELECT eligibility, COUNT(*) AS n FROM prescreen_matrix WHERE run_id = ? AND outcome = ? GROUP BY eligibility",
+                (run_id, OUTCOME_ASSESSED),
+            ).fetchall()
+            patients = self._conn.execute("SELECT COUNT(*) FROM prescreen_checkpoints WHERE run_id = ?", (run_id,)).fetchone()[0]
+        return {
+            "patients_checkpointed": patients,
+            "pairs": {f"{row['stage']}:{row['outcome']}": row["n"] for row in by_stage},
+            "eligibility": {row["eligibility"] or "unknown": row["n"] for row in by_eligibility},
+        }
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+# --- Progress metrics ---
+class PrescreenProgress:
+    """ Counters for a run: patients, pairs per stage outcome, LLM queue, throughput and ETA. """
+
+    def __init__(self, total_patients: int):
+        self.total_patients = total_patients
+        self.patients_done = 0
+        self.patients_skipped = 0
+        self.pairs_retrieved = 0
+        self.excluded = {stage: 0 for stage in FILTER_STAGES}
+        self.llm_queued = 0
+        self.llm_done = 0
+        self.llm_failed = 0
+        self.started_at = time.monotonic()
+
+    def snapshot(self) -> Dict[str, Any]:
+        elapsed = time.monotonic() - self.started_at
+        rate = self.patients_done / elapsed if elapsed > 0 else 0.0
+        remaining = self.total_patients - self.patients_done - self.patients_skipped
+        llm_backlog = self.llm_queued - self.llm_done - self.llm_failed
+        llm_rate = (self.llm_done + self.llm_failed) / elapsed if elapsed > 0 else 0.0
+        eta = None
+        if rate > 0:
+            eta = remaining / rate
+            if llm_rate > 0:
+                eta = max(eta, llm_backlog / llm_rate)
+        return {
+            "patients_total": self.total_patients,
+            "patients_done": self.patients_done,
+            "patients_skipped": self.patients_skipped,
+            "pairs_retrieved": self.pairs_retrieved,
+            "excluded_by_stage": dict(self.excluded),
+            "llm_queued": self.llm_queued,
+            "llm_done": self.llm_done,
+            "llm_failed": self.llm_failed,
+            "llm_backlog": llm_backlog,
+            "elapsed_seconds": round(elapsed, 2),
+            "patients_per_second": round(rate, 3),
+            "eta_seconds": round(eta, 1) if eta is not None else None,
+        }
+
+
+# --- Agent adapters ---
+def make_agent_retriever(agent: Any, open_statuses: Optional[Iterable[str]] = DEFAULT_OPEN_STATUSES,
+                         phases: Optional[Iterable[int]] = None,
+                         limit: int = DEFAULT_RETRIEVAL_TOP_K) -> PatientRetriever:
+    """
+    Wraps ClinicalTrialAgent's hybrid search as a per-patient retriever. The run's statuses/phases
+    (None disables either filter) and `limit` are applied inside the search, not only afterwards.
+    """
+    filters = search_filters(open_statuses, phases)
+
+    async def retrieve(patient: Dict[str, Any]) -> List[Tuple[str, Optional[float]]]:
+        query = agent._build_query_text({"patient_data": patient}, {}, "")
+        trials, early_response = await agent._search_candidates(query, filters=filters, limit=limit)
+        if early_response and early_response.get("status") == "failure":
+            raise RuntimeError(early_response.get("summary"))
+        return [(trial["nct_id"], None) for trial in trials]
+    return retrieve
+
+
+def make_agent_assessor(agent: Any) -> TrialAssessor:
+    """ Wraps ClinicalTrialAgent's (cached, locally pre-decided) eligibility assessment. """
+    async def assess(patient: Dict[str, Any], trial: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        return await agent._get_llm_assessment_for_trial(patient, trial)
+    return assess
+
+
+# --- Engine ---
+class PrescreeningEngine:
+    """ Runs the staged pre-screen for a cohort and writes the matrix. """
+
+    def __init__(self, trials: Sequence[Dict[str, Any]], store: PrescreenStore,
+                 retriever: Optional[PatientRetriever] = None,
+                 assessor: Optional[TrialAssessor] = None,
+                 genomic_agent: Any = None,
+                 criteria_index: Any = None,
+                 open_statuses: Optional[Iterable[str]] = DEFAULT_OPEN_STATUSES,
+                 phases: Optional[Iterable[int]] = None,
+                 llm_workers: int = 4,
+                 batch_size: int = 64,
+                 progress_interval: float = 30.0):
+        """
+        Args:
+            trials: `clinical_trials` rows (see load_trials).
+            retriever: Async patient -> [(nct_id, score)]. None screens every trial.
+            assessor: Async (patient, trial) -> assessment dict. None stops after the deterministic stages.
+            genomic_agent: GenomicAnalystAgent (or compatible) for genomic criteria. None skips the stage.
+            criteria_index: CriteriaIndex for pre-built atoms; trials are atomized on the fly without it.
+            open_statuses: Allowed trial statuses (case-insensitive). None disables the status filter.
+            phases: Allowed phase numbers. None disables the phase filter.
+            llm_workers: Size of the LLM worker pool.
+            batch_size: Patients per vectorized lab-rule pass.
+        """
+        self.trials = {trial["nct_id"]: trial for trial in trials}
+        self.store = store
+        self.retriever = retriever
+        self.assessor = assessor
+        self.genomic_agent = genomic_agent
+        self.open_statuses = {s.lower() for s in open_statuses} if open_statuses is not None else None
+        self.phases = set(phases) if phases is not None else None
+        self.llm_workers = max(1, llm_workers)
+        self.batch_size = max(1, batch_size)
+        self.progress_interval = progress_interval
+        self.progress = PrescreenProgress(0)
+
+        # --- Criteria atoms, compiled once for the whole catalogue ---
+        self.atoms: Dict[str, List[Dict[str, Any]]] = {}
+        for nct_id, trial in self.trials.items():
+            if criteria_index is not None:
+                self.atoms[nct_id] = criteria_index.atoms_for_trial(trial)
+            else:
+                self.atoms[nct_id] = (atomize_criteria(nct_id, trial.get("inclusion_criteria_text"), KIND_INCLUSION)
+                                      + atomize_criteria(nct_id, trial.get("exclusion_criteria_text"), KIND_EXCLUSION))
+        self.lab_engine = LabRuleEngine(atom for atoms in self.atoms.values() for atom in atoms)
+        self.lab_columns: Dict[str, List[int]] = {}
+        for column, atom in enumerate(self.lab_engine.atoms):
+            self.lab_columns.setdefault(atom["nct_id"], []).append(column)
+        self.scalar_atoms = {
+            nct_id: [a for a in atoms if a.get("deterministic") and a.get("analyte") in ("age", "ecog")]
+            for nct_id, atoms in self.atoms.items()
+        }
+        # Nested genomic bullets are alternatives; only top-level ones are hard requirements
+        self.genomic_atoms = {
+            nct_id: [a for a in atoms if a.get("category") == "genomic" and not a.get("parent_id")]
+            for nct_id, atoms in self.atoms.items()
+        }
+
+    # --- Deterministic stages ---
+    def _status_phase_check(self, trial: Dict[str, Any]) -> Optional[Tuple[str, str]]:
+        status = (trial.get("status") or trial.get("overall_status") or "").strip()
+        if self.open_statuses is not None and status.lower() not in self.open_statuses:
+            return STAGE_STATUS, f"Trial status '{status or 'unknown'}' is not open"
+        if self.phases is not None:
+            trial_phases = parse_phases(trial.get("phase"))
+            if not trial_phases & self.phases:
+                return STAGE_PHASE, f"Trial phase '{trial.get('phase') or 'unknown'}' not in requested phases"
+        return None
+
+    def _rules_check(self, patient: Dict[str, Any], nct_id: str, lab_row: Any) -> Optional[str]:
+        for column in self.lab_columns.get(nct_id, []):
+            if lab_row[column] == LAB_NOT_MET:
+                return f"Lab criterion not met: {self.lab_engine.atoms[column]['text']}"
+        for atom in self.scalar_atoms.get(nct_id, []):
+            result = evaluate_atom(atom, patient)
+            if result and result["status"] == STATUS_NOT_MET:
+                return f"Criterion not met: {atom['text']} ({result['reasoning']})"
+        return None
+
+    async def _genomic_check(self, patient: Dict[str, Any], nct_id: str) -> Optional[str]:
+        mutations = patient.get("mutations")
+        if self.genomic_agent is None or mutations is None:
+            return None
+        for atom in self.genomic_atoms.get(nct_id, []):
+            try:
+                result = await self.genomic_agent.run(
+                    genomic_query=atom["text"], patient_id=patient.get("patientId"),
+                    patient_mutations=mutations, criterion_id=atom["criterion_id"],
+                )
+            except Exception as e:
+                logging.warning(f"Genomic check failed for {patient.get('patientId')}/{nct_id}: {e}")
+                continue
+            status = getattr(result, "status", None) or (result.get("status") if isinstance(result, dict) else None)
+            evidence = getattr(result, "evidence", None) or (result.get("evidence") if isinstance(result, dict) else "")
+            if (atom["kind"] == KIND_INCLUSION and status == STATUS_NOT_MET) or (atom["kind"] == KIND_EXCLUSION and status == STATUS_MET):
+                return f"Genomic {atom['kind']} criterion decides against: {atom['text']} ({evidence})"
+        return None
+
+    async def _candidates(self, patient: Dict[str, Any]) -> List[Tuple[str, Optional[float]]]:
+        if self.retriever is None:
+            return [(nct_id, None) for nct_id in self.trials]
+        try:
+            candidates = await self.retriever(patient)
+        except Exception as e:
+            logging.warning(f"Retrieval failed for {patient.get('patientId')}, screening every trial instead: {e}")
+            return [(nct_id, None) for nct_id in self.trials]
+        return [(nct_id, score) for nct_id, score in candidates if nct_id in self.trials]
+
+    async def screen_patient(self, patient: Dict[str, Any], lab_row: Any) -> List[Dict[str, Any]]:
+        """ Runs the deterministic stages for one patient. Returns matrix rows; survivors are marked pending/passed. """
+        candidates = await self._candidates(patient)
+        self.progress.pairs_retrieved += len(candidates)
+        rows = []
+        for nct_id, score in candidates:
+            row = {"nct_id": nct_id, "retrieval_score": score}
+            stop = self._status_phase_check(self.trials[nct_id])
+            if stop is None:
+                reason = self._rules_check(patient, nct_id, lab_row)
+                stop = (STAGE_RULES, reason) if reason else None
+            if stop is None:
+                reason = await self._genomic_check(patient, nct_id)
+                stop = (STAGE_GENOMIC, reason) if reason else None
+            if stop is not None:
+                stage, reason = stop
+                self.progress.excluded[stage] += 1
+                row.update(stage=stage, outcome=OUTCOME_EXCLUDED, reason=reason, eligibility="Likely Ineligible")
+            elif self.assessor is not None:
+                row.update(stage=STAGE_LLM, outcome=OUTCOME_PENDING)
+            else:
+                row.update(stage=STAGE_GENOMIC, outcome=OUTCOME_PASSED, reason="Passed all deterministic filters")
+            rows.append(row)
+        return rows
+
+    # --- LLM stage ---
+    async def _llm_worker(self, run_id: str, queue: "asyncio.Queue") -> None:
+        while True:
+            item = await queue.get()
+            try:
+                if item is None:
+                    return
+                patient, nct_id = item
+                await self._assess_pair(run_id, patient, nct_id)
+            finally:
+                queue.task_done()
+
+    async def _assess_pair(self, run_id: str, patient: Dict[str, Any], nct_id: str) -> None:
+        patient_id = patient.get("patientId")
+        try:
+            result = await self.assessor(patient, self.trials[nct_id])
+        except Exception as e:
+            logging.error(f"LLM assessment failed for {patient_id}/{nct_id}: {e}", exc_info=True)
+            result = {"llm_eligibility_analysis": None, "overall_assessment": f"Assessment Failed ({e})"}
+        analysis = (result or {}).get("llm_eligibility_analysis")
+        if analysis:
+            eligibility = (analysis.get("eligibility_assessment") or {}).get("eligibility_summary")
+            await asyncio.to_thread(self.store.record_assessment, run_id, patient_id, nct_id, OUTCOME_ASSESSED,
+                                    eligibility, None, analysis)
+            self.progress.llm_done += 1
+        else:
+            reason = (result or {}).get("overall_assessment") or "No assessment returned"
+            await asyncio.to_thread(self.store.record_assessment, run_id, patient_id, nct_id, OUTCOME_ERROR,
+                                    None, reason, None)
+            self.progress.llm_failed += 1
+
+    # --- Driver ---
+    def _log_progress(self, force: bool = False) -> None:
+        now = time.monotonic()
+        if force or now - self._last_progress_log >= self.progress_interval:
+            self._last_progress_log = now
+            logging.info(f"Pre-screen progress: {json.dumps(self.progress.snapshot())}")
+
+    async def run(self, patients: Sequence[Dict[str, Any]], run_id: str,
+                  config: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """ Screens every patient (skipping checkpointed ones) and returns the final progress snapshot. """
+        resumed = await asyncio.to_thread(self.store.start_run, run_id, config or {})
+        done = await asyncio.to_thread(self.store.completed_patients, run_id) if resumed else set()
+        self.progress = PrescreenProgress(len(patients))
+        self._last_progress_log = time.monotonic()
+        patients_by_id = {p.get("patientId"): p for p in patients}
+
+        queue: "asyncio.Queue" = asyncio.Queue(maxsize=self.llm_workers * 4)
+        workers = []
+        if self.assessor is not None:
+            workers = [asyncio.create_task(self._llm_worker(run_id, queue)) for _ in range(self.llm_workers)]
+            # Pairs left pending (or failed) by an interrupted run go first
+            for patient_id, nct_id in await asyncio.to_thread(self.store.unfinished_pairs, run_id):
+                if patient_id in patients_by_id and nct_id in self.trials:
+                    self.progress.llm_queued += 1
+                    await queue.put((patients_by_id[patient_id], nct_id))
+
+        try:
+            todo = [p for p in patients if p.get("patientId") not in done]
+            self.progress.patients_skipped = len(patients) - len(todo)
+            for start in range(0, len(todo), self.batch_size):
+                batch = todo[start:start + self.batch_size]
+                lab_statuses = self.lab_engine.evaluate(batch)
+                for patient, lab_row in zip(batch, lab_statuses):
+                    rows = await self.screen_patient(patient, lab_row)
+                    await asyncio.to_thread(self.store.write_patient, run_id, patient.get("patientId"), rows)
+                    self.progress.patients_done += 1
+                    for row in rows:
+                        if row["outcome"] == OUTCOME_PENDING:
+                            self.progress.llm_queued += 1
+                            await queue.put((patient, row["nct_id"]))  # Blocks while the pool is saturated
+                    self._log_progress()
+            for _ in workers:
+                await queue.put(None)
+            await asyncio.gather(*workers)
+        except BaseException:
+            for worker in workers:
+                worker.cancel()
+            await asyncio.to_thread(self.store.finish_run, run_id, "interrupted")
+            raise
+
+        await asyncio.to_thread(self.store.finish_run, run_id)
+        self._log_progress(force=True)
+        return self.progress.snapshot()
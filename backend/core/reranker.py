@@ -0,0 +1,231 @@
+"""
+Local reranking of retrieved trials and a budget policy for LLM assessment.
+
+Retrieval ranks trials against the search query; the reranker re-scores
+them against the *patient* (diagnosis, stage, mutations, biomarkers,
+treatments) on CPU before any LLM call:
+
+- "cross_encoder": a small sentence-transformers CrossEncoder
+  (ms-marco-MiniLM-L-6-v2 by default) over (profile, trial criteria) pairs
+- "bi_encoder":    cosine similarity of MiniLM embeddings (the model the
+                   agent already loads for retrieval)
+- "retrieval":     keep the retrieval order (no model available)
+
+The assessment policy then decides how many reranked trials get the
+expensive eligibility assessment:
+
+- "top_k":          assess the first `top_k` trials
+- "until_eligible": assess in rerank order, `concurrency` at a time, and
+                    stop once `target_eligible` trials come back
+                    "Likely Eligible" (never more than `top_k`)
+
+`policy_report` is returned with the search response so cost can be tuned
+against recall.
+"""
+
+import asyncio
+import logging
+import os
+import threading
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Sequence, Tuple
+
+try:
+    from sentence_transformers import CrossEncoder
+except ImportError:
+    CrossEncoder = None
+
+RERANKER_MODE = os.getenv("TRIAL_RERANKER", "auto")  # auto | cross_encoder | bi_encoder | none
+CROSS_ENCODER_MODEL = os.getenv("TRIAL_RERANKER_MODEL", "cross-encoder/ms-marco-MiniLM-L-6-v2")
+MAX_TRIAL_TEXT_CHARS = 2000
+
+POLICY_TOP_K = "top_k"
+POLICY_UNTIL_ELIGIBLE = "until_eligible"
+DEFAULT_POLICY = {
+    "mode": os.getenv("TRIAL_ASSESSMENT_POLICY", POLICY_TOP_K),
+    "top_k": int(os.getenv("TRIAL_ASSESS_TOP_K", "4")),
+    "target_eligible": int(os.getenv("TRIAL_TARGET_ELIGIBLE", "2")),
+    "concurrency": int(os.getenv("TRIAL_ASSESS_CONCURRENCY", "3")),
+}
+
+Assessor = Callable[[Dict[str, Any]], Awaitable[Optional[Dict[str, Any]]]]
+
+
+# --- Text builders ---
+def patient_profile_text(patient: Dict[str, Any]) -> str:
+    """ Compact patient description for reranking (not for the LLM prompt). """
+    parts = []
+    diagnosis = patient.get("diagnosis") or {}
+    if diagnosis.get("primary"):
+        parts.append(f"Diagnosis: {diagnosis['primary']}")
+    if diagnosis.get("stage"):
+        parts.append(f"Stage: {diagnosis['stage']}")
+    for key in ("receptorStatus", "histology", "grade"):
+        if diagnosis.get(key):
+            parts.append(f"{key}: {diagnosis[key]}")
+    demographics = patient.get("demographics") or {}
+    if demographics.get("sex"):
+        parts.append(f"Sex: {demographics['sex']}")
+    biomarkers = patient.get("biomarkers") or []
+    if biomarkers:
+        parts.append(f"Biomarkers: {', '.join(map(str, biomarkers[:20]))}")
+    mutations = [
+        " ".join(filter(None, (m.get("hugo_gene_symbol"), m.get("protein_change"))))
+        for m in (patient.get("mutations") or [])[:30] if isinstance(m, dict)
+    ]
+    if mutations:
+        parts.append(f"Mutations: {', '.join(mutations)}")
+    medications = [m.get("name") for m in (patient.get("currentMedications") or []) if isinstance(m, dict) and m.get("name")]
+    if medications:
+        parts.append(f"Medications: {', '.join(medications[:15])}")
+    treatments = [t.get("name") for t in (patient.get("prior_treatments") or []) if isinstance(t, dict) and t.get("name")]
+    if treatments:
+        parts.append(f"Prior treatments: {', '.join(treatments[:15])}")
+    return ". ".join(parts)
+
+
+def trial_text(trial: Dict[str, Any]) -> str:
+    text = f"{trial.get('title') or ''}\n{trial.get('inclusion_criteria_text') or trial.get('eligibility_text') or ''}"
+    return text[:MAX_TRIAL_TEXT_CHARS]
+
+
+def is_likely_eligible(result: Optional[Dict[str, Any]]) -> bool:
+    """ True when an assessment's overall status is 'Likely Eligible'. """
+    analysis = (result or {}).get("llm_eligibility_analysis") or {}
+    summary = str((analysis.get("eligibility_assessment") or {}).get("eligibility_summary") or "").lower()
+    return "likely eligible" in summary and "ineligible" not in summary
+
+
+# --- Reranker ---
+class TrialReranker:
+    """ Scores (patient, trial) pairs on CPU; falls back from cross-encoder to bi-encoder to retrieval order. """
+
+    def __init__(self, bi_encoder: Any = None, mode: str = RERANKER_MODE, cross_encoder_model: str = CROSS_ENCODER_MODEL):
+        self.bi_encoder = bi_encoder
+        self.mode = mode
+        self.cross_encoder_model = cross_encoder_model
+        self._cross_encoder = None
+        self._cross_encoder_failed = False
+        self._lock = threading.Lock()
+
+    def _get_cross_encoder(self):
+        if self.mode not in ("auto", "cross_encoder") or CrossEncoder is None or self._cross_encoder_failed:
+            return None
+        with self._lock:
+            if self._cross_encoder is None and not self._cross_encoder_failed:
+                try:
+                    logging.info(f"[TrialReranker] Loading cross-encoder {self.cross_encoder_model}...")
+                    self._cross_encoder = CrossEncoder(self.cross_encoder_model, device="cpu")
+                except Exception as e:
+                    logging.warning(f"[TrialReranker] Cross-encoder unavailable ({e}); using bi-encoder similarity.")
+                    self._cross_encoder_failed = True
+        return self._cross_encoder
+
+    @property
+    def method(self) -> str:
+        if self.mode == "none":
+            return "retrieval"
+        if self._get_cross_encoder() is not None:
+            return "cross_encoder"
+        if self.bi_encoder is not None and self.mode in ("auto", "bi_encoder", "cross_encoder"):
+            return "bi_encoder"
+        return "retrieval"
+
+    def warmup(self) -> None:
+        self._get_cross_encoder()
+
+    def score_sync(self, profile: str, trials: Sequence[Dict[str, Any]]) -> Tuple[List[float], str]:
+        """ Returns (scores aligned with `trials`, method used). Higher is better. """
+        method = self.method if profile and trials else "retrieval"
+        if method == "cross_encoder":
+            scores = self._get_cross_encoder().predict([(profile, trial_text(t)) for t in trials], show_progress_bar=False)
+            return [float(s) for s in scores], method
+        if method == "bi_encoder":
+            vectors = self.bi_encoder.encode([profile] + [trial_text(t) for t in trials],
+                                             normalize_embeddings=True, show_progress_bar=False)
+            query = vectors[0]
+            return [float(sum(a * b for a, b in zip(query, v))) for v in vectors[1:]], method
+        # Retrieval order: first trial gets the highest score
+        return [float(len(trials) - i) for i in range(len(trials))], "retrieval"
+
+    async def rerank(self, patient: Dict[str, Any], trials: List[Dict[str, Any]]) -> Tuple[List[Dict[str, Any]], Dict[str, Any]]:
+        """ Returns (trials best-first, report). Each trial gets retrieval.rerank_score. """
+        profile = patient_profile_text(patient)
+        try:
+            scores, method = await asyncio.to_thread(self.score_sync, profile, trials)
+        except Exception as e:
+            logging.error(f"[TrialReranker] Reranking failed, keeping retrieval order: {e}", exc_info=True)
+            scores, method = [float(len(trials) - i) for i in range(len(trials))], "retrieval"
+        order = sorted(range(len(trials)), key=lambda i: scores[i], reverse=True)
+        ranked = []
+        for i in order:
+            trial = dict(trials[i])
+            trial["retrieval"] = {**(trial.get("retrieval") or {}), "rerank_score": round(scores[i], 6), "retrieval_rank": i + 1}
+            ranked.append(trial)
+        return ranked, {"method": method, "order": [t.get("nct_id") for t in ranked]}
+
+
+# --- Assessment budget ---
+def resolve_policy(overrides: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """ DEFAULT_POLICY with per-request overrides (unknown keys ignored, numbers clamped to >= 1). """
+    policy = dict(DEFAULT_POLICY)
+    for key, value in (overrides or {}).items():
+        if key in policy and value is not None:
+            policy[key] = value
+    if policy["mode"] not in (POLICY_TOP_K, POLICY_UNTIL_ELIGIBLE):
+        raise ValueError(f"Unknown assessment policy '{policy['mode']}'")
+    for key in ("top_k", "target_eligible", "concurrency"):
+        policy[key] = max(1, int(policy[key]))
+    return policy
+
+
+async def iter_budgeted_assessments(trials: Sequence[Dict[str, Any]], assess: Assessor, policy: Dict[str, Any],
+                                    report: Dict[str, Any]) -> AsyncIterator[Tuple[int, Optional[Dict[str, Any]]]]:
+    """
+    Yields (index, assessment) in completion order for the trials the policy selects, filling
+    `report` (assessed, eligible_found, stopped_early) as it goes. Indexes refer to `trials`.
+    """
+    budget = min(policy["top_k"], len(trials))
+    concurrency = budget if policy["mode"] == POLICY_TOP_K else min(policy["concurrency"], budget)
+    report.update({"assessed": 0, "eligible_found": 0, "stopped_early": False})
+
+    async def run(index: int) -> Tuple[int, Optional[Dict[str, Any]]]:
+        return index, await assess(trials[index])
+
+    next_index = 0
+    in_flight = set()
+    try:
+        while next_index < budget or in_flight:
+            stop = policy["mode"] == POLICY_UNTIL_ELIGIBLE and report["eligible_found"] >= policy["target_eligible"]
+            while not stop and next_index < budget and len(in_flight) < concurrency:
+                in_flight.add(asyncio.ensure_future(run(next_index)))
+                next_index += 1
+            if not in_flight:
+                break
+            done, in_flight = await asyncio.wait(in_flight, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                index, result = task.result()
+                report["assessed"] += 1
+                if is_likely_eligible(result):
+                    report["eligible_found"] += 1
+                yield index, result
+            if (policy["mode"] == POLICY_UNTIL_ELIGIBLE and report["eligible_found"] >= policy["target_eligible"]
+                    and (next_index < budget or in_flight)):
+                report["stopped_early"] = True
+                break
+    finally:
+        for task in in_flight:
+            task.cancel()
+    report["skipped"] = len(trials) - report["assessed"]
+
+
+def policy_report(policy: Dict[str, Any], rerank_report: Optional[Dict[str, Any]], candidates: int) -> Dict[str, Any]:
+    """ Starting report for a search response; iter_budgeted_assessments fills in the counters. """
+    return {
+        **policy,
+        "candidates": candidates,
+        "reranker": (rerank_report or {}).get("method"),
+        "assessed": 0,
+        "skipped": candidates,
+        "eligible_found": 0,
+        "stopped_early": False,
+    }
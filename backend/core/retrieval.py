@@ -0,0 +1,341 @@
+"""
+Criterion-level (multi-vector) trial retrieval.
+
+The original collection holds one embedding per trial of the whole
+`eligibility_text`, so a query that matches one specific criterion is
+diluted by dozens of unrelated ones. The criteria collection instead holds
+one embedding per atomized criterion (see criteria_index.atomize_criteria)
+plus one for the trial title. At query time we over-fetch chunks and pool
+their similarities back to one score per trial:
+
+- "maxsim":   the best matching chunk wins
+- "weighted": a decaying weighted mean of the trial's top chunks, so a
+              trial matching several criteria beats one lucky hit
+
+Chunk similarities are scaled by kind (exclusion matches count a little
+less than inclusion ones, since matching an exclusion is not a reason to
+enroll).
+
+Hybrid search adds a lexical side: an FTS5 index (`clinical_trials_fts`)
+over title, criteria and description, kept next to the criteria table in the
+derived index database (not in trials.db), ranked with bm25. Both
+sides are restricted up front to trials whose indexed `status`/`phase`
+columns pass the search filters (open statuses by default, plus any
+phase/status the orchestrator extracted), and their rankings are merged with
+reciprocal-rank fusion.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from backend.core.criteria_index import KIND_EXCLUSION, KIND_INCLUSION, atomize_criteria, read_trial_rows
+from backend.core.trial_filters import filters_from_entities, trial_matches_filters
+from backend.core.sqlite_pool import get_pool, json_list
+
+CRITERIA_COLLECTION_NAME = "clinical_trials_criteria"
+KIND_TITLE = "title"
+
+POOLING_MAXSIM = "maxsim"
+POOLING_WEIGHTED = "weighted"
+DEFAULT_POOLING = POOLING_WEIGHTED
+DEFAULT_FANOUT = 8          # Chunks fetched per trial requested
+DEFAULT_TOP_CHUNKS = 3      # Chunks pooled per trial for "weighted"
+DEFAULT_DECAY = 0.5         # Weight of the i-th best chunk is decay ** i
+KIND_WEIGHTS = {KIND_TITLE: 1.0, KIND_INCLUSION: 1.0, KIND_EXCLUSION: 0.8}
+MAX_CHUNK_CHARS = 1000
+
+FTS_TABLE_NAME = "clinical_trials_fts"
+RRF_K = 60                  # Standard reciprocal-rank-fusion constant
+# bm25 column weights: (nct_id, title, criteria, description); nct_id is UNINDEXED
+BM25_WEIGHTS = (0.0, 3.0, 1.0, 0.5)
+
+
+# --- Chunking (ingestion side) ---
+def criterion_chunks(nct_id: str, title: Optional[str], inclusion_text: Optional[str],
+                     exclusion_text: Optional[str]) -> List[Dict[str, Any]]:
+    """
+    One chunk per criterion (nested bullets are prefixed with their parent so they keep
+    their context) plus one title chunk. Chunk IDs reuse the stable criterion IDs.
+    """
+    chunks: List[Dict[str, Any]] = []
+    if title:
+        chunks.append({"id": f"{nct_id}:title", "kind": KIND_TITLE, "text": title[:MAX_CHUNK_CHARS]})
+    for kind, text in ((KIND_INCLUSION, inclusion_text), (KIND_EXCLUSION, exclusion_text)):
+        atoms = atomize_criteria(nct_id, text, kind)
+        by_id = {a["criterion_id"]: a for a in atoms}
+        for atom in atoms:
+            parent = by_id.get(atom["parent_id"]) if atom["parent_id"] else None
+            body = f"{parent['text']} {atom['text']}" if parent else atom["text"]
+            chunks.append({"id": atom["criterion_id"], "kind": kind, "text": body[:MAX_CHUNK_CHARS]})
+    return chunks
+
+
+def upsert_trial_chunks(collection: Any, model: Any, trials: Sequence[Dict[str, Any]],
+                        batch_size: int = 256, encode_batch_size: int = 64) -> int:
+    """
+    Replaces the chunks of `trials` (dicts with nct_id, title, status, source_url,
+    inclusion_criteria_text, exclusion_criteria_text) in the criteria collection.
+    All chunk texts are encoded in one batched call. Returns the number of chunks written.
+    """
+    ids, documents, metadatas = [], [], []
+    nct_ids = []
+    for trial in trials:
+        nct_id = trial.get("nct_id")
+        if not nct_id:
+            continue
+        nct_ids.append(nct_id)
+        for chunk in criterion_chunks(nct_id, trial.get("title"), trial.get("inclusion_criteria_text"),
+                                      trial.get("exclusion_criteria_text")):
+            ids.append(chunk["id"])
+            documents.append(chunk["text"])
+            metadatas.append({
+                "nct_id": nct_id,
+                "kind": chunk["kind"],
+                "source_url": trial.get("source_url") or "",
+                "status": trial.get("status") or "",
+            })
+    if nct_ids:
+        # Drop chunks of criteria that were removed/edited since the last load
+        collection.delete(where={"nct_id": {"$in": nct_ids}})
+    if not ids:
+        return 0
+    embeddings = model.encode(documents, batch_size=encode_batch_size, show_progress_bar=False)
+    for start in range(0, len(ids), batch_size):
+        end = start + batch_size
+        collection.upsert(
+            ids=ids[start:end],
+            embeddings=[list(map(float, e)) for e in embeddings[start:end]],
+            documents=documents[start:end],
+            metadatas=metadatas[start:end],
+        )
+    return len(ids)
+
+
+# --- Pooling (query side) ---
+def pool_trial_scores(hits: Iterable[Tuple[str, str, float, str]], method: str = DEFAULT_POOLING,
+                      top_chunks: int = DEFAULT_TOP_CHUNKS, decay: float = DEFAULT_DECAY) -> List[Dict[str, Any]]:
+    """
+    Aggregates chunk hits (nct_id, kind, similarity, text) into trial scores, best first.
+    Each result is {"nct_id", "score", "matched_chunks", "best_match"}.
+    """
+    per_trial: Dict[str, List[Tuple[float, str, str]]] = {}
+    for nct_id, kind, similarity, text in hits:
+        if not nct_id:
+            continue
+        per_trial.setdefault(nct_id, []).append((similarity * KIND_WEIGHTS.get(kind, 1.0), kind, text))
+
+    ranked = []
+    for nct_id, scored in per_trial.items():
+        scored.sort(key=lambda s: s[0], reverse=True)
+        if method == POOLING_MAXSIM:
+            score = scored[0][0]
+        elif method == POOLING_WEIGHTED:
+            top = scored[:max(1, top_chunks)]
+            weights = [decay ** i for i in range(len(top))]
+            # Normalize by the full weight mass so trials with fewer matching chunks are not favoured
+            full_mass = sum(decay ** i for i in range(max(1, top_chunks)))
+            score = sum(w * s[0] for w, s in zip(weights, top)) / full_mass
+        else:
+            raise ValueError(f"Unknown pooling method '{method}'")
+        best_score, best_kind, best_text = scored[0]
+        ranked.append({
+            "nct_id": nct_id,
+            "score": round(float(score), 6),
+            "matched_chunks": len(scored),
+            "best_match": {"kind": best_kind, "text": best_text, "similarity": round(float(best_score), 6)},
+        })
+    ranked.sort(key=lambda r: r["score"], reverse=True)
+    return ranked
+
+
+class CriterionRetriever:
+    """ Multi-vector search over the criteria collection with trial-level pooling. """
+
+    def __init__(self, collection: Any, method: str = DEFAULT_POOLING, fanout: int = DEFAULT_FANOUT,
+                 top_chunks: int = DEFAULT_TOP_CHUNKS, where: Optional[Dict[str, Any]] = None):
+        self.collection = collection
+        self.method = method
+        self.fanout = max(1, fanout)
+        self.top_chunks = top_chunks
+        self.where = where
+
+    def search_sync(self, query_embedding: List[float], n_trials: int,
+                    where: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+        n_chunks = max(n_trials * self.fanout, n_trials)
+        where = where or self.where
+        kwargs = {"where": where} if where else {}
+        results = self.collection.query(
+            query_embeddings=[query_embedding], n_results=n_chunks,
+            include=["metadatas", "distances", "documents"], **kwargs,
+        )
+        metadatas = (results.get("metadatas") or [[]])[0] or []
+        distances = (results.get("distances") or [[]])[0] or []
+        documents = (results.get("documents") or [[]])[0] or [""] * len(metadatas)
+        # Collection uses cosine distance: similarity = 1 - distance
+        hits = [
+            (meta.get("nct_id"), meta.get("kind"), 1.0 - float(distance), document)
+            for meta, distance, document in zip(metadatas, distances, documents) if meta
+        ]
+        ranked = pool_trial_scores(hits, self.method, self.top_chunks)
+        logging.debug(f"[CriterionRetriever] {len(hits)} chunk hits pooled into {len(ranked)} trials")
+        return ranked[:n_trials]
+
+    async def search(self, query_embedding: List[float], n_trials: int,
+                     where: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+        return await asyncio.to_thread(self.search_sync, query_embedding, n_trials, where)
+
+
+# --- Allowed trials (status / phase pre-filter) ---
+ALL_TRIALS_SQL = "SELECT nct_id, status, phase FROM clinical_trials WHERE nct_id IS NOT NULL"
+ALLOWED_TRIALS_SQL = ALL_TRIALS_SQL + " AND lower(trim(status)) IN (SELECT value FROM json_each(?))"
+
+
+async def allowed_trial_ids(db_path: str, filters: Dict[str, Any]) -> List[str]:
+    """ NCT IDs whose indexed status/phase pass `filters`; both retrievers are restricted to these. """
+    if filters["statuses"] is None:
+        rows = await get_pool(db_path).fetchall(ALL_TRIALS_SQL)
+    else:
+        rows = await get_pool(db_path).fetchall(ALLOWED_TRIALS_SQL, (json_list(sorted(filters["statuses"])),))
+    return [row["nct_id"] for row in rows if trial_matches_filters(row, filters)]
+
+
+# --- Lexical (FTS5 / bm25) side ---
+_TOKEN_RE = re.compile(r"[A-Za-z0-9][A-Za-z0-9\-]*")
+# Labels from _build_query_text plus common words that only add noise to bm25
+_FTS_STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "by", "for", "from", "in", "is", "it", "of", "on", "or", "the", "to",
+    "with", "condition", "stage", "phase", "status", "biomarkers", "prior", "treatments", "trial", "trials", "find",
+    "patient", "patients", "me", "show", "clinical", "any", "who", "that", "this", "what",
+}
+
+
+def build_fts_query(text: str) -> Optional[str]:
+    """ OR-query of quoted terms (quoted so hyphens/keywords are never parsed as FTS syntax). """
+    terms = []
+    for token in _TOKEN_RE.findall(text or ""):
+        lowered = token.lower()
+        if len(lowered) < 2 or lowered in _FTS_STOPWORDS or lowered in terms:
+            continue
+        terms.append(lowered)
+    return " OR ".join(f'"{t}"' for t in terms) if terms else None
+
+
+class LexicalIndex:
+    """ FTS5 index over trial title, criteria and description, kept in the derived index database. """
+
+    def __init__(self, db_path: str, trials_db_path: Optional[str] = None):
+        """ `trials_db_path` holds `clinical_trials` for (re)builds; defaults to `db_path` itself. """
+        self.db_path = db_path
+        self.trials_db_path = trials_db_path or db_path
+        self._lock = threading.Lock()
+        self._build_lock = threading.Lock()
+        self._built = False
+        self._conn: Optional[sqlite3.Connection] = None
+        try:
+            directory = os.path.dirname(db_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._conn = sqlite3.connect(db_path, check_same_thread=False)
+            if self.trials_db_path != db_path:
+                self._conn.execute("PRAGMA journal_mode=WAL")  # Our own file: searches read while a build writes
+            self._conn.execute(
+                f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE_NAME} USING fts5("
+                "nct_id UNINDEXED, title, criteria, description, tokenize = 'porter unicode61')"
+            )
+            self._conn.commit()
+        except sqlite3.Error as e:
+            logging.error(f"[LexicalIndex] Could not open {db_path}: {e}. Lexical search disabled.")
+            self._conn = None
+
+    @property
+    def available(self) -> bool:
+        return self._conn is not None
+
+    def index_trials(self, trials: Iterable[Dict[str, Any]]) -> int:
+        """ Replaces the FTS rows of the given trials (clinical_trials-shaped dicts) in one transaction. """
+        if self._conn is None:
+            return 0
+        rows = [
+            (t["nct_id"], t.get("title") or "",
+             "\n".join(filter(None, (t.get("inclusion_criteria_text"), t.get("exclusion_criteria_text")))),
+             "\n".join(filter(None, (t.get("description_text"), t.get("objectives_text")))))
+            for t in trials if t.get("nct_id")
+        ]
+        with self._lock, self._conn:
+            self._conn.execute(f"DELETE FROM {FTS_TABLE_NAME} WHERE nct_id IN (SELECT value FROM json_each(?))",
+                               (json.dumps([r[0] for r in rows]),))
+            self._conn.executemany(
+                f"INSERT INTO {FTS_TABLE_NAME} (nct_id, title, criteria, description) VALUES (?, ?, ?, ?)", rows
+            )
+        return len(rows)
+
+    def rebuild_from_trials(self) -> int:
+        """ Re-indexes every row of `clinical_trials`. Returns the number of trials indexed. """
+        if self._conn is None:
+            return 0
+        trials = [dict(r) for r in read_trial_rows(self.trials_db_path, "SELECT * FROM clinical_trials WHERE nct_id IS NOT NULL")]
+        with self._lock:
+            with self._conn:
+                self._conn.execute(f"DELETE FROM {FTS_TABLE_NAME}")
+        return self.index_trials(trials)
+
+    def ensure_built(self) -> None:
+        """ Builds the index once for databases loaded before it existed (blocking; `search` runs it off the loop). """
+        if self._conn is None or self._built:
+            return
+        with self._build_lock:
+            if self._built:
+                return
+            with self._lock:
+                indexed = self._conn.execute(f"SELECT COUNT(*) FROM {FTS_TABLE_NAME}").fetchone()[0]
+            try:
+                trials = read_trial_rows(self.trials_db_path, "SELECT COUNT(*) FROM clinical_trials WHERE nct_id IS NOT NULL")[0][0]
+            except sqlite3.Error:
+                trials = 0
+            if indexed == 0 and trials:
+                logging.info(f"[LexicalIndex] Building {FTS_TABLE_NAME} for {trials} trials...")
+                self.rebuild_from_trials()
+            self._built = True
+
+    async def search(self, query: str, allowed_ids: Sequence[str], limit: int) -> List[Tuple[str, float]]:
+        """ [(nct_id, bm25)] best first (bm25 is lower-is-better), restricted to `allowed_ids`. """
+        fts_query = build_fts_query(query)
+        if self._conn is None or not fts_query or not allowed_ids:
+            return []
+        if not self._built:
+            await asyncio.to_thread(self.ensure_built)  # First query builds the index if it is still empty
+        weights = ", ".join(str(w) for w in BM25_WEIGHTS)
+        sql = (
+            f"SELECT nct_id, bm25({FTS_TABLE_NAME}, {weights}) AS score FROM {FTS_TABLE_NAME} "
+            f"WHERE {FTS_TABLE_NAME} MATCH ? AND nct_id IN (SELECT value FROM json_each(?)) ORDER BY score LIMIT ?"
+        )
+        try:
+            rows = await get_pool(self.db_path).fetchall(sql, (fts_query, json_list(allowed_ids), limit))
+        except sqlite3.Error as e:
+            logging.error(f"[LexicalIndex] Search failed for {fts_query!r}: {e}")
+            return []
+        return [(row["nct_id"], row["score"]) for row in rows]
+
+    def close(self) -> None:
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+# --- Fusion ---
+def reciprocal_rank_fusion(rankings: Sequence[Sequence[str]], k: int = RRF_K,
+                           weights: Optional[Sequence[float]] = None) -> List[Tuple[str, float]]:
+    """ Merges best-first ID lists: score(id) = sum_i weight_i / (k + rank_i), ranks starting at 1. """
+    scores: Dict[str, float] = {}
+    for i, ranking in enumerate(rankings):
+        weight = weights[i] if weights else 1.0
+        for rank, item in enumerate(ranking, start=1):
+            scores[item] = scores.get(item, 0.0) + weight / (k + rank)
+    return sorted(scores.items(), key=lambda kv: kv[1], reverse=True)
@@ -0,0 +1,258 @@
+"""
+Bounded per-room message history for WebSocket catch-up.
+
+Every room broadcast gets a `seq` cursor and is kept in a per-room ring
+buffer (WS_ROOM_HISTORY_SIZE messages). A socket that joins with
+`since=<seq>` receives only what it missed; a fresh join receives the
+buffered history. Sequence numbers come from a microsecond clock (kept
+strictly increasing per room) and are assigned by the worker that sends the
+message, so a cursor stays valid when a client reconnects to another worker.
+
+With WS_ROOM_HISTORY_DIR set, messages are also appended to one JSONL file
+per room (one message per line, as sent) and reloaded on first use after a
+restart. Each worker appends only the messages it originated, so workers
+sharing the directory don't duplicate lines; files are compacted in place
+(under an exclusive lock where `fcntl` exists) once they reach twice the
+buffer size. Under a running event loop the file I/O happens on worker
+threads: appends are queued for a background writer task, and `load()`
+reads a room's file before its first use. Another worker holding the lock
+only delays that thread, never the loop.
+"""
+
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import re
+import time
+from collections import OrderedDict, deque
+from typing import Deque, Dict, List, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows: appends are still line-atomic enough for a dev setup
+    fcntl = None
+
+HISTORY_SIZE = int(os.getenv("WS_ROOM_HISTORY_SIZE", "200"))
+MAX_ROOMS = int(os.getenv("WS_ROOM_HISTORY_ROOMS", "1000"))
+HISTORY_DIR = os.getenv("WS_ROOM_HISTORY_DIR", "")
+
+Entry = Tuple[int, str]  # (seq, message JSON text)
+
+
+def parse_cursor(value: object) -> Optional[int]:
+    """ Client-supplied `since` cursor as an int, or None when absent/invalid. """
+    try:
+        return int(value) if value is not None and value != "" else None
+    except (TypeError, ValueError):
+        return None
+
+
+def _room_filename(room_id: str) -> str:
+    safe = re.sub(r"[^A-Za-z0-9_.-]", "_", room_id)[:64]
+    return f"{safe}-{hashlib.sha1(room_id.encode('utf-8')).hexdigest()[:8]}.jsonl"
+
+
+class _LockedFile:
+    """ Opens a file with an exclusive advisory lock held until close. """
+
+    def __init__(self, path: str, mode: str):
+        self.path, self.mode = path, mode
+
+    def __enter__(self):
+        self.f = open(self.path, self.mode, encoding="utf-8")
+        if fcntl is not None:
+            fcntl.flock(self.f.fileno(), fcntl.LOCK_EX)
+        return self.f
+
+    def __exit__(self, *exc):
+        if fcntl is not None:
+            fcntl.flock(self.f.fileno(), fcntl.LOCK_UN)
+        self.f.close()
+
+
+class RoomHistory:
+    """ Ring buffer of recent messages per room, with optional append-only persistence. """
+
+    def __init__(self, max_messages: int = HISTORY_SIZE, max_rooms: int = MAX_ROOMS,
+                 persist_dir: Optional[str] = HISTORY_DIR or None):
+        self.max_messages = max_messages
+        self.max_rooms = max_rooms
+        self.persist_dir = persist_dir
+        self.rooms: "OrderedDict[str, Deque[Entry]]" = OrderedDict()
+        self.last_seq: Dict[str, int] = {}
+        # Newest seq that fell out of each room's buffer; a cursor older than this missed messages
+        self.dropped_through: Dict[str, int] = {}
+        self._file_lines: Dict[str, int] = {}
+        self._pending: Dict[str, List[str]] = {}  # Lines waiting for the writer task, per room
+        self._writing: Dict[str, List[str]] = {}  # Batch the writer thread is appending right now
+        self._writer: Optional[asyncio.Task] = None
+        self._loading: Dict[str, asyncio.Future] = {}
+        if persist_dir:
+            os.makedirs(persist_dir, exist_ok=True)
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_messages > 0
+
+    def _buffer(self, room_id: str, loaded: Optional[List[Entry]] = None) -> Deque[Entry]:
+        buffer = self.rooms.get(room_id)
+        if buffer is None:
+            # Callers on the event loop `await load(room_id)` first; reading here is the sync fallback
+            buffer = deque(loaded if loaded is not None else self._load(room_id), maxlen=self.max_messages)
+            self.rooms[room_id] = buffer
+            if buffer:
+                self.last_seq[room_id] = max(self.last_seq.get(room_id, 0), buffer[-1][0])
+            while len(self.rooms) > self.max_rooms:
+                evicted, _ = self.rooms.popitem(last=False)  # Reloaded from disk if it comes back
+                self.last_seq.pop(evicted, None)
+                self.dropped_through.pop(evicted, None)
+                self._file_lines.pop(evicted, None)
+        else:
+            self.rooms.move_to_end(room_id)
+        return buffer
+
+    def next_seq(self, room_id: str) -> int:
+        """ Allocates the cursor for a new message in `room_id`. """
+        self._buffer(room_id)
+        seq = max(self.last_seq.get(room_id, 0) + 1, time.time_ns() // 1000)
+        self.last_seq[room_id] = seq
+        return seq
+
+    def append(self, room_id: str, seq: int, message_text: str, persist: bool = True) -> None:
+        """ Records a message (JSON text including its `seq`). `persist=False` for messages another worker owns. """
+        buffer = self._buffer(room_id)
+        if not buffer or seq > buffer[-1][0]:
+            if len(buffer) == self.max_messages:
+                self._note_dropped(room_id, buffer[0][0])
+            buffer.append((seq, message_text))  # maxlen drops the oldest
+        else:
+            # Arrived out of order from another worker: keep the buffer sorted by seq
+            items = sorted([*buffer, (seq, message_text)])
+            if len(items) > self.max_messages:
+                self._note_dropped(room_id, items[-self.max_messages - 1][0])
+            buffer.clear()
+            buffer.extend(items[-self.max_messages:])
+        self.last_seq[room_id] = max(self.last_seq.get(room_id, 0), seq)
+        if persist and self.persist_dir:
+            self._queue_write(room_id, message_text.replace("\n", " "))
+
+    def _note_dropped(self, room_id: str, seq: int) -> None:
+        self.dropped_through[room_id] = max(self.dropped_through.get(room_id, 0), seq)
+
+    def since(self, room_id: str, cursor: Optional[int] = None) -> Tuple[List[Entry], bool]:
+        """ Messages after `cursor` (all buffered ones when None), and whether older missed messages were dropped. """
+        buffer = self._buffer(room_id)
+        if cursor is None:
+            return list(buffer), False
+        entries = [entry for entry in buffer if entry[0] > cursor]
+        return entries, cursor < self.dropped_through.get(room_id, 0)
+
+    def latest_seq(self, room_id: str) -> Optional[int]:
+        buffer = self.rooms.get(room_id)
+        return buffer[-1][0] if buffer else self.last_seq.get(room_id)
+
+    # --- Persistence ---
+    async def load(self, room_id: str) -> None:
+        """ Reads the room's file on a worker thread if the room isn't in memory yet. """
+        if room_id in self.rooms or not self.persist_dir or not self.enabled:
+            return
+        pending = self._loading.get(room_id)
+        if pending is None:
+            pending = asyncio.ensure_future(self._load_async(room_id))
+            self._loading[room_id] = pending
+            pending.add_done_callback(lambda _: self._loading.pop(room_id, None))
+        await asyncio.shield(pending)
+
+    async def _load_async(self, room_id: str) -> None:
+        if room_id in self._pending or room_id in self._writing:
+            await self.flush()  # Evicted with writes still queued: read them back from the file
+        loaded = await asyncio.to_thread(self._load, room_id)
+        if room_id not in self.rooms:  # A sync caller may have loaded it meanwhile
+            self._buffer(room_id, loaded)
+
+    def _queue_write(self, room_id: str, line: str) -> None:
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            self._write_batch({room_id: [line]})  # No event loop (scripts): write inline
+            return
+        self._pending.setdefault(room_id, []).append(line)
+        if self._writer is None or self._writer.done():
+            self._writer = asyncio.ensure_future(self._drain())
+
+    async def _drain(self) -> None:
+        # One writer at a time keeps each room's lines in append order
+        while self._pending:
+            self._writing, self._pending = self._pending, {}
+            try:
+                await asyncio.to_thread(self._write_batch, self._writing)
+            finally:
+                self._writing = {}
+
+    async def flush(self) -> None:
+        """ Waits until every queued line is on disk (tests, shutdown). """
+        while self._writer is not None and not self._writer.done():
+            await asyncio.shield(self._writer)
+
+    def _path(self, room_id: str) -> str:
+        return os.path.join(self.persist_dir, _room_filename(room_id))
+
+    def _load(self, room_id: str) -> List[Entry]:
+        if not self.persist_dir or not os.path.exists(self._path(room_id)):
+            return []
+        entries: Dict[int, str] = {}
+        lines = 0
+        try:
+            with _LockedFile(self._path(room_id), "r") as f:
+                for line in f:
+                    line = line.strip()
+                    if not line:
+                        continue
+                    lines += 1
+                    try:
+                        seq = json.loads(line).get("seq")
+                    except (ValueError, AttributeError):
+                        continue  # Torn last line after a crash
+                    if isinstance(seq, int):
+                        entries[seq] = line
+        except OSError as e:
+            logging.error(f"[RoomHistory] Could not load history for room '{room_id}': {e}")
+            return []
+        self._file_lines[room_id] = lines
+        ordered = sorted(entries.items())
+        if len(ordered) > self.max_messages:
+            self.dropped_through[room_id] = ordered[-self.max_messages - 1][0]
+        return ordered[-self.max_messages:]
+
+    def _write_batch(self, batch: Dict[str, List[str]]) -> None:
+        """ Appends each room's lines under one lock, compacting files that grew past twice the buffer (blocking). """
+        for room_id, lines in batch.items():
+            try:
+                with _LockedFile(self._path(room_id), "a") as f:
+                    f.write("".join(line + "\n" for line in lines))
+                self._file_lines[room_id] = self._file_lines.get(room_id, 0) + len(lines)
+                if self._file_lines[room_id] >= 2 * self.max_messages:
+                    self._compact(room_id)
+            except OSError as e:
+                logging.error(f"[RoomHistory] Could not persist {len(lines)} message(s) for room '{room_id}': {e}")
+
+    def _compact(self, room_id: str) -> None:
+        """ Rewrites the room file in place with its newest `max_messages` lines. """
+        with _LockedFile(self._path(room_id), "r+") as f:
+            lines = [line for line in f.read().splitlines() if line.strip()]
+            keep = lines[-self.max_messages:]
+            f.seek(0)
+            f.truncate()
+            f.write("".join(line + "\n" for line in keep))
+        self._file_lines[room_id] = len(keep)
+
+    def stats(self) -> Dict[str, object]:
+        return {
+            "rooms": len(self.rooms),
+            "messages": sum(len(buffer) for buffer in self.rooms.values()),
+            "max_messages_per_room": self.max_messages,
+            "persist_dir": self.persist_dir,
+            "pending_writes": sum(len(lines) for lines in self._pending.values()),
+        }
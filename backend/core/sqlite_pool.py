@@ -0,0 +1,191 @@
+"""
+Shared, async-friendly read access to the SQLite databases (trials, mutations).
+
+Each database gets one `SQLitePool`: a fixed set of read-only connections
+(`mode=ro` URI, `query_only`) tuned with mmap_size / cache_size / temp_store,
+and a dedicated thread pool of the same size that runs every query, so the
+event loop never blocks on SQLite. Connections live for the life of the pool,
+which lets sqlite3's per-connection statement cache reuse prepared statements
+for repeated SQL; callers should therefore keep their SQL text constant and
+pass lists through `json_each(?)` rather than building variable-length IN
+clauses.
+
+Pools never modify the file by default, so reading the git-tracked
+trials.db leaves it untouched. With `enable_wal=True` the database is
+switched to WAL journaling once (with a short-lived writable connection)
+when the pool opens, so readers never block writers; runtime databases the
+app owns (patient repository, derived indexes) set WAL from their writer
+connections instead.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import queue
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+DEFAULT_POOL_SIZE = int(os.getenv("SQLITE_POOL_SIZE", "4"))
+DEFAULT_MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024)))
+DEFAULT_CACHE_SIZE_KIB = int(os.getenv("SQLITE_CACHE_SIZE_KIB", str(64 * 1024)))
+DEFAULT_CACHED_STATEMENTS = 256
+
+
+def json_list(values: Sequence[Any]) -> str:
+    """ Encodes a list for a `... IN (SELECT value FROM json_each(?))` parameter. """
+    return json.dumps(list(values))
+
+
+class SQLitePool:
+    """ Fixed-size pool of read-only SQLite connections with its own query thread pool. """
+
+    def __init__(self, db_path: str, size: int = DEFAULT_POOL_SIZE,
+                 mmap_size: int = DEFAULT_MMAP_SIZE,
+                 cache_size_kib: int = DEFAULT_CACHE_SIZE_KIB,
+                 enable_wal: bool = False):
+        self.db_path = os.path.abspath(db_path)
+        self.size = max(1, size)
+        self.mmap_size = mmap_size
+        self.cache_size_kib = cache_size_kib
+        self.enable_wal = enable_wal
+        self.queries = 0
+        self.errors = 0
+        self._connections: "queue.Queue[sqlite3.Connection]" = queue.Queue()
+        self._opened = 0
+        self._lock = threading.Lock()
+        self._wal_checked = False
+        self._closed = False
+        self._executor = ThreadPoolExecutor(max_workers=self.size, thread_name_prefix=f"sqlite-{os.path.basename(db_path)}")
+
+    # --- Connections ---
+    def _ensure_wal(self) -> None:
+        """ Persistently switches the file to WAL; skipped quietly when the file is not writable. """
+        if self._wal_checked or not self.enable_wal:
+            return
+        self._wal_checked = True
+        try:
+            conn = sqlite3.connect(f"file:{self.db_path}?mode=rw", uri=True)
+            try:
+                mode = conn.execute("PRAGMA journal_mode=WAL").fetchone()[0]
+                logging.info(f"[SQLitePool] {self.db_path} journal_mode={mode}")
+            finally:
+                conn.close()
+        except sqlite3.Error as e:
+            logging.warning(f"[SQLitePool] Could not enable WAL on {self.db_path}: {e}")
+
+    def _open(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(
+            f"file:{self.db_path}?mode=ro", uri=True,
+            check_same_thread=False, cached_statements=DEFAULT_CACHED_STATEMENTS,
+        )
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA query_only = ON")
+        conn.execute(f"PRAGMA mmap_size = {int(self.mmap_size)}")
+        conn.execute(f"PRAGMA cache_size = {-int(self.cache_size_kib)}")  # negative = KiB
+        conn.execute("PRAGMA temp_store = MEMORY")
+        return conn
+
+    def _acquire(self) -> sqlite3.Connection:
+        try:
+            return self._connections.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if self._closed:
+                raise sqlite3.ProgrammingError(f"Pool for {self.db_path} is closed")
+            if self._opened < self.size:
+                self._ensure_wal()
+                conn = self._open()
+                self._opened += 1
+                return conn
+        return self._connections.get()
+
+    def _release(self, conn: sqlite3.Connection) -> None:
+        if self._closed:
+            conn.close()
+        else:
+            self._connections.put(conn)
+
+    # --- Queries ---
+    def fetchall_sync(self, sql: str, params: Sequence[Any] = ()) -> List[Dict[str, Any]]:
+        """ Runs a read query on the calling thread. Rows are returned as plain dicts. """
+        conn = self._acquire()
+        try:
+            self.queries += 1
+            return [dict(row) for row in conn.execute(sql, params).fetchall()]
+        except sqlite3.Error:
+            self.errors += 1
+            raise
+        finally:
+            self._release(conn)
+
+    def fetchone_sync(self, sql: str, params: Sequence[Any] = ()) -> Optional[Dict[str, Any]]:
+        rows = self.fetchall_sync(sql, params)
+        return rows[0] if rows else None
+
+    async def fetchall(self, sql: str, params: Sequence[Any] = ()) -> List[Dict[str, Any]]:
+        """ Runs a read query on the pool's thread pool. """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, self.fetchall_sync, sql, tuple(params))
+
+    async def fetchone(self, sql: str, params: Sequence[Any] = ()) -> Optional[Dict[str, Any]]:
+        rows = await self.fetchall(sql, params)
+        return rows[0] if rows else None
+
+    async def run(self, fn: Callable[..., Any], *args: Any) -> Any:
+        """ Runs a blocking function that issues several `*_sync` queries, as one job on the pool's thread pool. """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, fn, *args)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "db_path": self.db_path,
+            "size": self.size,
+            "open_connections": self._opened,
+            "idle_connections": self._connections.qsize(),
+            "queries": self.queries,
+            "errors": self.errors,
+        }
+
+    def close(self) -> None:
+        with self._lock:
+            self._closed = True
+        self._executor.shutdown(wait=True)
+        while True:
+            try:
+                self._connections.get_nowait().close()
+            except queue.Empty:
+                break
+        self._opened = 0
+
+
+# --- Shared pools, one per database file ---
+_pools: Dict[str, SQLitePool] = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(db_path: str, **kwargs: Any) -> SQLitePool:
+    """ Returns the process-wide pool for `db_path`, creating it on first use. """
+    key = os.path.abspath(db_path)
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None or pool._closed:
+            pool = SQLitePool(key, **kwargs)
+            _pools[key] = pool
+        return pool
+
+
+def close_all_pools() -> None:
+    with _pools_lock:
+        pools = list(_pools.values())
+        _pools.clear()
+    for pool in pools:
+        pool.close()
+
+
+def pool_stats() -> List[Dict[str, Any]]:
+    with _pools_lock:
+        return [pool.stats() for pool in _pools.values()]
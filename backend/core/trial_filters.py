@@ -0,0 +1,62 @@
+"""
+Trial status / phase filters shared by request-path retrieval and batch pre-screening.
+
+Statuses are compared case-insensitively against DEFAULT_OPEN_STATUSES (or a
+caller-supplied set); phases are parsed from free text ("Phase I/II") into
+integers so "phase 2" in a query matches a "Phase II" trial.
+"""
+
+import re
+from typing import Any, Dict, Iterable, Optional, Set
+
+DEFAULT_OPEN_STATUSES = ("recruiting", "not yet recruiting", "active", "enrolling by invitation")
+
+# --- Phase parsing ---
+_PHASE_TOKENS = {"0": 0, "1": 1, "i": 1, "1a": 1, "1b": 1, "ib": 1, "2": 2, "ii": 2, "2a": 2, "2b": 2, "iia": 2, "iib": 2,
+                 "3": 3, "iii": 3, "3a": 3, "3b": 3, "4": 4, "iv": 4}
+_PHASE_RE = re.compile(r"phase\s*([0-4iv]+[ab]?(?:\s*(?:/|,|and|-)\s*(?:phase\s*)?[0-4iv]+[ab]?)*)", re.IGNORECASE)
+
+
+def parse_phases(text: Optional[str]) -> Set[int]:
+    """ "Phase I/II" -> {1, 2}; "No phase specified" -> set(). """
+    phases: Set[int] = set()
+    for match in _PHASE_RE.finditer(text or ""):
+        for token in re.split(r"\s*(?:/|,|and|-)\s*(?:phase\s*)?", match.group(1).lower()):
+            if token in _PHASE_TOKENS:
+                phases.add(_PHASE_TOKENS[token])
+    return phases
+
+
+# --- Search filters (status / phase) ---
+def filters_from_entities(entities: Optional[Dict[str, Any]] = None,
+                          open_statuses: Iterable[str] = DEFAULT_OPEN_STATUSES) -> Dict[str, Any]:
+    """
+    Builds {"statuses": set, "phases": set|None} from orchestrator entities. Only open statuses are
+    ever allowed; a specific open status ("not yet recruiting") narrows the set further.
+    """
+    entities = entities or {}
+    statuses = {s.lower() for s in open_statuses}
+    requested_status = str(entities.get("recruitment_status") or "").strip().lower()
+    if requested_status in statuses:
+        statuses = {requested_status}
+
+    phases = None
+    requested_phase = entities.get("trial_phase")
+    if requested_phase not in (None, ""):
+        text = str(requested_phase)
+        phases = parse_phases(text if "phase" in text.lower() else f"phase {text}") or None
+    return {"statuses": statuses, "phases": phases}
+
+
+def search_filters(statuses: Optional[Iterable[str]] = DEFAULT_OPEN_STATUSES,
+                   phases: Optional[Iterable[int]] = None) -> Dict[str, Any]:
+    """ Filters for callers that choose statuses/phases directly (batch pre-screening); None disables either one. """
+    return {"statuses": {s.lower() for s in statuses} if statuses is not None else None,
+            "phases": set(phases) if phases is not None else None}
+
+
+def trial_matches_filters(trial: Dict[str, Any], filters: Dict[str, Any]) -> bool:
+    status = (trial.get("status") or "").strip().lower()
+    if filters["statuses"] is not None and status not in filters["statuses"]:
+        return False
+    return filters["phases"] is None or bool(parse_phases(trial.get("phase")) & filters["phases"])
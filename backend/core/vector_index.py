@@ -0,0 +1,421 @@
+"""
+In-process ANN index built from the same embeddings as the Chroma collections.
+
+`chromadb.PersistentClient` has a noticeable cold start and per-query overhead
+that dominate the small-k searches the trial agent runs. `LocalVectorIndex` is
+an exported copy of a collection kept next to the app:
+
+- `embeddings.npy`  float32, L2-normalized, opened memory-mapped
+- `id_map.json`     row -> chunk/trial id and metadata (the ID map)
+- `documents.json`  row -> document text
+- `index.faiss` / `index.hnsw`  optional ANN graph over the rows
+- `meta.json`       format version, dimension, count, ANN backend, source,
+                    and the ingestion fingerprint it was exported at
+
+The ANN graph uses FAISS (HNSW, read with IO_FLAG_MMAP) or hnswlib if either
+is installed; otherwise searches are exact inner products over the mapped
+matrix, which is fast enough for the trial corpus. Filtered searches
+(`where={"nct_id": {"$in": [...]}}`) score the allowed rows exactly when they
+are a small part of the index, and otherwise over-fetch from the ANN graph and
+post-filter.
+
+The class implements the subset of the Chroma collection API the agent uses
+(`query`, `get`, `count`) with Chroma's result shapes and cosine distances, so
+`open_vector_collection(backend, name)` can hand either one to the agent,
+CriterionRetriever or the scripts.
+
+The export is a snapshot. `load_trials_local.py` records a per-sink content
+hash for every trial it embeds (`vector_hash` / `criteria_hash`), so an export
+stores a fingerprint of that column. Opening an index whose fingerprint no
+longer matches trials.db logs a warning and marks it `stale`, and the loader
+re-exports any existing local index that ingestion made stale.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import shutil
+import sqlite3
+import time
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+
+from backend.core.criteria_index import DEFAULT_TRIALS_DB_PATH, read_trial_rows
+
+try:
+    import faiss
+except ImportError:
+    faiss = None
+
+try:
+    import hnswlib
+except ImportError:
+    hnswlib = None
+
+VECTOR_BACKEND_CHROMA = "chroma"
+VECTOR_BACKEND_LOCAL = "local"
+DEFAULT_VECTOR_BACKEND = os.getenv("TRIAL_VECTOR_BACKEND", VECTOR_BACKEND_CHROMA)
+DEFAULT_CHROMA_PATH = "./chroma_db"
+DEFAULT_INDEX_DIR = os.getenv("LOCAL_VECTOR_INDEX_DIR", "backend/db/vector_index")
+INDEX_FORMAT_VERSION = 1
+
+ANN_FAISS = "faiss"
+ANN_HNSWLIB = "hnswlib"
+ANN_EXACT = "exact"
+HNSW_M = 32
+HNSW_EF_CONSTRUCTION = 200
+HNSW_EF_SEARCH = 128
+EXACT_FILTER_FRACTION = 0.25   # Filtered searches over <= this share of rows are scored exactly
+ANN_OVERFETCH = 4              # ANN candidates per requested result when post-filtering
+EXPORT_PAGE_SIZE = 1000
+# clinical_trials column holding the content hash last written to each collection (see load_trials_local.py)
+SOURCE_HASH_COLUMNS = {"clinical_trials_eligibility": "vector_hash", "clinical_trials_criteria": "criteria_hash"}
+
+
+def _normalize(matrix: np.ndarray) -> np.ndarray:
+    matrix = np.asarray(matrix, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+def available_ann_backend() -> str:
+    if faiss is not None:
+        return ANN_FAISS
+    if hnswlib is not None:
+        return ANN_HNSWLIB
+    return ANN_EXACT
+
+
+class LocalVectorIndex:
+    """ Memory-mapped embedding matrix + ID map with a Chroma-compatible query/get/count subset. """
+
+    def __init__(self, embeddings: np.ndarray, ids: List[str], metadatas: List[Dict[str, Any]],
+                 documents: Optional[List[str]], meta: Dict[str, Any], ann: Any = None):
+        self.embeddings = embeddings
+        self.ids = ids
+        self.metadatas = metadatas
+        self.documents = documents
+        self.meta = meta
+        self.ann = ann
+        self.ann_backend = meta.get("ann_backend", ANN_EXACT) if ann is not None else ANN_EXACT
+        self.name = meta.get("name")
+        self.stale = False  # Set by open_vector_collection when trials.db moved on since the export
+        # Per-field value -> rows, built lazily for the metadata keys used in `where`
+        self._field_rows: Dict[str, Dict[Any, np.ndarray]] = {}
+
+    # --- Build / persist ---
+    @classmethod
+    def build(cls, ids: Sequence[str], embeddings: Any, metadatas: Optional[Sequence[Dict[str, Any]]] = None,
+              documents: Optional[Sequence[str]] = None, name: Optional[str] = None,
+              ann_backend: Optional[str] = None) -> "LocalVectorIndex":
+        matrix = _normalize(embeddings)
+        if matrix.ndim != 2 or len(matrix) != len(ids):
+            raise ValueError(f"Expected {len(ids)} embeddings, got shape {matrix.shape}")
+        ann_backend = ann_backend or available_ann_backend()
+        meta = {
+            "format_version": INDEX_FORMAT_VERSION,
+            "name": name,
+            "count": len(ids),
+            "dim": int(matrix.shape[1]) if matrix.size else 0,
+            "ann_backend": ann_backend,
+            "space": "cosine",
+            "built_at": time.time(),
+        }
+        index = cls(matrix, list(ids), [dict(m or {}) for m in (metadatas or [{}] * len(ids))],
+                    list(documents) if documents is not None else None, meta)
+        if len(ids) and ann_backend != ANN_EXACT:
+            index.ann = index._build_ann(ann_backend)
+            index.ann_backend = ann_backend
+        return index
+
+    def _build_ann(self, backend: str) -> Any:
+        dim = self.meta["dim"]
+        if backend == ANN_FAISS:
+            ann = faiss.IndexHNSWFlat(dim, HNSW_M, faiss.METRIC_INNER_PRODUCT)
+            ann.hnsw.efConstruction = HNSW_EF_CONSTRUCTION
+            ann.add(np.ascontiguousarray(self.embeddings))
+            return ann
+        if backend == ANN_HNSWLIB:
+            ann = hnswlib.Index(space="ip", dim=dim)
+            ann.init_index(max_elements=len(self.ids), ef_construction=HNSW_EF_CONSTRUCTION, M=HNSW_M)
+            ann.add_items(np.asarray(self.embeddings), np.arange(len(self.ids)))
+            ann.set_ef(HNSW_EF_SEARCH)
+            return ann
+        raise ValueError(f"Unknown ANN backend '{backend}'")
+
+    @classmethod
+    def build_from_collection(cls, collection: Any, page_size: int = EXPORT_PAGE_SIZE,
+                              ann_backend: Optional[str] = None) -> "LocalVectorIndex":
+        """ Exports a Chroma collection (ids, embeddings, metadatas, documents) page by page. """
+        ids, embeddings, metadatas, documents = [], [], [], []
+        offset = 0
+        while True:
+            page = collection.get(limit=page_size, offset=offset, include=["embeddings", "metadatas", "documents"])
+            page_ids = page.get("ids") or []
+            if not page_ids:
+                break
+            ids.extend(page_ids)
+            embeddings.extend(page["embeddings"])
+            metadatas.extend(page.get("metadatas") or [{}] * len(page_ids))
+            documents.extend(page.get("documents") or [""] * len(page_ids))
+            offset += len(page_ids)
+        dim = len(embeddings[0]) if embeddings else 0
+        matrix = np.asarray(embeddings, dtype=np.float32).reshape(len(ids), dim)
+        return cls.build(ids, matrix, metadatas, documents, name=getattr(collection, "name", None),
+                         ann_backend=ann_backend)
+
+    def save(self, out_dir: str) -> None:
+        """ Writes the matrix, ID map, documents and ANN graph; swaps the directory in atomically. """
+        tmp_dir = f"{out_dir}.tmp"
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        os.makedirs(tmp_dir)
+        np.save(os.path.join(tmp_dir, "embeddings.npy"), np.ascontiguousarray(self.embeddings, dtype=np.float32))
+        with open(os.path.join(tmp_dir, "id_map.json"), "w") as f:
+            json.dump({"ids": self.ids, "metadatas": self.metadatas}, f)
+        if self.documents is not None:
+            with open(os.path.join(tmp_dir, "documents.json"), "w") as f:
+                json.dump(self.documents, f)
+        if self.ann is not None and self.ann_backend == ANN_FAISS:
+            faiss.write_index(self.ann, os.path.join(tmp_dir, "index.faiss"))
+        elif self.ann is not None and self.ann_backend == ANN_HNSWLIB:
+            self.ann.save_index(os.path.join(tmp_dir, "index.hnsw"))
+        with open(os.path.join(tmp_dir, "meta.json"), "w") as f:
+            json.dump(dict(self.meta, ann_backend=self.ann_backend), f)
+        old_dir = f"{out_dir}.old"
+        shutil.rmtree(old_dir, ignore_errors=True)
+        if os.path.exists(out_dir):
+            os.rename(out_dir, old_dir)
+        os.rename(tmp_dir, out_dir)
+        shutil.rmtree(old_dir, ignore_errors=True)
+
+    @classmethod
+    def open(cls, path: str, mmap: bool = True) -> "LocalVectorIndex":
+        """ Opens a saved index; the matrix (and a FAISS graph) are memory-mapped unless mmap=False. """
+        with open(os.path.join(path, "meta.json")) as f:
+            meta = json.load(f)
+        if meta.get("format_version") != INDEX_FORMAT_VERSION:
+            raise ValueError(f"Unsupported vector index format {meta.get('format_version')} at {path}")
+        embeddings = np.load(os.path.join(path, "embeddings.npy"), mmap_mode="r" if mmap else None)
+        with open(os.path.join(path, "id_map.json")) as f:
+            id_map = json.load(f)
+        documents = None
+        documents_path = os.path.join(path, "documents.json")
+        if os.path.exists(documents_path):
+            with open(documents_path) as f:
+                documents = json.load(f)
+
+        ann = None
+        backend = meta.get("ann_backend")
+        faiss_path, hnsw_path = os.path.join(path, "index.faiss"), os.path.join(path, "index.hnsw")
+        if backend == ANN_FAISS and faiss is not None and os.path.exists(faiss_path):
+            ann = faiss.read_index(faiss_path, faiss.IO_FLAG_MMAP if mmap else 0)
+            ann.hnsw.efSearch = HNSW_EF_SEARCH
+        elif backend == ANN_HNSWLIB and hnswlib is not None and os.path.exists(hnsw_path):
+            ann = hnswlib.Index(space="ip", dim=meta["dim"])
+            ann.load_index(hnsw_path, max_elements=meta["count"])
+            ann.set_ef(HNSW_EF_SEARCH)
+        elif backend not in (None, ANN_EXACT):
+            logging.warning(f"[LocalVectorIndex] {backend} graph unavailable at {path}; using exact search.")
+        return cls(embeddings, id_map["ids"], id_map["metadatas"], documents, meta, ann)
+
+    # --- Chroma-compatible API ---
+    def count(self) -> int:
+        return len(self.ids)
+
+    def get(self, ids: Optional[Sequence[str]] = None, where: Optional[Dict[str, Any]] = None,
+            limit: Optional[int] = None, offset: int = 0, include: Sequence[str] = ("metadatas", "documents")) -> Dict[str, Any]:
+        rows = self._filter_rows(where)
+        if rows is None:
+            rows = np.arange(len(self.ids))
+        if ids is not None:
+            wanted = set(ids)
+            rows = np.array([r for r in rows if self.ids[r] in wanted], dtype=np.int64)
+        rows = rows[offset:offset + limit if limit is not None else None]
+        result = {"ids": [self.ids[r] for r in rows]}
+        result.update(self._include(rows, include))
+        return result
+
+    def query(self, query_embeddings: Sequence[Sequence[float]], n_results: int = 10,
+              where: Optional[Dict[str, Any]] = None,
+              include: Sequence[str] = ("metadatas", "documents", "distances"), exact: bool = False) -> Dict[str, Any]:
+        """
+        Nearest rows per query embedding; distances are cosine distances (1 - similarity), as in Chroma.
+        exact=True skips the ANN graph (ground truth for recall measurements).
+        """
+        queries = _normalize(np.atleast_2d(np.asarray(query_embeddings, dtype=np.float32)))
+        allowed = self._filter_rows(where)
+        result: Dict[str, List[Any]] = {"ids": []}
+        for key in include:
+            result[key] = []
+        for vector in queries:
+            rows, sims = self._exact(vector, min(n_results, self._n_rows(allowed)), allowed) if exact \
+                else self._search(vector, n_results, allowed)
+            result["ids"].append([self.ids[r] for r in rows])
+            for key, values in self._include(rows, include).items():
+                result[key].append(values)
+            if "distances" in include:
+                result["distances"].append([float(1.0 - s) for s in sims])
+        return result
+
+    # --- Search ---
+    def _n_rows(self, allowed: Optional[np.ndarray]) -> int:
+        return len(self.ids) if allowed is None else len(allowed)
+
+    def _search(self, vector: np.ndarray, k: int, allowed: Optional[np.ndarray]):
+        k = min(k, self._n_rows(allowed))
+        if self.ann is None or (allowed is not None and len(allowed) <= EXACT_FILTER_FRACTION * len(self.ids)):
+            return self._exact(vector, k, allowed)
+        fetch = k if allowed is None else min(len(self.ids), k * ANN_OVERFETCH)
+        rows, sims = self._ann_search(vector, fetch)
+        if allowed is not None:
+            keep = np.isin(rows, allowed)
+            rows, sims = rows[keep], sims[keep]
+            if len(rows) < k:
+                # Filter too selective for the over-fetch: fall back to exact scoring
+                return self._exact(vector, k, allowed)
+        return rows[:k], sims[:k]
+
+    def _exact(self, vector: np.ndarray, k: int, allowed: Optional[np.ndarray]):
+        if k <= 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        matrix = self.embeddings if allowed is None else self.embeddings[allowed]
+        sims = matrix @ vector
+        top = np.argpartition(-sims, k - 1)[:k] if k < len(sims) else np.arange(len(sims))
+        top = top[np.argsort(-sims[top], kind="stable")]
+        rows = top if allowed is None else allowed[top]
+        return rows.astype(np.int64), sims[top]
+
+    def _ann_search(self, vector: np.ndarray, k: int):
+        if self.ann_backend == ANN_FAISS:
+            sims, rows = self.ann.search(vector.reshape(1, -1), k)
+            rows, sims = rows[0], sims[0]
+            valid = rows >= 0
+            return rows[valid].astype(np.int64), sims[valid]
+        labels, distances = self.ann.knn_query(vector.reshape(1, -1), k=k)
+        # hnswlib "ip" distance is 1 - inner product
+        return labels[0].astype(np.int64), 1.0 - distances[0]
+
+    # --- Metadata filters ---
+    def _rows_for(self, field: str, values: Sequence[Any]) -> np.ndarray:
+        lookup = self._field_rows.get(field)
+        if lookup is None:
+            grouped: Dict[Any, List[int]] = {}
+            for row, meta in enumerate(self.metadatas):
+                grouped.setdefault(meta.get(field), []).append(row)
+            lookup = {value: np.asarray(rows, dtype=np.int64) for value, rows in grouped.items()}
+            self._field_rows[field] = lookup
+        parts = [lookup[v] for v in set(values) if v in lookup]
+        return np.unique(np.concatenate(parts)) if parts else np.empty(0, dtype=np.int64)
+
+    def _filter_rows(self, where: Optional[Dict[str, Any]]) -> Optional[np.ndarray]:
+        """ Sorted allowed rows for a Chroma-style `where` ($eq/$in/$and), or None for no filter. """
+        if not where:
+            return None
+        rows = None
+        for field, condition in where.items():
+            if field == "$and":
+                matched = None
+                for clause in condition:
+                    clause_rows = self._filter_rows(clause)
+                    if clause_rows is not None:
+                        matched = clause_rows if matched is None else np.intersect1d(matched, clause_rows)
+            elif isinstance(condition, dict):
+                if "$in" in condition:
+                    matched = self._rows_for(field, condition["$in"])
+                elif "$eq" in condition:
+                    matched = self._rows_for(field, [condition["$eq"]])
+                else:
+                    raise ValueError(f"Unsupported where operator in {condition}")
+            else:
+                matched = self._rows_for(field, [condition])
+            if matched is not None:
+                rows = matched if rows is None else np.intersect1d(rows, matched)
+        return rows
+
+    def _include(self, rows: Sequence[int], include: Sequence[str]) -> Dict[str, List[Any]]:
+        result: Dict[str, List[Any]] = {}
+        if "metadatas" in include:
+            result["metadatas"] = [self.metadatas[r] for r in rows]
+        if "documents" in include:
+            result["documents"] = [self.documents[r] if self.documents is not None else None for r in rows]
+        if "embeddings" in include:
+            result["embeddings"] = [np.asarray(self.embeddings[r]).tolist() for r in rows]
+        return result
+
+    def stats(self) -> Dict[str, Any]:
+        return {"name": self.name, "count": self.count(), "dim": self.meta.get("dim"), "ann_backend": self.ann_backend,
+                "stale": self.stale}
+
+
+# --- Backend switch ---
+def local_index_path(collection_name: str, index_dir: str = DEFAULT_INDEX_DIR) -> str:
+    return os.path.join(index_dir, collection_name)
+
+
+def ingestion_fingerprint(collection_name: str, trials_db_path: str = DEFAULT_TRIALS_DB_PATH) -> Optional[str]:
+    """ Hash of the per-trial hashes ingestion last wrote to `collection_name`; None if it cannot be read. """
+    column = SOURCE_HASH_COLUMNS.get(collection_name)
+    if column is None or not os.path.exists(trials_db_path):
+        return None
+    try:
+        rows = read_trial_rows(trials_db_path, f"SELECT source_url, {column} FROM clinical_trials "
+                                               f"WHERE {column} IS NOT NULL ORDER BY source_url")
+    except sqlite3.Error:
+        return None  # Loaded before per-sink hashes existed
+    digest = hashlib.sha256()
+    for source_url, value in rows:
+        digest.update(f"{source_url}\t{value}\n".encode("utf-8"))
+    return digest.hexdigest()
+
+
+def local_index_is_stale(collection_name: str, index_dir: str = DEFAULT_INDEX_DIR,
+                         trials_db_path: str = DEFAULT_TRIALS_DB_PATH) -> bool:
+    """ True when an existing export no longer matches what ingestion has written since. """
+    try:
+        with open(os.path.join(local_index_path(collection_name, index_dir), "meta.json")) as f:
+            exported = json.load(f).get("source_fingerprint")
+    except (OSError, ValueError):
+        return False  # Nothing exported
+    current = ingestion_fingerprint(collection_name, trials_db_path)
+    return current is not None and exported != current
+
+
+def open_vector_collection(collection_name: str, backend: str = DEFAULT_VECTOR_BACKEND,
+                           chroma_path: str = DEFAULT_CHROMA_PATH, index_dir: str = DEFAULT_INDEX_DIR,
+                           trials_db_path: str = DEFAULT_TRIALS_DB_PATH) -> Optional[Any]:
+    """
+    Returns a queryable collection for `collection_name` from the chosen backend
+    ("chroma" or "local"), or None when it does not exist there.
+    """
+    if backend == VECTOR_BACKEND_LOCAL:
+        path = local_index_path(collection_name, index_dir)
+        if not os.path.exists(os.path.join(path, "meta.json")):
+            return None
+        index = LocalVectorIndex.open(path)
+        if local_index_is_stale(collection_name, index_dir, trials_db_path):
+            index.stale = True
+            logging.warning(f"[LocalVectorIndex] '{collection_name}' at {path} is older than the last ingestion; "
+                            f"re-export it (load_trials_local.py or build_vector_index.py build).")
+        return index
+    if backend == VECTOR_BACKEND_CHROMA:
+        import chromadb
+        client = chromadb.PersistentClient(path=chroma_path)
+        if collection_name not in [c.name for c in client.list_collections()]:
+            return None
+        return client.get_collection(name=collection_name)
+    raise ValueError(f"Unknown vector backend '{backend}'")
+
+
+def export_collection(collection: Any, collection_name: str, index_dir: str = DEFAULT_INDEX_DIR,
+                      ann_backend: Optional[str] = None, trials_db_path: str = DEFAULT_TRIALS_DB_PATH) -> LocalVectorIndex:
+    """ Builds and saves the local index for a Chroma collection, stamped with the current ingestion fingerprint. """
+    fingerprint = ingestion_fingerprint(collection_name, trials_db_path)  # Before reading: a concurrent load only makes it look stale
+    index = LocalVectorIndex.build_from_collection(collection, ann_backend=ann_backend)
+    index.meta["name"] = index.name = collection_name
+    index.meta["source_fingerprint"] = fingerprint
+    index.save(local_index_path(collection_name, index_dir))
+    logging.info(f"[LocalVectorIndex] Exported '{collection_name}': {index.stats()}")
+    return index
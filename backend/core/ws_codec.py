@@ -0,0 +1,141 @@
+"""
+WebSocket message encodings, negotiated per socket at `auth` time.
+
+- "json": text frames (the default, and what every existing client speaks).
+- "json+zstd": text frames, except payloads of at least ZSTD_MIN_BYTES are
+  sent as binary frames holding the zstd-compressed JSON.
+- "msgpack": binary msgpack frames.
+- "msgpack+zstd": binary msgpack frames, zstd-compressed from ZSTD_MIN_BYTES.
+
+Compressed frames start with the zstd magic number, so a client tells them
+apart from plain ones without extra framing. msgpack (`ormsgpack`, else
+`msgpack`) and `zstandard` are optional; encodings whose library is missing
+are simply not offered. Small frames are still covered by the transport's
+permessage-deflate when the client negotiates it.
+
+`EncodedMessage` serializes a payload at most once per encoding, so a room
+broadcast costs one encode per distinct encoding in the room, not per socket.
+"""
+
+import json
+import os
+from typing import Any, Dict, Iterable, List, Optional, Union
+
+try:
+    import ormsgpack as _msgpack
+    # Coerce non-str keys the way json.dumps does instead of rejecting them
+    _PACK_KWARGS = {"option": _msgpack.OPT_NON_STR_KEYS}
+except ImportError:
+    try:
+        import msgpack as _msgpack
+        _PACK_KWARGS = {}
+    except ImportError:
+        _msgpack = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+ZSTD_MIN_BYTES = int(os.getenv("WS_ZSTD_MIN_BYTES", "4096"))
+ZSTD_LEVEL = int(os.getenv("WS_ZSTD_LEVEL", "3"))
+MAX_INBOUND_BYTES = 16 * 1024 * 1024
+ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+DEFAULT_ENCODING = "json"
+
+Frame = Union[str, bytes]
+
+_compressor = zstandard.ZstdCompressor(level=ZSTD_LEVEL) if zstandard else None
+_decompressor = zstandard.ZstdDecompressor() if zstandard else None
+
+
+def available_encodings() -> List[str]:
+    """ Encodings this server can speak, most compact first. """
+    encodings = []
+    if _msgpack is not None:
+        encodings += ["msgpack+zstd", "msgpack"] if zstandard else ["msgpack"]
+    if zstandard is not None:
+        encodings.append("json+zstd")
+    encodings.append("json")
+    return encodings
+
+
+def negotiate(requested: Optional[Union[str, Iterable[str]]]) -> str:
+    """ Picks the first encoding the client asked for that we support (client order wins); JSON otherwise. """
+    if not requested:
+        return DEFAULT_ENCODING
+    if isinstance(requested, str):
+        requested = [requested]
+    supported = set(available_encodings())
+    for encoding in requested:
+        if isinstance(encoding, str) and encoding.lower() in supported:
+            return encoding.lower()
+    return DEFAULT_ENCODING
+
+
+def _maybe_compress(data: bytes) -> Optional[bytes]:
+    if len(data) < ZSTD_MIN_BYTES:
+        return None
+    compressed = _compressor.compress(data)
+    return compressed if len(compressed) < len(data) else None
+
+
+def encode(data: Any, encoding: str = DEFAULT_ENCODING, json_text: Optional[str] = None) -> Frame:
+    """ Serializes `data` for one encoding. Raises TypeError/ValueError if it can't be serialized. """
+    if encoding.startswith("msgpack"):
+        packed = _msgpack.packb(data, **_PACK_KWARGS)
+        if encoding.endswith("+zstd"):
+            return _maybe_compress(packed) or packed
+        return packed
+    text = json_text if json_text is not None else json.dumps(data)
+    if encoding == "json+zstd":
+        compressed = _maybe_compress(text.encode("utf-8"))
+        if compressed is not None:
+            return compressed
+    return text
+
+
+def decode(frame: Frame, encoding: str = DEFAULT_ENCODING) -> Any:
+    """ Parses an inbound frame: text is always JSON, binary is (optionally zstd-compressed) msgpack or JSON. """
+    if isinstance(frame, str):
+        return json.loads(frame)
+    if frame[:4] == ZSTD_MAGIC:
+        if _decompressor is None:
+            raise ValueError("Received a zstd frame but zstandard is not installed")
+        frame = _decompressor.decompress(frame, max_output_size=MAX_INBOUND_BYTES)
+    if encoding.startswith("msgpack"):
+        return _msgpack.unpackb(frame)
+    return json.loads(frame)
+
+
+class EncodedMessage:
+    """ One outbound payload, serialized lazily and at most once per encoding. """
+
+    def __init__(self, data: Any = None, json_text: Optional[str] = None):
+        self._data = data
+        self._has_data = json_text is None
+        self._frames: Dict[str, Frame] = {}
+        self._json_text = json_text
+
+    @property
+    def json_text(self) -> str:
+        """ Canonical JSON form (also what the backplane carries between workers). """
+        if self._json_text is None:
+            self._json_text = json.dumps(self._data)
+        return self._json_text
+
+    @property
+    def data(self) -> Any:
+        if not self._has_data:
+            self._data, self._has_data = json.loads(self._json_text), True
+        return self._data
+
+    def frame(self, encoding: str = DEFAULT_ENCODING) -> Frame:
+        frame = self._frames.get(encoding)
+        if frame is None:
+            if encoding.startswith("msgpack"):
+                frame = encode(self.data, encoding)
+            else:
+                frame = encode(None, encoding, json_text=self.json_text)
+            self._frames[encoding] = frame
+        return frame
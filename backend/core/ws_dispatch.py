@@ -0,0 +1,148 @@
+"""
+Per-socket task offloading for the WebSocket endpoint.
+
+The receive loop only parses and dispatches. Slow handlers (LLM prompts,
+agent commands, consult preparation, trial search) run as tasks in the
+socket's `SocketTaskGroup`, so `auth`, `join` and chat keep flowing while
+they are in flight. The group caps in-flight tasks per socket
+(WS_MAX_INFLIGHT): past the cap a request is rejected with a `busy` error
+instead of queuing without bound, and every task is cancelled when the
+socket disconnects.
+
+Every request carries a correlation ID (the client's `correlationId`, or one
+generated here), and `WebSocketSession.reply` stamps it on the response so
+clients can pipeline several commands and match results as they arrive.
+"""
+
+import asyncio
+import logging
+import os
+import uuid
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from fastapi import WebSocket
+
+from backend.core.connection_manager import ConnectionManager, manager as default_manager
+from backend.core.ws_codec import DEFAULT_ENCODING
+
+MAX_INFLIGHT_PER_SOCKET = int(os.getenv("WS_MAX_INFLIGHT", "4"))
+
+
+def new_correlation_id() -> str:
+    return uuid.uuid4().hex[:12]
+
+
+def with_correlation(payload: Dict[str, Any], correlation_id: Optional[str]) -> Dict[str, Any]:
+    """ Copy of `payload` tagged with `correlationId` (unchanged when there is none). """
+    if correlation_id is None:
+        return payload
+    return {**payload, "correlationId": correlation_id}
+
+
+class SocketTaskGroup:
+    """ In-flight handler tasks of one socket, keyed by correlation ID. """
+
+    def __init__(self, max_inflight: int = MAX_INFLIGHT_PER_SOCKET,
+                 on_error: Optional[Callable[[str, str, Exception], Awaitable[None]]] = None):
+        self.max_inflight = max_inflight
+        self.on_error = on_error
+        self.tasks: Dict[str, asyncio.Task] = {}
+        self.completed = 0
+        self.rejected = 0
+        self.cancelled = 0
+
+    def spawn(self, name: str, correlation_id: str, handler: Callable[..., Awaitable[Any]], *args: Any) -> Optional[str]:
+        """ Starts `handler(*args)` as a task. Returns None if accepted, otherwise why it was rejected. """
+        if correlation_id in self.tasks:
+            self.rejected += 1
+            return "duplicate"
+        if len(self.tasks) >= self.max_inflight:
+            self.rejected += 1
+            return "busy"
+        task = asyncio.create_task(self._run(name, correlation_id, handler, *args), name=f"ws-{name}-{correlation_id}")
+        self.tasks[correlation_id] = task
+        task.add_done_callback(lambda done, cid=correlation_id: self._discard(cid, done))
+        return None
+
+    def _discard(self, correlation_id: str, task: asyncio.Task) -> None:
+        # A cancelled task's ID may already belong to a newer request
+        if self.tasks.get(correlation_id) is task:
+            del self.tasks[correlation_id]
+
+    async def _run(self, name: str, correlation_id: str, handler: Callable[..., Awaitable[Any]], *args: Any) -> None:
+        try:
+            await handler(*args)
+            self.completed += 1
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logging.error(f"[WebSocket] '{name}' ({correlation_id}) failed: {e}", exc_info=True)
+            if self.on_error is not None:
+                await self.on_error(name, correlation_id, e)
+
+    def cancel(self, correlation_id: str) -> bool:
+        """ Cancels one in-flight task; its slot is freed immediately. """
+        task = self.tasks.pop(correlation_id, None)
+        if task is None or task.done():
+            return False
+        task.cancel()
+        self.cancelled += 1
+        return True
+
+    def cancel_all(self) -> int:
+        """ Cancels every in-flight task (on disconnect). Returns how many were cancelled. """
+        return sum(self.cancel(correlation_id) for correlation_id in list(self.tasks))
+
+    async def wait(self, timeout: Optional[float] = None) -> None:
+        """ Waits for the in-flight tasks to finish (tests, graceful shutdown). """
+        if self.tasks:
+            await asyncio.wait(list(self.tasks.values()), timeout=timeout)
+        await asyncio.sleep(0)  # Let done-callbacks and cancellations settle
+
+    def stats(self) -> Dict[str, int]:
+        return {"inflight": len(self.tasks), "completed": self.completed,
+                "rejected": self.rejected, "cancelled": self.cancelled}
+
+
+class WebSocketSession:
+    """ State of one WebSocket connection shared by the dispatcher and its handler tasks. """
+
+    def __init__(self, websocket: WebSocket, connection_manager: Optional[ConnectionManager] = None,
+                 max_inflight: int = MAX_INFLIGHT_PER_SOCKET):
+        self.websocket = websocket
+        self.manager = connection_manager or default_manager
+        self.user_id: Optional[str] = None
+        self.current_room: Optional[str] = None # Track the room this socket has joined
+        self.encoding = DEFAULT_ENCODING # Wire encoding, negotiated at auth
+        self.tasks = SocketTaskGroup(max_inflight, on_error=self._report_error)
+
+    @property
+    def label(self) -> str:
+        client = getattr(self.websocket, "client", None)
+        return self.user_id or (f"{client.host}:{client.port}" if client else "unknown")
+
+    async def reply(self, payload: Dict[str, Any], correlation_id: Optional[str] = None) -> bool:
+        """ Queues `payload` (tagged with the request's correlation ID) for this socket. """
+        return await self.manager.send_personal_message(with_correlation(payload, correlation_id), self.websocket)
+
+    async def broadcast(self, room_id: str, payload: Dict[str, Any], correlation_id: Optional[str] = None,
+                        exclude_self: bool = False) -> Tuple[int, Optional[int]]:
+        return await self.manager.broadcast_to_room(room_id, with_correlation(payload, correlation_id),
+                                                    exclude_sender=self.websocket if exclude_self else None)
+
+    def spawn(self, name: str, correlation_id: str, handler: Callable[..., Awaitable[Any]], *args: Any) -> Optional[str]:
+        return self.tasks.spawn(name, correlation_id, handler, *args)
+
+    async def reject(self, name: str, correlation_id: str, reason: str) -> None:
+        if reason == "busy":
+            message = f"Too many requests in flight (max {self.tasks.max_inflight}); retry when one completes."
+        else:
+            message = f"A request with correlationId '{correlation_id}' is already in flight."
+        await self.reply({"type": "error", "code": reason, "requestType": name, "message": message}, correlation_id)
+
+    async def _report_error(self, name: str, correlation_id: str, error: Exception) -> None:
+        await self.reply({"type": "error", "requestType": name, "message": f"Error processing {name}: {error}"}, correlation_id)
+
+    def close(self) -> int:
+        """ Cancels in-flight handler tasks; the socket itself is cleaned up by the manager. """
+        return self.tasks.cancel_all()
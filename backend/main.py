@@ -1,11 +1,12 @@
 from fastapi import FastAPI, HTTPException, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel, Field # Import BaseModel and Field
 import json
 import os
 from dotenv import load_dotenv # Import load_dotenv
 import asyncio # Import asyncio if not already present
-from typing import Optional, List, Dict, Any # <-- Import Optional, List, Dict, Any for type hinting
+from typing import Optional, List, Dict, Any, Literal # <-- Import Optional, List, Dict, Any for type hinting
 import re # <-- Import regex module
 import sys # <-- Import sys
 import time
@@ -15,6 +16,7 @@ import argparse
 from datetime import datetime
 import logging
 import sqlite3 # <--- Import sqlite3
+from contextlib import asynccontextmanager
 
 # --- Explicitly add project root to sys.path --- 
 # This helps resolve module imports when running with uvicorn from the project root
@@ -31,10 +33,18 @@ if PROJECT_ROOT not in sys.path:
 load_dotenv()
 
 # Import the orchestrator, blockchain utility, and connection manager
-from backend.core.orchestrator import AgentOrchestrator
+from backend.core.orchestrator import AgentOrchestrator, CLINICAL_TRIAL_FINDER, ELIGIBILITY_DEEP_DIVE
+from backend.core.agent_registry import agent_registry
 from backend.core.blockchain_utils import record_contribution
 from backend.core.connection_manager import manager
+from backend.core import ws_codec
+from backend.core.ws_dispatch import WebSocketSession, new_correlation_id
+from backend.core.room_history import parse_cursor
 from backend.core.llm_utils import get_llm_text_response
+from backend.core.llm_gateway import llm_gateway
+from backend.core.sqlite_pool import close_all_pools, get_pool
+from backend.core.patient_repository import CLINICAL_SECTIONS, patient_repository
+from backend.core.reranker import POLICY_TOP_K, POLICY_UNTIL_ELIGIBLE
 
 # Import specific agents needed for slash commands
 from backend.agents.comparative_therapy_agent import ComparativeTherapyAgent
@@ -49,13 +59,33 @@ from backend.research.router import router as research_router
 # If SQLITE_DB_PATH is in .env, it should be loaded via load_dotenv()
 # Otherwise, define it explicitly here or import from a config file
 TRIALS_DB_PATH = os.getenv('SQLITE_DB_PATH', './backend/data/clinical_trials.db') # Existing path for trials
-PATIENT_MUTATIONS_DB_PATH = os.path.join(PROJECT_ROOT, 'backend', 'data', 'patient_data.db')
+TRIAL_BY_ID_SQL = "SELECT * FROM clinical_trials WHERE nct_id = ?"
 # --- End DB Path Definition ---
 
-app = FastAPI()
-
-# Instantiate the orchestrator
-orchestrator = AgentOrchestrator()
+# --- Shared Agents ---
+# Agents holding heavy resources (embedding model, Chroma client, LLM clients) are
+# created once per worker and reused by every endpoint and the orchestrator.
+agent_registry.register(CLINICAL_TRIAL_FINDER, ClinicalTrialAgent)
+agent_registry.register(ELIGIBILITY_DEEP_DIVE, EligibilityDeepDiveAgent)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """ Seeds the patient repository and warms shared agents before serving, releases them on shutdown. """
+    await asyncio.to_thread(patient_repository.seed_from_file, MOCK_DATA_PATH)
+    await agent_registry.startup()
+    await manager.start_backplane() # No-op unless WS_BACKPLANE_URL is set (multi-worker fan-out)
+    yield
+    await manager.stop_backplane()
+    await manager.history.flush() # Room history lines still queued for the writer task
+    await agent_registry.shutdown()
+    patient_repository.close()
+    close_all_pools()
+
+app = FastAPI(lifespan=lifespan)
+
+# Instantiate the orchestrator (shares registry agents instead of building its own; they
+# are created by the lifespan startup, not here)
+orchestrator = AgentOrchestrator(registry=agent_registry)
 
 # Configure CORS
 origins = [
@@ -72,124 +102,8 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Load mock data from a JSON file (or define it directly)
-MOCK_DATA_PATH = 'mock_patient_data.json'
-
-# Define the mock data directly in the script first
-# In a real app, load from file or database
-mock_patient_data_dict = {
-  "PAT12345": {
-    "patientId": "PAT12345",
-    "demographics": {
-      "name": "Jane Doe",
-      "dob": "1965-03-15",
-      "sex": "Female",
-      "contact": "555-123-4567",
-      "address": "123 Main St, Anytown, USA"
-    },
-    "diagnosis": {
-      "primary": "Stage III Invasive Ductal Carcinoma (Breast)",
-      "diagnosedDate": "2023-01-20",
-      "status": "Active Treatment"
-    },
-    "medicalHistory": [
-      "Hypertension (controlled)",
-      "Type 2 Diabetes (well-managed)",
-      "Appendectomy (1995)"
-    ],
-    "currentMedications": [
-      { "name": "Lisinopril", "dosage": "10mg", "frequency": "Daily" },
-      { "name": "Metformin", "dosage": "500mg", "frequency": "Twice Daily" },
-      { "name": "Letrozole", "dosage": "2.5mg", "frequency": "Daily" }
-    ],
-    "allergies": [
-      "Penicillin (Rash)",
-      "Shellfish (Anaphylaxis)"
-    ],
-    "recentLabs": [
-      {
-        "panelName": "Complete Blood Count (CBC)",
-        "orderDate": "2024-07-25",
-        "resultDate": "2024-07-25",
-        "status": "Final",
-        "components": [
-          { "test": "WBC", "value": 6.5, "unit": "K/uL", "refRange": "4.0-11.0", "flag": "Normal" },
-          { "test": "RBC", "value": 4.2, "unit": "M/uL", "refRange": "4.0-5.5", "flag": "Normal" },
-          { "test": "Hgb", "value": 12.1, "unit": "g/dL", "refRange": "12.0-16.0", "flag": "Normal" },
-          { "test": "Plt", "value": 250, "unit": "K/uL", "refRange": "150-400", "flag": "Normal" }
-        ],
-        "interpretation": "Within normal limits."
-      },
-      {
-        "panelName": "Comprehensive Metabolic Panel (CMP)",
-        "orderDate": "2024-07-25",
-        "resultDate": "2024-07-25",
-        "status": "Final",
-        "components": [
-          { "test": "Glucose", "value": 110, "unit": "mg/dL", "refRange": "70-100", "flag": "High" },
-          { "test": "Creatinine", "value": 0.9, "unit": "mg/dL", "refRange": "0.6-1.2", "flag": "Normal" },
-          { "test": "ALT", "value": 25, "unit": "U/L", "refRange": "10-40", "flag": "Normal" }
-        ],
-        "interpretation": "Glucose elevated, consistent with history of T2DM. Monitor."
-      },
-      {
-        "panelName": "Tumor Marker CA 27-29",
-        "orderDate": "2024-07-15",
-        "resultDate": "2024-07-16",
-        "status": "Final",
-        "components": [
-          { "test": "CA 27-29", "value": 35, "unit": "U/mL", "refRange": "< 38", "flag": "Normal" }
-        ],
-        "interpretation": "Baseline within normal range."
-      }
-    ],
-    "imagingStudies": [
-       {
-         "studyId": "IMG78901",
-         "type": "Mammogram",
-         "modality": "MG",
-         "date": "2024-07-10",
-         "status": "Final Report",
-         "reportText": "Findings: Suspicious clustered microcalcifications in the right breast upper outer quadrant, approximately 1.5 cm lesion. Impression: Highly suspicious for malignancy (BI-RADS 5). Recommendation: Ultrasound-guided core biopsy.",
-         "imageAccess": {
-           "pacsSystem": "MainPACS",
-           "accessionNumber": "A12345678",
-           "studyInstanceUID": "1.2.840.113619.2.55.3.28311..."
-         }
-       },
-       {
-         "studyId": "IMG78902",
-         "type": "CT Chest/Abdomen/Pelvis w/ Contrast",
-         "modality": "CT",
-         "date": "2024-07-20",
-         "status": "Final Report",
-         "reportText": "Findings: No evidence of thoracic, abdominal, or pelvic metastatic disease. Stable postsurgical changes from prior appendectomy. Impression: No definite metastatic disease.",
-         "imageAccess": {
-           "pacsSystem": "MainPACS",
-           "accessionNumber": "A12345679",
-           "studyInstanceUID": "1.2.840.113619.2.55.3.28312..."
-         }
-       }
-    ],
-    "patientGeneratedHealthData": {
-        "source": "Apple HealthKit / Fitbit API",
-        "lastSync": "2024-07-30T08:00:00Z",
-        "summary": {
-          "averageStepsLast7Days": 4500,
-          "averageRestingHeartRateLast7Days": 68,
-          "averageSleepHoursLast7Days": 6.5,
-          "significantEvents": [
-            { "date": "2024-07-29", "type": "ActivityAlert", "detail": "Steps significantly below baseline (2000 vs 5000 avg)" },
-            { "date": "2024-07-28", "type": "SleepAlert", "detail": "Reported poor sleep quality via linked app" }
-          ]
-        }
-    },
-    "notes": [
-      { "noteId": "NOTE001", "date": "2024-07-28", "provider": "Dr. Adams (Oncology)", "type": "Progress Note", "text": "Patient reviewed treatment plan (AC-T chemotherapy). Tolerating initial cycle well with minor nausea managed by Zofran. Discussed importance of hydration and monitoring for fever. Reviewed recent labs and imaging - CT negative for mets, awaiting biopsy results from mammogram finding. Patient reports stable energy levels, step count slightly down per wearable data (discussed potential fatigue). Scheduled follow-up post-cycle 2." },
-      { "noteId": "NOTE002", "date": "2024-07-20", "provider": "Dr. Baker (PCP)", "type": "Follow-up Note", "text": "Routine follow-up. BP and A1c stable. Reviewed oncology plan. Reinforced supportive care measures." }
-    ]
-  }
-}
+# Seed records for the patient repository (loaded into patient_data.db at startup)
+MOCK_DATA_PATH = os.path.join(PROJECT_ROOT, 'backend', 'data', 'mock_patient_data.json')
 
 # --- Placeholder Authentication --- 
 # In a real app, this would involve JWT decoding, session checking, etc.
@@ -210,42 +124,17 @@ async def authenticate_websocket_token(token: str) -> Optional[str]:
 # Define the endpoint to get patient data
 @app.get("/api/patients/{patient_id}")
 async def get_patient_data(patient_id: str):
-    # In a real app, you'd query a database based on patient_id
-    # For MVP, just return the mock data if the ID matches
-    patient_info = mock_patient_data_dict.get(patient_id)
+    # Full record including mutations; sections are served from the repository's cache when warm
+    try:
+        patient_info = await patient_repository.get(patient_id)
+    except sqlite3.Error as e:
+        print(f"Database error when fetching patient {patient_id}: {e}")
+        raise HTTPException(status_code=500, detail="Database error fetching patient data")
     if not patient_info:
         raise HTTPException(status_code=404, detail="Patient not found")
+    print(f"Fetched {len(patient_info.get('mutations') or [])} mutations for patient {patient_id}")
 
-    # --- Fetch mutations from patient_data.db ---
-    mutations = []
-    conn = None
-    try:
-        print(f"Connecting to mutations DB at: {PATIENT_MUTATIONS_DB_PATH}")
-        if not os.path.exists(PATIENT_MUTATIONS_DB_PATH):
-            print(f"Warning: Mutations database not found at {PATIENT_MUTATIONS_DB_PATH}. Patient will have no mutations.")
-        else:
-            conn = sqlite3.connect(PATIENT_MUTATIONS_DB_PATH)
-            conn.row_factory = sqlite3.Row # To access columns by name
-            cursor = conn.cursor()
-            cursor.execute("SELECT * FROM mutations WHERE patient_id = ?", (patient_id,))
-            rows = cursor.fetchall()
-            mutations = [dict(row) for row in rows] # Convert rows to list of dicts
-            print(f"Fetched {len(mutations)} mutations for patient {patient_id}")
-            
-    except sqlite3.Error as e:
-        print(f"Database error when fetching mutations for patient {patient_id}: {e}")
-        # Optionally, raise an HTTPException or return patient_info without mutations
-    except Exception as e:
-        print(f"Unexpected error when fetching mutations for patient {patient_id}: {e}")
-    finally:
-        if conn:
-            conn.close()
-
-    # Add mutations to the patient_info
-    patient_info_with_mutations = patient_info.copy()
-    patient_info_with_mutations["mutations"] = mutations
-    
-    return {"success": True, "data": patient_info_with_mutations}
+    return {"success": True, "data": patient_info}
 
 # --- New Prompt Endpoint using Orchestrator ---
 class PromptRequest(BaseModel):
@@ -255,7 +144,7 @@ class PromptRequest(BaseModel):
 async def handle_prompt_request(patient_id: str, request: PromptRequest):
     """ Receives a user prompt and routes it through the orchestrator. """
     # 1. Get patient data
-    patient_data = mock_patient_data_dict.get(patient_id)
+    patient_data = await patient_repository.get(patient_id, sections=CLINICAL_SECTIONS)
     if not patient_data:
         raise HTTPException(status_code=404, detail="Patient not found for prompt processing")
 
@@ -325,31 +214,28 @@ async def _gather_included_data(patient_id: str, include_options: Dict[str, bool
     """
     print(f"[Data Gathering] Starting for {patient_id} with options: {include_options}")
     related_info = {}
-    patient_data = mock_patient_data_dict.get(patient_id)
-    if not patient_data:
-        print(f"[Data Gathering] Patient {patient_id} not found.")
-        return related_info
-
-    # Map include_options keys to mock_patient_data keys and desired format
+    # Map include_options keys to patient record sections and desired format
     data_map = {
         "includeLabs": ("recentLabs", "Recent Labs"),
         "includeMeds": ("currentMedications", "Current Medications"),
         "includeHistory": ("medicalHistory", "Medical History"),
-        "includeNotes": ("notes", "Recent Notes"), # Maybe limit notes? e.g., [:2]
+        "includeNotes": ("notes", "Recent Notes"),
         "includeDiagnosis": ("diagnosis", "Diagnosis"),
         # Add more mappings as needed (e.g., imaging)
     }
+    # Fetch only the sections that were ticked
+    requested_sections = [data_key for option_key, (data_key, _) in data_map.items() if include_options.get(option_key, False)]
+    patient_data = await patient_repository.get(patient_id, sections=requested_sections, limits={"notes": 2})
+    if not patient_data:
+        print(f"[Data Gathering] Patient {patient_id} not found.")
+        return related_info
 
     for option_key, (data_key, display_key) in data_map.items():
         if include_options.get(option_key, False): # Check if the option is True
             data_section = patient_data.get(data_key)
             if data_section:
-                # Simple implementation: Add the whole section. 
-                # Could refine later (e.g., only recent notes/labs)
-                if data_key == "notes":
-                     related_info[display_key] = data_section[:2] # Limit notes
-                else:
-                    related_info[display_key] = data_section
+                # Notes are already limited to the two most recent by the projection
+                related_info[display_key] = data_section
                 print(f"[Data Gathering] Included '{display_key}'")
             else:
                  print(f"[Data Gathering] Section '{display_key}' requested but not found/empty.")
@@ -360,7 +246,8 @@ async def _gather_included_data(patient_id: str, include_options: Dict[str, bool
 async def _generate_consult_focus(patient_id: str, topic: str, related_info: Dict[str, Any], initiator_note: Optional[str]) -> str:
     """Generates the AI focus statement using LLM based on topic, included data, and note."""
     print(f"[Focus Generation] Starting for {patient_id} based on topic: '{topic[:50]}...'")
-    patient_name = mock_patient_data_dict.get(patient_id, {}).get('demographics', {}).get('name', 'the patient')
+    patient_record = await patient_repository.get(patient_id, sections=("demographics",)) or {}
+    patient_name = (patient_record.get('demographics') or {}).get('name', 'the patient')
     
     prompt = f"Patient: {patient_name} ({patient_id})\n"
     prompt += f"Consultation Topic/Reason: {topic}\n"
@@ -418,10 +305,10 @@ async def handle_message_for_agent(message_data: dict, websocket: WebSocket, use
     if message_type == "agent_action" and message_data.get("action") == "summarize":
         agent_name = "data_analyzer"
         try:
-            agent = orchestrator.agents.get(agent_name)
+            agent = orchestrator.get_agent(agent_name)
             if agent:
                 # Prepare context and kwargs for DataAnalysisAgent
-                patient_data = mock_patient_data_dict.get(patient_id, {})
+                patient_data = await patient_repository.get(patient_id, sections=CLINICAL_SECTIONS) or {}
                 context = {"patient_data": patient_data}
                 # Extract relevant parts for the prompt if needed, or pass the whole message
                 prompt = message_data.get("payload", {}).get("prompt", "Summarize the patient record.")
@@ -463,7 +350,7 @@ async def handle_message_for_agent(message_data: dict, websocket: WebSocket, use
             # Split focus criteria into a list
             focus_criteria = [c.strip() for c in focus_criteria_text.split(',')]
             
-            agent = orchestrator.agents.get(agent_name)
+            agent = orchestrator.get_agent(agent_name)
             if agent:
                 result_text = await agent.run(
                     patient_id=patient_id, 
@@ -537,21 +424,486 @@ async def handle_message_for_agent(message_data: dict, websocket: WebSocket, use
         return None # Not an agent message or command
 
 # --- WebSocket Endpoint ---
+# --- Streaming Trial Search Helpers ---
+def _format_sse(event: Dict[str, Any]) -> str:
+    """ Formats one agent stream event as a Server-Sent Events frame. """
+    return f"event: {event.get('event', 'message')}\ndata: {json.dumps(event, default=str)}\n\n"
+
+async def _stream_trial_search_to_socket(session: WebSocketSession, query: str, patient_context: Dict[str, Any], search_id: Optional[str], correlation_id: Optional[str] = None):
+    """ Pushes streaming trial-search events to a single socket as they are produced. """
+    agent = agent_registry.get(CLINICAL_TRIAL_FINDER)
+    if agent is None:
+        await session.reply({"type": "trial_search_error", "searchId": search_id, "summary": "Clinical trial agent is not available."}, correlation_id)
+        return
+    stream = agent.run_streaming(context={"patient_data": patient_context}, prompt=query)
+    try:
+        async for event in stream:
+            payload = {"type": f"trial_search_{event.get('event')}", "searchId": search_id}
+            payload.update({k: v for k, v in event.items() if k != "event"})
+            # Round-trip through json so sqlite values / datetimes serialize the same way as the SSE endpoint
+            if not await session.reply(json.loads(json.dumps(payload, default=str)), correlation_id):
+                print(f"Socket {session.label} is gone; stopping trial search {search_id}")
+                break
+    except Exception as e:
+        logging.error(f"Error streaming trial search over WebSocket: {e}", exc_info=True)
+        await session.reply({"type": "trial_search_error", "searchId": search_id, "summary": str(e)}, correlation_id)
+    finally:
+        await stream.aclose() # Cancels assessments still in flight (also on task cancellation at disconnect)
+# --- End Streaming Trial Search Helpers ---
+
+# --- WebSocket Message Handlers ---
+# Slow handlers run as per-socket tasks (see core/ws_dispatch.py) so the receive loop stays responsive.
+# Each gets the session, the message, its correlation ID and the room the socket was in when it arrived.
+
+async def _ws_handle_prompt(session: WebSocketSession, data: Dict[str, Any], correlation_id: str, room: Optional[str]):
+    if not room:
+        await session.reply({"type": "error", "message": "Cannot process prompt: Not in a room."}, correlation_id)
+        return
+
+    prompt_text = data.get("prompt")
+    # Assuming room ID often corresponds to patient ID for general prompts
+    patient_id_for_prompt = room
+    patient_data = await patient_repository.get(patient_id_for_prompt, sections=CLINICAL_SECTIONS)
+
+    if not patient_data:
+        await session.reply({"type": "error", "message": f"Patient data not found for ID: {patient_id_for_prompt}"}, correlation_id)
+        return
+    if not prompt_text:
+        await session.reply({"type": "error", "message": "Prompt cannot be empty."}, correlation_id)
+        return
+
+    try:
+        print(f"Processing prompt '{prompt_text[:50]}...' for patient {patient_id_for_prompt} in room {room}")
+        result = await orchestrator.handle_prompt(
+            prompt=prompt_text,
+            patient_id=patient_id_for_prompt,
+            patient_data=patient_data
+        )
+        await session.reply({"type": "prompt_result", "result": result}, correlation_id)
+    except Exception as e:
+        print(f"Error processing prompt via WebSocket: {e}")
+        await session.reply({"type": "error", "message": f"Error processing prompt: {e}"}, correlation_id)
+
+async def _ws_handle_initiate_consult(session: WebSocketSession, data: Dict[str, Any], correlation_id: str, room: Optional[str]):
+    # --- Updated Initiate Consult Logic --- 
+    target_user_id = data.get("targetUserId")
+    patient_id = data.get("patientId")
+    initiator_info = data.get("initiator")
+    room_id = data.get("roomId")
+    context_data = data.get("context")
+
+    if not all([target_user_id, patient_id, initiator_info, room_id, context_data]):
+        print("Initiate consult failed: Missing parameters")
+        await session.reply({"type": "initiate_fail", "roomId": room_id, "error": "Missing required parameters"}, correlation_id)
+        return
+    
+    # Extract data based on the revised payload structure
+    initial_trigger = context_data.get("initialTrigger") # Contains { description: "..." }
+    include_options = context_data.get("includeOptions", {}) # Dict of bools
+    use_ai = context_data.get("useAI", False) 
+    initiator_note = context_data.get("initiatorNote")
+    topic_description = initial_trigger.get("description", "General Consultation")
+
+    print(f"Initiating consult from {initiator_info['id']} to {target_user_id} for patient {patient_id} in room {room_id}.")
+    print(f"Topic: '{topic_description[:50]}...', Include Options: {include_options}, AI Assist: {use_ai}")
+    if initiator_note: print(f"Initiator Note: {initiator_note[:50]}...")
+
+    # --- Prepare context to send to target user --- 
+    related_info = None
+    focus_statement = None
+    
+    try:
+        # 1. Gather included data based on checkboxes (always happens)
+        related_info = await _gather_included_data(patient_id, include_options)
+    except Exception as gather_ex:
+         print(f"Error during data gathering: {gather_ex}")
+         related_info = {"error": f"Could not gather context data: {gather_ex}"}
+
+    if use_ai:
+        try:
+            # 2. Generate focus statement using LLM (only if useAI is true)
+            focus_statement = await _generate_consult_focus(patient_id, topic_description, related_info or {}, initiator_note)
+        except Exception as focus_ex:
+            print(f"Error during AI focus generation: {focus_ex}")
+            focus_statement = f"AI Error: Could not generate focus ({focus_ex})"
+
+    # Construct the final context payload for the recipient
+    context_to_send = {
+        "initialTrigger": initial_trigger, # Keep the original trigger/topic info
+        "initiatorNote": initiator_note,
+        "useAI": use_ai, # Let recipient know if AI was involved
+        "relatedInfo": related_info, # The data gathered based on checkboxes
+        "consultFocusStatement": focus_statement if use_ai else None # Only include if AI was used
+    }
+
+    # --- Send to the target user's socket(s) on any worker --- 
+    message_to_target = {
+        "type": "consult_request",
+        "roomId": room_id,
+        "patientId": patient_id,
+        "initiator": initiator_info,
+        "context": context_to_send # Send the processed context
+    }
+    sent_count = await session.manager.send_to_user(target_user_id, message_to_target)
+    if sent_count > 0:
+        print(f"Successfully sent consult request for room {room_id} to {sent_count} socket(s) for user {target_user_id}")
+        await session.reply({"type": "initiate_ok", "roomId": room_id}, correlation_id)
+    else:
+        print(f"Target user {target_user_id} not found or not connected.")
+        await session.reply({"type": "initiate_fail", "roomId": room_id, "error": "Colleague is not currently connected"}, correlation_id)
+
+# === Handle Agent Commands Sent Via Text (Slash Commands) ===
+async def _ws_handle_agent_command_text(session: WebSocketSession, data: Dict[str, Any], correlation_id: str, room: Optional[str]):
+    room_id = data.get("roomId")
+    message_text = data.get("text", "").strip() # The raw command text
+    sender_info = data.get("sender")
+    patient_id_for_command = data.get("patientId") # Expect patientId for context
+
+    if not all([room_id, message_text, sender_info, patient_id_for_command]):
+        await session.reply({"type": "error", "message": "Missing fields for agent command text"}, correlation_id)
+        return # Skip processing
+
+    # Parse the command
+    agent_name = None
+    result_text = None
+    agent_response_type = "agent_output" # Default response type
+
+    try:
+        if message_text.startswith("/compare-therapy"):
+            try:
+                print(f"Processing /compare-therapy command: {message_text}")
+                
+                # First check the format of the message to understand what we're parsing
+                print(f"Raw command text: {message_text}")
+                
+                # Extract parameters without using argparse
+                # Example: /compare-therapy current="X" vs="Y" focus="Z"
+                command_pattern = r'/compare-therapy\s+current="([^"]*)"\s+vs="([^"]*)"\s+focus="([^"]*)"'
+                match = re.search(command_pattern, message_text)
+                
+                if not match:
+                    raise ValueError("Command format incorrect. Use: /compare-therapy current=\"therapy1\" vs=\"therapy2\" focus=\"criteria1,criteria2\"")
+                
+                current_therapy = match.group(1)
+                comparison_therapy = match.group(2)
+                focus_criteria_text = match.group(3)
+                
+                print(f"Parsed manually: current={current_therapy}, vs={comparison_therapy}, focus={focus_criteria_text}")
+                
+                # Split focus criteria into a list
+                focus_criteria = [c.strip() for c in focus_criteria_text.split(',')]
+                
+                # Import again at this scope to be sure
+                try:
+                    from backend.agents.comparative_therapy_agent import ComparativeTherapyAgent
+                    agent_name = "ComparativeTherapyAgent"
+                    agent = ComparativeTherapyAgent()
+                    print(f"Instantiated {agent_name}")
+                    
+                    result = await agent.run(
+                        patient_id=patient_id_for_command,
+                        therapy_a=current_therapy,
+                        therapy_b=comparison_therapy,
+                        focus_criteria=focus_criteria,
+                        context={"id": patient_id_for_command}
+                    )
+                    print(f"Agent run complete, result: {type(result)}")
+                    
+                    # Handle both string and dict return types
+                    if isinstance(result, dict):
+                        result_text = result.get("comparison_summary", str(result))
+                    else:
+                        # Assume it's a string if not a dict
+                        result_text = str(result)
+                except ImportError as imp_err:
+                    print(f"ImportError when loading ComparativeTherapyAgent: {imp_err}")
+                    raise
+                except Exception as agent_err:
+                    print(f"Error running ComparativeTherapyAgent: {agent_err}")
+                    raise
+                    
+            except Exception as ex:
+                print(f"Error in /compare-therapy command block: {ex}")
+                result_text = f"Error processing /compare-therapy command: {ex}"
+                agent_name = "System"
+                agent_response_type = "error"
+
+        elif message_text.startswith("/draft-patient-info"):
+            try:
+                print(f"Processing /draft-patient-info command: {message_text}")
+                
+                # First check the format of the message to understand what we're parsing
+                print(f"Raw command text: {message_text}")
+                
+                # Extract topic without using argparse
+                # Example: /draft-patient-info topic="Managing nausea from chemotherapy"
+                command_pattern = r'/draft-patient-info\s+topic="([^"]*)"'
+                match = re.search(command_pattern, message_text)
+                
+                if not match:
+                    raise ValueError("Command format incorrect. Use: /draft-patient-info topic=\"Your topic here\"")
+                
+                topic = match.group(1)
+                print(f"Parsed manually: topic={topic}")
+                
+                # Import again at this scope to be sure
+                try:
+                    from backend.agents.patient_education_draft_agent import PatientEducationDraftAgent
+                    agent_name = "PatientEducationDraftAgent"
+                    agent = PatientEducationDraftAgent()
+                    print(f"Instantiated {agent_name}")
+                    
+                    result = await agent.run(
+                        topic=topic,
+                        context={"id": patient_id_for_command} # Minimal context
+                    )
+                    print(f"Agent run complete, result: {type(result)}")
+                    
+                    # Handle both string and dict return types
+                    if isinstance(result, dict):
+                        result_text = result.get("draft_content", str(result))
+                    else:
+                        # Assume it's a string if not a dict
+                        result_text = str(result)
+                    agent_response_type = "agent_output" # <- USE GENERIC SUCCESS TYPE
+                except ImportError as imp_err:
+                    print(f"ImportError when loading PatientEducationDraftAgent: {imp_err}")
+                    raise
+                except Exception as agent_err:
+                    print(f"Error running PatientEducationDraftAgent: {agent_err}")
+                    raise
+                    
+            except Exception as ex:
+                print(f"Error in /draft-patient-info command block: {ex}")
+                result_text = f"Error processing /draft-patient-info command: {ex}"
+                agent_name = "System"
+                agent_response_type = "error"
+
+        else:
+             # Command not recognized
+            result_text = f"Unknown command: {message_text.split()[0]}"
+            agent_name = "System"
+            agent_response_type = "error" # Send as error type
+
+    except (argparse.ArgumentError, Exception) as e:
+        print(f"Error parsing or running agent command '{message_text}': {e}")
+        result_text = f"Error processing command: {e}"
+        agent_name = "System"
+        agent_response_type = "error"
+
+    # Prepare response if command was processed (even if it was an error message)
+    if agent_name and result_text is not None:
+        timestamp = asyncio.get_event_loop().time()
+        
+        # Check if it was an error or a successful agent output
+        if agent_response_type == "error":
+            response_data = {
+                "type": "error",
+                "roomId": room_id,
+                "agentName": agent_name, # Could be "System"
+                "sender": sender_info,
+                "timestamp": timestamp,
+                "message": result_text # Error message content
+            }
+        else: # Assume it's a successful "agent_output"
+            response_data = {
+                "type": "agent_output", # USE GENERIC SUCCESS TYPE
+                "roomId": room_id,
+                "agentName": agent_name, # Actual agent name
+                "sender": sender_info, 
+                "timestamp": timestamp,
+                "content": result_text # Agent result content
+            }
+
+        # Broadcast the agent's result or error
+        print(f"Broadcasting agent ({agent_name}) message (type: {response_data['type']}) to room {room_id}")
+        await session.broadcast(room_id, response_data, correlation_id)
+    else:
+        # This case handles parsing/execution errors where we only send back a personal message
+        await session.reply({
+            "type": "error", 
+            "message": result_text or "Failed to process command.", 
+            "timestamp": asyncio.get_event_loop().time()
+        }, correlation_id)
+
+async def _ws_handle_agent_command(session: WebSocketSession, data: Dict[str, Any], correlation_id: str, room: Optional[str]):
+    room_id = data.get("roomId")
+    command = data.get("command")
+    command_context = data.get("context", {}) # Optional extra context
+    sender_info = data.get("sender")
+    patient_id_for_command = data.get("patientId") # Expect patientId for context
+
+    if not all([room_id, command, sender_info, patient_id_for_command]):
+        await session.reply({"type": "error", "message": "Missing fields for agent command"}, correlation_id)
+        return
+        
+    print(f"Processing agent command '{command}' in room {room_id} from {sender_info['id']} for patient {patient_id_for_command}")
+    
+    # Send an acknowledgement back to the sender that the command is being processed
+    await session.reply({
+        "type": "system_message",
+        "roomId": room_id,
+        "content": f"Processing command: {command}..."
+    }, correlation_id)
+    
+    agent_result = None
+    error_message = None
+    
+    try:
+        patient_data = await patient_repository.get(patient_id_for_command, sections=CLINICAL_SECTIONS)
+        if not patient_data:
+            raise ValueError(f"Patient data not found for ID: {patient_id_for_command}")
+
+        # --- Route command to appropriate AI logic --- 
+        if command == "summarize":
+            # Use orchestrator for summarization intent
+            result = await orchestrator.handle_prompt(
+                prompt="Generate a clinical summary", # Standardized prompt
+                patient_id=patient_id_for_command,
+                patient_data=patient_data
+            )
+            # Extract relevant part of the result
+            agent_result = result.get('output', {}).get('summary_text')
+            if not agent_result: agent_result = result.get('summary', 'Summary could not be generated.')
+            
+        elif command == "check_interactions":
+            # Construct a direct LLM prompt
+            med_list = "\n".join([f"- {med['name']} {med['dosage']}" for med in patient_data.get('currentMedications', [])])
+            allergy_list = "\n".join([f"- {allergy['substance']}" for allergy in patient_data.get('allergies', [])])
+            prompt = (
+                f"Patient: {patient_data['demographics']['name']}\n"
+                f"Current Medications:\n{med_list or '- None'}\n"
+                f"Known Allergies:\n{allergy_list or '- None'}\n\n"
+                f"Please check for potential drug-drug interactions, drug-allergy interactions, "
+                f"and any significant contraindications based ONLY on the provided medication and allergy lists. "
+                f"Focus on clinically significant interactions. Format as a concise list."
+            )
+            agent_result = await get_llm_text_response(prompt)
+        
+        # --- NEW: Handle Suggested Questions --- 
+        elif command in ["ask_glucose_trend", "ask_letrozole_effect", "ask_management_recommendations"]:
+            question_text = data.get("params", {}).get("question")
+            if not question_text:
+                 raise ValueError("Missing 'question' parameter for ask command")
+            
+            # --- Generate Simulated Responses --- 
+            if command == "ask_glucose_trend":
+                # Simulate finding the most recent glucose and add mock trend/A1c
+                glucose_val = "N/A"
+                glucose_date = "N/A"
+                cmp = next((lab for lab in patient_data.get('recentLabs', []) if lab['panelName'] == 'Comprehensive Metabolic Panel (CMP)'), None)
+                if cmp:
+                    glucose_comp = next((c for c in cmp.get('components',[]) if c['test'] == 'Glucose'), None)
+                    if glucose_comp:
+                        glucose_val = f"{glucose_comp['value']} {glucose_comp['unit']}"
+                        glucose_date = cmp.get('resultDate', 'N/A')
+                
+                agent_result = (
+                    f"Most Recent Glucose ({glucose_date}): {glucose_val}.\n"
+                    f"Simulated Recent Trend: 105 mg/dL (7/18), 112 mg/dL (7/10), 98 mg/dL (7/1).\n"
+                    f"Simulated Last HbA1c (6/15): 6.8%."
+                )
+
+            elif command == "ask_letrozole_effect":
+                agent_result = (
+                    "Letrozole (an aromatase inhibitor) can occasionally be associated with hyperglycemia or worsening glycemic control, although it's less common than with some other cancer therapies. "
+                    "No major pharmacokinetic interaction between Letrozole and Metformin is typically expected. "
+                    "Consider if the timing of glucose changes aligns with Letrozole initiation or dosage adjustments. Monitoring is key."
+                )
+            
+            elif command == "ask_management_recommendations":
+                 agent_result = (
+                    "Recommendations for managing glucose ~110 mg/dL in T2DM patient on active cancer treatment:\n"
+                    "1. Assess Trend & A1c: Confirm if this is isolated or a pattern (Use 'Glucose Trend & A1c?' question).\n"
+                    "2. Reinforce Lifestyle: Emphasize diet consistency and physical activity as tolerated.\n"
+                    "3. Medication Review: Ensure Metformin adherence and correct dosage. Consider Letrozole contribution (Use 'Letrozole/Glucose Impact?' question).\n"
+                    "4. Monitoring: Advise regular self-monitoring of blood glucose (SMBG) if feasible.\n"
+                    "5. Follow-up: Schedule repeat fasting glucose or A1c based on trend and overall clinical picture."
+                )
+            else: 
+                # Fallback for safety, though this condition shouldn't be hit given the outer elif
+                agent_result = "Simulated response for this question is not configured."
+            # --- End Simulated Responses --- 
+
+        elif command == "review_side_effects":
+             # Use orchestrator for side effects intent
+            result = await orchestrator.handle_prompt(
+                prompt="What are the potential side effects and management tips?", # Example prompt
+                patient_id=patient_id_for_command,
+                patient_data=patient_data
+            )
+            # Format the result more nicely
+            output = result.get('output', {})
+            side_effects = "\n".join([f"- {se}" for se in output.get('potential_side_effects', [])])
+            management = "\n".join([f"- {tip['symptom']}: {tip['tip']}" for tip in output.get('management_tips', [])])
+            agent_result = f"Potential Side Effects:\n{side_effects or '- None identified'}\n\nManagement Tips:\n{management or '- None provided'}"
+            if not agent_result: agent_result = result.get('summary', 'Could not retrieve side effect info.')
+
+        else:
+            error_message = f"Unknown agent command: {command}"
+            
+    except Exception as e:
+        print(f"Error processing agent command '{command}': {e}")
+        error_message = f"Error during '{command}': {e}"
+        
+    # --- Broadcast result or error to the room --- 
+    if error_message:
+        response_payload = {
+            "type": "system_message",
+            "roomId": room_id,
+            "content": error_message,
+            "isError": True
+        }
+    else:
+        response_payload = {
+            "type": "agent_output", # USE GENERIC SUCCESS TYPE
+            "roomId": room_id,
+            "command": command,
+            "result": agent_result or "No result generated.", # Ensure result is not None
+            "senderIsAgent": True # Flag for UI styling
+        }
+        
+    print(f"Broadcasting agent result/error for command '{command}' in room {room_id}")
+    await session.broadcast(room_id, response_payload, correlation_id)
+
+async def _ws_handle_search_trials(session: WebSocketSession, data: Dict[str, Any], correlation_id: str, room: Optional[str]):
+    query = data.get("query")
+    if not query:
+        await session.reply({"type": "error", "message": "Query cannot be empty."}, correlation_id)
+        return
+    patient_context = data.get("patientContext") or (
+        await patient_repository.get(room, sections=CLINICAL_SECTIONS) if room else None
+    ) or {}
+    print(f"Streaming trial search '{query[:50]}' for {session.user_id}")
+    await _stream_trial_search_to_socket(session, query, patient_context, data.get("searchId"), correlation_id)
+
+# Message types offloaded to per-socket tasks; everything else is handled inline by the dispatcher
+WS_TASK_HANDLERS = {
+    "prompt": _ws_handle_prompt,
+    "initiate_consult": _ws_handle_initiate_consult,
+    "agent_command_text": _ws_handle_agent_command_text,
+    "agent_command": _ws_handle_agent_command,
+    "search_trials": _ws_handle_search_trials,
+}
+# --- End WebSocket Message Handlers ---
+
 @app.websocket("/ws")
 async def websocket_endpoint(websocket: WebSocket):
     client_host = websocket.client.host
     client_port = websocket.client.port
     print(f"WebSocket connection attempt from: {client_host}:{client_port}")
     await manager.connect(websocket)
-    authenticated_user_id = None
-    current_room = None # Track the room this socket has joined
+    session = WebSocketSession(websocket, manager)
 
     try:
         while True:
-            data_text = await websocket.receive_text()
-            data = json.loads(data_text)
+            frame = await websocket.receive()
+            if frame["type"] == "websocket.disconnect":
+                raise WebSocketDisconnect(frame.get("code", 1000))
+            data = ws_codec.decode(frame["text"] if frame.get("text") is not None else frame["bytes"], session.encoding)
             message_type = data.get("type")
-            print(f"Received WS message type: {message_type} from {authenticated_user_id or f'{client_host}:{client_port}'}")
+            correlation_id = str(data.get("correlationId") or new_correlation_id())
+            print(f"Received WS message type: {message_type} ({correlation_id}) from {session.label}")
 
             if message_type == "auth":
                 token = data.get("token")
@@ -560,9 +912,18 @@ async def websocket_endpoint(websocket: WebSocket):
                 # --- End Logging ---
                 user_id = await authenticate_websocket_token(token)
                 if user_id:
-                    authenticated_user_id = user_id
+                    session.user_id = user_id
                     await manager.associate_user(user_id, websocket)
-                    await manager.send_personal_message({"type": "auth_success", "message": f"Authenticated as {user_id}"}, websocket)
+                    # Client lists the encodings it can read ("encodings": [...] in preference order); auth_success itself is JSON
+                    session.encoding = ws_codec.negotiate(data.get("encodings") or data.get("encoding"))
+                    await session.reply({
+                        "type": "auth_success",
+                        "message": f"Authenticated as {user_id}",
+                        "encoding": session.encoding,
+                        "zstdMinBytes": ws_codec.ZSTD_MIN_BYTES,
+                        "maxInflight": session.tasks.max_inflight,
+                    }, correlation_id)
+                    manager.set_encoding(websocket, session.encoding)
                     print(f"User {user_id} authenticated for WebSocket connection from {client_host}:{client_port}")
                     
                     # --- Corrected Auto-Join Logic --- 
@@ -570,8 +931,9 @@ async def websocket_endpoint(websocket: WebSocket):
                     patient_id_for_auto_join = data.get("patientId") 
                     if patient_id_for_auto_join:
                         # Ensure we join the PATIENT room, not a stale consult ID
-                        await manager.join_room(patient_id_for_auto_join, websocket)
-                        current_room = patient_id_for_auto_join # Track joined PATIENT room
+                        # Catch up on the room: everything buffered, or only what came after the client's `since` cursor
+                        await manager.join_room(patient_id_for_auto_join, websocket, since=parse_cursor(data.get("since")), catch_up=True)
+                        session.current_room = patient_id_for_auto_join # Track joined PATIENT room
                         print(f"User {user_id} auto-joined room: {patient_id_for_auto_join}")
                     else:
                         print(f"User {user_id} authenticated but no patientId provided for auto-join.")
@@ -579,313 +941,28 @@ async def websocket_endpoint(websocket: WebSocket):
                         # For now, we allow it, but prompts might fail later if no room is joined.
 
                 else:
-                    await manager.send_personal_message({"type": "auth_fail", "message": "Invalid token"}, websocket)
+                    await session.reply({"type": "auth_fail", "message": "Invalid token"}, correlation_id)
                     print(f"Authentication failed for WebSocket from {client_host}:{client_port}. Disconnecting.")
+                    await manager.flush(websocket) # Messages are queued; deliver auth_fail before closing
                     await websocket.close(code=1008)
                     manager.disconnect(websocket)
                     break
 
             # --- All subsequent actions require authentication ---
-            elif not authenticated_user_id:
+            elif not session.user_id:
                 print(f"WS message ignored from unauthenticated connection {client_host}:{client_port}")
-                await manager.send_personal_message({"type": "error", "message": "Authentication required"}, websocket)
+                await session.reply({"type": "error", "message": "Authentication required"}, correlation_id)
                 continue # Ignore message, wait for auth
 
             elif message_type == "join":
                 room_id = data.get("roomId")
                 if room_id:
-                    await manager.join_room(room_id, websocket)
-                    current_room = room_id
-                    await manager.send_personal_message({"type": "status", "message": f"Joined room {room_id}"}, websocket)
-                    print(f"User {authenticated_user_id} explicitly joined room: {room_id}")
+                    await manager.join_room(room_id, websocket, since=parse_cursor(data.get("since")), catch_up=True)
+                    session.current_room = room_id
+                    await session.reply({"type": "status", "message": f"Joined room {room_id}"}, correlation_id)
+                    print(f"User {session.user_id} explicitly joined room: {room_id}")
                 else:
-                     await manager.send_personal_message({"type": "error", "message": "Room ID missing for join request"}, websocket)
-
-            elif message_type == "prompt":
-                if not current_room:
-                    await manager.send_personal_message({"type": "error", "message": "Cannot process prompt: Not in a room."}, websocket)
-                    continue
-                    
-                prompt_text = data.get("prompt")
-                # Assuming room ID often corresponds to patient ID for general prompts
-                patient_id_for_prompt = current_room 
-                patient_data = mock_patient_data_dict.get(patient_id_for_prompt)
-
-                if not patient_data:
-                     await manager.send_personal_message({"type": "error", "message": f"Patient data not found for ID: {patient_id_for_prompt}"}, websocket)
-                     continue
-                if not prompt_text:
-                     await manager.send_personal_message({"type": "error", "message": "Prompt cannot be empty."}, websocket)
-                     continue
-
-                try:
-                    print(f"Processing prompt '{prompt_text[:50]}...' for patient {patient_id_for_prompt} in room {current_room}")
-                    result = await orchestrator.handle_prompt(
-                        prompt=prompt_text,
-                        patient_id=patient_id_for_prompt,
-                        patient_data=patient_data
-                    )
-                    await manager.send_personal_message({"type": "prompt_result", "result": result}, websocket)
-                except Exception as e:
-                    print(f"Error processing prompt via WebSocket: {e}")
-                    await manager.send_personal_message({"type": "error", "message": f"Error processing prompt: {e}"}, websocket)
-
-            elif message_type == "initiate_consult":
-                # --- Updated Initiate Consult Logic --- 
-                target_user_id = data.get("targetUserId")
-                patient_id = data.get("patientId")
-                initiator_info = data.get("initiator")
-                room_id = data.get("roomId")
-                context_data = data.get("context")
-
-                if not all([target_user_id, patient_id, initiator_info, room_id, context_data]):
-                    print("Initiate consult failed: Missing parameters")
-                    await manager.send_personal_message({"type": "initiate_fail", "roomId": room_id, "error": "Missing required parameters"}, websocket)
-                    continue
-                
-                # Extract data based on the revised payload structure
-                initial_trigger = context_data.get("initialTrigger") # Contains { description: "..." }
-                include_options = context_data.get("includeOptions", {}) # Dict of bools
-                use_ai = context_data.get("useAI", False) 
-                initiator_note = context_data.get("initiatorNote")
-                topic_description = initial_trigger.get("description", "General Consultation")
-
-                print(f"Initiating consult from {initiator_info['id']} to {target_user_id} for patient {patient_id} in room {room_id}.")
-                print(f"Topic: '{topic_description[:50]}...', Include Options: {include_options}, AI Assist: {use_ai}")
-                if initiator_note: print(f"Initiator Note: {initiator_note[:50]}...")
-
-                # --- Prepare context to send to target user --- 
-                related_info = None
-                focus_statement = None
-                
-                try:
-                    # 1. Gather included data based on checkboxes (always happens)
-                    related_info = await _gather_included_data(patient_id, include_options)
-                except Exception as gather_ex:
-                     print(f"Error during data gathering: {gather_ex}")
-                     related_info = {"error": f"Could not gather context data: {gather_ex}"}
-
-                if use_ai:
-                    try:
-                        # 2. Generate focus statement using LLM (only if useAI is true)
-                        focus_statement = await _generate_consult_focus(patient_id, topic_description, related_info or {}, initiator_note)
-                    except Exception as focus_ex:
-                        print(f"Error during AI focus generation: {focus_ex}")
-                        focus_statement = f"AI Error: Could not generate focus ({focus_ex})"
-
-                # Construct the final context payload for the recipient
-                context_to_send = {
-                    "initialTrigger": initial_trigger, # Keep the original trigger/topic info
-                    "initiatorNote": initiator_note,
-                    "useAI": use_ai, # Let recipient know if AI was involved
-                    "relatedInfo": related_info, # The data gathered based on checkboxes
-                    "consultFocusStatement": focus_statement if use_ai else None # Only include if AI was used
-                }
-
-                # --- Find target user socket(s) and send --- 
-                target_sockets = await manager.get_user_sockets(target_user_id)
-                if target_sockets:
-                    message_to_target = {
-                        "type": "consult_request",
-                        "roomId": room_id,
-                        "patientId": patient_id,
-                        "initiator": initiator_info,
-                        "context": context_to_send # Send the processed context
-                    }
-                    sent_count = 0
-                    for target_socket in target_sockets:
-                        try:
-                            # Use manager's method which now handles serialization
-                            await manager.send_personal_message(message_to_target, target_socket)
-                            sent_count += 1
-                        except Exception as e:
-                             print(f"Error sending consult_request to a socket for {target_user_id}: {e}")
-                             
-                    if sent_count > 0:
-                        print(f"Successfully sent consult request for room {room_id} to {sent_count} socket(s) for user {target_user_id}")
-                        await manager.send_personal_message({"type": "initiate_ok", "roomId": room_id}, websocket)
-                    else:
-                         print(f"Failed sending consult_request to any socket for {target_user_id}")
-                         await manager.send_personal_message({"type": "initiate_fail", "roomId": room_id, "error": "Failed to send message to colleague's active sessions"}, websocket)
-                else:
-                    print(f"Target user {target_user_id} not found or not connected.")
-                    await manager.send_personal_message({"type": "initiate_fail", "roomId": room_id, "error": "Colleague is not currently connected"}, websocket)
-
-            # === Handle Agent Commands Sent Via Text (Slash Commands) ===
-            elif message_type == "agent_command_text":
-                room_id = data.get("roomId")
-                message_text = data.get("text", "").strip() # The raw command text
-                sender_info = data.get("sender")
-                patient_id_for_command = data.get("patientId") # Expect patientId for context
-
-                if not all([room_id, message_text, sender_info, patient_id_for_command]):
-                    await manager.send_personal_message({"type": "error", "message": "Missing fields for agent command text"}, websocket)
-                    continue # Skip processing
-
-                # Parse the command
-                agent_name = None
-                result_text = None
-                agent_response_type = "agent_output" # Default response type
-
-                try:
-                    if message_text.startswith("/compare-therapy"):
-                        try:
-                            print(f"Processing /compare-therapy command: {message_text}")
-                            
-                            # First check the format of the message to understand what we're parsing
-                            print(f"Raw command text: {message_text}")
-                            
-                            # Extract parameters without using argparse
-                            # Example: /compare-therapy current="X" vs="Y" focus="Z"
-                            command_pattern = r'/compare-therapy\s+current="([^"]*)"\s+vs="([^"]*)"\s+focus="([^"]*)"'
-                            match = re.search(command_pattern, message_text)
-                            
-                            if not match:
-                                raise ValueError("Command format incorrect. Use: /compare-therapy current=\"therapy1\" vs=\"therapy2\" focus=\"criteria1,criteria2\"")
-                            
-                            current_therapy = match.group(1)
-                            comparison_therapy = match.group(2)
-                            focus_criteria_text = match.group(3)
-                            
-                            print(f"Parsed manually: current={current_therapy}, vs={comparison_therapy}, focus={focus_criteria_text}")
-                            
-                            # Split focus criteria into a list
-                            focus_criteria = [c.strip() for c in focus_criteria_text.split(',')]
-                            
-                            # Import again at this scope to be sure
-                            try:
-                                from backend.agents.comparative_therapy_agent import ComparativeTherapyAgent
-                                agent_name = "ComparativeTherapyAgent"
-                                agent = ComparativeTherapyAgent()
-                                print(f"Instantiated {agent_name}")
-                                
-                                result = await agent.run(
-                                    patient_id=patient_id_for_command,
-                                    therapy_a=current_therapy,
-                                    therapy_b=comparison_therapy,
-                                    focus_criteria=focus_criteria,
-                                    context={"id": patient_id_for_command}
-                                )
-                                print(f"Agent run complete, result: {type(result)}")
-                                
-                                # Handle both string and dict return types
-                                if isinstance(result, dict):
-                                    result_text = result.get("comparison_summary", str(result))
-                                else:
-                                    # Assume it's a string if not a dict
-                                    result_text = str(result)
-                            except ImportError as imp_err:
-                                print(f"ImportError when loading ComparativeTherapyAgent: {imp_err}")
-                                raise
-                            except Exception as agent_err:
-                                print(f"Error running ComparativeTherapyAgent: {agent_err}")
-                                raise
-                                
-                        except Exception as ex:
-                            print(f"Error in /compare-therapy command block: {ex}")
-                            result_text = f"Error processing /compare-therapy command: {ex}"
-                            agent_name = "System"
-                            agent_response_type = "error"
-
-                    elif message_text.startswith("/draft-patient-info"):
-                        try:
-                            print(f"Processing /draft-patient-info command: {message_text}")
-                            
-                            # First check the format of the message to understand what we're parsing
-                            print(f"Raw command text: {message_text}")
-                            
-                            # Extract topic without using argparse
-                            # Example: /draft-patient-info topic="Managing nausea from chemotherapy"
-                            command_pattern = r'/draft-patient-info\s+topic="([^"]*)"'
-                            match = re.search(command_pattern, message_text)
-                            
-                            if not match:
-                                raise ValueError("Command format incorrect. Use: /draft-patient-info topic=\"Your topic here\"")
-                            
-                            topic = match.group(1)
-                            print(f"Parsed manually: topic={topic}")
-                            
-                            # Import again at this scope to be sure
-                            try:
-                                from backend.agents.patient_education_draft_agent import PatientEducationDraftAgent
-                                agent_name = "PatientEducationDraftAgent"
-                                agent = PatientEducationDraftAgent()
-                                print(f"Instantiated {agent_name}")
-                                
-                                result = await agent.run(
-                                    topic=topic,
-                                    context={"id": patient_id_for_command} # Minimal context
-                                )
-                                print(f"Agent run complete, result: {type(result)}")
-                                
-                                # Handle both string and dict return types
-                                if isinstance(result, dict):
-                                    result_text = result.get("draft_content", str(result))
-                                else:
-                                    # Assume it's a string if not a dict
-                                    result_text = str(result)
-                                agent_response_type = "agent_output" # <- USE GENERIC SUCCESS TYPE
-                            except ImportError as imp_err:
-                                print(f"ImportError when loading PatientEducationDraftAgent: {imp_err}")
-                                raise
-                            except Exception as agent_err:
-                                print(f"Error running PatientEducationDraftAgent: {agent_err}")
-                                raise
-                                
-                        except Exception as ex:
-                            print(f"Error in /draft-patient-info command block: {ex}")
-                            result_text = f"Error processing /draft-patient-info command: {ex}"
-                            agent_name = "System"
-                            agent_response_type = "error"
-
-                    else:
-                         # Command not recognized
-                        result_text = f"Unknown command: {message_text.split()[0]}"
-                        agent_name = "System"
-                        agent_response_type = "error" # Send as error type
-
-                except (argparse.ArgumentError, Exception) as e:
-                    print(f"Error parsing or running agent command '{message_text}': {e}")
-                    result_text = f"Error processing command: {e}"
-                    agent_name = "System"
-                    agent_response_type = "error"
-
-                # Prepare response if command was processed (even if it was an error message)
-                if agent_name and result_text is not None:
-                    timestamp = asyncio.get_event_loop().time()
-                    
-                    # Check if it was an error or a successful agent output
-                    if agent_response_type == "error":
-                        response_data = {
-                            "type": "error",
-                            "roomId": room_id,
-                            "agentName": agent_name, # Could be "System"
-                            "sender": sender_info,
-                            "timestamp": timestamp,
-                            "message": result_text # Error message content
-                        }
-                    else: # Assume it's a successful "agent_output"
-                        response_data = {
-                            "type": "agent_output", # USE GENERIC SUCCESS TYPE
-                            "roomId": room_id,
-                            "agentName": agent_name, # Actual agent name
-                            "sender": sender_info, 
-                            "timestamp": timestamp,
-                            "content": result_text # Agent result content
-                        }
-
-                    # Broadcast the agent's result or error
-                    print(f"Broadcasting agent ({agent_name}) message (type: {response_data['type']}) to room {room_id}")
-                    await manager.broadcast_to_room(room_id, response_data)
-                else:
-                    # This case handles parsing/execution errors where we only send back a personal message
-                    await manager.send_personal_message({
-                        "type": "error", 
-                        "message": result_text or "Failed to process command.", 
-                        "timestamp": asyncio.get_event_loop().time()
-                    }, websocket)
-                    
-                continue # Agent command handled, skip further checks
+                     await session.reply({"type": "error", "message": "Room ID missing for join request"}, correlation_id)
 
             elif message_type == "chat_message":
                 room_id = data.get("roomId")
@@ -902,163 +979,36 @@ async def websocket_endpoint(websocket: WebSocket):
                         "timestamp": timestamp
                     }
                     print(f"Broadcasting chat message in room {room_id} from {sender_info['id']}")
-                    await manager.broadcast_to_room(room_id, chat_payload, exclude_sender=websocket)
-                    # Also send back to sender for confirmation/display
-                    await manager.send_personal_message(chat_payload, websocket)
+                    _, seq = await manager.broadcast_to_room(room_id, chat_payload, exclude_sender=websocket)
+                    # Also send back to sender for confirmation/display, with the same seq cursor the room got
+                    await session.reply({**chat_payload, "seq": seq} if seq is not None else chat_payload, correlation_id)
                 else:
-                    await manager.send_personal_message({"type": "error", "message": "Missing fields for chat message"}, websocket)
+                    await session.reply({"type": "error", "message": "Missing fields for chat message"}, correlation_id)
 
-            elif message_type == "agent_command":
-                room_id = data.get("roomId")
-                command = data.get("command")
-                command_context = data.get("context", {}) # Optional extra context
-                sender_info = data.get("sender")
-                patient_id_for_command = data.get("patientId") # Expect patientId for context
-
-                if not all([room_id, command, sender_info, patient_id_for_command]):
-                    await manager.send_personal_message({"type": "error", "message": "Missing fields for agent command"}, websocket)
-                    continue
-                    
-                print(f"Processing agent command '{command}' in room {room_id} from {sender_info['id']} for patient {patient_id_for_command}")
-                
-                # Send an acknowledgement back to the sender that the command is being processed
-                await manager.send_personal_message({
-                    "type": "system_message",
-                    "roomId": room_id,
-                    "content": f"Processing command: {command}..."
-                }, websocket)
-                
-                agent_result = None
-                error_message = None
-                
-                try:
-                    patient_data = mock_patient_data_dict.get(patient_id_for_command)
-                    if not patient_data:
-                        raise ValueError(f"Patient data not found for ID: {patient_id_for_command}")
-
-                    # --- Route command to appropriate AI logic --- 
-                    if command == "summarize":
-                        # Use orchestrator for summarization intent
-                        result = await orchestrator.handle_prompt(
-                            prompt="Generate a clinical summary", # Standardized prompt
-                            patient_id=patient_id_for_command,
-                            patient_data=patient_data
-                        )
-                        # Extract relevant part of the result
-                        agent_result = result.get('output', {}).get('summary_text')
-                        if not agent_result: agent_result = result.get('summary', 'Summary could not be generated.')
-                        
-                    elif command == "check_interactions":
-                        # Construct a direct LLM prompt
-                        med_list = "\n".join([f"- {med['name']} {med['dosage']}" for med in patient_data.get('currentMedications', [])])
-                        allergy_list = "\n".join([f"- {allergy['substance']}" for allergy in patient_data.get('allergies', [])])
-                        prompt = (
-                            f"Patient: {patient_data['demographics']['name']}\n"
-                            f"Current Medications:\n{med_list or '- None'}\n"
-                            f"Known Allergies:\n{allergy_list or '- None'}\n\n"
-                            f"Please check for potential drug-drug interactions, drug-allergy interactions, "
-                            f"and any significant contraindications based ONLY on the provided medication and allergy lists. "
-                            f"Focus on clinically significant interactions. Format as a concise list."
-                        )
-                        agent_result = await get_llm_text_response(prompt)
-                    
-                    # --- NEW: Handle Suggested Questions --- 
-                    elif command in ["ask_glucose_trend", "ask_letrozole_effect", "ask_management_recommendations"]:
-                        question_text = data.get("params", {}).get("question")
-                        if not question_text:
-                             raise ValueError("Missing 'question' parameter for ask command")
-                        
-                        # --- Generate Simulated Responses --- 
-                        if command == "ask_glucose_trend":
-                            # Simulate finding the most recent glucose and add mock trend/A1c
-                            glucose_val = "N/A"
-                            glucose_date = "N/A"
-                            cmp = next((lab for lab in patient_data.get('recentLabs', []) if lab['panelName'] == 'Comprehensive Metabolic Panel (CMP)'), None)
-                            if cmp:
-                                glucose_comp = next((c for c in cmp.get('components',[]) if c['test'] == 'Glucose'), None)
-                                if glucose_comp:
-                                    glucose_val = f"{glucose_comp['value']} {glucose_comp['unit']}"
-                                    glucose_date = cmp.get('resultDate', 'N/A')
-                            
-                            agent_result = (
-                                f"Most Recent Glucose ({glucose_date}): {glucose_val}.\n"
-                                f"Simulated Recent Trend: 105 mg/dL (7/18), 112 mg/dL (7/10), 98 mg/dL (7/1).\n"
-                                f"Simulated Last HbA1c (6/15): 6.8%."
-                            )
-
-                        elif command == "ask_letrozole_effect":
-                            agent_result = (
-                                "Letrozole (an aromatase inhibitor) can occasionally be associated with hyperglycemia or worsening glycemic control, although it's less common than with some other cancer therapies. "
-                                "No major pharmacokinetic interaction between Letrozole and Metformin is typically expected. "
-                                "Consider if the timing of glucose changes aligns with Letrozole initiation or dosage adjustments. Monitoring is key."
-                            )
-                        
-                        elif command == "ask_management_recommendations":
-                             agent_result = (
-                                "Recommendations for managing glucose ~110 mg/dL in T2DM patient on active cancer treatment:\n"
-                                "1. Assess Trend & A1c: Confirm if this is isolated or a pattern (Use 'Glucose Trend & A1c?' question).\n"
-                                "2. Reinforce Lifestyle: Emphasize diet consistency and physical activity as tolerated.\n"
-                                "3. Medication Review: Ensure Metformin adherence and correct dosage. Consider Letrozole contribution (Use 'Letrozole/Glucose Impact?' question).\n"
-                                "4. Monitoring: Advise regular self-monitoring of blood glucose (SMBG) if feasible.\n"
-                                "5. Follow-up: Schedule repeat fasting glucose or A1c based on trend and overall clinical picture."
-                            )
-                        else: 
-                            # Fallback for safety, though this condition shouldn't be hit given the outer elif
-                            agent_result = "Simulated response for this question is not configured."
-                        # --- End Simulated Responses --- 
-
-                    elif command == "review_side_effects":
-                         # Use orchestrator for side effects intent
-                        result = await orchestrator.handle_prompt(
-                            prompt="What are the potential side effects and management tips?", # Example prompt
-                            patient_id=patient_id_for_command,
-                            patient_data=patient_data
-                        )
-                        # Format the result more nicely
-                        output = result.get('output', {})
-                        side_effects = "\n".join([f"- {se}" for se in output.get('potential_side_effects', [])])
-                        management = "\n".join([f"- {tip['symptom']}: {tip['tip']}" for tip in output.get('management_tips', [])])
-                        agent_result = f"Potential Side Effects:\n{side_effects or '- None identified'}\n\nManagement Tips:\n{management or '- None provided'}"
-                        if not agent_result: agent_result = result.get('summary', 'Could not retrieve side effect info.')
+            elif message_type == "cancel":
+                # Cancels an in-flight request of this socket by its correlation ID
+                target_id = str(data.get("targetCorrelationId") or "")
+                cancelled = session.tasks.cancel(target_id)
+                await session.reply({"type": "cancel_result", "targetCorrelationId": target_id, "cancelled": cancelled}, correlation_id)
 
-                    else:
-                        error_message = f"Unknown agent command: {command}"
-                        
-                except Exception as e:
-                    print(f"Error processing agent command '{command}': {e}")
-                    error_message = f"Error during '{command}': {e}"
-                    
-                # --- Broadcast result or error to the room --- 
-                if error_message:
-                    response_payload = {
-                        "type": "system_message",
-                        "roomId": room_id,
-                        "content": error_message,
-                        "isError": True
-                    }
-                else:
-                    response_payload = {
-                        "type": "agent_output", # USE GENERIC SUCCESS TYPE
-                        "roomId": room_id,
-                        "command": command,
-                        "result": agent_result or "No result generated.", # Ensure result is not None
-                        "senderIsAgent": True # Flag for UI styling
-                    }
-                    
-                print(f"Broadcasting agent result/error for command '{command}' in room {room_id}")
-                await manager.broadcast_to_room(room_id, response_payload)
+            elif message_type in WS_TASK_HANDLERS:
+                # Offload: the loop goes straight back to receiving; the result is sent with the same correlationId
+                rejected = session.spawn(message_type, correlation_id, WS_TASK_HANDLERS[message_type],
+                                         session, data, correlation_id, session.current_room)
+                if rejected:
+                    await session.reject(message_type, correlation_id, rejected)
 
             else:
                 print(f"Unknown message type received: {message_type}")
                 # Optionally send an error back
-                await manager.send_personal_message({"type": "error", "message": f"Unsupported message type: {message_type}"}, websocket)
+                await session.reply({"type": "error", "message": f"Unsupported message type: {message_type}"}, correlation_id)
 
     except WebSocketDisconnect as e:
-        print(f"WebSocket disconnected from {authenticated_user_id or f'{client_host}:{client_port}'} with code: {e.code}")
+        print(f"WebSocket disconnected from {session.label} with code: {e.code}")
         # Optionally log disconnect reason if needed (e.g., e.reason)
     except Exception as e:
         # Catch potential errors during receive/processing
-        print(f"Error in WebSocket connection handler for {authenticated_user_id or f'{client_host}:{client_port}'}: {e}")
+        print(f"Error in WebSocket connection handler for {session.label}: {e}")
         # Try to close gracefully if possible
         try:
             await websocket.close(code=1011) # Internal Error
@@ -1066,14 +1016,17 @@ async def websocket_endpoint(websocket: WebSocket):
             pass # Already closed or unable to close
     finally:
         # Ensure the connection is removed from the manager on disconnect/error
-        print(f"Cleaning up WebSocket connection for {authenticated_user_id or f'{client_host}:{client_port}'}")
+        print(f"Cleaning up WebSocket connection for {session.label}")
+        cancelled = session.close() # Stop in-flight handlers; nobody is left to receive their results
+        if cancelled:
+            print(f"Cancelled {cancelled} in-flight request(s) for {session.label}")
         manager.disconnect(websocket)
-        if authenticated_user_id and current_room:
+        if session.user_id and session.current_room:
             # Optional: Broadcast a leave message if desired
-            leave_message = {"type": "system_message", "roomId": current_room, "content": f"{authenticated_user_id} left."}
-            # Don't await this, just fire and forget if it fails
+            leave_message = {"type": "system_message", "roomId": session.current_room, "content": f"{session.user_id} left."}
+            # Only queues to the remaining sockets, so awaiting it here doesn't hold up the disconnect
             # Pass websocket as the third positional arg (sender to exclude)
-            asyncio.create_task(manager.broadcast_to_room(current_room, leave_message, websocket))
+            await manager.broadcast_to_room(session.current_room, leave_message, websocket)
             
 
 # Include the research API router
@@ -1084,11 +1037,30 @@ app.include_router(research_router, prefix="/api/research", tags=["research"])
 async def read_root():
     return {"message": "Beat Cancer AI Backend is running"}
 
+@app.get("/api/health")
+async def health_check():
+    """ Reports load and warmup state of the shared agents, LLM gateway metrics and WebSocket fan-out state. """
+    health = agent_registry.health()
+    health["llm_gateway"] = llm_gateway.metrics()
+    health["websockets"] = manager.stats()
+    return health
+
 # --- Add Request Model ---
+class AssessmentPolicy(BaseModel):
+    """ Per-request overrides for the LLM assessment budget; unset fields keep the server defaults. """
+    mode: Optional[Literal[POLICY_TOP_K, POLICY_UNTIL_ELIGIBLE]] = None
+    top_k: Optional[int] = Field(default=None, ge=1, description="Max trials to assess.")
+    target_eligible: Optional[int] = Field(default=None, ge=1, description="until_eligible: stop after this many likely-eligible trials.")
+    concurrency: Optional[int] = Field(default=None, ge=1, description="until_eligible: assessments in flight at once.")
+
+    def overrides(self) -> Dict[str, Any]:
+        return self.dict(exclude_none=True)
+
 class TrialSearchRequest(BaseModel):
     query: str = Field(..., description="The search query text entered by the user.")
     # Use the more specific PatientContext model defined later
     patient_context: Optional['PatientContext'] = Field(default=None, description="Optional patient context data.")
+    assessment_policy: Optional[AssessmentPolicy] = Field(default=None, description="Overrides for the LLM assessment budget (mode, top_k, target_eligible, concurrency).")
 
 # --- NEW Clinical Trial Search Endpoint --- 
 @app.post("/api/search-trials")
@@ -1112,12 +1084,15 @@ async def search_clinical_trials(request: TrialSearchRequest):
     # --- END MOCK DATA ---
 
     # --- Original Agent Call (Re-enabled) ---
-    agent = ClinicalTrialAgent() # Instantiate the agent
+    agent = agent_registry.get(CLINICAL_TRIAL_FINDER) # Shared, already-warm instance
+    if agent is None:
+        raise HTTPException(status_code=503, detail="Clinical trial agent is not available.")
     
     # Prepare context and kwargs for the agent
     # Agent expects patient data under 'patient_data' key in context
     context = {"patient_data": request.patient_context.dict() if request.patient_context else {}} 
-    kwargs = {"prompt": request.query} # Pass query as prompt
+    policy = request.assessment_policy.overrides() if request.assessment_policy else None
+    kwargs = {"prompt": request.query, "assessment_policy": policy} # Pass query as prompt
     
     try:
         # Run the agent asynchronously
@@ -1131,7 +1106,11 @@ async def search_clinical_trials(request: TrialSearchRequest):
             found_trials = agent_output.get("found_trials", [])
             return {
                 "success": True, 
-                "data": { "found_trials": found_trials } # Return trials under data.found_trials
+                "data": {  # Return trials under data.found_trials
+                    "found_trials": found_trials,
+                    "assessment_policy": agent_output.get("assessment_policy"),
+                    "prompt_compression": agent_output.get("prompt_compression"),
+                }
             }
         elif result.get("status") == "clarification_needed":
              # For now, treat clarification needed as no results found, 
@@ -1154,6 +1133,30 @@ async def search_clinical_trials(request: TrialSearchRequest):
         raise HTTPException(status_code=500, detail=f"Failed to search trials: {str(e)}")
     # --- End Original Agent Call ---
 
+@app.post("/api/search-trials/stream")
+async def search_clinical_trials_stream(request: TrialSearchRequest):
+    """
+    Streaming variant of /api/search-trials (Server-Sent Events).
+    Emits vector hits immediately, then one `trial_result` event per trial as its assessment finishes.
+    """
+    logging.info(f"Received streaming trial search request. Query: '{request.query}', Patient Context Provided: {request.patient_context is not None}")
+    agent = agent_registry.get(CLINICAL_TRIAL_FINDER)
+    if agent is None:
+        raise HTTPException(status_code=503, detail="Clinical trial agent is not available.")
+
+    context = {"patient_data": request.patient_context.dict() if request.patient_context else {}}
+    policy = request.assessment_policy.overrides() if request.assessment_policy else None
+
+    async def event_stream():
+        async for event in agent.run_streaming(context=context, prompt=request.query, assessment_policy=policy):
+            yield _format_sse(event)
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
 # --- Data Models ---
 class PatientContext(BaseModel):
     # Define fields based on what Research.jsx sends
@@ -1167,6 +1170,7 @@ class PatientContext(BaseModel):
 class TrialSearchRequest(BaseModel):
     query: str
     patient_context: Optional[PatientContext] = None # Use the refined model
+    assessment_policy: Optional[AssessmentPolicy] = None
 
 class ConsultationRequest(BaseModel):
     room_id: str
@@ -1271,13 +1275,12 @@ async def get_trial_details(trial_id: str, patient_id: str):
     Fetches details for a specific trial from SQLite DB and runs eligibility analysis.
     """
     logging.info(f"[TrialDetails:{trial_id}] Endpoint started for patient {patient_id}") # ADD LOG
-    conn = None # Initialize conn
     fetched_trial_data = None # Initialize
     
     try:
         # 1. Get Patient Data
         logging.info(f"[TrialDetails:{trial_id}] Getting patient data...") # ADD LOG
-        patient_data = mock_patient_data_dict.get(patient_id)
+        patient_data = await patient_repository.get(patient_id, sections=CLINICAL_SECTIONS)
         if not patient_data:
             logging.error(f"[TrialDetails:{trial_id}] Patient data not found for ID: {patient_id}")
             raise HTTPException(status_code=404, detail=f"Patient data not found for ID: {patient_id}")
@@ -1285,43 +1288,27 @@ async def get_trial_details(trial_id: str, patient_id: str):
             
         # 2. Fetch ACTUAL Trial Data from SQLite DB
         try:
-            logging.info(f"[TrialDetails:{trial_id}] Connecting to SQLite DB: {TRIALS_DB_PATH}") # ADD LOG
-            conn = sqlite3.connect(TRIALS_DB_PATH)
-            conn.row_factory = sqlite3.Row # Important: Get rows as dict-like objects
-            cursor = conn.cursor()
-            logging.info(f"[TrialDetails:{trial_id}] DB Connected. Fetching trial...") # ADD LOG
-            
-            query = "SELECT * FROM clinical_trials WHERE nct_id = ?" 
-            cursor.execute(query, (trial_id,))
-            trial_row = cursor.fetchone()
-            logging.info(f"[TrialDetails:{trial_id}] DB Fetch complete. Trial found: {trial_row is not None}") # ADD LOG
+            logging.info(f"[TrialDetails:{trial_id}] Fetching trial from SQLite DB: {TRIALS_DB_PATH}") # ADD LOG
+            fetched_trial_data = await get_pool(TRIALS_DB_PATH).fetchone(TRIAL_BY_ID_SQL, (trial_id,))
+            logging.info(f"[TrialDetails:{trial_id}] DB Fetch complete. Trial found: {fetched_trial_data is not None}") # ADD LOG
             
-            if not trial_row:
+            if not fetched_trial_data:
                 logging.warning(f"[TrialDetails:{trial_id}] Trial {trial_id} not found in the database.")
                 raise HTTPException(status_code=404, detail=f"Trial with ID {trial_id} not found in database.")
-                
-            # Convert row to a standard dictionary
-            fetched_trial_data = dict(trial_row)
-            logging.info(f"[TrialDetails:{trial_id}] Successfully fetched and converted trial data from DB.") # ADD LOG
             
         except sqlite3.Error as db_err:
             logging.error(f"[TrialDetails:{trial_id}] SQLite error fetching trial {trial_id}: {db_err}", exc_info=True)
             raise HTTPException(status_code=500, detail=f"Database error fetching trial details.")
-        finally:
-            if conn:
-                logging.info(f"[TrialDetails:{trial_id}] Closing DB connection.") # ADD LOG
-                conn.close()
-                # logging.info(f"[TrialDetails:{trial_id}] Closed SQLite DB connection for {trial_id} fetch.") # Original log - slightly redundant
         
         # Ensure fetched_trial_data is available before proceeding
         if fetched_trial_data is None:
              logging.error(f"[TrialDetails:{trial_id}] fetched_trial_data is None after DB block. This should not happen.")
              raise HTTPException(status_code=500, detail="Internal error retrieving trial data.")
              
-        # 3. Instantiate Agent
-        logging.info(f"[TrialDetails:{trial_id}] Instantiating ClinicalTrialAgent...") # ADD LOG
-        agent = ClinicalTrialAgent()
-        logging.info(f"[TrialDetails:{trial_id}] ClinicalTrialAgent instantiated.") # ADD LOG
+        # 3. Get Shared Agent
+        agent = agent_registry.get(CLINICAL_TRIAL_FINDER)
+        if agent is None:
+            raise HTTPException(status_code=503, detail="Clinical trial agent is not available.")
 
         # 4. Run Agent Analysis for this specific trial using FETCHED data
         logging.info(f"[TrialDetails:{trial_id}] Calling agent.run_single_trial_analysis...") # ADD LOG
@@ -1382,9 +1369,11 @@ async def request_deep_dive(request: DeepDiveRequest):
     """Triggers the EligibilityDeepDiveAgent to analyze specific criteria."""
     logging.info(f"Received request for deep dive analysis for trial: {request.trial_data.get('nct_id', 'N/A')}")
     
+    agent = agent_registry.get(ELIGIBILITY_DEEP_DIVE)
+    if agent is None:
+        raise HTTPException(status_code=503, detail="Eligibility deep dive agent is not available.")
+
     try:
-        agent = EligibilityDeepDiveAgent()
-        
         # Pass the necessary data from the request to the agent's run method
         # Use request.dict() to pass keyword arguments matching the agent's expected kwargs
         report = await agent.run(**request.dict())
@@ -7,6 +7,8 @@ import logging
 
 # Import the utility function
 from .pubmed_utils import search_pubmed
+from backend.core.sqlite_pool import get_pool
+from backend.core.mutation_store import get_mutation_store
 
 # Import the agent
 try:
@@ -38,6 +40,7 @@ except ImportError:
 # For now, let's define them here, assuming structure relative to this file's potential location
 PROJECT_ROOT_FROM_ROUTER = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 PATIENT_MUTATIONS_DB_PATH = os.path.join(PROJECT_ROOT_FROM_ROUTER, 'backend', 'data', 'patient_data.db')
+MUTATIONS_BY_PATIENT_SQL = "SELECT * FROM mutations WHERE patient_id = ?"
 
 # Need access to mock_patient_data_dict, maybe import from main? Or redefine subset?
 # Importing directly from main can cause circular dependency issues.
@@ -89,6 +92,34 @@ async def search_clinical_trials_endpoint(payload: Dict[str, Any] = Body(...)):
     ]
     return mock_results
 
+# --- Cohort Queries (columnar mutation store) ---
+def _require_mutation_store():
+    store = get_mutation_store()
+    if store is None:
+        raise HTTPException(status_code=503, detail="Mutation store not built. Run backend/scripts/load_mutations_to_db.py.")
+    return store
+
+@router.get("/mutations/cohort", response_model=Dict[str, Any])
+async def mutation_cohort(gene: str, protein_change: Optional[str] = None, variant_type: Optional[str] = None):
+    """ Patients carrying a mutation in `gene`, e.g. ?gene=PIK3CA&protein_change=H1047R. """
+    patients = _require_mutation_store().patients_with(gene, protein_change, variant_type)
+    return {"gene": gene, "protein_change": protein_change, "variant_type": variant_type,
+            "patient_count": len(patients), "patients": patients}
+
+@router.post("/mutations/presence", response_model=Dict[str, Any])
+async def mutation_presence(payload: Dict[str, Any] = Body(...)):
+    """ Gene x patient presence matrix for {"genes": [...], "patients": [...]} (patients optional). """
+    genes = payload.get("genes")
+    if not genes or not isinstance(genes, list):
+        raise HTTPException(status_code=400, detail="Missing or invalid 'genes' list in request body")
+    matrix, gene_names, patient_names = _require_mutation_store().presence_matrix(genes, payload.get("patients"))
+    return {"genes": gene_names, "patients": patient_names, "matrix": matrix.astype(int).tolist()}
+
+@router.get("/mutations/range", response_model=List[Dict[str, Any]])
+async def mutation_range(chromosome: str, start: int, end: Optional[int] = None):
+    """ Mutations overlapping chromosome:start-end. """
+    return _require_mutation_store().range_lookup(chromosome, start, end)
+
 # --- New Mutation Analysis Endpoint --- 
 @router.post("/mutation-analysis", response_model=Dict[str, Any])
 async def analyze_mutations(request: MutationAnalysisRequest):
@@ -105,19 +136,12 @@ async def analyze_mutations(request: MutationAnalysisRequest):
     # --- Fetch patient mutations from DB --- 
     # Simplified logic, similar to main.py, but without fetching mock_patient_data_dict
     mutations = []
-    conn = None
     try:
-        logging.debug(f"Connecting to mutations DB at: {PATIENT_MUTATIONS_DB_PATH}")
         if not os.path.exists(PATIENT_MUTATIONS_DB_PATH):
             logging.warning(f"Mutations database not found at {PATIENT_MUTATIONS_DB_PATH} for patient {patient_id}. Returning empty mutation list.")
         else:
-            conn = sqlite3.connect(PATIENT_MUTATIONS_DB_PATH)
-            conn.row_factory = sqlite3.Row
-            cursor = conn.cursor()
             # Assuming the DB contains necessary fields like hugo_gene_symbol, protein_change, variant_type
-            cursor.execute("SELECT * FROM mutations WHERE patient_id = ?", (patient_id,))
-            rows = cursor.fetchall()
-            mutations = [dict(row) for row in rows]
+            mutations = await get_pool(PATIENT_MUTATIONS_DB_PATH).fetchall(MUTATIONS_BY_PATIENT_SQL, (patient_id,))
             logging.info(f"Fetched {len(mutations)} mutations from DB for patient {patient_id}")
             
     except sqlite3.Error as e:
@@ -126,9 +150,6 @@ async def analyze_mutations(request: MutationAnalysisRequest):
     except Exception as e:
         logging.error(f"Unexpected error fetching mutations for {patient_id}: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail=f"Unexpected error fetching mutations.")
-    finally:
-        if conn:
-            conn.close()
             
     # --- Instantiate and Run Agent --- 
     try:
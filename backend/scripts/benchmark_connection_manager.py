@@ -0,0 +1,197 @@
+"""
+WebSocket fan-out benchmark for ConnectionManager (no network: in-memory sockets).
+
+Puts `--sockets` fake sockets in one room and measures:
+- join / disconnect cost for the whole room
+- broadcast call latency (what the sending handler waits for)
+- time until every socket has received every message
+- the same with one stalled client in the room
+
+and compares against the previous list + asyncio.gather implementation
+(`LegacyFanout`), where a broadcast awaits every socket's send.
+
+`--encoding` sets the negotiated wire encoding of every socket (see
+core/ws_codec.py) and `--payload-kb` swaps in a consult-sized payload, to
+compare bytes on the wire and broadcast cost per encoding.
+
+Usage (from the project root):
+    python -m backend.scripts.benchmark_connection_manager --sockets 1000 --messages 200
+    python -m backend.scripts.benchmark_connection_manager --encoding msgpack+zstd --payload-kb 64
+"""
+
+import argparse
+import asyncio
+import json
+import statistics
+import time
+from types import SimpleNamespace
+from typing import Any, Dict, List
+
+from starlette.websockets import WebSocketState
+
+from backend.core.connection_manager import ConnectionManager
+from backend.core import ws_codec
+
+PAYLOAD = {"type": "chat_message", "roomId": "bench", "sender": "dr_bench", "content": "x" * 200}
+
+
+def consult_payload(kb: int) -> Dict[str, Any]:
+    """ Roughly `kb` KiB of JSON shaped like a consult_request with embedded lab panels. """
+    component = {"test": "Hemoglobin", "value": 11.2, "unit": "g/dL", "refRange": "12.0-16.0", "flag": "Low"}
+    per_component = len(json.dumps(component)) + 2
+    return {"type": "consult_request", "roomId": "bench", "context": {"relatedInfo": {"recentLabs": [
+        {"panelName": "CBC", "resultDate": "2024-07-25", "components": [dict(component, value=11.2 + i / 10) for i in range(10)]}
+        for _ in range(max(1, kb * 1024 // (per_component * 10)))
+    ]}}}
+
+
+class BenchSocket:
+    def __init__(self, i: int, delay: float = 0.0):
+        self.client = SimpleNamespace(host="10.0.0.1", port=i)
+        self.client_state = WebSocketState.CONNECTING
+        self.delay = delay
+        self.received = 0
+        self.bytes_received = 0
+
+    async def accept(self):
+        self.client_state = WebSocketState.CONNECTED
+
+    async def send_text(self, text: str):
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        else:
+            await asyncio.sleep(0)  # Yield like a real transport write
+        self.received += 1
+        self.bytes_received += len(text.encode("utf-8")) if isinstance(text, str) else len(text)
+
+    async def send_bytes(self, data: bytes):
+        await self.send_text(data)
+
+    async def close(self, code: int = 1000):
+        self.client_state = WebSocketState.DISCONNECTED
+
+
+class LegacyFanout:
+    """ The previous approach: list membership, one closure per socket, gather over all sends. """
+
+    def __init__(self):
+        self.room: List[Any] = []
+
+    def join(self, ws):
+        if ws not in self.room:
+            self.room.append(ws)
+
+    def leave(self, ws):
+        if ws in self.room:
+            self.room.remove(ws)
+
+    async def broadcast(self, data):
+        message = json.dumps(data)
+
+        async def send(ws, msg):
+            await ws.send_text(msg)
+        await asyncio.gather(*(send(ws, message) for ws in list(self.room)))
+
+
+def ms(seconds: float) -> float:
+    return round(seconds * 1000, 3)
+
+
+def summarize(latencies: List[float]) -> Dict[str, float]:
+    latencies = sorted(latencies)
+    return {"p50_ms": ms(statistics.median(latencies)), "p95_ms": ms(latencies[int(len(latencies) * 0.95) - 1])}
+
+
+async def wait_delivered(sockets, expected: int, timeout: float = 60.0):
+    deadline = time.perf_counter() + timeout
+    while any(ws.received < expected for ws in sockets) and time.perf_counter() < deadline:
+        await asyncio.sleep(0.001)
+
+
+async def bench_manager(n_sockets: int, n_messages: int, slow_delay: float, payload: Dict[str, Any],
+                        encoding: str) -> Dict[str, Any]:
+    manager = ConnectionManager(queue_size=max(256, n_messages + 1))
+    sockets = [BenchSocket(i) for i in range(n_sockets)]
+    start = time.perf_counter()
+    for ws in sockets:
+        await manager.connect(ws)
+        manager.set_encoding(ws, encoding)
+        await manager.join_room("bench", ws)
+    join_seconds = time.perf_counter() - start
+
+    report = {"connect_and_join_all_ms": ms(join_seconds), "encoding": encoding}  # Includes starting each writer task
+    for label, extra in (("all_fast", []), ("one_stalled", [BenchSocket(-1, delay=slow_delay)])):
+        for ws in extra:
+            await manager.connect(ws)
+            manager.set_encoding(ws, encoding)
+            await manager.join_room("bench", ws)
+        for ws in sockets:
+            ws.received = ws.bytes_received = 0
+        latencies = []
+        start = time.perf_counter()
+        for _ in range(n_messages):
+            t0 = time.perf_counter()
+            await manager.broadcast_to_room("bench", payload)
+            latencies.append(time.perf_counter() - t0)
+        await wait_delivered(sockets, n_messages)
+        report[label] = {**summarize(latencies), "delivered_all_ms": ms(time.perf_counter() - start),
+                         "bytes_per_message": sockets[0].bytes_received // max(1, n_messages)}
+        for ws in extra:
+            manager.disconnect(ws)
+
+    start = time.perf_counter()
+    for ws in sockets:
+        manager.disconnect(ws)
+    report["disconnect_all_ms"] = ms(time.perf_counter() - start)
+    return report
+
+
+async def bench_legacy(n_sockets: int, n_messages: int, slow_delay: float, payload: Dict[str, Any]) -> Dict[str, Any]:
+    fanout = LegacyFanout()
+    sockets = [BenchSocket(i) for i in range(n_sockets)]
+    start = time.perf_counter()
+    for ws in sockets:
+        fanout.join(ws)
+    report = {"join_all_ms": ms(time.perf_counter() - start)}
+    for label, extra in (("all_fast", []), ("one_stalled", [BenchSocket(-1, delay=slow_delay)])):
+        for ws in extra:
+            fanout.join(ws)
+        latencies = []
+        start = time.perf_counter()
+        # Stalled run is capped: every broadcast waits for the slow socket
+        for _ in range(n_messages if not extra else min(n_messages, 5)):
+            t0 = time.perf_counter()
+            await fanout.broadcast(payload)
+            latencies.append(time.perf_counter() - t0)
+        report[label] = {**summarize(latencies), "delivered_all_ms": ms(time.perf_counter() - start),
+                         "messages": len(latencies)}
+        for ws in extra:
+            fanout.leave(ws)
+    start = time.perf_counter()
+    for ws in sockets:
+        fanout.leave(ws)
+    report["disconnect_all_ms"] = ms(time.perf_counter() - start)
+    return report
+
+
+async def main(args):
+    payload = consult_payload(args.payload_kb) if args.payload_kb else PAYLOAD
+    result = {
+        "sockets": args.sockets,
+        "messages": args.messages,
+        "stalled_send_seconds": args.slow_delay,
+        "json_payload_bytes": len(json.dumps(payload)),
+        "queued_fanout": await bench_manager(args.sockets, args.messages, args.slow_delay, payload, args.encoding),
+        "legacy_gather": await bench_legacy(args.sockets, args.messages, args.slow_delay, payload),
+    }
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark WebSocket room fan-out.")
+    parser.add_argument("--sockets", type=int, default=1000, help="Sockets in the room.")
+    parser.add_argument("--messages", type=int, default=200, help="Broadcasts per run.")
+    parser.add_argument("--slow-delay", type=float, default=0.2, help="Per-send delay of the stalled client (seconds).")
+    parser.add_argument("--encoding", default="json", choices=ws_codec.available_encodings(), help="Wire encoding of every socket.")
+    parser.add_argument("--payload-kb", type=int, default=0, help="Use a consult-sized payload of about this many KiB.")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,189 @@
+"""
+Throughput benchmark for the agent pipeline using the offline LLM provider.
+
+Runs orchestrator prompts, trial searches and eligibility deep dives
+concurrently against LocalLLMProvider (no quota, no network) and reports
+throughput, latency percentiles and LLM gateway metrics.
+
+Assessments are cached in a throwaway SQLite file (removed on exit) unless
+ASSESSMENT_CACHE_PATH is set, and patient ids are unique per run, so repeated
+runs neither hit nor pollute backend/db/assessments.db.
+
+Usage (from the project root):
+    python -m backend.scripts.benchmark_pipeline --requests 50 --concurrency 10
+    LOCAL_LLM_LATENCY_MS=800 LOCAL_LLM_ERROR_RATE=0.05 python -m backend.scripts.benchmark_pipeline --stages trial_search
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import shutil
+import sqlite3
+import statistics
+import tempfile
+import time
+import uuid
+from typing import Any, Awaitable, Callable, Dict, List
+
+# Must be set before the agents/gateway are imported
+os.environ.setdefault("LLM_PROVIDER", "local")
+_CACHE_DIR = None
+if "ASSESSMENT_CACHE_PATH" not in os.environ:
+    _CACHE_DIR = tempfile.mkdtemp(prefix="bench_assessments_")
+    os.environ["ASSESSMENT_CACHE_PATH"] = os.path.join(_CACHE_DIR, "assessments.db")
+
+from backend.core.llm_gateway import llm_gateway
+
+SQLITE_DB_PATH = "backend/db/trials.db"
+STAGES = ("orchestrator", "trial_search", "deep_dive")
+RUN_ID = uuid.uuid4().hex[:8]  # Keeps patient ids unique across runs sharing a cache
+
+SAMPLE_PROMPTS = [
+    "Summarize the latest labs",
+    "Find recruiting trials for HER2 positive breast cancer",
+    "What was the last hemoglobin value?",
+    "How do I manage nausea from chemo?",
+    "Notify Dr. Baker about the elevated creatinine",
+]
+SAMPLE_QUERIES = [
+    "metastatic breast cancer HER2 positive",
+    "non-small cell lung cancer EGFR mutation",
+    "ovarian cancer BRCA1 PARP inhibitor",
+    "triple negative breast cancer immunotherapy",
+]
+
+
+def make_patient(index: int) -> Dict[str, Any]:
+    """ Synthetic patient; the id is unique per run so assessments never hit a cache from an earlier run. """
+    return {
+        "patientId": patient_id(index),
+        "demographics": {"name": f"Bench Patient {index}", "dob": "1965-03-15", "sex": "Female"},
+        "diagnosis": {"primary": "Invasive Ductal Carcinoma, Stage III", "status": "On treatment"},
+        "recentLabs": [{"panel": "CBC", "components": [
+            {"test": "Hemoglobin", "value": 10.5 + (index % 5) * 0.3, "unit": "g/dL"},
+            {"test": "Platelets", "value": 140 + index % 50, "unit": "K/uL"},
+        ]}],
+        "currentMedications": [{"name": "Letrozole", "dosage": "2.5mg"}],
+        "notes": [{"text": "Patient ambulatory, ECOG 1."}],
+    }
+
+
+def patient_id(index: int) -> str:
+    return f"BENCH{RUN_ID}{index:05d}"
+
+
+def load_trials(limit: int = 10) -> List[Dict[str, Any]]:
+    try:
+        conn = sqlite3.connect(SQLITE_DB_PATH)
+        conn.row_factory = sqlite3.Row
+        rows = conn.execute("SELECT * FROM clinical_trials LIMIT ?", (limit,)).fetchall()
+        conn.close()
+        return [dict(r) for r in rows]
+    except sqlite3.Error as e:
+        logging.error(f"Could not load trials from {SQLITE_DB_PATH}: {e}")
+        return []
+
+
+def criteria_from_trial(trial: Dict[str, Any], limit: int = 4) -> List[Dict[str, Any]]:
+    lines = [l.strip("*-• \t") for l in (trial.get("inclusion_criteria_text") or "").splitlines()]
+    return [{"criterion": l, "reasoning": "Not documented in patient record."} for l in lines if len(l) > 10][:limit]
+
+
+async def run_load(name: str, make_call: Callable[[int], Awaitable[Any]], requests: int, concurrency: int) -> Dict[str, Any]:
+    """ Runs `requests` calls with at most `concurrency` in flight; returns latency stats. """
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies: List[float] = []
+    errors = 0
+
+    async def one(i: int):
+        nonlocal errors
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                result = await make_call(i)
+                if isinstance(result, dict) and result.get("status") in ("error", "failure"):
+                    errors += 1
+            except Exception as e:
+                logging.debug(f"[{name}] request {i} failed: {e}")
+                errors += 1
+            latencies.append(time.perf_counter() - start)
+
+    wall_start = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(requests)))
+    wall = time.perf_counter() - wall_start
+    latencies.sort()
+    return {
+        "stage": name,
+        "requests": requests,
+        "concurrency": concurrency,
+        "errors": errors,
+        "wall_seconds": round(wall, 3),
+        "throughput_rps": round(requests / wall, 2) if wall else None,
+        "p50_ms": round(statistics.median(latencies) * 1000, 1) if latencies else None,
+        "p95_ms": round(latencies[max(0, int(len(latencies) * 0.95) - 1)] * 1000, 1) if latencies else None,
+        "max_ms": round(latencies[-1] * 1000, 1) if latencies else None,
+    }
+
+
+async def main(args):
+    # Gateway limiters are created lazily, so overriding the limits here applies to every stage
+    if args.llm_rpm is not None:
+        llm_gateway.rate_limit_rpm = args.llm_rpm
+    if args.llm_concurrency is not None:
+        llm_gateway.max_concurrency = args.llm_concurrency
+    logging.info(f"LLM provider: {llm_gateway.provider.name}")
+    stages = [s.strip() for s in args.stages.split(",") if s.strip()]
+    reports = []
+
+    if "orchestrator" in stages:
+        from backend.core.orchestrator import AgentOrchestrator
+        orchestrator = AgentOrchestrator()
+
+        async def call(i):
+            return await orchestrator.handle_prompt(SAMPLE_PROMPTS[i % len(SAMPLE_PROMPTS)], patient_id(i), make_patient(i))
+        reports.append(await run_load("orchestrator", call, args.requests, args.concurrency))
+
+    if "trial_search" in stages:
+        from backend.agents.clinical_trial_agent import ClinicalTrialAgent
+        trial_agent = ClinicalTrialAgent()
+
+        async def call(i):
+            return await trial_agent.run({"patient_data": make_patient(i)}, prompt=SAMPLE_QUERIES[i % len(SAMPLE_QUERIES)])
+        reports.append(await run_load("trial_search", call, args.requests, args.concurrency))
+
+    if "deep_dive" in stages:
+        from backend.agents.eligibility_deep_dive_agent import EligibilityDeepDiveAgent
+        deep_dive_agent = EligibilityDeepDiveAgent()
+        trials = load_trials()
+        if not trials:
+            logging.warning("No trials available in SQLite; skipping deep_dive stage.")
+        else:
+            async def call(i):
+                trial = trials[i % len(trials)]
+                return await deep_dive_agent.run(
+                    unmet_criteria=[], unclear_criteria=criteria_from_trial(trial),
+                    patient_data=make_patient(i), trial_data=trial,
+                )
+            reports.append(await run_load("deep_dive", call, args.requests, args.concurrency))
+
+    print(json.dumps({"stages": reports, "llm_gateway": llm_gateway.metrics()}, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the agent pipeline against the offline LLM provider.")
+    parser.add_argument("--requests", type=int, default=20, help="Requests per stage.")
+    parser.add_argument("--concurrency", type=int, default=5, help="Max in-flight requests per stage.")
+    parser.add_argument("--stages", default=",".join(STAGES), help=f"Comma-separated subset of: {', '.join(STAGES)}")
+    parser.add_argument("--llm-rpm", type=float, default=None, help="Override the gateway rate limit (requests/minute, 0 = unlimited).")
+    parser.add_argument("--llm-concurrency", type=int, default=None, help="Override the gateway per-model concurrency.")
+    parser.add_argument("--verbose", action="store_true")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.WARNING,
+                        format='%(asctime)s - %(levelname)s - %(message)s')
+    try:
+        asyncio.run(main(args))
+    finally:
+        if _CACHE_DIR:
+            shutil.rmtree(_CACHE_DIR, ignore_errors=True)
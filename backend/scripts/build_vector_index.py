@@ -0,0 +1,161 @@
+"""
+Builds the in-process vector index from the Chroma collections and benchmarks it.
+
+`build` exports each collection (ids, embeddings, metadata, documents) into
+backend/db/vector_index/<collection>/ (see backend/core/vector_index.py).
+Set TRIAL_VECTOR_BACKEND=local to make ClinicalTrialAgent search it instead of
+ChromaDB.
+
+`benchmark` compares both backends on the trial corpus: cold start (open +
+first query), per-query latency percentiles with and without the agent's
+nct_id filter, and recall@k of each backend against exact search.
+
+Usage (from the project root):
+    python -m backend.scripts.build_vector_index build
+    python -m backend.scripts.build_vector_index benchmark --queries 200 --k 10
+"""
+
+import argparse
+import json
+import logging
+import random
+import statistics
+import time
+from typing import Any, Callable, Dict, List, Sequence
+
+import numpy as np
+
+from backend.core.retrieval import CRITERIA_COLLECTION_NAME
+from backend.core.vector_index import (
+    DEFAULT_CHROMA_PATH, DEFAULT_INDEX_DIR, DEFAULT_TRIALS_DB_PATH, VECTOR_BACKEND_CHROMA, VECTOR_BACKEND_LOCAL, LocalVectorIndex,
+    export_collection, open_vector_collection,
+)
+
+CHROMA_COLLECTION_NAME = "clinical_trials_eligibility"
+COLLECTIONS = (CHROMA_COLLECTION_NAME, CRITERIA_COLLECTION_NAME)
+EMBEDDING_MODEL = 'all-MiniLM-L6-v2'
+SAMPLE_QUERIES = [
+    "metastatic breast cancer HER2 positive",
+    "non-small cell lung cancer EGFR mutation",
+    "ovarian cancer BRCA1 PARP inhibitor",
+    "triple negative breast cancer immunotherapy",
+    "PIK3CA mutation hormone receptor positive",
+    "prior platinum chemotherapy allowed",
+]
+
+
+def build(args) -> None:
+    for name in args.collections:
+        collection = open_vector_collection(name, VECTOR_BACKEND_CHROMA, chroma_path=args.chroma_path)
+        if collection is None:
+            logging.warning(f"Chroma collection '{name}' not found at {args.chroma_path}; skipping.")
+            continue
+        start = time.perf_counter()
+        index = export_collection(collection, name, args.index_dir, ann_backend=args.ann, trials_db_path=args.trials_db)
+        print(json.dumps({**index.stats(), "seconds": round(time.perf_counter() - start, 2)}))
+
+
+def query_embeddings(index: LocalVectorIndex, n_queries: int, seed: int) -> np.ndarray:
+    """ Sample queries encoded with the retrieval model, topped up with stored chunk embeddings. """
+    texts = list(SAMPLE_QUERIES)
+    vectors: List[Any] = []
+    try:
+        from sentence_transformers import SentenceTransformer
+        vectors.extend(SentenceTransformer(EMBEDDING_MODEL).encode(texts[:n_queries]))
+    except ImportError:
+        logging.warning("sentence-transformers not installed; using stored embeddings as queries only.")
+    rng = random.Random(seed)
+    rows = rng.sample(range(index.count()), min(index.count(), max(0, n_queries - len(vectors))))
+    vectors.extend(np.asarray(index.embeddings[r]) for r in rows)
+    return np.asarray(vectors, dtype=np.float32)
+
+
+def time_queries(search: Callable[[np.ndarray], Sequence[str]], queries: np.ndarray):
+    latencies, results = [], []
+    for vector in queries:
+        start = time.perf_counter()
+        results.append(list(search(vector)))
+        latencies.append(time.perf_counter() - start)
+    latencies.sort()
+    return results, {
+        "p50_ms": round(statistics.median(latencies) * 1000, 3),
+        "p95_ms": round(latencies[max(0, int(len(latencies) * 0.95) - 1)] * 1000, 3),
+        "mean_ms": round(statistics.fmean(latencies) * 1000, 3),
+    }
+
+
+def recall(results: Sequence[Sequence[str]], truth: Sequence[Sequence[str]]) -> float:
+    hits = sum(len(set(r) & set(t)) for r, t in zip(results, truth))
+    total = sum(len(t) for t in truth)
+    return round(hits / total, 4) if total else 1.0
+
+
+def benchmark_collection(name: str, args) -> Dict[str, Any]:
+    start = time.perf_counter()
+    local = open_vector_collection(name, VECTOR_BACKEND_LOCAL, index_dir=args.index_dir)
+    if local is None:
+        return {"collection": name, "error": "local index not built"}
+    queries = query_embeddings(local, args.queries, args.seed)
+    local.query(query_embeddings=[queries[0]], n_results=args.k)
+    local_cold = time.perf_counter() - start
+
+    start = time.perf_counter()
+    chroma = open_vector_collection(name, VECTOR_BACKEND_CHROMA, chroma_path=args.chroma_path)
+    if chroma is None:
+        return {"collection": name, "error": "chroma collection not found"}
+    chroma.query(query_embeddings=[queries[0].tolist()], n_results=args.k)
+    chroma_cold = time.perf_counter() - start
+
+    # Filter like the agent does: a random subset of trials standing in for the open ones
+    nct_ids = sorted({m.get("nct_id") for m in local.metadatas if m.get("nct_id")})
+    allowed = random.Random(args.seed).sample(nct_ids, max(1, int(len(nct_ids) * args.filter_fraction))) if nct_ids else []
+    where = {"nct_id": {"$in": allowed}} if allowed else None
+
+    report = {
+        "collection": name,
+        "rows": local.count(),
+        "ann_backend": local.ann_backend,
+        "k": args.k,
+        "queries": len(queries),
+        "cold_start_ms": {"chroma": round(chroma_cold * 1000, 1), "local": round(local_cold * 1000, 1)},
+    }
+    for label, filt in (("unfiltered", None), ("filtered", where)):
+        def run(index, as_list=False):
+            return lambda v: index.query(query_embeddings=[v.tolist() if as_list else v], n_results=args.k,
+                                         where=filt, include=[])["ids"][0]
+        truth, _ = time_queries(lambda v: local.query(query_embeddings=[v], n_results=args.k, where=filt,
+                                                      include=[], exact=True)["ids"][0], queries)
+        chroma_ids, chroma_latency = time_queries(run(chroma, as_list=True), queries)
+        local_ids, local_latency = time_queries(run(local), queries)
+        report[label] = {
+            "chroma": {**chroma_latency, "recall_at_k": recall(chroma_ids, truth)},
+            "local": {**local_latency, "recall_at_k": recall(local_ids, truth)},
+            "overlap_at_k": recall(local_ids, chroma_ids),
+        }
+    return report
+
+
+def benchmark(args) -> None:
+    print(json.dumps([benchmark_collection(name, args) for name in args.collections], indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build / benchmark the in-process vector index.")
+    parser.add_argument("command", choices=("build", "benchmark"))
+    parser.add_argument("--collections", nargs="+", default=list(COLLECTIONS))
+    parser.add_argument("--chroma-path", default=DEFAULT_CHROMA_PATH)
+    parser.add_argument("--index-dir", default=DEFAULT_INDEX_DIR)
+    parser.add_argument("--trials-db", default=DEFAULT_TRIALS_DB_PATH, help="Ingestion hashes the export is stamped with.")
+    parser.add_argument("--ann", choices=("faiss", "hnswlib", "exact"), default=None, help="ANN graph (default: best installed).")
+    parser.add_argument("--queries", type=int, default=100, help="Benchmark queries per collection.")
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--filter-fraction", type=float, default=0.6, help="Share of trials allowed in the filtered run.")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--verbose", action="store_true")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.WARNING,
+                        format='%(asctime)s - %(levelname)s - %(message)s')
+    if args.command == "build":
+        build(args)
+    else:
+        benchmark(args)
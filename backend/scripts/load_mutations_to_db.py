@@ -1,9 +1,11 @@
 #!/usr/bin/env python3
 
+import argparse
 import sqlite3
 import json
 import os
 import sys
+import time
 
 # --- Get Project Root --- 
 # Assuming this script is in backend/scripts/
@@ -13,10 +15,18 @@ PROJECT_ROOT = os.path.dirname(BACKEND_DIR)
 if PROJECT_ROOT not in sys.path:
     sys.path.insert(0, PROJECT_ROOT)
 
+from backend.core.json_stream import iter_json_array
+
 # --- Configuration --- 
-INPUT_JSON_PATH = os.path.join(BACKEND_DIR, "data", "merged_mutation_clinical.json")
+# Raw cBioPortal dump (fetch_mutations.py). A legacy merged_mutation_clinical.json also works;
+# its embedded `clinical_data` copies are ignored.
+INPUT_JSON_PATH = os.path.join(BACKEND_DIR, "data", "brca_tcga_mutations.json")
+CLINICAL_JSON_PATH = os.path.join(BACKEND_DIR, "data", "brca_tcga_clinical_data.json")
 DB_PATH = os.path.join(BACKEND_DIR, "data", "patient_data.db")
 TABLE_NAME = "mutations"
+CLINICAL_TABLE_NAME = "clinical_patients"
+BATCH_SIZE = 50000  # Rows per executemany / transaction
+MUTATION_STORE_DIR = os.path.join(BACKEND_DIR, "data", "mutation_store")
 
 # Define the columns based on the desired schema and merged JSON keys
 # Use lowercase and underscores for column names (standard SQL practice)
@@ -59,25 +69,29 @@ INDEXED_COLUMNS = ["patient_id", "hugo_gene_symbol"]
 REQUIRED_JSON_FIELDS = ["patientId", "gene", "uniqueSampleKey"]
 
 def create_database_schema(conn):
-    """Creates the mutations table and necessary indexes."""
-    cursor = conn.cursor()
-    
-    # Build the CREATE TABLE statement dynamically
+    """Creates the mutations and clinical tables. Secondary indexes are created after the load."""
     column_defs = [f'"{col_name}" {col_type}' for col_name, col_type in COLUMN_TYPES.items()]
-    create_table_sql = f"CREATE TABLE IF NOT EXISTS \"{TABLE_NAME}\" ({ ', '.join(column_defs) });"
-    
-    print(f"Executing: {create_table_sql}")
-    cursor.execute(create_table_sql)
-    
-    # Create indexes
+    conn.execute(f"CREATE TABLE IF NOT EXISTS \"{TABLE_NAME}\" ({ ', '.join(column_defs) });")
+    # Clinical rows are stored once per patient and joined on patient_id, not copied into every mutation
+    conn.execute(
+        f"CREATE TABLE IF NOT EXISTS \"{CLINICAL_TABLE_NAME}\" "
+        "(patient_id TEXT PRIMARY KEY NOT NULL, clinical_json TEXT NOT NULL);"
+    )
+    conn.commit()
+    print(f"Tables '{TABLE_NAME}' and '{CLINICAL_TABLE_NAME}' ensured.")
+
+def drop_secondary_indexes(conn):
+    """Dropping the indexes during a bulk load and rebuilding once is much cheaper than per-row index updates."""
+    for col in INDEXED_COLUMNS:
+        conn.execute(f"DROP INDEX IF EXISTS \"idx_{TABLE_NAME}_{col}\";")
+    conn.commit()
+
+def create_secondary_indexes(conn):
     for col in INDEXED_COLUMNS:
         index_name = f"idx_{TABLE_NAME}_{col}"
-        create_index_sql = f"CREATE INDEX IF NOT EXISTS \"{index_name}\" ON \"{TABLE_NAME}\" (\"{col}\");"
-        print(f"Executing: {create_index_sql}")
-        cursor.execute(create_index_sql)
-    
+        conn.execute(f"CREATE INDEX IF NOT EXISTS \"{index_name}\" ON \"{TABLE_NAME}\" (\"{col}\");")
     conn.commit()
-    print(f"Table '{TABLE_NAME}' and indexes ensured.")
+    print(f"Indexes on {INDEXED_COLUMNS} created.")
 
 def process_record_for_batch(record, column_mapping, sql_columns, required_json_fields):
     """Processes a single JSON record into a tuple of values for SQL insertion, adding validation."""
@@ -85,10 +99,8 @@ def process_record_for_batch(record, column_mapping, sql_columns, required_json_
     for field in required_json_fields:
         if field == "gene": # Special check for the nested hugoGeneSymbol
             if not record.get("gene") or record.get("gene", {}).get("hugoGeneSymbol") is None:
-                # print(f"Skipping record missing required field 'gene.hugoGeneSymbol': Patient ID {record.get('patientId', 'N/A')}")
                 return None
         elif record.get(field) is None: 
-            # print(f"Skipping record missing required field '{field}': Patient ID {record.get('patientId', 'N/A')}")
             return None # Signal to skip this record
             
     values_dict = {}
@@ -103,120 +115,155 @@ def process_record_for_batch(record, column_mapping, sql_columns, required_json_
     ordered_values = [values_dict.get(col) for col in sql_columns]
     return tuple(ordered_values)
 
-def load_data_to_db(conn, data):
-    """Loads mutation data into the specified table using executemany for performance."""
+def _insert_batch(conn, insert_sql, batch):
+    """Inserts one batch in its own transaction; returns the number of new rows."""
+    before = conn.total_changes
+    with conn:
+        conn.executemany(insert_sql, batch)
+    return conn.total_changes - before
+
+def load_data_to_db(conn, records, batch_size=BATCH_SIZE):
+    """Streams mutation records into the table in large executemany transactions. Returns load stats."""
     sql_columns = list(COLUMN_TYPES.keys())
     sql_placeholders = ", ".join(["?"] * len(sql_columns))
     formatted_sql_columns = ", ".join([f'"{c}"' for c in sql_columns])
     insert_sql = f"INSERT OR IGNORE INTO \"{TABLE_NAME}\" ({formatted_sql_columns}) VALUES ({sql_placeholders});"
-    
-    batch_size = 1000
-    processed_records_for_batch = []
-    
-    total_json_records = len(data)
-    print(f"Preparing to insert {total_json_records} records in batches of {batch_size}...")
-    
-    records_processed_count = 0
-    newly_inserted_count = 0
-    skipped_due_to_missing_fields = 0
-    skipped_due_to_duplicate_pk = 0
-
-    for i, record in enumerate(data):
-        processed_values = process_record_for_batch(record, COLUMN_MAPPING, sql_columns, REQUIRED_JSON_FIELDS)
-        if processed_values:
-            processed_records_for_batch.append(processed_values)
+
+    stats = {"records": 0, "inserted": 0, "skipped_missing_fields": 0, "skipped_duplicates": 0}
+    batch = []
+    started = time.perf_counter()
+
+    def flush():
+        inserted = _insert_batch(conn, insert_sql, batch)
+        stats["inserted"] += inserted
+        stats["skipped_duplicates"] += len(batch) - inserted
+        elapsed = time.perf_counter() - started
+        print(f"  {stats['records']} records read, {stats['inserted']} inserted ({stats['records'] / max(elapsed, 1e-9):,.0f} rows/sec)")
+        batch.clear()
+
+    for record in records:
+        stats["records"] += 1
+        values = process_record_for_batch(record, COLUMN_MAPPING, sql_columns, REQUIRED_JSON_FIELDS)
+        if values is None:
+            stats["skipped_missing_fields"] += 1
+            continue
+        batch.append(values)
+        if len(batch) >= batch_size:
+            flush()
+    if batch:
+        flush()
+
+    stats["seconds"] = round(time.perf_counter() - started, 3)
+    stats["rows_per_sec"] = round(stats["records"] / max(stats["seconds"], 1e-9))
+    return stats
+
+def load_clinical_to_db(conn, records, batch_size=BATCH_SIZE):
+    """Stores each clinical row once, keyed by patient; returns the number of patients written."""
+    insert_sql = f"INSERT OR REPLACE INTO \"{CLINICAL_TABLE_NAME}\" (patient_id, clinical_json) VALUES (?, ?);"
+    written = 0
+    batch = []
+    for row in records:
+        patient_id = row.get("Patient ID")
+        if not patient_id:
+            continue
+        batch.append((patient_id, json.dumps(row)))
+        if len(batch) >= batch_size:
+            written += _insert_batch(conn, insert_sql, batch)
+            batch = []
+    if batch:
+        written += _insert_batch(conn, insert_sql, batch)
+    return written
+
+def configure_for_bulk_load(conn):
+    # WAL keeps API readers unblocked; NORMAL sync is safe with WAL and avoids an fsync per commit
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("PRAGMA temp_store=MEMORY")
+    conn.execute("PRAGMA cache_size=-262144")  # 256 MiB, helps the deferred index build
+
+def validate_first_record(record):
+    """Cheap schema sanity check on the first streamed record."""
+    expected_keys_subset = {"patientId", "uniqueSampleKey", "proteinChange", "gene"}
+    missing = expected_keys_subset - set(record.keys())
+    if missing:
+        raise ValueError(f"JSON schema mismatch. First record is missing expected keys: {missing}")
+    if not (record.get("gene") or {}).get("hugoGeneSymbol"):
+        raise ValueError("JSON schema mismatch. 'hugoGeneSymbol' is missing within the 'gene' object of the first record.")
+
+def validated_records(records):
+    first = True
+    for record in records:
+        if first:
+            validate_first_record(record)
+            first = False
+        yield record
+
+def build_mutation_store(db_path=DB_PATH):
+    """Builds the memory-mapped columnar store the API uses for cohort/range queries."""
+    from backend.core.mutation_store import MutationStore, reset_mutation_store
+    print(f"Building columnar mutation store at {MUTATION_STORE_DIR}...")
+    store = MutationStore.build_from_sqlite(db_path, MUTATION_STORE_DIR, table=TABLE_NAME)
+    # Same-process readers re-open now; a running API notices the swapped directory on its next request
+    reset_mutation_store()
+    print(f"  Mutation store stats: {store.stats()}")
+
+def run(mutations_path=INPUT_JSON_PATH, clinical_path=CLINICAL_JSON_PATH, db_path=DB_PATH,
+        batch_size=BATCH_SIZE, build_store=True):
+    """Streaming ingestion: clinical rows, then mutations, then indexes (and the columnar store)."""
+    print(f"Database path: {db_path}")
+    print(f"Input JSON path: {mutations_path}")
+    if not os.path.exists(mutations_path):
+        raise FileNotFoundError(f"Input JSON file not found at {mutations_path}")
+
+    conn = sqlite3.connect(db_path)
+    try:
+        configure_for_bulk_load(conn)
+        create_database_schema(conn)
+
+        if clinical_path and os.path.exists(clinical_path):
+            written = load_clinical_to_db(conn, iter_json_array(clinical_path), batch_size)
+            print(f"Stored clinical data for {written} patients from {clinical_path}")
         else:
-            skipped_due_to_missing_fields += 1
-            
-        if len(processed_records_for_batch) == batch_size or (i == total_json_records - 1 and processed_records_for_batch):
-            try:
-                with conn:
-                    cursor = conn.cursor()
-                    cursor.executemany(insert_sql, processed_records_for_batch)
-                    if cursor.rowcount != -1:
-                        newly_inserted_count += cursor.rowcount
-                        skipped_due_to_duplicate_pk += (len(processed_records_for_batch) - cursor.rowcount)
-                    else:
-                        skipped_due_to_duplicate_pk += len(processed_records_for_batch)
-
-                    records_processed_count += len(processed_records_for_batch)
-                    print(f"  Processed batch ending at record {i+1}/{total_json_records}. Cumulative new inserts: {newly_inserted_count}")
-            except sqlite3.Error as e:
-                print(f"Error during batch insert (records {i-len(processed_records_for_batch)+1} to {i+1}): {e}")
-            finally:
-                processed_records_for_batch = []
-            
-    print("\nInsertion attempt complete.")
-    print(f"  Total JSON records processed: {total_json_records}")
-    print(f"  Records processed for DB insertion: {records_processed_count}")
-    print(f"  Newly inserted records: {newly_inserted_count}")
-    print(f"  Skipped due to missing required fields: {skipped_due_to_missing_fields}")
-    print(f"  Skipped (likely due to existing PK or other IGNORE condition): {skipped_due_to_duplicate_pk}") 
+            print(f"Clinical JSON not found at {clinical_path}; skipping clinical table.")
+
+        drop_secondary_indexes(conn)
+        try:
+            stats = load_data_to_db(conn, validated_records(iter_json_array(mutations_path)), batch_size)
+        finally:
+            create_secondary_indexes(conn)
+
+        print("\nInsertion complete.")
+        print(f"  Total JSON records read: {stats['records']}")
+        print(f"  Newly inserted records: {stats['inserted']}")
+        print(f"  Skipped due to missing required fields: {stats['skipped_missing_fields']}")
+        print(f"  Skipped (existing PK or other IGNORE condition): {stats['skipped_duplicates']}")
+        print(f"  Throughput: {stats['rows_per_sec']:,} rows/sec over {stats['seconds']}s")
+    finally:
+        conn.close()
+        print("Database connection closed.")
+
+    if build_store:
+        # Rebuild the columnar store from the table (not the JSON) so it matches the deduplicated rows
+        build_mutation_store(db_path)
+    return stats
 
 def main():
-    print(f"Database path: {DB_PATH}")
-    print(f"Input JSON path: {INPUT_JSON_PATH}")
-    
-    # Check if input file exists
-    if not os.path.exists(INPUT_JSON_PATH):
-        print(f"Error: Input JSON file not found at {INPUT_JSON_PATH}")
-        sys.exit(1)
-    
-    # Connect to SQLite database
-    conn = None
+    parser = argparse.ArgumentParser(description="Stream cBioPortal mutations and clinical data into patient_data.db.")
+    parser.add_argument("--mutations", default=INPUT_JSON_PATH, help="Mutation JSON array (cBioPortal dump).")
+    parser.add_argument("--clinical", default=CLINICAL_JSON_PATH, help="Clinical JSON array keyed by 'Patient ID'.")
+    parser.add_argument("--db", default=DB_PATH, help="SQLite database to load into.")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE, help="Rows per executemany transaction.")
+    parser.add_argument("--no-store", action="store_true", help="Skip rebuilding the columnar mutation store.")
+    args = parser.parse_args()
+
     try:
-        conn = sqlite3.connect(DB_PATH)
-        print("Database connection established.")
-        
-        # Create schema
-        create_database_schema(conn)
-        
-        # Load JSON data
-        print(f"Loading JSON data from {INPUT_JSON_PATH}...")
-        with open(INPUT_JSON_PATH, 'r') as f:
-            mutation_data = json.load(f)
-        print(f"Loaded {len(mutation_data)} records from JSON.")
-        
-        # JSON Schema Sanity Check
-        if not mutation_data:
-            print("Error: Mutation data is empty. Nothing to load.")
-            sys.exit(1)
-        
-        # Check keys of the first record against a subset of expected keys
-        # For the sanity check, we verify top-level keys. `hugoGeneSymbol` is nested.
-        expected_keys_subset = {"patientId", "uniqueSampleKey", "proteinChange", "gene"}
-        first_record_keys = set(mutation_data[0].keys())
-        if not expected_keys_subset.issubset(first_record_keys):
-            print("Error: JSON schema mismatch. First record is missing expected keys.")
-            print(f"  Expected (subset): {expected_keys_subset}")
-            print(f"  Found in first record: {first_record_keys}")
-            missing = expected_keys_subset - first_record_keys
-            if missing:
-                print(f"  Missing critical keys: {missing}")
-            # Additionally, check for the nested hugoGeneSymbol in the first record for a more complete sanity check
-            if "gene" in first_record_keys and not mutation_data[0].get("gene", {}).get("hugoGeneSymbol"):
-                print("  Additionally, 'hugoGeneSymbol' is missing within the 'gene' object of the first record.")
-            sys.exit(1)
-        # Check the nested hugoGeneSymbol specifically if 'gene' is present
-        if "gene" in first_record_keys and not mutation_data[0].get("gene", {}).get("hugoGeneSymbol"):
-             print("Error: JSON schema sanity check failed. 'hugoGeneSymbol' is missing within the 'gene' object of the first record.")
-             sys.exit(1)
-
-        print("JSON schema sanity check passed.")
-
-        # Load data into DB
-        load_data_to_db(conn, mutation_data)
-        
-    except json.JSONDecodeError as e:
-        print(f"Error decoding JSON: {e}")
+        run(args.mutations, args.clinical, args.db, args.batch_size, build_store=not args.no_store)
+    except (FileNotFoundError, ValueError) as e:
+        print(f"Error: {e}")
+        sys.exit(1)
     except sqlite3.Error as e:
         print(f"Database error: {e}")
-    except Exception as e:
-        print(f"An unexpected error occurred: {e}")
-    finally:
-        if conn:
-            conn.close()
-            print("Database connection closed.")
+        sys.exit(1)
 
 if __name__ == "__main__":
-    main() 
\ No newline at end of file
+    main()
@@ -1,15 +1,34 @@
+import argparse
+import asyncio
 import os
 import json
 import re
-import pprint
 import sqlite3
 from dotenv import load_dotenv
-import chromadb
-from sentence_transformers import SentenceTransformer
 import logging
 from pathlib import Path
-import google.generativeai as genai
 import time
+import sys
+
+try:
+    import chromadb
+except ImportError:
+    chromadb = None
+try:
+    from sentence_transformers import SentenceTransformer
+except ImportError:
+    SentenceTransformer = None
+
+# Make `backend.*` importable when run as `python backend/scripts/load_trials_local.py`
+PROJECT_ROOT = str(Path(__file__).resolve().parent.parent.parent)
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+from backend.core.assessment_store import content_hash
+from backend.core.criteria_index import DEFAULT_INDEX_DB_PATH, CriteriaIndex
+from backend.core.json_stream import iter_json_array
+from backend.core.llm_gateway import llm_gateway
+from backend.core.retrieval import CRITERIA_COLLECTION_NAME, LexicalIndex, upsert_trial_chunks
+from backend.core.vector_index import export_collection, local_index_is_stale
 
 # --- Configuration ---
 # Force DEBUG level logging to see detailed parsing output
@@ -24,9 +43,19 @@ SOURCE_JSON_PATH = "backend/documents.json"
 EMBEDDING_MODEL = 'all-MiniLM-L6-v2'
 VECTOR_DIMENSION = 384
 
+# --- Incremental Ingestion Configuration ---
+CHUNK_SIZE = 256             # Trials parsed, embedded and written per transaction
+EMBEDDING_BATCH_SIZE = 64    # Batch size passed to model.encode
+CHROMA_BATCH_SIZE = 256
+SUMMARY_WORKERS = int(os.getenv("TRIAL_SUMMARY_WORKERS", "8"))
+
 # --- LLM Configuration for Summarization ---
-GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
+# Calls go through llm_gateway, which handles rate limiting, retries and backoff
 LLM_MODEL_NAME = "gemini-1.5-flash"
+SUMMARY_SKIPPED_NO_LLM = "AI summary skipped: LLM client not initialized."
+SUMMARY_SKIPPED_MISSING_TEXT = "AI summary skipped: Missing description/objectives."
+SUMMARY_FAILED = "AI summary generation failed."
+NO_SUMMARY_INPUT = "no-input"  # summary_hash for trials without description/objectives: nothing left to summarize
 
 # --- Trial Summary Prompt Template (Copied from Agent) ---
 TRIAL_SUMMARY_PROMPT_TEMPLATE = """
@@ -182,14 +211,31 @@ def parse_markdown_content(markdown):
     logging.debug("--- Parsing Markdown End ---") # Add debug end
     return data
 
+TRIAL_COLUMNS = (
+    "source_url", "nct_id", "primary_id", "title", "status", "phase",
+    "description_text", "inclusion_criteria_text", "exclusion_criteria_text",
+    "objectives_text", "eligibility_text", "raw_markdown", "metadata_json", "ai_summary",
+    "content_hash", "summary_hash", "vector_hash", "criteria_hash",
+)
+# Columns added after the original schema: name -> definition
+ADDED_COLUMNS = {
+    "ai_summary": "TEXT DEFAULT NULL",     # Precomputed summary
+    "content_hash": "TEXT DEFAULT NULL",   # Hash of markdown + metadata; unchanged trials are skipped
+    "summary_hash": "TEXT DEFAULT NULL",   # Hash of the summary prompt behind ai_summary; NULL = summary still owed
+    # content_hash the Chroma sinks were last written for; they lag behind after a failed upsert or --no-vector
+    "vector_hash": "TEXT DEFAULT NULL",    # Trial-level eligibility embedding
+    "criteria_hash": "TEXT DEFAULT NULL",  # Criterion-level embeddings
+}
+# Chroma sinks: hash column -> ingest() argument that enables it
+VECTOR_SINKS = {"vector_hash": "collection", "criteria_hash": "criteria_collection"}
+
 def initialize_sqlite(db_path):
-    """Connects to SQLite DB and creates table if not exists."""
+    """Connects to SQLite DB and creates/migrates the clinical_trials table."""
     logging.info(f"Initializing SQLite database at {db_path}...")
     try:
         conn = sqlite3.connect(db_path)
-        cursor = conn.cursor()
-        # Add ai_summary column
-        create_table_sql = """
+        conn.row_factory = sqlite3.Row
+        conn.execute("""
         CREATE TABLE IF NOT EXISTS clinical_trials (
             source_url TEXT PRIMARY KEY,
             nct_id TEXT,
@@ -203,38 +249,30 @@ def initialize_sqlite(db_path):
             objectives_text TEXT,
             eligibility_text TEXT,
             raw_markdown TEXT,
-            metadata_json TEXT,
-            ai_summary TEXT DEFAULT NULL  -- Add new column for precomputed summary
+            metadata_json TEXT
         );
-        """
-        cursor.execute(create_table_sql)
-        # Attempt to add column if table already exists (idempotent)
-        try:
-            cursor.execute("ALTER TABLE clinical_trials ADD COLUMN ai_summary TEXT DEFAULT NULL;")
-            logging.info("Added 'ai_summary' column to existing table.")
-        except sqlite3.OperationalError as alter_err:
-            # Ignore error if column already exists
-            if "duplicate column name" in str(alter_err).lower():
-                logging.info("'ai_summary' column already exists.")
-            else:
-                raise # Re-raise unexpected alter table errors
-
-        # Create indices
-        cursor.execute("CREATE INDEX IF NOT EXISTS idx_status ON clinical_trials (status);")
-        cursor.execute("CREATE INDEX IF NOT EXISTS idx_phase ON clinical_trials (phase);")
-        cursor.execute("CREATE INDEX IF NOT EXISTS idx_nct_id ON clinical_trials (nct_id);")
+        """)
+        existing = {row["name"] for row in conn.execute("PRAGMA table_info(clinical_trials)")}
+        for column, definition in ADDED_COLUMNS.items():
+            if column not in existing:
+                conn.execute(f"ALTER TABLE clinical_trials ADD COLUMN {column} {definition};")
+                logging.info(f"Added '{column}' column to clinical_trials.")
+
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_status ON clinical_trials (status);")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_phase ON clinical_trials (phase);")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_nct_id ON clinical_trials (nct_id);")
         conn.commit()
         logging.info("SQLite database and table initialized/updated successfully.")
         return conn
     except sqlite3.Error as e:
         logging.error(f"SQLite error during initialization/update: {e}")
         return None
-    except Exception as e:
-        logging.error(f"Unexpected error initializing/updating SQLite: {e}")
-        return None
 
 def initialize_chromadb(path, collection_name):
     """Initializes ChromaDB client and gets/creates a collection."""
+    if chromadb is None:
+        logging.error("chromadb is not installed; run with --no-vector to skip embeddings.")
+        return None
     logging.info(f"Initializing ChromaDB at {path} for collection '{collection_name}'...")
     try:
         client = chromadb.PersistentClient(path=path)
@@ -248,209 +286,314 @@ def initialize_chromadb(path, collection_name):
         logging.error(f"Failed to initialize ChromaDB: {e}", exc_info=True)
         return None
 
-# --- Main Execution ---
-if __name__ == "__main__":
-    logging.info("--- Starting Clinical Trial Local Loading Script --- (with AI Summary Pre-computation)")
-
-    # Initialize LLM Client
-    llm_client = None
-    if GOOGLE_API_KEY:
-        try:
-            logging.info("Configuring Google Generative AI for summarization...")
-            genai.configure(api_key=GOOGLE_API_KEY)
-            llm_client = genai.GenerativeModel(LLM_MODEL_NAME)
-            logging.info("Google Generative AI client initialized successfully.")
-        except Exception as e:
-            logging.error(f"Failed to initialize Google Generative AI client: {e}. AI summaries will be skipped.")
-    else:
-        logging.warning("GOOGLE_API_KEY not found. AI summaries will be skipped.")
+# --- Incremental Ingestion ---
 
-    # 1. Initialize SQLite (now includes ai_summary column)
-    sql_conn = initialize_sqlite(SQLITE_DB_PATH)
-    if not sql_conn:
-        exit(1)
-    sql_cursor = sql_conn.cursor()
+def trial_content_hash(trial):
+    """Hash of everything a trial row is derived from (markdown + source metadata)."""
+    return content_hash({"markdown": trial.get("markdown", ""), "metadata": trial.get("metadata", {})})
 
-    # 2. Initialize ChromaDB
-    chroma_collection = initialize_chromadb(CHROMA_DB_PATH, CHROMA_COLLECTION_NAME)
-    if not chroma_collection:
-        sql_conn.close()
-        exit(1)
-
-    # 3. Load Source JSON
-    logging.info(f"Loading source JSON file: {SOURCE_JSON_PATH}")
-    try:
-        with open(SOURCE_JSON_PATH, 'r') as f:
-            trials_data = json.load(f)
-        logging.info(f"Successfully loaded {len(trials_data)} trials from JSON.")
-    except Exception as e:
-        logging.error(f"Error loading JSON file {SOURCE_JSON_PATH}: {e}")
-        sql_conn.close()
-        exit(1)
+def summary_prompt(parsed_data):
+    """Summary prompt for a parsed trial, or None when description/objectives are missing."""
+    if not (parsed_data.get("description_text") and parsed_data.get("objectives_text")):
+        return None
+    return TRIAL_SUMMARY_PROMPT_TEMPLATE.format(
+        description=parsed_data["description_text"],
+        objectives=parsed_data["objectives_text"],
+    )
+
+def load_existing_state(conn):
+    """{source_url: {content_hash, summary_hash, ai_summary, vector_hash, criteria_hash}} for every stored trial."""
+    rows = conn.execute(
+        "SELECT source_url, content_hash, summary_hash, ai_summary, vector_hash, criteria_hash FROM clinical_trials"
+    ).fetchall()
+    return {row["source_url"]: dict(row) for row in rows}
+
+def select_changed_trials(trials, existing, llm_available, stats, vector_sinks=()):
+    """
+    Yields (trial, content_hash) for trials that need (re)processing: new or edited markdown, an
+    unchanged trial whose summary is still missing now that an LLM is available, or one that an
+    enabled Chroma sink (`vector_sinks`: hash column names) has not been written for yet.
+    """
+    for trial in trials:
+        stats["seen"] += 1
+        source_url = (trial.get("metadata") or {}).get("sourceURL")
+        if not source_url:
+            logging.warning(f"Skipping trial {stats['seen']} due to missing 'sourceURL' in metadata.")
+            stats["errors"] += 1
+            continue
+        digest = trial_content_hash(trial)
+        row = existing.get(source_url)
+        if (row and row["content_hash"] == digest and (row["summary_hash"] or not llm_available)
+                and all(row[sink] == digest for sink in vector_sinks)):
+            stats["unchanged"] += 1
+            continue
+        yield trial, digest
+
+def _chunks(iterable, size):
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+async def summarize_trials(prepared, existing, llm_available, workers):
+    """
+    Fills `ai_summary` / `summary_hash` for a chunk of prepared trials using a bounded pool of
+    concurrent gateway calls. Summaries whose prompt did not change are reused.
+    """
+    queue = asyncio.Queue()
+    for item in prepared:
+        prompt = summary_prompt(item["parsed"])
+        previous = existing.get(item["source_url"]) or {}
+        if prompt is None:
+            item["ai_summary"], item["summary_hash"] = SUMMARY_SKIPPED_MISSING_TEXT, NO_SUMMARY_INPUT
+            continue
+        prompt_hash = content_hash(prompt)
+        if previous.get("summary_hash") == prompt_hash:
+            item["ai_summary"], item["summary_hash"] = previous["ai_summary"], prompt_hash
+            continue
+        if not llm_available:
+            item["ai_summary"], item["summary_hash"] = SUMMARY_SKIPPED_NO_LLM, None
+            continue
+        queue.put_nowait((item, prompt, prompt_hash))
+
+    async def worker():
+        while True:
+            try:
+                item, prompt, prompt_hash = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            try:
+                text = await llm_gateway.generate(prompt, model_name=LLM_MODEL_NAME, caller="trial_ingestion")
+                item["ai_summary"], item["summary_hash"] = text.strip(), prompt_hash
+            except Exception as e:
+                logging.error(f"  Failed to generate AI summary for {item['source_url']}: {e}")
+                item["ai_summary"], item["summary_hash"] = SUMMARY_FAILED, None
+
+    pending = queue.qsize()
+    if pending:
+        await asyncio.gather(*(worker() for _ in range(min(max(1, workers), pending))))
+    return pending
+
+def prepare_trial(trial, digest):
+    """Parses one trial into the values written to SQLite/Chroma."""
+    metadata = trial.get("metadata", {})
+    markdown = trial.get("markdown", "")
+    parsed_data = parse_markdown_content(markdown)
+    return {
+        "source_url": metadata.get("sourceURL"),
+        "parsed": parsed_data,
+        "title": parsed_data.get('title_from_markdown') or metadata.get('title', 'Title Not Found'),
+        "markdown": markdown,
+        "metadata": metadata,
+        "content_hash": digest,
+    }
+
+def write_sqlite_chunk(conn, prepared):
+    """Upserts a chunk of trials in one transaction, with the per-sink hashes the chunk ended up with."""
+    placeholders = ", ".join("?" * len(TRIAL_COLUMNS))
+    sql = f"INSERT OR REPLACE INTO clinical_trials ({', '.join(TRIAL_COLUMNS)}) VALUES ({placeholders})"
+    rows = []
+    for item in prepared:
+        parsed = item["parsed"]
+        rows.append((
+            item["source_url"], parsed.get('nct_id'), parsed.get('primary_id'), item["title"],
+            parsed.get('status'), parsed.get('phase'), parsed.get('description_text'),
+            parsed.get('inclusion_criteria_text'), parsed.get('exclusion_criteria_text'),
+            parsed.get('objectives_text'), parsed.get('eligibility_text'), item["markdown"],
+            json.dumps(item["metadata"]), item["ai_summary"], item["content_hash"], item["summary_hash"],
+            item["vector_hash"], item["criteria_hash"],
+        ))
+    with conn:
+        conn.executemany(sql, rows)
+
+def write_vector_chunk(collection, model, prepared):
+    """Batch-encodes eligibility text for a chunk and upserts it to Chroma. Returns the number upserted."""
+    items = [item for item in prepared if item["parsed"].get("eligibility_text")]
+    if not items:
+        return 0
+    documents = [item["parsed"]["eligibility_text"] for item in items]
+    embeddings = model.encode(documents, batch_size=EMBEDDING_BATCH_SIZE, show_progress_bar=False)
+    for start in range(0, len(items), CHROMA_BATCH_SIZE):
+        batch = items[start:start + CHROMA_BATCH_SIZE]
+        collection.upsert(
+            ids=[item["source_url"] for item in batch],
+            embeddings=[list(map(float, e)) for e in embeddings[start:start + CHROMA_BATCH_SIZE]],
+            documents=documents[start:start + CHROMA_BATCH_SIZE],
+            metadatas=[{
+                "nct_id": item["parsed"].get("nct_id"),
+                "source_url": item["source_url"],
+                "title": item["title"],
+                "status": item["parsed"].get("status"),
+            } for item in batch],
+        )
+    return len(items)
+
+def write_criteria_chunk(collection, model, prepared):
+    """Replaces the criterion-level embeddings (one per criterion + title) for a chunk of trials."""
+    return upsert_trial_chunks(collection, model, [{
+        "nct_id": item["parsed"].get("nct_id"),
+        "title": item["title"],
+        "status": item["parsed"].get("status"),
+        "source_url": item["source_url"],
+        "inclusion_criteria_text": item["parsed"].get("inclusion_criteria_text"),
+        "exclusion_criteria_text": item["parsed"].get("exclusion_criteria_text"),
+    } for item in prepared], batch_size=CHROMA_BATCH_SIZE, encode_batch_size=EMBEDDING_BATCH_SIZE)
+
+def _mark_written(prepared, column):
+    for item in prepared:
+        item[column] = item["content_hash"]
+
+async def ingest(trials, conn, collection=None, model=None, criteria_index=None,
+                 chunk_size=CHUNK_SIZE, summary_workers=SUMMARY_WORKERS, use_llm=True,
+                 criteria_collection=None, lexical_index=None):
+    """
+    Incrementally loads `trials` (an iterable of {"metadata", "markdown"} documents).
+
+    Unchanged trials (same content hash, and already written to every enabled Chroma sink) are
+    skipped. Changed ones are processed in chunks: parse, AI summaries through a concurrent worker
+    pool, criteria re-atomization and FTS5 re-indexing, one batched embedding call + Chroma upsert
+    (trial-level and, when given, criterion-level), and finally one SQLite transaction. A sink's
+    hash column only advances when its upsert succeeded, so failed or skipped sinks are retried
+    on the next run.
+    """
+    llm_available = use_llm and llm_gateway.available
+    if use_llm and not llm_available:
+        logging.warning(f"{llm_gateway.unavailable_reason}. AI summaries will be skipped.")
+    sinks = {"collection": collection if model is not None else None,
+             "criteria_collection": criteria_collection if model is not None else None}
+    vector_sinks = [column for column, arg in VECTOR_SINKS.items() if sinks[arg] is not None]
+    existing = load_existing_state(conn)
+    stats = {"seen": 0, "unchanged": 0, "processed": 0, "summarized": 0, "embedded": 0, "criterion_chunks": 0, "errors": 0}
+    started = time.perf_counter()
+
+    for chunk in _chunks(select_changed_trials(trials, existing, llm_available, stats, vector_sinks), chunk_size):
+        prepared = []
+        for trial, digest in chunk:
+            try:
+                item = prepare_trial(trial, digest)
+            except Exception as e:
+                logging.error(f"Failed to parse trial {(trial.get('metadata') or {}).get('sourceURL')}: {e}", exc_info=True)
+                stats["errors"] += 1
+                continue
+            previous = existing.get(item["source_url"]) or {}
+            for column in VECTOR_SINKS:
+                item[column] = previous.get(column)  # Kept unless this run rewrites the sink
+            prepared.append(item)
+
+        stats["summarized"] += await summarize_trials(prepared, existing, llm_available, summary_workers)
+        if "vector_hash" in vector_sinks:
+            try:
+                stats["embedded"] += write_vector_chunk(collection, model, prepared)
+                _mark_written(prepared, "vector_hash")
+            except Exception as e:
+                logging.error(f"  Error upserting embeddings to ChromaDB (will retry on the next run): {e}")
+                stats["errors"] += len(prepared)
+        if "criteria_hash" in vector_sinks:
+            try:
+                stats["criterion_chunks"] += write_criteria_chunk(criteria_collection, model, prepared)
+                _mark_written(prepared, "criteria_hash")
+            except Exception as e:
+                logging.error(f"  Error upserting criterion embeddings to ChromaDB (will retry on the next run): {e}")
+                stats["errors"] += len(prepared)
+        if criteria_index is not None:
+            for item in prepared:
+                nct_id = item["parsed"].get("nct_id")
+                if nct_id:
+                    criteria_index.index_trial(nct_id, item["parsed"].get("inclusion_criteria_text"),
+                                               item["parsed"].get("exclusion_criteria_text"), commit=False)
+            criteria_index.commit()
+        if lexical_index is not None:
+            lexical_index.index_trials([{
+                "nct_id": item["parsed"].get("nct_id"), "title": item["title"],
+                "inclusion_criteria_text": item["parsed"].get("inclusion_criteria_text"),
+                "exclusion_criteria_text": item["parsed"].get("exclusion_criteria_text"),
+                "description_text": item["parsed"].get("description_text"),
+                "objectives_text": item["parsed"].get("objectives_text"),
+            } for item in prepared])
+        # Last, so content_hash is only recorded once the derived indexes above are written
+        write_sqlite_chunk(conn, prepared)
+        stats["processed"] += len(prepared)
+        logging.info(f"  Processed {stats['processed']} changed trials ({stats['unchanged']} unchanged so far)")
+
+    stats["seconds"] = round(time.perf_counter() - started, 3)
+    return stats
 
-    # 4. Initialize Embedding Model
-    logging.info(f"Loading embedding model: {EMBEDDING_MODEL}...")
-    try:
+# --- Main Execution ---
+def main():
+    parser = argparse.ArgumentParser(description="Incrementally load trials from documents.json into SQLite and ChromaDB.")
+    parser.add_argument("--source", default=SOURCE_JSON_PATH, help="Trial documents JSON array.")
+    parser.add_argument("--db", default=SQLITE_DB_PATH, help="SQLite trials database.")
+    parser.add_argument("--index-db", default=DEFAULT_INDEX_DB_PATH, help="Derived criteria / FTS index database (git-ignored).")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE, help="Trials per processing chunk / transaction.")
+    parser.add_argument("--summary-workers", type=int, default=SUMMARY_WORKERS, help="Concurrent AI summary calls.")
+    parser.add_argument("--no-llm", action="store_true", help="Skip AI summaries.")
+    parser.add_argument("--no-vector", action="store_true", help="Skip embeddings / ChromaDB.")
+    parser.add_argument("--force", action="store_true", help="Reprocess every trial, ignoring content hashes.")
+    parser.add_argument("--local-index", action="store_true",
+                        help="Re-export both collections to the in-process vector index afterwards (existing stale exports are always refreshed).")
+    args = parser.parse_args()
+
+    logging.info("--- Starting Clinical Trial Local Loading Script --- (incremental)")
+
+    sql_conn = initialize_sqlite(args.db)
+    if not sql_conn:
+        sys.exit(1)
+    if args.force:
+        with sql_conn:
+            sql_conn.execute("UPDATE clinical_trials SET content_hash = NULL, vector_hash = NULL, criteria_hash = NULL")
+
+    collection = criteria_collection = model = None
+    if not args.no_vector:
+        collection = initialize_chromadb(CHROMA_DB_PATH, CHROMA_COLLECTION_NAME)
+        criteria_collection = initialize_chromadb(CHROMA_DB_PATH, CRITERIA_COLLECTION_NAME)
+        if collection is None or criteria_collection is None or SentenceTransformer is None:
+            logging.error("Vector store unavailable (chromadb / sentence-transformers missing?). Use --no-vector to skip it.")
+            sql_conn.close()
+            sys.exit(1)
+        logging.info(f"Loading embedding model: {EMBEDDING_MODEL}...")
         model = SentenceTransformer(EMBEDDING_MODEL)
-        logging.info("Embedding model loaded successfully.")
-    except Exception as e:
-        logging.error(f"Failed to load sentence transformer model '{EMBEDDING_MODEL}': {e}")
+        # An emptied (or new) collection needs every trial written to it again
+        for column, name, target in (("vector_hash", CHROMA_COLLECTION_NAME, collection),
+                                     ("criteria_hash", CRITERIA_COLLECTION_NAME, criteria_collection)):
+            if target.count() == 0:
+                logging.info(f"'{name}' is empty; re-embedding all trials into it.")
+                with sql_conn:
+                    sql_conn.execute(f"UPDATE clinical_trials SET {column} = NULL")
+
+    criteria_index = CriteriaIndex(args.index_db, args.db)
+    lexical_index = LexicalIndex(args.index_db, args.db)
+    # A new or deleted index database is filled from the trials already loaded; ingest then updates changed ones
+    if criteria_index.available and not criteria_index.stats()["trials"]:
+        logging.info(f"Criteria index empty; atomized {criteria_index.rebuild_from_trials()} existing trials.")
+    lexical_index.ensure_built()
+    try:
+        stats = asyncio.run(ingest(
+            iter_json_array(args.source), sql_conn, collection, model, criteria_index,
+            chunk_size=args.chunk_size, summary_workers=args.summary_workers, use_llm=not args.no_llm,
+            criteria_collection=criteria_collection, lexical_index=lexical_index,
+        ))
+    finally:
         sql_conn.close()
-        exit(1)
-
-    # 5. Process and Load Trials
-    logging.info("--- Starting data processing and loading (including AI summaries) ---")
-    processed_count = 0
-    error_count = 0
-    chroma_batch_size = 100 # Adjust batch size as needed for ChromaDB performance
-    chroma_batch = {"ids": [], "embeddings": [], "documents": [], "metadatas": []}
-
-    for i, trial in enumerate(trials_data):
-        logging.info(f"Processing trial {i+1}/{len(trials_data)}...")
-        metadata = trial.get("metadata", {})
-        markdown = trial.get("markdown", "")
-        source_url = metadata.get("sourceURL")
+        logging.info(f"Criteria index: {criteria_index.stats()}")
+        criteria_index.close()
+        lexical_index.close()
 
-        if not source_url:
-            logging.warning(f"Skipping trial {i+1} due to missing 'sourceURL' in metadata.")
-            error_count += 1
+    logging.info(f"--- Processing complete ---")
+    logging.info(f"Trials seen: {stats['seen']}, unchanged (skipped): {stats['unchanged']}, processed: {stats['processed']}")
+    logging.info(f"AI summaries generated: {stats['summarized']}, embeddings upserted: {stats['embedded']}, criterion chunks: {stats['criterion_chunks']}")
+    logging.info(f"Errors encountered: {stats['errors']} trials, elapsed {stats['seconds']}s")
+    logging.info(f"LLM gateway metrics: {llm_gateway.metrics()}")
+
+    # An export is a snapshot: refresh any that this run made stale, not only when asked to
+    for name, target in ((CHROMA_COLLECTION_NAME, collection), (CRITERIA_COLLECTION_NAME, criteria_collection)):
+        if target is None:
             continue
+        if args.local_index or local_index_is_stale(name, trials_db_path=args.db):
+            export_collection(target, name, trials_db_path=args.db)
 
-        try:
-            # Parse markdown content
-            parsed_data = parse_markdown_content(markdown)
-            
-            # --- Generate AI Summary --- 
-            ai_summary = "AI summary skipped: LLM client not initialized." # Default
-            if llm_client and parsed_data.get("description_text") and parsed_data.get("objectives_text"):
-                try:
-                    summary_prompt = TRIAL_SUMMARY_PROMPT_TEMPLATE.format(
-                        description=parsed_data["description_text"],
-                        objectives=parsed_data["objectives_text"]
-                    )
-                    # Simple retry logic
-                    for attempt in range(2):
-                        try:
-                            response = llm_client.generate_content(summary_prompt)
-                            ai_summary = response.text.strip()
-                            logging.info(f"  Successfully generated AI summary for {source_url}.")
-                            break # Success, exit retry loop
-                        except Exception as llm_err:
-                            logging.warning(f"  LLM summarization attempt {attempt+1} failed for {source_url}: {llm_err}")
-                            if attempt == 1: # Last attempt failed
-                                raise llm_err # Re-raise the last error
-                            time.sleep(1) # Wait before retrying
-                except Exception as e:
-                    logging.error(f"  Failed to generate AI summary for {source_url}: {e}")
-                    ai_summary = "AI summary generation failed."
-            elif not llm_client:
-                pass # Keep default message
-            else:
-                logging.warning(f"  Skipping AI summary for {source_url} due to missing description or objectives.")
-                ai_summary = "AI summary skipped: Missing description/objectives."
-
-            # Prepare data for SQLite
-            # Use parsed title first, fallback to metadata title
-            title = parsed_data.get('title_from_markdown') or metadata.get('title', 'Title Not Found')
-            nct_id = parsed_data.get('nct_id') # Get parsed NCT ID
-
-            sql_data = (
-                source_url,
-                nct_id,
-                parsed_data.get('primary_id'),
-                title,
-                parsed_data.get('status'),
-                parsed_data.get('phase'),
-                parsed_data.get('description_text'),
-                parsed_data.get('inclusion_criteria_text'),
-                parsed_data.get('exclusion_criteria_text'),
-                parsed_data.get('objectives_text'),
-                parsed_data.get('eligibility_text'),
-                markdown,
-                json.dumps(metadata), # Store original metadata
-                ai_summary # Store the generated summary
-            )
-
-            # Insert/Replace into SQLite
-            sql_cursor.execute("""
-                INSERT OR REPLACE INTO clinical_trials (
-                    source_url, nct_id, primary_id, title, status, phase, 
-                    description_text, inclusion_criteria_text, exclusion_criteria_text, 
-                    objectives_text, eligibility_text, raw_markdown, metadata_json, ai_summary
-                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            """, sql_data)
-
-            # Prepare data for ChromaDB
-            eligibility_text = parsed_data.get('eligibility_text', '')
-            if eligibility_text:
-                embedding = model.encode([eligibility_text])[0].tolist()
-                chroma_batch["ids"].append(source_url)
-                chroma_batch["embeddings"].append(embedding)
-                chroma_batch["documents"].append(eligibility_text)
-                # --- FIX: Add nct_id to metadata --- 
-                chroma_batch["metadatas"].append({
-                    "nct_id": nct_id, 
-                    # Add other relevant metadata if needed for filtering later
-                    "source_url": source_url, 
-                    "title": title, 
-                    "status": parsed_data.get('status')
-                })
-                # --- END FIX --- 
-            else:
-                logging.warning(f"  Skipping ChromaDB entry for {source_url} due to missing eligibility text.")
-
-            # Commit SQLite changes periodically (or after loop)
-            if (i + 1) % 50 == 0:
-                sql_conn.commit()
-                logging.info(f"  Committed SQLite changes after {i+1} trials.")
-            
-            # Upsert batch to ChromaDB
-            if len(chroma_batch["ids"]) >= chroma_batch_size:
-                logging.info(f"  Upserting batch of {len(chroma_batch['ids'])} embeddings to ChromaDB...")
-                try:
-                    chroma_collection.upsert(
-                        ids=chroma_batch["ids"],
-                        embeddings=chroma_batch["embeddings"],
-                        documents=chroma_batch["documents"],
-                        metadatas=chroma_batch["metadatas"]
-                    )
-                    logging.info(f"  Successfully upserted batch to ChromaDB.")
-                    # Clear the batch
-                    chroma_batch = {"ids": [], "embeddings": [], "documents": [], "metadatas": []}
-                except Exception as chroma_err:
-                    logging.error(f"  Error upserting batch to ChromaDB: {chroma_err}")
-                    # Decide how to handle batch error - skip batch? retry?
-                    # For simplicity, clear batch and continue
-                    chroma_batch = {"ids": [], "embeddings": [], "documents": [], "metadatas": []}
-                    error_count += chroma_batch_size # Increment error count for the batch
-
-            processed_count += 1
-
-        except Exception as e:
-            logging.error(f"Failed to process trial {i+1} ({source_url}): {e}", exc_info=True)
-            error_count += 1
-
-    # Upsert any remaining items in the batch
-    if chroma_batch["ids"]:
-        logging.info(f"Upserting final batch of {len(chroma_batch['ids'])} embeddings to ChromaDB...")
-        try:
-            chroma_collection.upsert(
-                ids=chroma_batch["ids"],
-                embeddings=chroma_batch["embeddings"],
-                documents=chroma_batch["documents"],
-                metadatas=chroma_batch["metadatas"]
-            )
-            logging.info("Successfully upserted final batch to ChromaDB.")
-        except Exception as chroma_err:
-            logging.error(f"Error upserting final batch to ChromaDB: {chroma_err}")
-            error_count += len(chroma_batch["ids"])
-
-    # Final commit for SQLite
-    sql_conn.commit()
-    logging.info("Final SQLite commit complete.")
-    sql_conn.close()
-    logging.info("SQLite connection closed.")
-
-    logging.info(f"--- Processing complete ---")
-    logging.info(f"Successfully processed: {processed_count} trials")
-    logging.info(f"Errors encountered: {error_count} trials") 
\ No newline at end of file
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+"""
+Overnight pre-screen of the TCGA-BRCA cohort against every trial in `clinical_trials`.
+
+Writes one row per (patient, trial) pair to `prescreen_matrix` in the
+pre-screening DB. Re-running with the same --run-id resumes: checkpointed
+patients are skipped and pending/failed LLM assessments are retried.
+
+Usage (from the project root):
+    python -m backend.scripts.run_prescreening --run-id brca-nightly --llm-workers 8
+    python -m backend.scripts.run_prescreening --run-id dry --no-llm --statuses all --limit 50
+    LLM_PROVIDER=local python -m backend.scripts.run_prescreening --run-id bench --no-vector
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import time
+
+from backend.core.prescreening import (
+    DEFAULT_CLINICAL_JSON_PATH, DEFAULT_OPEN_STATUSES, DEFAULT_PATIENT_DB_PATH, DEFAULT_PRESCREEN_DB_PATH,
+    DEFAULT_RETRIEVAL_TOP_K, DEFAULT_TRIALS_DB_PATH, PrescreenStore, PrescreeningEngine,
+    load_cohort, load_trials, make_agent_assessor, make_agent_retriever,
+)
+
+
+async def main(args):
+    trials = load_trials(args.trials_db)
+    patients = load_cohort(args.patient_db, args.clinical_json, limit=args.limit)
+    logging.info(f"Loaded {len(patients)} patients and {len(trials)} trials.")
+    if patients and patients[0].get("mutations") is None:
+        logging.warning(f"No mutations table in {args.patient_db}; the genomic stage will be skipped.")
+
+    trial_agent = None
+    if not (args.no_vector and args.no_llm):
+        from backend.agents.clinical_trial_agent import ClinicalTrialAgent
+        trial_agent = ClinicalTrialAgent()
+    genomic_agent = None
+    if not args.no_genomic:
+        from backend.agents.genomic_analyst_agent import GenomicAnalystAgent
+        genomic_agent = GenomicAnalystAgent()
+
+    statuses = None if args.statuses == "all" else [s.strip() for s in args.statuses.split(",") if s.strip()]
+    phases = [int(p) for p in args.phases.split(",")] if args.phases else None
+
+    retriever = None
+    if not args.no_vector and trial_agent and trial_agent.model and (trial_agent.chroma_collection or trial_agent.criterion_retriever):
+        retriever = make_agent_retriever(trial_agent, statuses, phases, args.top_k)
+    elif not args.no_vector:
+        logging.warning("Vector search unavailable; screening every trial for every patient.")
+    store = PrescreenStore(args.db)
+    engine = PrescreeningEngine(
+        trials, store,
+        retriever=retriever,
+        assessor=None if args.no_llm else make_agent_assessor(trial_agent),
+        genomic_agent=genomic_agent,
+        criteria_index=trial_agent.criteria_index if trial_agent else None,
+        open_statuses=statuses,
+        phases=phases,
+        llm_workers=args.llm_workers,
+        batch_size=args.batch_size,
+        progress_interval=args.progress_interval,
+    )
+    config = {"statuses": statuses, "phases": phases, "vector": retriever is not None, "top_k": args.top_k,
+              "llm": not args.no_llm, "genomic": genomic_agent is not None, "limit": args.limit}
+    started = time.perf_counter()
+    try:
+        progress = await engine.run(patients, args.run_id, config)
+    finally:
+        if trial_agent:
+            trial_agent.close()
+    report = {
+        "run_id": args.run_id,
+        "wall_seconds": round(time.perf_counter() - started, 2),
+        "progress": progress,
+        "matrix": store.summary(args.run_id),
+    }
+    store.close()
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Batch patient x trial pre-screening with resumable checkpoints.")
+    parser.add_argument("--run-id", required=True, help="Run identifier; reuse it to resume an interrupted run.")
+    parser.add_argument("--db", default=DEFAULT_PRESCREEN_DB_PATH, help="SQLite DB for the matrix and checkpoints.")
+    parser.add_argument("--trials-db", default=DEFAULT_TRIALS_DB_PATH)
+    parser.add_argument("--patient-db", default=DEFAULT_PATIENT_DB_PATH)
+    parser.add_argument("--clinical-json", default=DEFAULT_CLINICAL_JSON_PATH)
+    parser.add_argument("--limit", type=int, default=None, help="Screen only the first N patients.")
+    parser.add_argument("--statuses", default=",".join(DEFAULT_OPEN_STATUSES),
+                        help="Comma-separated allowed trial statuses, or 'all' to disable the filter.")
+    parser.add_argument("--phases", default=None, help="Comma-separated allowed phase numbers, e.g. 2,3.")
+    parser.add_argument("--top-k", type=int, default=DEFAULT_RETRIEVAL_TOP_K, help="Trials retrieved per patient by vector search.")
+    parser.add_argument("--llm-workers", type=int, default=4, help="LLM worker pool size.")
+    parser.add_argument("--batch-size", type=int, default=64, help="Patients per vectorized lab-rule pass.")
+    parser.add_argument("--progress-interval", type=float, default=30.0, help="Seconds between progress log lines.")
+    parser.add_argument("--no-llm", action="store_true", help="Stop after the deterministic stages.")
+    parser.add_argument("--no-vector", action="store_true", help="Skip vector retrieval and screen every trial.")
+    parser.add_argument("--no-genomic", action="store_true", help="Skip the GenomicAnalystAgent stage.")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    asyncio.run(main(args))
@@ -1,15 +1,32 @@
-import chromadb
+import argparse
 import pprint
-
-CHROMA_DB_PATH = "./chroma_db"
+import sys
+from pathlib import Path
+
+# Make `backend.*` importable when run as `python backend/scripts/verify_chromaDB.py`
+PROJECT_ROOT = str(Path(__file__).resolve().parent.parent.parent)
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+from backend.core.vector_index import (
+    DEFAULT_CHROMA_PATH, DEFAULT_INDEX_DIR, VECTOR_BACKEND_CHROMA, VECTOR_BACKEND_LOCAL, open_vector_collection,
+)
+
+CHROMA_DB_PATH = DEFAULT_CHROMA_PATH
 CHROMA_COLLECTION_NAME = "clinical_trials_eligibility"
 
-print(f"Connecting to ChromaDB at: {CHROMA_DB_PATH}")
-client = chromadb.PersistentClient(path=CHROMA_DB_PATH)
+parser = argparse.ArgumentParser(description="Inspect a trial vector collection (ChromaDB or the local index).")
+parser.add_argument("--backend", choices=(VECTOR_BACKEND_CHROMA, VECTOR_BACKEND_LOCAL), default=VECTOR_BACKEND_CHROMA)
+parser.add_argument("--collection", default=CHROMA_COLLECTION_NAME)
+args = parser.parse_args()
+
+location = CHROMA_DB_PATH if args.backend == VECTOR_BACKEND_CHROMA else DEFAULT_INDEX_DIR
+print(f"Connecting to {args.backend} vector store at: {location}")
 
 try:
-    print(f"Getting collection: {CHROMA_COLLECTION_NAME}")
-    collection = client.get_collection(name=CHROMA_COLLECTION_NAME)
+    print(f"Getting collection: {args.collection}")
+    collection = open_vector_collection(args.collection, args.backend)
+    if collection is None:
+        raise ValueError(f"Collection '{args.collection}' not found")
 
     # 1. Check Count
     count = collection.count()
@@ -26,7 +43,7 @@ try:
         pprint.pprint(results)
 
         # Optionally check embedding dimension of the first result if it exists
-        if results and results.get('embeddings') and results['embeddings']:
+        if results and results.get('embeddings') is not None and len(results['embeddings']):
              print(f"Dimension of first embedding vector: {len(results['embeddings'][0])}")
         else:
              print("Could not retrieve embeddings for sample.")
@@ -0,0 +1,47 @@
+"""
+Shared test doubles for the WebSocket tests (connection manager, backplane, room history, dispatch).
+"""
+
+import asyncio
+import json
+from types import SimpleNamespace
+
+from starlette.websockets import WebSocketState
+
+
+class FakeWebSocket:
+    """
+    Records decoded outbound messages in `sent`.
+
+    Args:
+        port: Client port, so sockets are distinguishable in logs.
+        delay: Seconds each send blocks (a slow client).
+        fail: Every send raises (a dropped connection).
+        strip_seq: Drop the room-history `seq` cursor from recorded messages, for tests that check it separately.
+    """
+
+    def __init__(self, port=1, delay=0.0, fail=False, strip_seq=False):
+        self.client = SimpleNamespace(host="127.0.0.1", port=port)
+        self.client_state = WebSocketState.CONNECTING
+        self.delay = delay
+        self.fail = fail
+        self.strip_seq = strip_seq
+        self.sent = []
+        self.closed_with = None
+
+    async def accept(self):
+        self.client_state = WebSocketState.CONNECTED
+
+    async def send_text(self, text):
+        if self.fail:
+            raise RuntimeError("connection reset")
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        message = json.loads(text)
+        if self.strip_seq:
+            message.pop("seq", None)
+        self.sent.append(message)
+
+    async def close(self, code=1000):
+        self.closed_with = code
+        self.client_state = WebSocketState.DISCONNECTED
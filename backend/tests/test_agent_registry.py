@@ -0,0 +1,88 @@
+import asyncio
+import os
+import threading
+import time
+import unittest
+
+try:
+    from backend.core.agent_registry import AgentRegistry
+except ImportError:
+    import sys
+    sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+    from backend.core.agent_registry import AgentRegistry
+
+
+class FakeAgent:
+    created = 0
+
+    def __init__(self):
+        FakeAgent.created += 1
+        time.sleep(0.05)  # Slow enough for concurrent get() calls to overlap
+        self.warmed = False
+        self.closed = False
+
+    def warmup(self):
+        self.warmed = True
+
+    async def close(self):
+        self.closed = True
+
+
+class BrokenAgent:
+    def __init__(self):
+        raise RuntimeError("model files missing")
+
+
+class TestAgentRegistry(unittest.TestCase):
+    def setUp(self):
+        FakeAgent.created = 0
+        self.registry = AgentRegistry()
+        self.registry.register("fake", FakeAgent)
+
+    def test_register_does_not_construct(self):
+        self.assertTrue(self.registry.is_registered("fake"))
+        self.assertEqual(FakeAgent.created, 0)
+        self.assertFalse(self.registry.health()["agents"]["fake"]["loaded"])
+
+        agent = self.registry.get("fake")
+        self.assertIs(self.registry.get("fake"), agent)
+        self.assertEqual(FakeAgent.created, 1)
+
+    def test_concurrent_get_constructs_once(self):
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(self.registry.get("fake"))) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(FakeAgent.created, 1)
+        self.assertEqual(len({id(agent) for agent in results}), 1)
+
+    def test_startup_warms_and_shutdown_closes(self):
+        asyncio.run(self.registry.startup())
+        agent = self.registry.get("fake")
+        self.assertTrue(agent.warmed)
+        health = self.registry.health()
+        self.assertEqual((health["status"], health["started"]), ("ok", True))
+        self.assertTrue(health["agents"]["fake"]["warmed"])
+
+        asyncio.run(self.registry.shutdown())
+        self.assertTrue(agent.closed)
+        health = self.registry.health()
+        self.assertFalse(health["started"])
+        self.assertFalse(health["agents"]["fake"]["loaded"])
+        self.assertIsNot(self.registry.get("fake"), agent)  # Recreated on next use
+
+    def test_unavailable_agents_return_none_and_degrade_health(self):
+        self.assertIsNone(self.registry.get("unknown"))
+        self.registry.register("broken", BrokenAgent)
+        asyncio.run(self.registry.startup())
+        self.assertIsNone(self.registry.get("broken"))
+        health = self.registry.health()
+        self.assertEqual(health["status"], "degraded")
+        self.assertIn("model files missing", health["agents"]["broken"]["error"])
+        self.assertTrue(health["agents"]["fake"]["loaded"])
+
+
+if __name__ == '__main__':
+    unittest.main()
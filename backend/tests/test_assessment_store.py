@@ -0,0 +1,54 @@
+import os
+import tempfile
+import unittest
+
+try:
+    from backend.core.assessment_store import AssessmentStore, content_hash, prompt_version
+except ImportError:
+    import sys
+    sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+    from backend.core.assessment_store import AssessmentStore, content_hash, prompt_version
+
+
+class TestAssessmentStore(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.store = AssessmentStore(os.path.join(self.tmp.name, "assessments.db"))
+        self.patient_hash = content_hash({"patientId": "PAT1", "diagnosis": "NSCLC"})
+        self.criteria_hash = content_hash({"inclusion": "Age >= 18", "exclusion": "Pregnancy"})
+        self.version = prompt_version("v1", "template text")
+        self.assessment = {"eligibility_status": "Likely Eligible", "met_criteria": [{"criterion": "Age >= 18"}]}
+
+    def tearDown(self):
+        self.store.close()
+        self.tmp.cleanup()
+
+    def test_content_hash_ignores_key_order(self):
+        self.assertEqual(content_hash({"a": 1, "b": 2}), content_hash({"b": 2, "a": 1}))
+
+    def test_prompt_version_tracks_template(self):
+        self.assertNotEqual(prompt_version("v1", "template A"), prompt_version("v1", "template B"))
+
+    def test_round_trip(self):
+        self.store.put("NCT1", "PAT1", self.patient_hash, self.criteria_hash, self.version, self.assessment)
+        cached = self.store.get("NCT1", "PAT1", self.patient_hash, self.criteria_hash, self.version)
+        self.assertEqual(cached, self.assessment)
+        self.assertEqual(self.store.stats()["hits"], 1)
+
+    def test_changed_inputs_invalidate(self):
+        self.store.put("NCT1", "PAT1", self.patient_hash, self.criteria_hash, self.version, self.assessment)
+        new_patient_hash = content_hash({"patientId": "PAT1", "diagnosis": "SCLC"})
+        self.assertIsNone(self.store.get("NCT1", "PAT1", new_patient_hash, self.criteria_hash, self.version))
+        # The stale row is gone, so the original hashes miss too
+        self.assertIsNone(self.store.get("NCT1", "PAT1", self.patient_hash, self.criteria_hash, self.version))
+        self.assertEqual(self.store.stats()["invalidations"], 1)
+
+    def test_purge_other_versions(self):
+        self.store.put("NCT1", "PAT1", self.patient_hash, self.criteria_hash, "old", self.assessment)
+        self.store.put("NCT2", "PAT1", self.patient_hash, self.criteria_hash, self.version, self.assessment)
+        self.assertEqual(self.store.purge_other_versions(self.version), 1)
+        self.assertIsNotNone(self.store.get("NCT2", "PAT1", self.patient_hash, self.criteria_hash, self.version))
+
+
+if __name__ == '__main__':
+    unittest.main()
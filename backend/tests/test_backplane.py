@@ -0,0 +1,140 @@
+import asyncio
+import os
+import unittest
+
+try:
+    from backend.core.backplane import Backplane, InMemoryBackplane, InMemoryHub, LocalPubSubServer, RedisBackplane, create_backplane
+    from backend.core.connection_manager import ConnectionManager
+    from backend.tests.fakes import FakeWebSocket
+except ImportError:
+    import sys
+    sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+    from backend.core.backplane import Backplane, InMemoryBackplane, InMemoryHub, LocalPubSubServer, RedisBackplane, create_backplane
+    from backend.core.connection_manager import ConnectionManager
+    from backend.tests.fakes import FakeWebSocket
+
+
+async def settle(condition, timeout=2.0):
+    deadline = asyncio.get_running_loop().time() + timeout
+    while not condition() and asyncio.get_running_loop().time() < deadline:
+        await asyncio.sleep(0.005)
+
+
+class CrossWorkerCases:
+    """ Two managers standing in for two uvicorn workers; subclasses supply the backplane. """
+
+    async def make_backplane(self):
+        raise NotImplementedError
+
+    async def asyncSetUp(self):
+        self.workers = [ConnectionManager(), ConnectionManager()]
+        for worker in self.workers:
+            await worker.start_backplane(await self.make_backplane())
+        self.a, self.b = FakeWebSocket(1, strip_seq=True), FakeWebSocket(2, strip_seq=True)  # seq is checked in test_room_history
+        await self.workers[0].connect(self.a)
+        await self.workers[1].connect(self.b)
+
+    async def asyncTearDown(self):
+        for worker in self.workers:
+            for ws in list(worker.outbound):
+                worker.disconnect(ws)
+            await worker.stop_backplane()
+
+    async def test_room_broadcast_reaches_other_worker(self):
+        w0, w1 = self.workers
+        await w0.join_room("PAT1", self.a)
+        await w1.join_room("PAT1", self.b)
+        await asyncio.sleep(0.05)  # Let subscriptions reach the server
+        self.assertEqual((await w0.broadcast_to_room("PAT1", {"n": 1}, exclude_sender=self.a))[0], 0)
+        await w1.broadcast_to_room("PAT1", {"n": 2})
+        await settle(lambda: len(self.b.sent) == 2 and len(self.a.sent) == 1)
+        # Delivered once each, no echo (order is only guaranteed per sending worker)
+        self.assertEqual(sorted(m["n"] for m in self.b.sent), [1, 2])
+        self.assertEqual(self.a.sent, [{"n": 2}])
+
+        # Both workers hold the same history with the origin's cursors
+        self.assertEqual([seq for seq, _ in w0.history.since("PAT1")[0]], [seq for seq, _ in w1.history.since("PAT1")[0]])
+        self.assertEqual(len(w1.history.since("PAT1")[0]), 2)
+
+        await w1.leave_room("PAT1", self.b)
+        self.assertFalse(w1.backplane.is_subscribed("room:PAT1"))
+
+    async def test_send_to_user_counts_remote_sockets(self):
+        w0, w1 = self.workers
+        second_tab = FakeWebSocket(3, strip_seq=True)
+        await w1.connect(second_tab)
+        await w1.associate_user("dr_b", self.b)
+        await w1.associate_user("dr_b", second_tab)
+        await asyncio.sleep(0.05)
+        self.assertEqual(await w0.send_to_user("dr_b", {"type": "consult_request"}), 2)
+        await settle(lambda: self.b.sent and second_tab.sent)
+        self.assertEqual(self.b.sent, [{"type": "consult_request"}])
+        self.assertEqual(await w0.send_to_user("nobody", {"type": "consult_request"}, timeout=0.2), 0)
+
+        await w0.associate_user("dr_b", self.a)  # Now also on the sending worker
+        await asyncio.sleep(0.05)
+        self.assertEqual(await w0.send_to_user("dr_b", {"n": 1}), 3)
+
+
+class TestInMemoryBackplane(CrossWorkerCases, unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.hub = InMemoryHub()
+        await super().asyncSetUp()
+
+    async def make_backplane(self):
+        return InMemoryBackplane(self.hub)
+
+    async def test_empty_channels_are_dropped_from_hub(self):
+        await self.workers[0].join_room("r", self.a)
+        self.assertIn("room:r", self.hub.channels)
+        self.workers[0].disconnect(self.a)
+        self.assertNotIn("room:r", self.hub.channels)
+
+
+class TestRedisProtocolBackplane(CrossWorkerCases, unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.server = await LocalPubSubServer().start()
+        await super().asyncSetUp()
+
+    async def asyncTearDown(self):
+        await super().asyncTearDown()
+        await self.server.close()
+
+    async def make_backplane(self):
+        return create_backplane(self.server.url)
+
+    async def test_subscriber_reconnects_and_resubscribes(self):
+        w0, w1 = self.workers
+        await w1.join_room("PAT1", self.b)
+        await settle(lambda: "room:PAT1" in self.server.channels)
+        # Drop every server-side connection; the subscriber must come back with its channels
+        for writer in list(self.server._clients):
+            writer.close()
+        await settle(lambda: w1.backplane.reconnects >= 1 and "room:PAT1" in self.server.channels, timeout=5)
+        await w0.broadcast_to_room("PAT1", {"n": 1})
+        await settle(lambda: self.b.sent)
+        self.assertEqual(self.b.sent, [{"n": 1}])
+
+
+class TestCreateBackplane(unittest.TestCase):
+    def test_urls(self):
+        self.assertIsNone(create_backplane(""))
+        self.assertIsInstance(create_backplane("memory://"), InMemoryBackplane)
+        redis = create_backplane("redis://:secret@cache:6380")
+        self.assertIsInstance(redis, RedisBackplane)
+        self.assertEqual((redis.host, redis.port, redis.password), ("cache", 6380, "secret"))
+        with self.assertRaises(ValueError):
+            create_backplane("kafka://broker")
+
+    def test_base_is_abstract_and_defines_shared_state(self):
+        with self.assertRaises(TypeError):
+            Backplane("base")
+        backplane = InMemoryBackplane(InMemoryHub())
+        backplane.subscribe("room:r")
+        self.assertEqual(backplane.stats(), {"backend": "memory", "channels": 1})
+        self.assertTrue(backplane.is_subscribed("room:r"))
+        self.assertEqual(RedisBackplane().stats()["backend"], "redis")
+
+
+if __name__ == '__main__':
+    unittest.main()
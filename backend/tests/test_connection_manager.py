@@ -0,0 +1,86 @@
+import asyncio
+import os
+import unittest
+
+try:
+    from backend.core.connection_manager import ConnectionManager
+    from backend.core.room_history import RoomHistory
+    from backend.tests.fakes import FakeWebSocket
+except ImportError:
+    import sys
+    sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+    from backend.core.connection_manager import ConnectionManager
+    from backend.core.room_history import RoomHistory
+    from backend.tests.fakes import FakeWebSocket
+
+
+class TestConnectionManager(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.manager = ConnectionManager(queue_size=4, history=RoomHistory(max_messages=0))  # Fan-out only; see test_room_history
+        self.sockets = [FakeWebSocket(i) for i in range(3)]
+        for ws in self.sockets:
+            await self.manager.connect(ws)
+            await self.manager.join_room("room", ws)
+
+    async def asyncTearDown(self):
+        for ws in list(self.manager.outbound):
+            self.manager.disconnect(ws)
+
+    async def test_membership_bookkeeping(self):
+        a, b, _ = self.sockets
+        await self.manager.associate_user("dr_a", a)
+        await self.manager.join_room("other", a)
+        await self.manager.join_room("room", a)  # Idempotent
+        self.assertEqual(len(self.manager.room_connections["room"]), 3)
+
+        await self.manager.leave_room("other", a)
+        self.assertNotIn("other", self.manager.room_connections)
+        self.assertEqual(self.manager.socket_to_rooms[a], {"room"})
+
+        self.manager.disconnect(a)
+        self.assertNotIn(a, self.manager.room_connections["room"])
+        self.assertEqual(await self.manager.get_user_sockets("dr_a"), [])
+        self.assertNotIn(a, self.manager.outbound)
+        self.manager.disconnect(a)  # Second disconnect is a no-op
+
+    async def test_broadcast_excludes_sender_and_keeps_order(self):
+        a, b, c = self.sockets
+        await self.manager.send_personal_message({"n": 0}, b)
+        queued, _ = await self.manager.broadcast_to_room("room", {"n": 1}, exclude_sender=a)
+        self.assertEqual(queued, 2)
+        await self.manager.broadcast_to_room("room", {"n": 2})
+        for ws in self.sockets:
+            await self.manager.flush(ws)
+        self.assertEqual(a.sent, [{"n": 2}])
+        self.assertEqual(b.sent, [{"n": 0}, {"n": 1}, {"n": 2}])
+        self.assertEqual(c.sent, [{"n": 1}, {"n": 2}])
+        self.assertEqual((await self.manager.broadcast_to_room("missing", {"n": 3}))[0], 0)
+        self.assertFalse(await self.manager.send_personal_message({"bad": object()}, a))
+
+    async def test_slow_client_is_closed_without_stalling_room(self):
+        slow = FakeWebSocket(99, delay=10)
+        await self.manager.connect(slow)
+        await self.manager.join_room("room", slow)
+        for n in range(6):
+            await self.manager.broadcast_to_room("room", {"n": n})
+            await asyncio.sleep(0)
+        for ws in self.sockets:
+            await self.manager.flush(ws, timeout=1)
+            self.assertEqual([m["n"] for m in ws.sent], list(range(6)))
+        self.assertNotIn(slow, self.manager.room_connections["room"])
+        await asyncio.sleep(0)
+        self.assertEqual(slow.closed_with, 1013)
+        self.assertEqual(self.manager.stats()["slow_consumers_closed"], 1)
+
+    async def test_failed_send_disconnects_socket(self):
+        broken = FakeWebSocket(98, fail=True)
+        await self.manager.connect(broken)
+        await self.manager.join_room("room", broken)
+        await self.manager.broadcast_to_room("room", {"n": 1})
+        await asyncio.sleep(0.01)
+        self.assertNotIn(broken, self.manager.socket_to_rooms)
+        self.assertEqual(len(self.manager.room_connections["room"]), 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
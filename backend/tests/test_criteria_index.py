@@ -0,0 +1,111 @@
+import os
+import sqlite3
+import tempfile
+import unittest
+
+try:
+    from backend.core.criteria_index import CriteriaIndex, atomize_criteria, criterion_id, evaluate_atom, split_atoms
+except ImportError:
+    import sys
+    sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+    from backend.core.criteria_index import CriteriaIndex, atomize_criteria, criterion_id, evaluate_atom, split_atoms
+
+INCLUSION = """- Age >= 18 years
+- Eastern Cooperative Oncology Group (ECOG) performance status of 0-1
+- Platelets > 75,000/µl
+- Patients are eligible under ONE of the following criteria:
+\\\\* Hemoglobin >= 9 g/dL
+\\\\* Prior trastuzumab"""
+
+EXCLUSION = """- Hemoglobin < 9.0 g/dL
+- Total bilirubin > 1.5 times ULN
+- ALT > 2.5 times ULN if no liver metastases
+- Active brain metastases"""
+
+PATIENT = {
+    "patientId": "PAT1",
+    "demographics": {"dob": "1965-03-15"},
+    "recentLabs": [{"components": [
+        {"test": "Hgb", "value": 12.1, "unit": "g/dL", "refRange": "12.0-16.0"},
+        {"test": "Plt", "value": 250, "unit": "K/uL", "refRange": "150-400"},
+        {"test": "Bilirubin", "value": 2.0, "unit": "mg/dL", "refRange": "0.1-1.2"},
+    ]}],
+    "notes": [{"text": "Patient ambulatory, ECOG 1."}],
+}
+
+
+class TestAtomization(unittest.TestCase):
+    def setUp(self):
+        self.atoms = atomize_criteria("NCT1", INCLUSION, "inclusion") + atomize_criteria("NCT1", EXCLUSION, "exclusion")
+        self.by_text = {a["text"]: a for a in self.atoms}
+
+    def test_bullets_and_nesting(self):
+        self.assertEqual(len(self.atoms), 10)
+        parent = self.by_text["Patients are eligible under ONE of the following criteria:"]
+        child = self.by_text["Hemoglobin >= 9 g/dL"]
+        self.assertEqual(child["parent_id"], parent["criterion_id"])
+        # Nested inclusion bullets are alternatives, so they are never decided locally
+        self.assertFalse(child["deterministic"])
+
+    def test_stable_ids(self):
+        self.assertEqual(self.by_text["Age >= 18 years"]["criterion_id"], criterion_id("NCT1", "inclusion", "  age >= 18 YEARS. "))
+        reordered = atomize_criteria("NCT1", "- Platelets > 75,000/µl\n- Age >= 18 years", "inclusion")
+        self.assertEqual(reordered[1]["criterion_id"], self.by_text["Age >= 18 years"]["criterion_id"])
+
+    def test_thresholds_and_categories(self):
+        ecog = self.by_text["Eastern Cooperative Oncology Group (ECOG) performance status of 0-1"]
+        self.assertEqual((ecog["category"], ecog["operator"], ecog["value"], ecog["value_max"]), ("ecog", "between", 0.0, 1.0))
+        platelets = self.by_text["Platelets > 75,000/µl"]
+        self.assertEqual((platelets["analyte"], platelets["operator"], platelets["value"]), ("platelets", ">", 75000.0))
+        bilirubin = self.by_text["Total bilirubin > 1.5 times ULN"]
+        self.assertEqual(bilirubin["uln_multiple"], 1.5)
+        self.assertFalse(self.by_text["ALT > 2.5 times ULN if no liver metastases"]["deterministic"])
+        self.assertEqual(self.by_text["Active brain metastases"]["category"], "cns_metastases")
+
+    def test_local_evaluation(self):
+        decided, remaining = split_atoms(self.atoms, PATIENT)
+        statuses = {r["criterion"]: r["status"] for r in decided}
+        self.assertEqual(statuses["Age >= 18 years"], "MET")
+        self.assertEqual(statuses["Eastern Cooperative Oncology Group (ECOG) performance status of 0-1"], "MET")
+        self.assertEqual(statuses["Platelets > 75,000/µl"], "MET")  # 250 K/uL vs 75 x 10^9/L
+        self.assertEqual(statuses["Hemoglobin < 9.0 g/dL"], "MET")  # exclusion condition is false
+        self.assertEqual(statuses["Total bilirubin > 1.5 times ULN"], "NOT_MET")  # 2.0 > 1.5 x 1.2
+        self.assertIn("Active brain metastases", [a["text"] for a in remaining])
+
+    def test_missing_data_is_left_for_the_llm(self):
+        self.assertIsNone(evaluate_atom(self.by_text["Age >= 18 years"], {"patientId": "PAT2"}))
+
+
+class TestCriteriaIndex(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.db_path = os.path.join(self.tmp.name, "trials.db")
+        conn = sqlite3.connect(self.db_path)
+        conn.execute("CREATE TABLE clinical_trials (nct_id TEXT, inclusion_criteria_text TEXT, exclusion_criteria_text TEXT)")
+        conn.execute("INSERT INTO clinical_trials VALUES (?, ?, ?)", ("NCT1", INCLUSION, EXCLUSION))
+        conn.commit()
+        conn.close()
+        self.index = CriteriaIndex(self.db_path)
+
+    def tearDown(self):
+        self.index.close()
+        self.tmp.cleanup()
+
+    def test_rebuild_and_lookup(self):
+        self.assertEqual(self.index.rebuild_from_trials(), 1)
+        atoms = self.index.get_atoms("NCT1")
+        self.assertEqual(len(atoms), 10)
+        self.assertEqual(atoms[0]["kind"], "inclusion")
+        self.assertEqual(self.index.stats()["deterministic"], sum(a["deterministic"] for a in atoms))
+        # Re-indexing replaces rather than duplicates
+        self.index.rebuild_from_trials()
+        self.assertEqual(self.index.stats()["criteria"], 10)
+
+    def test_unindexed_trial_is_atomized_on_the_fly(self):
+        atoms = self.index.atoms_for_trial({"nct_id": "NCT2", "inclusion_criteria_text": "- Age >= 18 years"})
+        self.assertEqual(len(atoms), 1)
+        self.assertTrue(atoms[0]["deterministic"])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,68 @@
+import os
+import tempfile
+import time
+import unittest
+
+try:
+    from backend.core.embedding_cache import EmbeddingCache
+except ImportError:
+    import sys
+    sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+    from backend.core.embedding_cache import EmbeddingCache
+
+
+class TestEmbeddingCache(unittest.TestCase):
+    def setUp(self):
+        self.calls = []
+
+    def _encode(self, text):
+        self.calls.append(text)
+        return [float(len(text)), 0.5, -1.0]
+
+    def test_normalized_queries_share_entry(self):
+        cache = EmbeddingCache(model_name="test-model")
+        first = cache.get_or_compute("  Ovarian   Cancer  BRCA1 ", self._encode)
+        second = cache.get_or_compute("ovarian cancer brca1", self._encode)
+        self.assertEqual(first, second)
+        self.assertEqual(self.calls, ["ovarian cancer brca1"])
+        stats = cache.stats()
+        self.assertEqual(stats["hits"], 1)
+        self.assertEqual(stats["misses"], 1)
+
+    def test_model_name_is_part_of_key(self):
+        cache_a = EmbeddingCache(model_name="model-a")
+        cache_b = EmbeddingCache(model_name="model-b")
+        self.assertNotEqual(cache_a._key("query"), cache_b._key("query"))
+
+    def test_lru_eviction(self):
+        cache = EmbeddingCache(model_name="test-model", max_entries=2)
+        cache.put("a", [1.0])
+        cache.put("b", [2.0])
+        cache.get("a")  # "a" becomes most recently used
+        cache.put("c", [3.0])
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(cache.get("a"), [1.0])
+        self.assertEqual(cache.stats()["size"], 2)
+
+    def test_ttl_expiry(self):
+        cache = EmbeddingCache(model_name="test-model", ttl_seconds=0.01)
+        cache.put("query", [1.0])
+        time.sleep(0.02)
+        self.assertIsNone(cache.get("query"))
+
+    def test_disk_tier_survives_restart(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "embeddings.db")
+            cache = EmbeddingCache(model_name="test-model", persist_path=path)
+            cache.get_or_compute("her2 positive breast cancer", self._encode)
+            cache.close()
+
+            reopened = EmbeddingCache(model_name="test-model", persist_path=path)
+            self.assertEqual(reopened.get("HER2 positive breast cancer"), [27.0, 0.5, -1.0])
+            self.assertEqual(reopened.stats()["disk_hits"], 1)
+            reopened.close()
+        self.assertEqual(len(self.calls), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
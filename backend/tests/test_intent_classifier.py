@@ -0,0 +1,102 @@
+import asyncio
+import os
+import unittest
+
+try:
+    from backend.core.intent_classifier import IntentClassifier, extract_entities, normalize_prompt, TIER_CACHE, TIER_LLM, TIER_RULES
+    from backend.core.intents import FIND_TRIALS, MANAGE_SIDE_EFFECTS, NOTIFY, REFERRAL, SCHEDULE, UNKNOWN_INTENT
+except ImportError:
+    import sys
+    sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+    from backend.core.intent_classifier import IntentClassifier, extract_entities, normalize_prompt, TIER_CACHE, TIER_LLM, TIER_RULES
+    from backend.core.intents import FIND_TRIALS, MANAGE_SIDE_EFFECTS, NOTIFY, REFERRAL, SCHEDULE, UNKNOWN_INTENT
+
+
+class TestIntentClassifier(unittest.TestCase):
+    def setUp(self):
+        self.llm_calls = []
+
+        async def fake_llm(prompt):
+            self.llm_calls.append(prompt)
+            return {"status": "success", "intent": "answer_question", "entities": {}}
+
+        self.classifier = IntentClassifier(llm_fallback=fake_llm)
+
+    def classify(self, prompt):
+        return asyncio.run(self.classifier.classify(prompt))
+
+    def test_rules_answer_obvious_prompts(self):
+        result = self.classify("Summarize the latest labs")
+        self.assertEqual(result["intent"], "summarize")
+        self.assertEqual(result["intent_tier"], TIER_RULES)
+        self.assertEqual(result["entities"]["timeframe"], "latest")
+
+        result = self.classify("Find trials for lung cancer with EGFR mutation")
+        self.assertEqual(result["intent"], "find_trials")
+        self.assertEqual(result["entities"]["specific_condition"], "lung cancer")
+        self.assertEqual(self.llm_calls, [])
+
+    def test_ambiguous_prompt_falls_back_to_llm(self):
+        result = self.classify("Summarize the side effects seen in this study")
+        self.assertEqual(result["intent_tier"], TIER_LLM)
+        self.assertEqual(len(self.llm_calls), 1)
+
+        result = self.classify("Anything new")
+        self.assertEqual(result["intent_tier"], TIER_LLM)
+        self.assertEqual(len(self.llm_calls), 2)
+
+    def test_repeat_prompt_hits_cache(self):
+        self.classify("Anything new?")
+        result = self.classify("  anything   NEW ")
+        self.assertEqual(result["intent_tier"], TIER_CACHE)
+        self.assertEqual(len(self.llm_calls), 1)
+        self.assertEqual(self.classifier.stats()["tiers"], {TIER_CACHE: 1, TIER_RULES: 0, TIER_LLM: 1})
+
+    def test_condition_only_when_it_names_a_condition(self):
+        result = self.classify("Is she eligible for any clinical trials?")
+        self.assertEqual(result["intent"], FIND_TRIALS)
+        self.assertNotIn("specific_condition", result["entities"])
+        self.assertEqual(extract_entities("Look for trials for her metastatic breast cancer")["specific_condition"],
+                         "metastatic breast cancer")
+        self.assertNotIn("specific_condition", extract_entities("Schedule a follow-up for next Tuesday"))
+
+    def test_referral_specialty_allows_words_before_to(self):
+        result = self.classify("Refer the patient to a cardiologist for palpitations")
+        self.assertEqual(result["intent"], REFERRAL)
+        self.assertEqual(result["entities"]["recipient_specialty"], "Cardiologist")
+        for prompt, specialty in [("Draft a referral to oncology", "Oncology"),
+                                  ("Please refer Mrs. Lee back to the dermatology clinic", "Dermatology")]:
+            self.assertEqual(extract_entities(prompt)["recipient_specialty"], specialty)
+
+    def test_rules_answer_only_with_the_entities_agents_need(self):
+        expected = {
+            "What are side effects of Letrozole?": (MANAGE_SIDE_EFFECTS, {"medication_name": "Letrozole"}),
+            "Notify Dr. Baker about the patient's high glucose from yesterday's labs":
+                (NOTIFY, {"recipient": "Dr. Baker", "specific_condition": "high glucose"}),
+            "Schedule a follow-up next Tuesday morning": (SCHEDULE, {"date_details": "next Tuesday", "time_preference": "morning"}),
+            "Refer the patient to cardiology for chest pain evaluation":
+                (REFERRAL, {"recipient_specialty": "Cardiology", "reason": "chest pain evaluation"}),
+        }
+        for prompt, (intent, entities) in expected.items():
+            with self.subTest(prompt=prompt):
+                result = self.classify(prompt)
+                self.assertEqual((result["intent"], result["intent_tier"]), (intent, TIER_RULES))
+                self.assertEqual({key: result["entities"].get(key) for key in entities}, entities)
+        self.assertEqual(self.llm_calls, [])
+
+        # Intent is clear but the agent's inputs are not: the LLM extracts them
+        for prompt in ("What are the side effects of her medications?", "Refer the patient to a cardiologist",
+                       "Notify Dr. Baker", "Schedule a follow-up"):
+            self.assertEqual(self.classify(prompt)["intent_tier"], TIER_LLM)
+        self.assertEqual(len(self.llm_calls), 4)
+
+    def test_unmatched_prompt_without_llm_is_unknown_intent(self):
+        result = asyncio.run(IntentClassifier().classify("Anything new"))
+        self.assertEqual(result["intent"], UNKNOWN_INTENT)
+
+    def test_normalize_prompt(self):
+        self.assertEqual(normalize_prompt("  Find   Trials!? "), "find trials")
+
+
+if __name__ == '__main__':
+    unittest.main()
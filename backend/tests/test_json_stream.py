@@ -0,0 +1,80 @@
+import json
+import os
+import sqlite3
+import tempfile
+import unittest
+
+try:
+    from backend.core.json_stream import _iter_with_raw_decode, iter_json_array
+    from backend.scripts import load_mutations_to_db as loader
+except ImportError:
+    import sys
+    sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+    from backend.core.json_stream import _iter_with_raw_decode, iter_json_array
+    from backend.scripts import load_mutations_to_db as loader
+
+
+def _mutation(i, patient):
+    return {
+        "uniqueSampleKey": f"key{i}", "uniquePatientKey": f"pk-{patient}", "patientId": patient,
+        "sampleId": f"{patient}-01", "gene": {"hugoGeneSymbol": "TP53" if i % 2 else "PIK3CA"},
+        "proteinChange": f"R{i}H", "variantType": "SNP", "chromosome": "17",
+        "startPosition": 7670000 + i, "endPosition": 7670000 + i, "mutationStatus": "Somatic",
+    }
+
+
+class TestJsonStream(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def _write(self, name, data, **kwargs):
+        path = os.path.join(self.tmp.name, name)
+        with open(path, "w") as f:
+            json.dump(data, f, **kwargs)
+        return path
+
+    def test_fallback_parser_matches_json_load_across_chunk_boundaries(self):
+        data = [{"id": i, "text": "é" * (i % 7), "values": [1.5, None, True]} for i in range(300)] + [12345, "tail", []]
+        path = self._write("data.json", data, indent=2)
+        for chunk_size in (1, 13, 4096):
+            self.assertEqual(list(_iter_with_raw_decode(path, chunk_size)), data)
+        self.assertEqual(list(iter_json_array(path)), data)
+        self.assertEqual(list(_iter_with_raw_decode(self._write("empty.json", []), 4)), [])
+
+    def test_fallback_parser_rejects_non_arrays_and_truncation(self):
+        with self.assertRaises(ValueError):
+            list(_iter_with_raw_decode(self._write("obj.json", {"a": 1}), 8))
+        path = os.path.join(self.tmp.name, "truncated.json")
+        with open(path, "w") as f:
+            f.write('[{"a": 1}, {"b": ')
+        with self.assertRaises(ValueError):
+            list(_iter_with_raw_decode(path, 4))
+
+    def test_streaming_load_stores_clinical_once_and_builds_indexes(self):
+        mutations = [_mutation(i, f"P{i % 3}") for i in range(10)]
+        mutations.append({"patientId": "P9", "uniqueSampleKey": "bad", "proteinChange": None, "gene": {}})
+        mutations.append(_mutation(0, "P0"))  # Duplicate primary key
+        mutations_path = self._write("mutations.json", mutations)
+        clinical_path = self._write("clinical.json", [{"Patient ID": f"P{i}", "Diagnosis Age": 50.0 + i} for i in range(3)])
+        db_path = os.path.join(self.tmp.name, "patient_data.db")
+
+        stats = loader.run(mutations_path, clinical_path, db_path, batch_size=4, build_store=False)
+        self.assertEqual((stats["records"], stats["inserted"]), (12, 10))
+        self.assertEqual((stats["skipped_missing_fields"], stats["skipped_duplicates"]), (1, 1))
+
+        conn = sqlite3.connect(db_path)
+        self.assertEqual(conn.execute("SELECT COUNT(*) FROM clinical_patients").fetchone()[0], 3)
+        joined = conn.execute(
+            "SELECT COUNT(*) FROM mutations m JOIN clinical_patients c ON c.patient_id = m.patient_id"
+        ).fetchone()[0]
+        self.assertEqual(joined, 10)
+        indexes = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'index'")}
+        self.assertTrue({"idx_mutations_patient_id", "idx_mutations_hugo_gene_symbol"} <= indexes)
+        conn.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
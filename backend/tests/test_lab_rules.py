@@ -0,0 +1,74 @@
+import os
+import unittest
+
+import numpy as np
+
+try:
+    from backend.core.criteria_index import atomize_criteria
+    from backend.core.lab_rules import (
+        STATUS_MET, STATUS_NOT_MET, STATUS_UNCLEAR, LabRuleEngine, normalize_value, upper_limit,
+    )
+except ImportError:
+    import sys
+    sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+    from backend.core.criteria_index import atomize_criteria
+    from backend.core.lab_rules import (
+        STATUS_MET, STATUS_NOT_MET, STATUS_UNCLEAR, LabRuleEngine, normalize_value, upper_limit,
+    )
+
+
+def make_patient(hgb=None, plt=None, creatinine=None, creatinine_unit="mg/dL", alt=None):
+    components = []
+    if hgb is not None:
+        components.append({"test": "Hgb", "value": hgb, "unit": "g/dL", "refRange": "12.0-16.0"})
+    if plt is not None:
+        components.append({"test": "Plt", "value": plt, "unit": "K/uL", "refRange": "150-400"})
+    if creatinine is not None:
+        components.append({"test": "Creatinine", "value": creatinine, "unit": creatinine_unit})
+    if alt is not None:
+        components.append({"test": "ALT", "value": alt, "unit": "U/L", "refRange": "10-40"})
+    return {"recentLabs": [{"panelName": "Panel", "components": components}]}
+
+
+class TestLabRuleEngine(unittest.TestCase):
+    def setUp(self):
+        inclusion = "- Hemoglobin >= 9 g/dL\n- Platelets >= 100,000/mm^3\n- Serum creatinine <= 1.5 mg/dL"
+        exclusion = "- ALT > 2.5 times ULN\n- Active brain metastases"
+        atoms = atomize_criteria("NCT1", inclusion, "inclusion") + atomize_criteria("NCT1", exclusion, "exclusion")
+        self.engine = LabRuleEngine(atoms)
+
+    def test_only_lab_thresholds_are_compiled(self):
+        self.assertEqual(len(self.engine), 4)
+
+    def test_matrix_evaluation(self):
+        patients = [
+            make_patient(hgb=12.1, plt=250, creatinine=0.9, alt=25),
+            make_patient(hgb=8.5, plt=90, creatinine=150, creatinine_unit="µmol/L", alt=120),
+            make_patient(hgb=10.0),
+        ]
+        statuses = self.engine.evaluate(patients)
+        self.assertEqual(statuses.shape, (3, 4))
+        np.testing.assert_array_equal(statuses[0], [STATUS_MET] * 4)
+        # 150 µmol/L = 1.7 mg/dL; ALT 120 = 3 x ULN on an exclusion
+        np.testing.assert_array_equal(statuses[1], [STATUS_NOT_MET] * 4)
+        np.testing.assert_array_equal(statuses[2], [STATUS_MET, STATUS_UNCLEAR, STATUS_UNCLEAR, STATUS_UNCLEAR])
+        np.testing.assert_array_equal(
+            LabRuleEngine.patient_verdicts(statuses), [STATUS_MET, STATUS_NOT_MET, STATUS_UNCLEAR]
+        )
+
+    def test_evaluate_patient_reports_evidence(self):
+        results = self.engine.evaluate_patient(make_patient(hgb=8.0))
+        self.assertEqual(results[0]["status"], "NOT_MET")
+        self.assertIn("Hgb 8.0 g/dL", results[0]["reasoning"])
+        self.assertEqual(results[1]["status"], "UNCLEAR")
+
+    def test_unit_helpers(self):
+        self.assertAlmostEqual(normalize_value(88.4, "umol/L", "creatinine")[0], 1.0)
+        self.assertEqual(normalize_value(75000, "/µL", "platelets"), (75.0, "10^9/L"))
+        self.assertEqual(normalize_value(5, "furlongs", "platelets"), (None, None))
+        self.assertEqual(upper_limit("10-40"), 40.0)
+        self.assertEqual(upper_limit("< 38"), 38.0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,165 @@
+import asyncio
+import json
+import os
+import unittest
+
+try:
+    from backend.core.llm_gateway import LLMGateway, LLMBlockedError
+    from backend.core.llm_clients import GeminiProvider, LLMProvider, LocalLLMProvider, SimulatedLLMError
+except ImportError:
+    import sys
+    sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+    from backend.core.llm_gateway import LLMGateway, LLMBlockedError
+    from backend.core.llm_clients import GeminiProvider, LLMProvider, LocalLLMProvider, SimulatedLLMError
+
+
+class ResourceExhausted(Exception):
+    """ Stand-in with the same class name as google.api_core's 429 error. """
+
+
+class TestLLMGateway(unittest.TestCase):
+    def _gateway(self, generate_fn, **kwargs):
+        kwargs.setdefault("rate_limit_rpm", 0)  # disable rate limiting unless a test wants it
+        kwargs.setdefault("backoff_base", 0.001)
+        return LLMGateway(generate_fn=generate_fn, **kwargs)
+
+    def test_concurrency_is_bounded_per_model(self):
+        state = {"active": 0, "peak": 0}
+
+        async def generate(prompt, model_name, generation_config, safety_settings):
+            state["active"] += 1
+            state["peak"] = max(state["peak"], state["active"])
+            await asyncio.sleep(0.01)
+            state["active"] -= 1
+            return prompt
+
+        gateway = self._gateway(generate, max_concurrency=2)
+
+        async def main():
+            return await asyncio.gather(*(gateway.generate(f"p{i}", caller="test") for i in range(6)))
+
+        results = asyncio.run(main())
+        self.assertEqual(results, [f"p{i}" for i in range(6)])
+        self.assertEqual(state["peak"], 2)
+
+    def test_identical_prompts_are_coalesced(self):
+        calls = []
+
+        async def generate(prompt, model_name, generation_config, safety_settings):
+            calls.append(prompt)
+            await asyncio.sleep(0.01)
+            return "answer"
+
+        gateway = self._gateway(generate)
+
+        async def main():
+            return await asyncio.gather(
+                gateway.generate("same", caller="a"),
+                gateway.generate("same", caller="b"),
+                gateway.generate("other", caller="a"),
+            )
+
+        self.assertEqual(asyncio.run(main()), ["answer", "answer", "answer"])
+        self.assertEqual(sorted(calls), ["other", "same"])
+        self.assertEqual(gateway.metrics()["callers"]["b"]["coalesced"], 1)
+
+    def test_retries_transient_errors(self):
+        attempts = {"count": 0}
+
+        async def generate(prompt, model_name, generation_config, safety_settings):
+            attempts["count"] += 1
+            if attempts["count"] < 3:
+                raise ResourceExhausted("quota")
+            return "ok"
+
+        gateway = self._gateway(generate, max_retries=3)
+        self.assertEqual(asyncio.run(gateway.generate("p", caller="retry")), "ok")
+        self.assertEqual(gateway.metrics()["callers"]["retry"]["retries"], 2)
+
+    def test_non_retryable_errors_fail_fast(self):
+        attempts = {"count": 0}
+
+        async def generate(prompt, model_name, generation_config, safety_settings):
+            attempts["count"] += 1
+            raise LLMBlockedError("SAFETY")
+
+        gateway = self._gateway(generate, max_retries=3)
+        with self.assertRaises(LLMBlockedError):
+            asyncio.run(gateway.generate("p", caller="blocked"))
+        self.assertEqual(attempts["count"], 1)
+        self.assertEqual(gateway.metrics()["callers"]["blocked"]["failures"], 1)
+
+    def test_rate_limit_spaces_requests(self):
+        async def generate(prompt, model_name, generation_config, safety_settings):
+            return prompt
+
+        # 600 rpm = 10/s with a burst of 1 -> the 3rd request waits ~0.2s
+        gateway = self._gateway(generate, max_concurrency=1, rate_limit_rpm=600)
+
+        async def main():
+            loop = asyncio.get_running_loop()
+            start = loop.time()
+            for i in range(3):
+                await gateway.generate(f"p{i}", caller="rl")
+            return loop.time() - start
+
+        self.assertGreaterEqual(asyncio.run(main()), 0.15)
+
+    def test_unavailable_without_key_or_backend(self):
+        gateway = LLMGateway(provider=GeminiProvider(api_key=""))
+        self.assertFalse(gateway.available)
+        self.assertIn("'gemini'", gateway.unavailable_reason)
+        self.assertIn("GOOGLE_API_KEY", gateway.unavailable_reason)
+        self.assertIsNone(LLMGateway(provider=LocalLLMProvider(latency_ms=0)).unavailable_reason)
+
+    def test_provider_interface_is_abstract(self):
+        with self.assertRaises(TypeError):
+            LLMProvider()
+
+
+class TestLocalLLMProvider(unittest.TestCase):
+    ELIGIBILITY_PROMPT = """
+Trial Title: Example
+Inclusion Criteria:
+* Age >= 18 years
+* ECOG performance status 0-1
+* Adequate bone marrow function
+Exclusion Criteria:
+* Pregnant or breastfeeding
+* Active brain metastases
+
+**Instructions & Output Format (Plain Text ONLY):**
+== SUMMARY ==
+== ELIGIBILITY ==
+== MET CRITERIA ==
+== UNMET CRITERIA ==
+== UNCLEAR CRITERIA ==
+"""
+
+    def test_eligibility_response_is_structured_and_deterministic(self):
+        provider = LocalLLMProvider(latency_ms=0)
+        first = asyncio.run(provider.generate(self.ELIGIBILITY_PROMPT, "local"))
+        second = asyncio.run(provider.generate(self.ELIGIBILITY_PROMPT, "local"))
+        self.assertEqual(first, second)
+        for marker in ("== SUMMARY ==", "== ELIGIBILITY ==", "== MET CRITERIA ==", "== UNMET CRITERIA ==", "== UNCLEAR CRITERIA =="):
+            self.assertIn(marker, first)
+        # Every criterion from the prompt lands in exactly one bucket
+        for criterion in ("Age >= 18 years", "Pregnant or breastfeeding", "Active brain metastases"):
+            self.assertEqual(first.count(f"* {criterion}"), 1)
+
+    def test_intent_response_is_json(self):
+        provider = LocalLLMProvider(latency_ms=0)
+        prompt = 'The possible intents are: ["find_trials"]\nAnalyze the following user request:\nFind trials for lung cancer\n\nRespond ONLY with a JSON object'
+        parsed = json.loads(provider.respond(prompt))
+        self.assertEqual(parsed["intent"], "find_trials")
+        self.assertEqual(parsed["entities"]["specific_condition"], "lung cancer")
+
+    def test_injected_errors_are_retried_by_gateway(self):
+        provider = LocalLLMProvider(latency_ms=0, error_rate=1.0)
+        with self.assertRaises(SimulatedLLMError):
+            asyncio.run(provider.generate("hello", "local"))
+        self.assertTrue(LLMGateway.is_retryable(SimulatedLLMError("x")))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,126 @@
+import asyncio
+import os
+import tempfile
+import unittest
+
+try:
+    from backend.scripts import load_trials_local as loader
+except ImportError:
+    import sys
+    sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+    from backend.scripts import load_trials_local as loader
+
+MARKDOWN = """# Trial {n}
+Trial Status: Active
+
+## Description
+Description {n}
+
+## Eligibility Criteria
+### Inclusion Criteria
+- Age >= 18 years
+
+### Exclusion Criteria
+- Pregnancy
+
+## Trial IDs
+- **Primary ID** P{n}
+- **ClinicalTrials.gov ID** [NCT0000000{n}](https://clinicaltrials.gov/study/NCT0000000{n})
+"""
+
+
+def _trial(n, extra=""):
+    return {"metadata": {"sourceURL": f"https://example.org/{n}", "title": f"Trial {n}"},
+            "markdown": MARKDOWN.format(n=n) + extra}
+
+
+class FakeModel:
+    def __init__(self):
+        self.calls = []
+
+    def encode(self, texts, batch_size=32, show_progress_bar=False):
+        self.calls.append(len(texts))
+        return [[float(len(t)), 1.0] for t in texts]
+
+
+class FakeCollection:
+    def __init__(self, fail=False):
+        self.ids = []
+        self.fail = fail
+
+    def upsert(self, ids, embeddings, documents, metadatas):
+        if self.fail:
+            raise RuntimeError("Chroma unavailable")
+        self.ids.extend(ids)
+
+
+class TestIncrementalTrialIngestion(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.conn = loader.initialize_sqlite(os.path.join(self.tmp.name, "trials.db"))
+
+    def tearDown(self):
+        self.conn.close()
+        self.tmp.cleanup()
+
+    def _ingest(self, trials, collection=None, **kwargs):
+        model, collection = FakeModel(), collection or FakeCollection()
+        stats = asyncio.run(loader.ingest(trials, self.conn, collection, model, use_llm=False, **kwargs))
+        return stats, model, collection
+
+    def test_unchanged_trials_are_skipped(self):
+        trials = [_trial(n) for n in range(1, 6)]
+        stats, model, collection = self._ingest(trials, chunk_size=2)
+        self.assertEqual((stats["processed"], stats["unchanged"]), (5, 0))
+        self.assertEqual(model.calls, [2, 2, 1])  # One batched encode per chunk
+        self.assertEqual(len(collection.ids), 5)
+
+        trials[2] = _trial(3, extra="\nUpdated text\n")
+        stats, model, collection = self._ingest(trials)
+        self.assertEqual((stats["processed"], stats["unchanged"]), (1, 4))
+        self.assertEqual(collection.ids, ["https://example.org/3"])
+
+        row = self.conn.execute("SELECT nct_id, content_hash, ai_summary FROM clinical_trials WHERE source_url = ?",
+                                ("https://example.org/3",)).fetchone()
+        self.assertEqual(row["nct_id"], "NCT00000003")
+        self.assertEqual(row["content_hash"], loader.trial_content_hash(trials[2]))
+        self.assertEqual(row["ai_summary"], loader.SUMMARY_SKIPPED_MISSING_TEXT)
+
+    def test_failed_or_skipped_vector_upserts_are_retried(self):
+        trials = [_trial(n) for n in range(1, 4)]
+        stats, _, _ = self._ingest(trials, collection=FakeCollection(fail=True))
+        self.assertEqual((stats["processed"], stats["errors"]), (3, 3))
+        row = self.conn.execute("SELECT content_hash, vector_hash FROM clinical_trials WHERE source_url = ?",
+                                ("https://example.org/1",)).fetchone()
+        self.assertEqual(row["content_hash"], loader.trial_content_hash(trials[0]))
+        self.assertIsNone(row["vector_hash"])
+
+        # SQLite is current, but the embeddings are still owed
+        stats, _, collection = self._ingest(trials)
+        self.assertEqual((stats["processed"], stats["unchanged"], stats["embedded"]), (3, 0, 3))
+        self.assertEqual(len(collection.ids), 3)
+        stats, _, collection = self._ingest(trials)
+        self.assertEqual((stats["unchanged"], collection.ids), (3, []))
+
+        # A --no-vector run does not mark the new trial as embedded
+        trials.append(_trial(4))
+        stats = asyncio.run(loader.ingest(trials, self.conn, use_llm=False))
+        self.assertEqual((stats["processed"], stats["unchanged"]), (1, 3))
+        stats, _, collection = self._ingest(trials)
+        self.assertEqual(collection.ids, ["https://example.org/4"])
+
+    def test_summaries_are_reused_when_prompt_is_unchanged(self):
+        item = {"source_url": "u1", "parsed": {"description_text": "d", "objectives_text": "o"}}
+        prompt_hash = loader.content_hash(loader.summary_prompt(item["parsed"]))
+        existing = {"u1": {"summary_hash": prompt_hash, "ai_summary": "Cached summary"}}
+        generated = asyncio.run(loader.summarize_trials([item], existing, llm_available=True, workers=4))
+        self.assertEqual(generated, 0)
+        self.assertEqual((item["ai_summary"], item["summary_hash"]), ("Cached summary", prompt_hash))
+
+        fresh = {"source_url": "u2", "parsed": dict(item["parsed"])}
+        asyncio.run(loader.summarize_trials([fresh], existing, llm_available=False, workers=4))
+        self.assertEqual((fresh["ai_summary"], fresh["summary_hash"]), (loader.SUMMARY_SKIPPED_NO_LLM, None))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,95 @@
+import os
+import sqlite3
+import tempfile
+import unittest
+
+try:
+    from backend.core.mutation_store import MutationStore, get_mutation_store, reset_mutation_store
+except ImportError:
+    import sys
+    sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+    from backend.core.mutation_store import MutationStore, get_mutation_store, reset_mutation_store
+
+
+def _record(patient, gene, protein, chrom, start, end, variant="SNP"):
+    return {
+        "patientId": patient, "sampleId": f"{patient}-01", "gene": {"hugoGeneSymbol": gene},
+        "proteinChange": protein, "chromosome": chrom, "startPosition": start, "endPosition": end,
+        "variantType": variant, "mutationStatus": "Somatic",
+    }
+
+
+RECORDS = [
+    _record("P1", "PIK3CA", "H1047R", "3", 179234297, 179234297),
+    _record("P2", "PIK3CA", "E545K", "3", 179218303, 179218303),
+    _record("P3", "PIK3CA", "p.H1047R", "chr3", 179234297, 179234297),
+    _record("P3", "TP53", "R175H", "17", 7675088, 7675088),
+    _record("P4", "TP53", "X125_splice", "17", 7674180, 7674200, variant="DEL"),
+    {"patientId": "P5", "gene": {}},  # No gene symbol: skipped
+]
+
+
+class TestMutationStore(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.store_dir = os.path.join(self.tmp.name, "mutation_store")
+        MutationStore.build(RECORDS, self.store_dir)
+        self.store = MutationStore.open(self.store_dir)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_cohort_queries(self):
+        self.assertEqual(self.store.meta["rows"], 5)
+        self.assertEqual(self.store.patients_with("PIK3CA", "H1047R"), ["P1", "P3"])
+        self.assertEqual(self.store.patients_with("pik3ca", "p.h1047r"), ["P1", "P3"])
+        self.assertEqual(self.store.patients_with("PIK3CA"), ["P1", "P2", "P3"])
+        self.assertEqual(self.store.patients_with("TP53", variant_type="DEL"), ["P4"])
+        self.assertEqual(self.store.patients_with("KRAS"), [])
+        self.assertEqual(self.store.gene_counts(), {"PIK3CA": 3, "TP53": 2})
+
+    def test_presence_matrix(self):
+        matrix, genes, patients = self.store.presence_matrix(["TP53", "PIK3CA", "KRAS"], ["P3", "P4", "P9"])
+        self.assertEqual((genes, patients), (["TP53", "PIK3CA", "KRAS"], ["P3", "P4", "P9"]))
+        self.assertEqual(matrix.astype(int).tolist(), [[1, 1, 0], [1, 0, 0], [0, 0, 0]])
+
+    def test_range_lookup_and_patient_rows(self):
+        hits = self.store.range_lookup("chr17", 7674190)
+        self.assertEqual([(m["patient_id"], m["protein_change"]) for m in hits], [("P4", "X125_SPLICE")])
+        self.assertEqual(len(self.store.range_lookup("3", 179200000, 179300000)), 3)
+        self.assertEqual(self.store.range_lookup("X", 1, 10), [])
+
+        mutations = self.store.mutations_for_patient("P3")
+        self.assertEqual(sorted(m["hugo_gene_symbol"] for m in mutations), ["PIK3CA", "TP53"])
+        self.assertEqual(mutations[0]["sample_id"], "P3-01")
+
+    def test_build_from_sqlite_matches_table(self):
+        db_path = os.path.join(self.tmp.name, "patient_data.db")
+        conn = sqlite3.connect(db_path)
+        conn.execute("CREATE TABLE mutations (patient_id TEXT, hugo_gene_symbol TEXT, protein_change TEXT, "
+                     "chromosome TEXT, start_position INTEGER, end_position INTEGER)")
+        conn.executemany("INSERT INTO mutations VALUES (?, ?, ?, ?, ?, ?)", [
+            ("P1", "KRAS", "G12D", "12", 25245350, 25245350),
+            ("P2", "KRAS", "G12V", "12", 25245350, 25245350),
+        ])
+        conn.commit()
+        conn.close()
+        store = MutationStore.build_from_sqlite(db_path)
+        self.assertEqual(store.patients_with("KRAS", "G12D"), ["P1"])
+        self.assertEqual(len(store.range_lookup("12", 25245350)), 2)
+
+    def test_shared_store_reopens_after_rebuild(self):
+        self.addCleanup(reset_mutation_store)
+        shared = get_mutation_store(self.store_dir)
+        self.assertIs(get_mutation_store(self.store_dir), shared)
+        self.assertEqual(shared.patients_with("KRAS"), [])
+
+        MutationStore.build(RECORDS + [_record("P9", "KRAS", "G12D", "12", 25245350, 25245350)], self.store_dir)
+        rebuilt = get_mutation_store(self.store_dir)  # No reset / restart needed
+        self.assertIsNot(rebuilt, shared)
+        self.assertEqual(rebuilt.patients_with("KRAS"), ["P9"])
+        self.assertEqual(shared.patients_with("PIK3CA"), ["P1", "P2", "P3"])  # Old mappings stay readable
+
+
+if __name__ == '__main__':
+    unittest.main()
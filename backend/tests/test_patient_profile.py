@@ -0,0 +1,95 @@
+import os
+import unittest
+
+try:
+    from backend.core.patient_profile import (
+        MAX_ECOG_MENTIONS, PatientProfileCache, build_eligibility_profile, compression_report, estimate_tokens,
+        full_record_text,
+    )
+except ImportError:
+    import sys
+    sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+    from backend.core.patient_profile import (
+        MAX_ECOG_MENTIONS, PatientProfileCache, build_eligibility_profile, compression_report, estimate_tokens,
+        full_record_text,
+    )
+
+PATIENT = {
+    "patientId": "PAT1",
+    "demographics": {"name": "Jane Doe", "age": 58, "sex": "Female", "address": "123 Main St"},
+    "diagnosis": {"primary": "Invasive Ductal Carcinoma", "stage": "Stage IV", "status": "Active Treatment"},
+    "currentMedications": [{"name": "Letrozole", "dosage": "2.5mg"}],
+    "recentLabs": [
+        {"panelName": "CBC", "resultDate": "2024-07-25", "components": [
+            {"test": "Hgb", "value": 9.1, "unit": "g/dL", "refRange": "12.0-16.0", "flag": "Low"},
+            {"test": "RBC", "value": 4.2, "unit": "M/uL", "refRange": "4.0-5.5", "flag": "Normal"},
+            {"test": "Plt", "value": 250, "unit": "K/uL", "refRange": "150-400", "flag": "Normal"},
+        ]},
+        {"panelName": "CBC", "resultDate": "2024-06-01", "components": [
+            {"test": "Hgb", "value": 11.0, "unit": "g/dL", "flag": "Low"},
+        ]},
+    ],
+    "mutations": [{"hugo_gene_symbol": "PIK3CA", "protein_change": "H1047R"}, {"hugo_gene_symbol": "PIK3CA", "protein_change": "H1047R"}],
+    "imagingStudies": [{
+        "date": "2024-07-20", "type": "CT", "imageAccess": {"studyInstanceUID": "1.2.840.113619"},
+        "reportText": "Findings: liver lesions. Impression: Hepatic metastases. Recommendation: biopsy.",
+    }],
+    "patientGeneratedHealthData": {"summary": {"averageStepsLast7Days": 4500}},
+    "notes": [{"date": "2024-07-28", "text": "Tolerating therapy. ECOG 1, ambulatory. Long discussion of family history."}],
+}
+
+
+class TestPatientProfile(unittest.TestCase):
+    def test_profile_keeps_eligibility_facts(self):
+        profile = build_eligibility_profile(PATIENT)
+        for expected in ("age 58", "Stage IV", "ECOG: 1", "2024-07-28: ECOG 1, ambulatory", "Hgb 9.1 g/dL", "[LOW]",
+                         "Plt 250", "Letrozole 2.5mg", "PIK3CA H1047R", "Hepatic metastases"):
+            self.assertIn(expected, profile)
+        # Latest lab per test only; normal results outside the lab-rule analytes are dropped
+        self.assertNotIn("11.0", profile)
+        self.assertNotIn("RBC", profile)
+        self.assertEqual(profile.count("PIK3CA"), 1)
+        for dropped in ("123 Main St", "1.2.840.113619", "averageStepsLast7Days", "family history", "biopsy"):
+            self.assertNotIn(dropped, profile)
+
+    def test_latest_dated_lab_wins_regardless_of_panel_order(self):
+        labs = [
+            {"panelName": "CMP", "resultDate": "2024-05-02", "components": [
+                {"test": "Creatinine", "value": 2.4, "unit": "mg/dL", "flag": "High"}]},
+            {"panelName": "Undated", "components": [{"test": "Creatinine", "value": 3.0, "flag": "High"}]},
+            {"panelName": "CMP", "resultDate": "2024-07-30", "components": [
+                {"test": "Creatinine", "value": 0.9, "unit": "mg/dL", "flag": "Normal"}]},
+        ]
+        profile = build_eligibility_profile({"recentLabs": labs})
+        self.assertIn("Creatinine 0.9 mg/dL (2024-07-30)", profile)
+        self.assertNotIn("2.4", profile)
+        self.assertNotIn("3.0", profile)
+
+    def test_ecog_mentions_are_capped_across_notes(self):
+        notes = [{"date": f"2024-0{n}-01", "text": f"ECOG {n} today. Performance status stable; KPS 80."} for n in range(1, 4)]
+        profile = build_eligibility_profile({"notes": notes})
+        self.assertEqual(profile.count(" | ") + 1, MAX_ECOG_MENTIONS)
+        self.assertIn("2024-01-01: ECOG 1 today", profile)
+        self.assertNotIn("2024-03-01", profile)
+
+    def test_cache_by_record_hash_and_report(self):
+        cache = PatientProfileCache(max_entries=1)
+        first = cache.get(PATIENT)
+        self.assertIs(cache.get(dict(PATIENT)), first)
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+        self.assertEqual(first["full_tokens"], estimate_tokens(full_record_text(PATIENT)))
+        self.assertLess(first["profile_tokens"], first["full_tokens"])
+
+        cache.get(dict(PATIENT, notes=[]))
+        self.assertEqual(cache.stats()["entries"], 1)
+
+        report = compression_report(first, prompts_sent=3)
+        self.assertEqual(report["saved_tokens"], 3 * (first["full_tokens"] - first["profile_tokens"]))
+        self.assertEqual(compression_report(first, 0)["saved_tokens"], 0)
+
+    def test_empty_record(self):
+        self.assertEqual(build_eligibility_profile({}), "(No patient information provided)")
+
+
+if __name__ == '__main__':
+    unittest.main()
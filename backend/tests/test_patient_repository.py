@@ -0,0 +1,95 @@
+import asyncio
+import os
+import sqlite3
+import tempfile
+import unittest
+
+try:
+    from backend.core.patient_repository import CLINICAL_SECTIONS, PatientRepository, project_record
+    from backend.core.sqlite_pool import close_all_pools
+except ImportError:
+    import sys
+    sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+    from backend.core.patient_repository import CLINICAL_SECTIONS, PatientRepository, project_record
+    from backend.core.sqlite_pool import close_all_pools
+
+RECORD = {
+    "patientId": "PAT1",
+    "demographics": {"name": "Jane Doe", "dob": "1965-03-15", "sex": "Female"},
+    "diagnosis": {"primary": "Invasive Ductal Carcinoma"},
+    "currentMedications": [{"name": "Letrozole"}, {"name": "Metformin"}],
+    "recentLabs": [{"panelName": "CBC", "components": [{"test": "Hgb", "value": 12.1}]}],
+    "notes": [{"text": "Note 1"}, {"text": "Note 2"}, {"text": "Note 3"}],
+}
+
+
+class TestPatientRepository(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.db_path = os.path.join(self.tmp.name, "patient_data.db")
+        conn = sqlite3.connect(self.db_path)
+        conn.execute("CREATE TABLE mutations (unique_sample_key TEXT PRIMARY KEY, patient_id TEXT, hugo_gene_symbol TEXT)")
+        conn.execute("INSERT INTO mutations VALUES ('s1', 'PAT1', 'PIK3CA')")
+        conn.commit()
+        conn.close()
+        self.repo = PatientRepository(self.db_path, cache_size=2)
+        self.repo.seed([RECORD])
+
+    def tearDown(self):
+        self.repo.close()
+        close_all_pools()
+        self.tmp.cleanup()
+
+    def test_round_trip_with_mutations(self):
+        record = asyncio.run(self.repo.get("PAT1"))
+        for key, value in RECORD.items():
+            self.assertEqual(record[key], value)
+        self.assertEqual([m["hugo_gene_symbol"] for m in record["mutations"]], ["PIK3CA"])
+        self.assertIsNone(asyncio.run(self.repo.get("UNKNOWN")))
+
+    def test_projection_loads_only_requested_sections(self):
+        record = self.repo.get_sync("PAT1", sections=["demographics", "notes"], limits={"notes": 2})
+        self.assertEqual(set(record), {"patientId", "demographics", "notes"})
+        self.assertEqual(len(record["notes"]), 2)
+        self.assertEqual(self.repo._cache["PAT1"]["_loaded"], {"demographics", "notes"})
+        # Clinical sections never pull mutations
+        self.assertNotIn("mutations", self.repo.get_sync("PAT1", sections=CLINICAL_SECTIONS))
+
+    def test_cache_hits_and_write_through_invalidation(self):
+        self.repo.get_sync("PAT1", sections=["notes"])
+        self.repo.get_sync("PAT1", sections=["notes"])
+        self.assertEqual((self.repo.hits, self.repo.misses), (1, 1))
+
+        self.repo.update_section("PAT1", "notes", [{"text": "Updated"}])
+        self.assertNotIn("PAT1", self.repo._cache)
+        self.assertEqual(self.repo.get_sync("PAT1", sections=["notes"])["notes"], [{"text": "Updated"}])
+
+        # Re-seeding with the original record rewrites it; an unchanged seed is a no-op
+        self.assertEqual(self.repo.seed([RECORD]), 1)
+        self.assertEqual(self.repo.seed([RECORD]), 0)
+        self.assertEqual(len(self.repo.get_sync("PAT1", sections=["notes"])["notes"]), 3)
+
+    def test_empty_lists_round_trip_and_late_mutations_table(self):
+        db_path = os.path.join(self.tmp.name, "no_mutations.db")
+        repo = PatientRepository(db_path)
+        repo.seed([{"patientId": "PAT2", "allergies": [], "notes": [], "diagnosis": {}}])
+        record = repo.get_sync("PAT2")
+        self.assertEqual((record["allergies"], record["notes"], record["diagnosis"], record["mutations"]), ([], [], {}, []))
+
+        # The mutation loader creates the table after the repository first looked for it
+        conn = sqlite3.connect(db_path)
+        conn.execute("CREATE TABLE mutations (unique_sample_key TEXT PRIMARY KEY, patient_id TEXT, hugo_gene_symbol TEXT)")
+        conn.execute("INSERT INTO mutations VALUES ('s2', 'PAT2', 'TP53')")
+        conn.commit()
+        conn.close()
+        repo.invalidate("PAT2")
+        self.assertEqual([m["hugo_gene_symbol"] for m in repo.get_sync("PAT2")["mutations"]], ["TP53"])
+        repo.close()
+
+    def test_project_record(self):
+        projected = project_record(RECORD, ["notes", "missing"], {"notes": 1})
+        self.assertEqual(projected, {"patientId": "PAT1", "notes": [{"text": "Note 1"}]})
+
+
+if __name__ == '__main__':
+    unittest.main()
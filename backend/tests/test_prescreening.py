@@ -0,0 +1,140 @@
+import asyncio
+import os
+import tempfile
+import unittest
+
+try:
+    from backend.core.prescreening import (
+        OUTCOME_ASSESSED, OUTCOME_ERROR, OUTCOME_EXCLUDED, PrescreenStore, PrescreeningEngine, make_agent_retriever,
+        parse_phases,
+    )
+except ImportError:
+    import sys
+    sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+    from backend.core.prescreening import (
+        OUTCOME_ASSESSED, OUTCOME_ERROR, OUTCOME_EXCLUDED, PrescreenStore, PrescreeningEngine, make_agent_retriever,
+        parse_phases,
+    )
+
+TRIALS = [
+    {"nct_id": "NCT_OPEN", "status": "Recruiting", "phase": "Phase II",
+     "inclusion_criteria_text": "- Age >= 18 years\n- Platelets >= 100,000/mcL", "exclusion_criteria_text": "- Active brain metastases"},
+    {"nct_id": "NCT_CLOSED", "status": "complete", "phase": "Phase II",
+     "inclusion_criteria_text": "- Age >= 18 years", "exclusion_criteria_text": None},
+    {"nct_id": "NCT_PHASE1", "status": "Recruiting", "phase": "Phase I",
+     "inclusion_criteria_text": "- Age >= 18 years", "exclusion_criteria_text": None},
+    {"nct_id": "NCT_BRCA", "status": "Recruiting", "phase": "Phase I/II",
+     "inclusion_criteria_text": "- Documented germline BRCA1 mutation", "exclusion_criteria_text": None},
+]
+
+
+def make_patient(patient_id, platelets, mutations=None):
+    return {
+        "patientId": patient_id,
+        "demographics": {"age": 52.0},
+        "recentLabs": [{"components": [{"test": "Platelets", "value": platelets, "unit": "K/uL"}]}],
+        "mutations": mutations,
+    }
+
+
+class FakeGenomicResult:
+    def __init__(self, status):
+        self.status = status
+        self.evidence = f"simulated {status}"
+
+
+class FakeGenomicAgent:
+    async def run(self, genomic_query, patient_id, patient_mutations, criterion_id=None):
+        has_brca1 = any(m.get("hugo_gene_symbol") == "BRCA1" for m in patient_mutations)
+        return FakeGenomicResult("MET" if has_brca1 else "NOT_MET")
+
+
+class FakeTrialAgent:
+    def __init__(self):
+        self.searches = []
+
+    def _build_query_text(self, context, entities, prompt):
+        return "breast cancer"
+
+    async def _search_candidates(self, query, entities=None, filters=None, limit=6):
+        self.searches.append((filters, limit))
+        return [{"nct_id": "NCT_CLOSED"}, {"nct_id": "NCT_OPEN"}], None
+
+
+class TestPrescreening(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.store = PrescreenStore(os.path.join(self.tmp.name, "prescreen.db"))
+        self.assessed = []
+        self.fail_for = set()
+
+        async def assessor(patient, trial):
+            self.assessed.append((patient["patientId"], trial["nct_id"]))
+            if patient["patientId"] in self.fail_for:
+                return {"llm_eligibility_analysis": None, "overall_assessment": "Assessment Failed (API Error)"}
+            return {"llm_eligibility_analysis": {"eligibility_assessment": {"eligibility_summary": "Likely Eligible"}}}
+
+        self.assessor = assessor
+        self.patients = [
+            make_patient("P1", 250, mutations=[{"hugo_gene_symbol": "BRCA1", "protein_change": "E1836fs"}]),
+            make_patient("P2", 50, mutations=[]),
+        ]
+
+    def tearDown(self):
+        self.store.close()
+        self.tmp.cleanup()
+
+    def make_engine(self, **kwargs):
+        return PrescreeningEngine(TRIALS, self.store, assessor=self.assessor, genomic_agent=FakeGenomicAgent(),
+                                  phases=[2], llm_workers=2, **kwargs)
+
+    def matrix(self, run_id):
+        rows = self.store._conn.execute(
+            "SELECT patient_id, nct_id, stage, outcome FROM prescreen_matrix WHERE run_id = ?", (run_id,)).fetchall()
+        return {(r["patient_id"], r["nct_id"]): (r["stage"], r["outcome"]) for r in rows}
+
+    def test_parse_phases(self):
+        self.assertEqual(parse_phases("Phase I/II"), {1, 2})
+        self.assertEqual(parse_phases("Phase 3"), {3})
+        self.assertEqual(parse_phases("No phase specified"), set())
+
+    def test_agent_retriever_searches_with_the_run_filters(self):
+        agent = FakeTrialAgent()
+        candidates = asyncio.run(make_agent_retriever(agent, None, [2, 3], limit=40)(self.patients[0]))
+        self.assertEqual(candidates, [("NCT_CLOSED", None), ("NCT_OPEN", None)])
+        self.assertEqual(agent.searches, [({"statuses": None, "phases": {2, 3}}, 40)])
+        asyncio.run(make_agent_retriever(agent, ["Recruiting"])(self.patients[0]))
+        self.assertEqual(agent.searches[-1][0]["statuses"], {"recruiting"})
+
+    def test_stages_and_llm_only_for_survivors(self):
+        progress = asyncio.run(self.make_engine().run(self.patients, "run1"))
+        matrix = self.matrix("run1")
+        self.assertEqual(len(matrix), 8)
+        self.assertEqual(matrix[("P1", "NCT_CLOSED")], ("status", OUTCOME_EXCLUDED))
+        self.assertEqual(matrix[("P1", "NCT_PHASE1")], ("phase", OUTCOME_EXCLUDED))
+        self.assertEqual(matrix[("P2", "NCT_OPEN")], ("rules", OUTCOME_EXCLUDED))  # platelets 50 < 100
+        self.assertEqual(matrix[("P2", "NCT_BRCA")], ("genomic", OUTCOME_EXCLUDED))
+        self.assertEqual(matrix[("P1", "NCT_OPEN")], ("llm", OUTCOME_ASSESSED))
+        self.assertEqual(matrix[("P1", "NCT_BRCA")], ("llm", OUTCOME_ASSESSED))
+        self.assertEqual(sorted(self.assessed), [("P1", "NCT_BRCA"), ("P1", "NCT_OPEN")])
+        self.assertEqual(progress["llm_done"], 2)
+        self.assertEqual(progress["excluded_by_stage"], {"status": 2, "phase": 2, "rules": 1, "genomic": 1})
+
+    def test_resume_skips_checkpointed_patients_and_retries_failures(self):
+        self.fail_for = {"P1"}
+        asyncio.run(self.make_engine().run(self.patients[:1], "run2"))
+        self.assertEqual(self.matrix("run2")[("P1", "NCT_OPEN")], ("llm", OUTCOME_ERROR))
+
+        self.fail_for = set()
+        self.assessed.clear()
+        progress = asyncio.run(self.make_engine().run(self.patients, "run2"))
+        self.assertEqual(progress["patients_skipped"], 1)
+        self.assertEqual(progress["patients_done"], 1)
+        # P1's failed pairs are retried; P2 has no survivors
+        self.assertEqual(sorted(self.assessed), [("P1", "NCT_BRCA"), ("P1", "NCT_OPEN")])
+        self.assertEqual(self.matrix("run2")[("P1", "NCT_OPEN")], ("llm", OUTCOME_ASSESSED))
+        self.assertEqual(self.store.summary("run2")["patients_checkpointed"], 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
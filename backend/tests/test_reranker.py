@@ -0,0 +1,119 @@
+import asyncio
+import os
+import unittest
+
+try:
+    from backend.core.reranker import (
+        TrialReranker, is_likely_eligible, iter_budgeted_assessments, patient_profile_text, policy_report, resolve_policy,
+    )
+except ImportError:
+    import sys
+    sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+    from backend.core.reranker import (
+        TrialReranker, is_likely_eligible, iter_budgeted_assessments, patient_profile_text, policy_report, resolve_policy,
+    )
+
+PATIENT = {
+    "diagnosis": {"primary": "Invasive Ductal Carcinoma", "stage": "IV"},
+    "mutations": [{"hugo_gene_symbol": "PIK3CA", "protein_change": "H1047R"}],
+    "currentMedications": [{"name": "Letrozole"}],
+}
+TRIALS = [{"nct_id": f"NCT{i}", "title": title, "inclusion_criteria_text": ""}
+          for i, title in enumerate(["melanoma", "breast PIK3CA", "lung"])]
+
+
+def eligibility(summary):
+    return {"llm_eligibility_analysis": {"eligibility_assessment": {"eligibility_summary": summary}}}
+
+
+class KeywordEncoder:
+    """ Bi-encoder stand-in: one dimension per keyword. """
+    KEYWORDS = ["breast", "pik3ca", "melanoma", "lung"]
+
+    def encode(self, texts, normalize_embeddings=True, show_progress_bar=False):
+        vectors = []
+        for text in texts:
+            v = [float(k in text.lower()) for k in self.KEYWORDS]
+            norm = sum(x * x for x in v) ** 0.5 or 1.0
+            vectors.append([x / norm for x in v])
+        return vectors
+
+
+def collect(trials, results, policy):
+    report = policy_report(policy, None, len(trials))
+    calls = []
+
+    async def assess(trial):
+        calls.append(trial["nct_id"])
+        await asyncio.sleep(0)
+        return results[trial["nct_id"]]
+
+    async def run():
+        return [item async for item in iter_budgeted_assessments(trials, assess, policy, report)]
+
+    return asyncio.run(run()), calls, report
+
+
+class TestReranker(unittest.TestCase):
+    def test_profile_text(self):
+        text = patient_profile_text(PATIENT)
+        self.assertIn("Stage: IV", text)
+        self.assertIn("PIK3CA H1047R", text)
+        self.assertIn("Letrozole", text)
+
+    def test_bi_encoder_rerank(self):
+        ranked, report = asyncio.run(TrialReranker(bi_encoder=KeywordEncoder(), mode="bi_encoder").rerank(PATIENT, TRIALS))
+        self.assertEqual(report["method"], "bi_encoder")
+        self.assertEqual(ranked[0]["nct_id"], "NCT1")
+        self.assertEqual(ranked[0]["retrieval"]["retrieval_rank"], 2)
+        self.assertNotIn("retrieval", TRIALS[1])
+
+    def test_no_model_keeps_retrieval_order(self):
+        ranked, report = asyncio.run(TrialReranker(mode="none").rerank(PATIENT, TRIALS))
+        self.assertEqual(report["method"], "retrieval")
+        self.assertEqual([t["nct_id"] for t in ranked], ["NCT0", "NCT1", "NCT2"])
+
+    def test_is_likely_eligible(self):
+        self.assertTrue(is_likely_eligible(eligibility("Likely Eligible")))
+        self.assertFalse(is_likely_eligible(eligibility("Likely Ineligible")))
+        self.assertFalse(is_likely_eligible({"overall_assessment": "Assessment Failed"}))
+        self.assertFalse(is_likely_eligible(None))
+
+    def test_resolve_policy(self):
+        policy = resolve_policy({"mode": "until_eligible", "top_k": 0, "unknown": 1})
+        self.assertEqual(policy["mode"], "until_eligible")
+        self.assertEqual(policy["top_k"], 1)
+        self.assertNotIn("unknown", policy)
+        with self.assertRaises(ValueError):
+            resolve_policy({"mode": "everything"})
+
+
+class TestAssessmentBudget(unittest.TestCase):
+    trials = [{"nct_id": f"NCT{i}"} for i in range(6)]
+
+    def test_top_k_assesses_first_k(self):
+        results = {t["nct_id"]: eligibility("Likely Ineligible") for t in self.trials}
+        items, calls, report = collect(self.trials, results, resolve_policy({"mode": "top_k", "top_k": 3}))
+        self.assertEqual(sorted(i for i, _ in items), [0, 1, 2])
+        self.assertEqual(sorted(calls), ["NCT0", "NCT1", "NCT2"])
+        self.assertEqual((report["assessed"], report["skipped"], report["stopped_early"]), (3, 3, False))
+
+    def test_until_eligible_stops_early(self):
+        results = {t["nct_id"]: eligibility("Likely Ineligible") for t in self.trials}
+        results["NCT1"] = results["NCT2"] = eligibility("Likely Eligible")
+        policy = resolve_policy({"mode": "until_eligible", "top_k": 6, "target_eligible": 2, "concurrency": 1})
+        items, calls, report = collect(self.trials, results, policy)
+        self.assertEqual(calls, ["NCT0", "NCT1", "NCT2"])
+        self.assertEqual((report["assessed"], report["eligible_found"], report["skipped"]), (3, 2, 3))
+        self.assertTrue(report["stopped_early"])
+
+    def test_until_eligible_respects_top_k_cap(self):
+        results = {t["nct_id"]: eligibility("Likely Ineligible") for t in self.trials}
+        policy = resolve_policy({"mode": "until_eligible", "top_k": 4, "target_eligible": 1, "concurrency": 2})
+        _, calls, report = collect(self.trials, results, policy)
+        self.assertEqual(len(calls), 4)
+        self.assertFalse(report["stopped_early"])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,148 @@
+import asyncio
+import os
+import sqlite3
+import tempfile
+import unittest
+
+try:
+    from backend.core.retrieval import (
+        POOLING_MAXSIM, POOLING_WEIGHTED, CriterionRetriever, LexicalIndex, allowed_trial_ids, build_fts_query,
+        criterion_chunks, filters_from_entities, pool_trial_scores, reciprocal_rank_fusion, upsert_trial_chunks,
+    )
+    from backend.core.sqlite_pool import close_all_pools
+except ImportError:
+    import sys
+    sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+    from backend.core.retrieval import (
+        POOLING_MAXSIM, POOLING_WEIGHTED, CriterionRetriever, LexicalIndex, allowed_trial_ids, build_fts_query,
+        criterion_chunks, filters_from_entities, pool_trial_scores, reciprocal_rank_fusion, upsert_trial_chunks,
+    )
+    from backend.core.sqlite_pool import close_all_pools
+
+INCLUSION = "- Age >= 18 years\n- HER2-positive breast cancer\n\\* confirmed by IHC 3+\n- ECOG 0-1"
+EXCLUSION = "- Active brain metastases"
+
+
+class FakeCollection:
+    def __init__(self, rows=None):
+        self.rows = rows or []
+        self.deleted = []
+        self.upserted = []
+
+    def delete(self, where):
+        self.deleted.append(where)
+
+    def upsert(self, ids, embeddings, documents, metadatas):
+        self.upserted.extend(zip(ids, documents, metadatas))
+
+    def query(self, query_embeddings, n_results, include, **kwargs):
+        rows = self.rows[:n_results]
+        return {"metadatas": [[r[0] for r in rows]], "distances": [[r[1] for r in rows]], "documents": [[r[2] for r in rows]]}
+
+
+class FakeModel:
+    def encode(self, texts, batch_size=32, show_progress_bar=False):
+        return [[1.0, 0.0] for _ in texts]
+
+
+class TestCriterionRetrieval(unittest.TestCase):
+    def test_chunks_one_per_criterion_with_parent_context(self):
+        chunks = criterion_chunks("NCT1", "A HER2 trial", INCLUSION, EXCLUSION)
+        self.assertEqual([c["kind"] for c in chunks], ["title", "inclusion", "inclusion", "inclusion", "inclusion", "exclusion"])
+        self.assertEqual(chunks[3]["text"], "HER2-positive breast cancer confirmed by IHC 3+")
+        self.assertEqual(len({c["id"] for c in chunks}), len(chunks))
+
+    def test_upsert_replaces_trial_chunks(self):
+        collection = FakeCollection()
+        written = upsert_trial_chunks(collection, FakeModel(), [
+            {"nct_id": "NCT1", "title": "T1", "inclusion_criteria_text": INCLUSION, "exclusion_criteria_text": EXCLUSION},
+            {"nct_id": None, "title": "skipped"},
+        ])
+        self.assertEqual(written, 6)
+        self.assertEqual(collection.deleted, [{"nct_id": {"$in": ["NCT1"]}}])
+        self.assertTrue(all(meta["nct_id"] == "NCT1" for _, _, meta in collection.upserted))
+
+    def test_pooling(self):
+        hits = [
+            ("NCT1", "inclusion", 0.90, "lucky hit"),
+            ("NCT2", "inclusion", 0.85, "a"), ("NCT2", "inclusion", 0.84, "b"), ("NCT2", "title", 0.83, "c"),
+            ("NCT3", "exclusion", 0.95, "excluded condition"),
+        ]
+        maxsim = pool_trial_scores(hits, POOLING_MAXSIM)
+        self.assertEqual([r["nct_id"] for r in maxsim], ["NCT1", "NCT2", "NCT3"])  # exclusion down-weighted
+        weighted = pool_trial_scores(hits, POOLING_WEIGHTED)
+        self.assertEqual(weighted[0]["nct_id"], "NCT2")  # several good criteria beat one lucky hit
+        self.assertEqual(weighted[0]["matched_chunks"], 3)
+        with self.assertRaises(ValueError):
+            pool_trial_scores(hits, "unknown")
+
+    def test_retriever_converts_distances_and_limits_trials(self):
+        rows = [({"nct_id": f"NCT{i % 4}", "kind": "inclusion"}, 0.1 * (i % 4), f"doc{i}") for i in range(12)]
+        ranked = CriterionRetriever(FakeCollection(rows), method=POOLING_MAXSIM, fanout=4).search_sync([1.0, 0.0], 2)
+        self.assertEqual([r["nct_id"] for r in ranked], ["NCT0", "NCT1"])
+        self.assertAlmostEqual(ranked[0]["score"], 1.0)
+
+
+
+TRIALS = [
+    ("NCT1", "HER2-positive metastatic breast cancer study", "active", "Phase II", "- HER2-positive breast cancer", "Trastuzumab combination"),
+    ("NCT2", "Lung cancer EGFR study", "Active", "Phase I/II", "- EGFR mutation", "Osimertinib in lung cancer"),
+    ("NCT3", "HER2 breast cancer follow-up", "closed to accrual", "Phase II", "- HER2-positive breast cancer", "Closed study"),
+    ("NCT4", "Breast cancer phase 3", "recruiting", "Phase III", "- HER2-negative breast cancer", "Endocrine therapy"),
+]
+
+
+class TestHybridSearch(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.db_path = os.path.join(self.tmp.name, "trials.db")
+        conn = sqlite3.connect(self.db_path)
+        conn.execute("CREATE TABLE clinical_trials (nct_id TEXT, title TEXT, status TEXT, phase TEXT, "
+                     "inclusion_criteria_text TEXT, exclusion_criteria_text TEXT, description_text TEXT, objectives_text TEXT)")
+        conn.executemany("INSERT INTO clinical_trials VALUES (?, ?, ?, ?, ?, NULL, ?, NULL)", TRIALS)
+        conn.commit()
+        conn.close()
+        self.index = LexicalIndex(self.db_path)  # Built lazily by the first search
+
+    def tearDown(self):
+        self.index.close()
+        close_all_pools()
+        self.tmp.cleanup()
+
+    def test_filters_only_allow_open_statuses_and_requested_phase(self):
+        self.assertEqual(asyncio.run(allowed_trial_ids(self.db_path, filters_from_entities({}))), ["NCT1", "NCT2", "NCT4"])
+        phase_two = filters_from_entities({"trial_phase": "II", "recruitment_status": "Active"})
+        self.assertEqual(phase_two, {"statuses": {"active"}, "phases": {2}})
+        self.assertEqual(asyncio.run(allowed_trial_ids(self.db_path, phase_two)), ["NCT1", "NCT2"])
+        # A closed status can never be requested
+        self.assertNotIn("closed to accrual", filters_from_entities({"recruitment_status": "closed to accrual"})["statuses"])
+        # Batch callers can disable the status filter entirely
+        self.assertEqual(asyncio.run(allowed_trial_ids(self.db_path, {"statuses": None, "phases": {2}})), ["NCT1", "NCT2", "NCT3"])
+
+    def test_lexical_search_respects_allow_list(self):
+        self.assertEqual(build_fts_query('Condition: HER2-positive "breast" cancer. Phase: 2'), '"her2-positive" OR "breast" OR "cancer"')
+        hits = asyncio.run(self.index.search("HER2 positive breast cancer", ["NCT1", "NCT2", "NCT4"], 10))
+        ids = [nct_id for nct_id, _ in hits]
+        self.assertEqual(ids[0], "NCT1")
+        self.assertNotIn("NCT3", ids)
+        self.assertEqual(asyncio.run(self.index.search("", ["NCT1"], 10)), [])
+
+    def test_separate_index_db_leaves_trials_db_untouched(self):
+        with open(self.db_path, "rb") as f:
+            before = f.read()
+        index = LexicalIndex(os.path.join(self.tmp.name, "trial_indexes.db"), self.db_path)
+        hits = asyncio.run(index.search("HER2 positive breast cancer", ["NCT1", "NCT2", "NCT4"], 10))
+        index.close()
+        self.assertEqual(hits[0][0], "NCT1")
+        with open(self.db_path, "rb") as f:
+            self.assertEqual(f.read(), before)
+        self.assertFalse(any(name.startswith("trials.db-") for name in os.listdir(self.tmp.name)))
+
+    def test_reciprocal_rank_fusion(self):
+        fused = reciprocal_rank_fusion([["A", "B", "C"], ["C", "A"]])
+        self.assertEqual([item for item, _ in fused], ["A", "C", "B"])
+        self.assertAlmostEqual(fused[0][1], 1 / 61 + 1 / 62)
+
+
+if __name__ == '__main__':
+    unittest.main()
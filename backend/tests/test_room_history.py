@@ -0,0 +1,137 @@
+import json
+import os
+import tempfile
+import threading
+import unittest
+
+try:
+    from backend.core.connection_manager import ConnectionManager
+    from backend.core.room_history import RoomHistory, parse_cursor
+    from backend.tests.fakes import FakeWebSocket
+except ImportError:
+    import sys
+    sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+    from backend.core.connection_manager import ConnectionManager
+    from backend.core.room_history import RoomHistory, parse_cursor
+    from backend.tests.fakes import FakeWebSocket
+
+
+def record(history, room_id, n, persist=True):
+    seq = history.next_seq(room_id)
+    history.append(room_id, seq, json.dumps({"n": n, "seq": seq}), persist=persist)
+    return seq
+
+
+class TestRoomHistory(unittest.TestCase):
+    def test_ring_buffer_and_since_cursor(self):
+        history = RoomHistory(max_messages=3, persist_dir=None)
+        seqs = [record(history, "r", n) for n in range(5)]
+        self.assertEqual(seqs, sorted(set(seqs)))  # Strictly increasing
+        entries, truncated = history.since("r")
+        self.assertEqual([json.loads(text)["n"] for _, text in entries], [2, 3, 4])
+        self.assertFalse(truncated)
+
+        entries, truncated = history.since("r", seqs[3])
+        self.assertEqual([seq for seq, _ in entries], [seqs[4]])
+        self.assertFalse(truncated)
+        # Cursor older than what the buffer still holds: client missed evicted messages
+        self.assertTrue(history.since("r", seqs[0])[1])
+        self.assertEqual(history.since("r", seqs[4]), ([], False))
+        self.assertEqual(history.latest_seq("r"), seqs[4])
+
+    def test_out_of_order_remote_message_is_sorted_in(self):
+        history = RoomHistory(max_messages=5, persist_dir=None)
+        first = record(history, "r", 0)
+        last = record(history, "r", 1)
+        history.append("r", first - 1, '{"n": "remote"}', persist=False)  # Sent earlier on another worker
+        self.assertEqual([seq for seq, _ in history.since("r")[0]], [first - 1, first, last])
+        self.assertEqual(history.latest_seq("r"), last)
+
+    def test_room_count_is_bounded(self):
+        history = RoomHistory(max_messages=2, max_rooms=2, persist_dir=None)
+        for room_id in ("a", "b", "c"):
+            record(history, room_id, 0)
+        self.assertEqual(list(history.rooms), ["b", "c"])
+
+    def test_persistence_reload_and_compaction(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            history = RoomHistory(max_messages=3, persist_dir=tmp)
+            seqs = [record(history, "consult/PAT 1", n) for n in range(6)]
+            record(history, "consult/PAT 1", 99, persist=False)  # Owned (and persisted) by another worker
+            (path,) = [os.path.join(tmp, name) for name in os.listdir(tmp)]
+            with open(path, encoding="utf-8") as f:
+                self.assertEqual(len(f.read().splitlines()), 3)  # Compacted at 2x the buffer size
+            with open(path, "a", encoding="utf-8") as f:
+                f.write('{"n": 6, "se')  # Torn write from a crash
+
+            reloaded = RoomHistory(max_messages=2, persist_dir=tmp)
+            entries, truncated = reloaded.since("consult/PAT 1", seqs[3])
+            self.assertEqual([seq for seq, _ in entries], seqs[4:])
+            self.assertFalse(truncated)
+            self.assertTrue(reloaded.since("consult/PAT 1", seqs[1])[1])
+            self.assertGreater(reloaded.next_seq("consult/PAT 1"), seqs[-1])
+
+    def test_parse_cursor(self):
+        self.assertEqual(parse_cursor("17"), 17)
+        for value in (None, "", "abc", [1]):
+            self.assertIsNone(parse_cursor(value))
+
+
+class TestCatchUpOnJoin(unittest.IsolatedAsyncioTestCase):
+    async def test_join_with_since_gets_only_missed_messages(self):
+        manager = ConnectionManager(history=RoomHistory(max_messages=10, persist_dir=None))
+        a, b = FakeWebSocket(1), FakeWebSocket(2)
+        await manager.connect(a)
+        await manager.connect(b)
+        await manager.join_room("PAT1", a)
+        seqs = [(await manager.broadcast_to_room("PAT1", {"type": "chat_message", "n": n}))[1] for n in range(3)]
+        self.assertEqual(await manager.broadcast_to_room("PAT1", {"type": "typing"}, record=False), (1, None))
+        await manager.flush(a)
+        self.assertEqual([m["seq"] for m in a.sent[:3]], seqs)  # Senders can echo the seq the room got
+        cursor = a.sent[0]["seq"]
+        self.assertNotIn("seq", a.sent[-1])
+
+        self.assertEqual(await manager.join_room("PAT1", b, since=cursor, catch_up=True), 2)
+        await manager.broadcast_to_room("PAT1", {"type": "chat_message", "n": 3})
+        await manager.flush(b)
+        catch_up, live = b.sent
+        self.assertEqual(catch_up["type"], "room_history")
+        self.assertEqual([m["n"] for m in catch_up["messages"]], [1, 2])
+        self.assertEqual(catch_up["latestSeq"], catch_up["messages"][-1]["seq"])
+        self.assertFalse(catch_up["truncated"])
+        self.assertEqual(live["n"], 3)
+        self.assertGreater(live["seq"], catch_up["latestSeq"])
+
+        await manager.join_room("PAT1", b, catch_up=True)  # Fresh join: everything buffered
+        await manager.flush(b)
+        self.assertEqual([m["n"] for m in b.sent[-1]["messages"]], [0, 1, 2, 3])
+        for ws in (a, b):
+            manager.disconnect(ws)
+
+
+class TestPersistenceOffLoop(unittest.IsolatedAsyncioTestCase):
+    async def test_writes_and_loads_run_on_worker_threads(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            history = RoomHistory(max_messages=5, persist_dir=tmp)
+            threads = []
+            write_batch, load = history._write_batch, history._load
+            history._write_batch = lambda batch: threads.append(threading.get_ident()) or write_batch(batch)
+            seqs = [record(history, "PAT1", n) for n in range(3)]
+            self.assertEqual(history.stats()["pending_writes"], 3)  # Queued, not written on the loop
+            await history.flush()
+            self.assertEqual(history.stats()["pending_writes"], 0)
+            self.assertNotIn(threading.get_ident(), threads)
+
+            manager = ConnectionManager(history=RoomHistory(max_messages=5, persist_dir=tmp))
+            manager.history._load = lambda room_id: threads.append(threading.get_ident()) or load(room_id)
+            ws = FakeWebSocket(1)
+            await manager.connect(ws)
+            self.assertEqual(await manager.join_room("PAT1", ws, catch_up=True), 3)
+            self.assertNotIn(threading.get_ident(), threads)
+            await manager.flush(ws)
+            self.assertEqual([m["seq"] for m in ws.sent[0]["messages"]], seqs)
+            manager.disconnect(ws)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,75 @@
+import asyncio
+import os
+import sqlite3
+import tempfile
+import unittest
+
+try:
+    from backend.core.sqlite_pool import SQLitePool, json_list
+except ImportError:
+    import sys
+    sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+    from backend.core.sqlite_pool import SQLitePool, json_list
+
+
+class TestSQLitePool(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.db_path = os.path.join(self.tmp.name, "trials.db")
+        conn = sqlite3.connect(self.db_path)
+        conn.execute("CREATE TABLE clinical_trials (nct_id TEXT PRIMARY KEY, title TEXT)")
+        conn.executemany("INSERT INTO clinical_trials VALUES (?, ?)", [(f"NCT{i}", f"Trial {i}") for i in range(20)])
+        conn.commit()
+        conn.close()
+        self.pool = SQLitePool(self.db_path, size=2)
+
+    def tearDown(self):
+        self.pool.close()
+        self.tmp.cleanup()
+
+    def test_reads_return_dicts_and_wal_is_opt_in(self):
+        row = self.pool.fetchone_sync("SELECT * FROM clinical_trials WHERE nct_id = ?", ("NCT3",))
+        self.assertEqual(row, {"nct_id": "NCT3", "title": "Trial 3"})
+        self.assertIsNone(self.pool.fetchone_sync("SELECT * FROM clinical_trials WHERE nct_id = ?", ("missing",)))
+        self.assertEqual(self._journal_mode(), "delete")  # Tracked files stay untouched
+
+        wal_pool = SQLitePool(self.db_path, size=1, enable_wal=True)
+        wal_pool.fetchall_sync("SELECT 1")
+        wal_pool.close()
+        self.assertEqual(self._journal_mode(), "wal")
+
+    def _journal_mode(self):
+        conn = sqlite3.connect(self.db_path)
+        try:
+            return conn.execute("PRAGMA journal_mode").fetchone()[0]
+        finally:
+            conn.close()
+
+    def test_connections_are_read_only(self):
+        with self.assertRaises(sqlite3.Error):
+            self.pool.fetchall_sync("INSERT INTO clinical_trials VALUES ('NCTX', 'x')")
+        self.assertEqual(self.pool.stats()["errors"], 1)
+
+    def test_concurrent_async_queries_share_bounded_connections(self):
+        sql = "SELECT nct_id FROM clinical_trials WHERE nct_id IN (SELECT value FROM json_each(?))"
+
+        async def run():
+            return await asyncio.gather(*(self.pool.fetchall(sql, (json_list([f"NCT{i}", f"NCT{i + 1}"]),)) for i in range(10)))
+
+        results = asyncio.run(run())
+        self.assertEqual(len(results), 10)
+        self.assertTrue(all(len(rows) == 2 for rows in results))
+        stats = self.pool.stats()
+        self.assertEqual(stats["queries"], 10)
+        self.assertLessEqual(stats["open_connections"], 2)
+
+    def test_missing_database_raises(self):
+        pool = SQLitePool(os.path.join(self.tmp.name, "missing.db"))
+        with self.assertRaises(sqlite3.Error):
+            pool.fetchall_sync("SELECT 1")
+        pool.close()
+        self.assertFalse(os.path.exists(os.path.join(self.tmp.name, "missing.db")))
+
+
+if __name__ == '__main__':
+    unittest.main()
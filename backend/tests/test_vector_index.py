@@ -0,0 +1,110 @@
+import os
+import sqlite3
+import tempfile
+import unittest
+
+import numpy as np
+
+try:
+    from backend.core.vector_index import (
+        ANN_EXACT, LocalVectorIndex, export_collection, local_index_is_stale, open_vector_collection,
+    )
+except ImportError:
+    import sys
+    sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+    from backend.core.vector_index import (
+        ANN_EXACT, LocalVectorIndex, export_collection, local_index_is_stale, open_vector_collection,
+    )
+
+
+class PagedCollection:
+    """ Minimal stand-in for a Chroma collection's paged get(). """
+    name = "clinical_trials_criteria"
+
+    def __init__(self, ids, embeddings, metadatas, documents):
+        self.rows = list(zip(ids, embeddings, metadatas, documents))
+
+    def get(self, limit, offset, include):
+        page = self.rows[offset:offset + limit]
+        return {
+            "ids": [r[0] for r in page],
+            "embeddings": [list(r[1]) for r in page],
+            "metadatas": [r[2] for r in page],
+            "documents": [r[3] for r in page],
+        }
+
+
+class TestLocalVectorIndex(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(7)
+        self.vectors = rng.normal(size=(60, 16)).astype(np.float32)
+        self.ids = [f"NCT{i // 3:03d}:{i % 3}" for i in range(60)]
+        self.metadatas = [{"nct_id": f"NCT{i // 3:03d}", "kind": "inclusion" if i % 3 else "title"} for i in range(60)]
+        self.documents = [f"chunk {i}" for i in range(60)]
+        self.index = LocalVectorIndex.build(self.ids, self.vectors, self.metadatas, self.documents, ann_backend=ANN_EXACT)
+
+    def brute_force(self, query, rows, k):
+        normed = self.vectors / np.linalg.norm(self.vectors, axis=1, keepdims=True)
+        sims = normed[rows] @ (query / np.linalg.norm(query))
+        return [self.ids[rows[i]] for i in np.argsort(-sims)[:k]]
+
+    def test_query_matches_brute_force_with_cosine_distances(self):
+        query = self.vectors[5] + 0.1
+        result = self.index.query(query_embeddings=[query.tolist()], n_results=5)
+        self.assertEqual(result["ids"][0], self.brute_force(query, np.arange(60), 5))
+        self.assertEqual(result["ids"][0][0], self.ids[5])
+        self.assertLess(result["distances"][0][0], 0.05)
+        self.assertEqual(result["metadatas"][0][0], self.metadatas[5])
+        self.assertEqual(result["documents"][0][0], "chunk 5")
+
+    def test_where_filters(self):
+        allowed = ["NCT001", "NCT007", "NCT019"]
+        rows = np.array([i for i, m in enumerate(self.metadatas) if m["nct_id"] in allowed])
+        result = self.index.query(query_embeddings=[self.vectors[0]], n_results=20,
+                                  where={"nct_id": {"$in": allowed}}, include=["metadatas"])
+        self.assertEqual(result["ids"][0], self.brute_force(self.vectors[0], rows, 20))
+        self.assertTrue(all(m["nct_id"] in allowed for m in result["metadatas"][0]))
+
+        both = self.index.get(where={"$and": [{"nct_id": {"$in": allowed}}, {"kind": "title"}]})
+        self.assertEqual(both["ids"], ["NCT001:0", "NCT007:0", "NCT019:0"])
+        self.assertEqual(self.index.query(query_embeddings=[self.vectors[0]], where={"nct_id": "missing"})["ids"], [[]])
+
+    def test_save_open_round_trip_memory_mapped(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            collection = PagedCollection(self.ids, self.vectors, self.metadatas, self.documents)
+            export_collection(collection, "clinical_trials_criteria", tmp, ann_backend=ANN_EXACT)
+            opened = open_vector_collection("clinical_trials_criteria", "local", index_dir=tmp)
+            self.assertIsInstance(opened.embeddings, np.memmap)
+            self.assertEqual(opened.count(), 60)
+            self.assertEqual(opened.get(limit=2, offset=3, include=["documents"])["documents"], ["chunk 3", "chunk 4"])
+            query = [self.vectors[11]]
+            self.assertEqual(opened.query(query_embeddings=query, n_results=4)["ids"],
+                             self.index.query(query_embeddings=query, n_results=4)["ids"])
+            self.assertIsNone(open_vector_collection("clinical_trials_eligibility", "local", index_dir=tmp))
+
+    def test_export_goes_stale_when_ingestion_hashes_change(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            trials_db = os.path.join(tmp, "trials.db")
+            conn = sqlite3.connect(trials_db)
+            conn.execute("CREATE TABLE clinical_trials (source_url TEXT PRIMARY KEY, criteria_hash TEXT)")
+            conn.execute("INSERT INTO clinical_trials VALUES ('https://a', 'h1')")
+            conn.commit()
+            collection = PagedCollection(self.ids, self.vectors, self.metadatas, self.documents)
+            export_collection(collection, "clinical_trials_criteria", tmp, ann_backend=ANN_EXACT, trials_db_path=trials_db)
+            opened = open_vector_collection("clinical_trials_criteria", "local", index_dir=tmp, trials_db_path=trials_db)
+            self.assertFalse(opened.stats()["stale"])
+
+            conn.execute("UPDATE clinical_trials SET criteria_hash = 'h2'")  # A later load re-embedded the trial
+            conn.commit()
+            conn.close()
+            self.assertTrue(local_index_is_stale("clinical_trials_criteria", tmp, trials_db))
+            with self.assertLogs(level="WARNING"):
+                opened = open_vector_collection("clinical_trials_criteria", "local", index_dir=tmp, trials_db_path=trials_db)
+            self.assertTrue(opened.stats()["stale"])
+
+            export_collection(collection, "clinical_trials_criteria", tmp, ann_backend=ANN_EXACT, trials_db_path=trials_db)
+            self.assertFalse(local_index_is_stale("clinical_trials_criteria", tmp, trials_db))
+
+
+if __name__ == '__main__':
+    unittest.main()
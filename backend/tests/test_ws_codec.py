@@ -0,0 +1,109 @@
+import asyncio
+import json
+import os
+import unittest
+from types import SimpleNamespace
+from unittest import mock
+
+from starlette.websockets import WebSocketState
+
+try:
+    from backend.core import ws_codec
+    from backend.core.connection_manager import ConnectionManager
+    from backend.core.room_history import RoomHistory
+except ImportError:
+    import sys
+    sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+    from backend.core import ws_codec
+    from backend.core.connection_manager import ConnectionManager
+    from backend.core.room_history import RoomHistory
+
+HAS_MSGPACK = ws_codec._msgpack is not None
+HAS_ZSTD = ws_codec.zstandard is not None
+
+LARGE = {"type": "consult_request", "context": {"relatedInfo": {"labs": [
+    {"test": f"T{i}", "value": i * 1.5, "unit": "g/dL", "flag": "Normal"} for i in range(300)
+]}}}
+
+
+class FrameSocket:
+    def __init__(self, port):
+        self.client = SimpleNamespace(host="127.0.0.1", port=port)
+        self.client_state = WebSocketState.CONNECTING
+        self.frames = []
+
+    async def accept(self):
+        self.client_state = WebSocketState.CONNECTED
+
+    async def send_text(self, text):
+        self.frames.append(text)
+
+    async def send_bytes(self, data):
+        self.frames.append(data)
+
+    async def close(self, code=1000):
+        self.client_state = WebSocketState.DISCONNECTED
+
+
+class TestCodec(unittest.TestCase):
+    def test_negotiation(self):
+        self.assertEqual(ws_codec.negotiate(None), "json")
+        self.assertEqual(ws_codec.negotiate(["cbor", "JSON"]), "json")
+        self.assertEqual(ws_codec.negotiate("bogus"), "json")
+        if HAS_MSGPACK:
+            self.assertEqual(ws_codec.negotiate(["msgpack", "json"]), "msgpack")
+        self.assertEqual(ws_codec.available_encodings()[-1], "json")
+
+    def test_json_is_unchanged_text(self):
+        self.assertEqual(ws_codec.encode({"a": 1}), json.dumps({"a": 1}))
+
+    @unittest.skipUnless(HAS_ZSTD, "zstandard not installed")
+    def test_zstd_only_for_large_payloads(self):
+        small = ws_codec.encode({"a": 1}, "json+zstd")
+        self.assertIsInstance(small, str)
+        large = ws_codec.encode(LARGE, "json+zstd")
+        self.assertTrue(large.startswith(ws_codec.ZSTD_MAGIC))
+        self.assertLess(len(large), len(json.dumps(LARGE)) // 3)
+        self.assertEqual(ws_codec.decode(large, "json+zstd"), LARGE)
+
+    @unittest.skipUnless(HAS_MSGPACK and HAS_ZSTD, "msgpack/zstandard not installed")
+    def test_msgpack_round_trip(self):
+        for payload in ({"a": [1, 2.5, None, "x"]}, LARGE):
+            frame = ws_codec.encode(payload, "msgpack+zstd")
+            self.assertIsInstance(frame, bytes)
+            self.assertEqual(ws_codec.decode(frame, "msgpack+zstd"), payload)
+
+    def test_encoded_message_serializes_once_per_encoding(self):
+        message = ws_codec.EncodedMessage({"a": 1})
+        with mock.patch.object(ws_codec.json, "dumps", wraps=json.dumps) as dumps:
+            self.assertIs(message.frame("json"), message.frame("json"))
+            message.json_text
+            self.assertEqual(dumps.call_count, 1)
+        self.assertEqual(ws_codec.EncodedMessage(json_text='{"b": 2}').data, {"b": 2})
+
+
+class TestManagerEncodings(unittest.IsolatedAsyncioTestCase):
+    async def test_broadcast_uses_each_socket_encoding(self):
+        manager = ConnectionManager(history=RoomHistory(max_messages=0))
+        sockets = [FrameSocket(i) for i in range(3)]
+        for ws in sockets:
+            await manager.connect(ws)
+            await manager.join_room("room", ws)
+        encoding = "msgpack" if HAS_MSGPACK else "json+zstd" if HAS_ZSTD else "json"
+        manager.set_encoding(sockets[0], encoding)
+        await manager.broadcast_to_room("room", LARGE)
+        for ws in sockets:
+            await manager.flush(ws)
+        self.assertEqual(json.loads(sockets[1].frames[0]), LARGE)
+        self.assertIs(sockets[1].frames[0], sockets[2].frames[0])  # JSON serialized once for both
+        self.assertEqual(ws_codec.decode(sockets[0].frames[0], encoding), LARGE)
+        if encoding != "json":
+            self.assertEqual(manager.stats()["encodings"], {encoding: 1})
+        for ws in sockets:
+            manager.disconnect(ws)
+        self.assertEqual(manager.socket_encoding, {})
+        await asyncio.sleep(0)
+
+
+if __name__ == '__main__':
+    unittest.main()
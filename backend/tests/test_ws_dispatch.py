@@ -0,0 +1,100 @@
+import asyncio
+import os
+import unittest
+
+try:
+    from backend.core.connection_manager import ConnectionManager
+    from backend.core.ws_dispatch import SocketTaskGroup, WebSocketSession, with_correlation
+    from backend.tests.fakes import FakeWebSocket
+except ImportError:
+    import sys
+    sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+    from backend.core.connection_manager import ConnectionManager
+    from backend.core.ws_dispatch import SocketTaskGroup, WebSocketSession, with_correlation
+    from backend.tests.fakes import FakeWebSocket
+
+
+class TestSocketTaskGroup(unittest.IsolatedAsyncioTestCase):
+    async def test_cap_duplicates_and_cancel_all(self):
+        group = SocketTaskGroup(max_inflight=2)
+        gate = asyncio.Event()
+        self.assertIsNone(group.spawn("prompt", "a", gate.wait))
+        self.assertEqual(group.spawn("prompt", "a", gate.wait), "duplicate")
+        self.assertIsNone(group.spawn("prompt", "b", gate.wait))
+        self.assertEqual(group.spawn("prompt", "c", gate.wait), "busy")
+
+        self.assertTrue(group.cancel("a"))
+        self.assertFalse(group.cancel("missing"))
+        self.assertIsNone(group.spawn("prompt", "c", gate.wait))  # Cancelled task freed its slot
+        self.assertEqual(group.cancel_all(), 2)
+        await group.wait(timeout=1)
+        self.assertEqual(group.stats(), {"inflight": 0, "completed": 0, "rejected": 2, "cancelled": 3})
+
+    async def test_failures_are_reported_with_correlation_id(self):
+        errors = []
+
+        async def on_error(name, correlation_id, error):
+            errors.append((name, correlation_id, str(error)))
+
+        async def boom():
+            raise ValueError("LLM unavailable")
+
+        group = SocketTaskGroup(on_error=on_error)
+        group.spawn("agent_command", "x1", boom)
+        await group.wait(timeout=1)
+        self.assertEqual(errors, [("agent_command", "x1", "LLM unavailable")])
+
+
+class TestWebSocketSession(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.manager = ConnectionManager()
+        self.ws = FakeWebSocket()
+        await self.manager.connect(self.ws)
+        self.session = WebSocketSession(self.ws, self.manager, max_inflight=1)
+
+    async def asyncTearDown(self):
+        self.session.close()
+        self.manager.disconnect(self.ws)
+
+    async def test_slow_handler_does_not_block_replies(self):
+        release = asyncio.Event()
+
+        async def slow_prompt(session, correlation_id):
+            await release.wait()
+            await session.reply({"type": "prompt_result"}, correlation_id)
+
+        self.assertIsNone(self.session.spawn("prompt", "p1", slow_prompt, self.session, "p1"))
+        rejected = self.session.spawn("prompt", "p2", slow_prompt, self.session, "p2")
+        await self.session.reject("prompt", "p2", rejected)
+        await self.session.reply({"type": "status", "message": "Joined room r"}, "j1")  # Handled inline meanwhile
+        release.set()
+        await self.session.tasks.wait(timeout=1)
+        await self.manager.flush(self.ws)
+        self.assertEqual([(m["type"], m["correlationId"]) for m in self.ws.sent],
+                         [("error", "p2"), ("status", "j1"), ("prompt_result", "p1")])
+        self.assertEqual(self.ws.sent[0]["code"], "busy")
+
+    async def test_close_cancels_inflight(self):
+        started = asyncio.Event()
+
+        async def never_finishes():
+            started.set()
+            await asyncio.Event().wait()
+
+        self.session.spawn("search_trials", "s1", never_finishes)
+        await started.wait()
+        task = self.session.tasks.tasks["s1"]
+        self.assertEqual(self.session.close(), 1)
+        await asyncio.wait([task], timeout=1)
+        self.assertTrue(task.cancelled())
+        self.assertEqual(self.session.tasks.stats()["inflight"], 0)
+
+    def test_with_correlation_copies(self):
+        payload = {"type": "x"}
+        self.assertEqual(with_correlation(payload, "c"), {"type": "x", "correlationId": "c"})
+        self.assertEqual(payload, {"type": "x"})
+        self.assertIs(with_correlation(payload, None), payload)
+
+
+if __name__ == '__main__':
+    unittest.main()